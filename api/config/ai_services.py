@@ -7,12 +7,26 @@ Self-contained with zero-config default; togglable via settings.py.
 """
 
 from functools import lru_cache
+from typing import Optional, Tuple
 from api.config.settings import (
     ENABLE_AI_SERVICES,        # Boolean toggle to enable/disable all AI services
     SELECTED_AI_PROVIDER,     # Optional string to filter to a specific provider (e.g., "OpenAI")
-    SELECTED_AI_MODEL         # Optional string to filter to a specific model (e.g., "gpt-4o")
+    SELECTED_AI_MODEL,        # Optional string to filter to a specific model (e.g., "gpt-4o")
+    AI_ENDPOINTS              # Optional {model: [endpoint specs]} for self-hosted/extra nodes
 )
 
+# Categories whose entries are chat models that can be routed to an endpoint
+ROUTABLE_CATEGORIES = ("HostedLLMProviders", "SelfHostedModels")
+
+# Default OpenAI-compatible endpoints for hosted providers.
+# Structure: {provider: {"url": base_url, "api_key_env": env var holding the key}}
+HOSTED_PROVIDER_ENDPOINTS = {
+    "OpenAI": {"url": "https://api.openai.com/v1", "api_key_env": "OPENAI_API_KEY"},
+    "Anthropic": {"url": "https://api.anthropic.com/v1/", "api_key_env": "ANTHROPIC_API_KEY"},
+    "Grok": {"url": "https://api.x.ai/v1", "api_key_env": "XAI_API_KEY"},
+    "XAI": {"url": "https://api.x.ai/v1", "api_key_env": "XAI_API_KEY"},
+}
+
 @lru_cache()
 def get_ai_services() -> dict:
     """
@@ -93,4 +107,49 @@ def get_ai_services() -> dict:
             # Non-provider categories (e.g., InferenceEngines) are included unfiltered
             filtered_services[category] = providers
 
-    return filtered_services
\ No newline at end of file
+    return filtered_services
+
+
+@lru_cache()
+def find_ai_model(model_name: str) -> Optional[Tuple[str, str]]:
+    """
+    Looks up which routable category and provider serve a model.
+
+    Args:
+        model_name (str): Model name as sent by clients (e.g., "gpt-4o", "llama-3").
+
+    Returns:
+        tuple | None: (category, provider), or None if the registry does not list the model.
+    """
+    services = get_ai_services()
+    for category in ROUTABLE_CATEGORIES:
+        for provider, models in services.get(category, {}).items():
+            if model_name in models:
+                return category, provider
+    return None
+
+
+@lru_cache()
+def get_ai_endpoints() -> dict:
+    """
+    Returns the endpoint specs for every routable model.
+
+    Returns:
+        dict: {model_name: [endpoint spec dicts]}. Specs come from AI_ENDPOINTS in
+              settings.py; hosted models without explicit endpoints get their
+              provider's default from HOSTED_PROVIDER_ENDPOINTS.
+
+    Notes:
+        - Self-hosted models (e.g., "llama-3") are only routable once AI_ENDPOINTS
+          lists at least one node for them (vLLM, llama.cpp server, LiteLLM proxy...).
+        - Models listed in AI_ENDPOINTS but missing from the registry are still
+          routable; explicit configuration wins.
+    """
+    endpoints = {model: [dict(spec) for spec in specs] for model, specs in AI_ENDPOINTS.items()}
+    for provider, models in get_ai_services().get("HostedLLMProviders", {}).items():
+        default = HOSTED_PROVIDER_ENDPOINTS.get(provider)
+        if not default:
+            continue
+        for model in models:
+            endpoints.setdefault(model, [dict(default, engine="openai", name=f"{provider.lower()}-{model}")])
+    return endpoints
@@ -0,0 +1,258 @@
+# api/config/drain.py
+
+"""
+Graceful drain for rolling deploys.
+On SIGTERM the worker stops accepting connections, lets in-flight LLM streams
+finish within DRAIN_TIMEOUT, interrupts whatever is still running (WebSocket
+clients get a resume token so another worker can continue without
+re-generating), runs the registered flush hooks (conversation state, metrics)
+and only then lets uvicorn close the remaining connections.
+
+uvicorn closes every WebSocket with 1012 as soon as its own shutdown starts,
+before the app's lifespan shutdown runs, so draining has to happen first:
+DrainingServer does that, and run_server() is uvicorn.run() built on it.
+The lifespan also calls drain() so the flush hooks run under any server.
+"""
+
+import asyncio
+import json
+import os
+import time
+from functools import lru_cache
+
+import uvicorn
+from fastapi import status
+
+from api.config.exceptions import ServiceUnavailableException
+from api.config.logging import logger
+from api.config.metrics import metrics
+from api.config.settings import DRAIN_TIMEOUT, DRAIN_HANDOFF_GRACE, DRAIN_METRICS_PATH, WS_PER_MESSAGE_DEFLATE
+
+metrics.describe("drain_active_streams", "Streams and WebSocket sessions tracked for draining")
+metrics.describe("drain_interrupted_total", "Streams interrupted because the drain deadline passed")
+
+
+class StreamInterrupted(Exception):
+    """Raised inside a tracked stream when the drain interrupts it."""
+
+
+class StreamHandle:
+    """
+    One tracked HTTP stream or WebSocket session.
+
+    Routes wrap their blocking awaits with `guard()` / `iterate()` so a drain
+    can interrupt them cleanly; `streaming` tells the drain whether the
+    session is mid-generation (let it finish) or idle (hand it off now).
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.streaming = False
+        self.interrupted = asyncio.Event()
+        self._waiter = None
+
+    def interrupt(self):
+        self.interrupted.set()
+
+    async def guard(self, awaitable):
+        """
+        Awaits `awaitable` unless the handle is interrupted first.
+
+        Raises:
+            StreamInterrupted: If the drain interrupted this stream.
+        """
+        task = asyncio.ensure_future(awaitable)
+        if self.interrupted.is_set():
+            task.cancel()
+            raise StreamInterrupted()
+        if self._waiter is None or self._waiter.done():
+            self._waiter = asyncio.ensure_future(self.interrupted.wait())
+        try:
+            done, _ = await asyncio.wait({task, self._waiter}, return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            await self._cancel(task)  # Caller cancelled: don't leave the awaitable running
+            raise
+        if task in done:
+            return task.result()
+        await self._cancel(task)
+        raise StreamInterrupted()
+
+    @staticmethod
+    async def _cancel(task):
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            pass
+
+    async def iterate(self, stream):
+        """Yields from async iterator `stream` until it ends or the drain interrupts it."""
+        iterator = stream.__aiter__()
+        try:
+            while True:
+                try:
+                    item = await self.guard(iterator.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+
+    def close(self):
+        if self._waiter is not None:
+            self._waiter.cancel()
+
+
+class DrainController:
+    """
+    Tracks live streams and coordinates the drain.
+
+    Services register flush hooks (sync or async callables) with `on_flush`;
+    they run once, after the streams are gone.
+    """
+
+    def __init__(self):
+        self.draining = False
+        self.drained = False
+        self._streams = set()
+        self._flush_hooks = []
+        self._idle = None
+
+    def open_stream(self, kind: str) -> StreamHandle:
+        """
+        Registers a new stream.
+
+        Raises:
+            ServiceUnavailableException: While draining, so clients retry on another worker.
+        """
+        if self.draining:
+            raise ServiceUnavailableException("Server is draining, retry on another instance")
+        handle = StreamHandle(kind)
+        self._streams.add(handle)
+        metrics.set("drain_active_streams", len(self._streams))
+        return handle
+
+    def close_stream(self, handle: StreamHandle):
+        handle.close()
+        self._streams.discard(handle)
+        metrics.set("drain_active_streams", len(self._streams))
+        if not self._streams and self._idle is not None:
+            self._idle.set()
+
+    def on_flush(self, hook):
+        """Registers a callable run once the streams have drained."""
+        self._flush_hooks.append(hook)
+
+    @property
+    def active(self) -> int:
+        return len(self._streams)
+
+    async def drain(self, timeout: float = DRAIN_TIMEOUT, grace: float = DRAIN_HANDOFF_GRACE):
+        """
+        Drains this worker. Safe to call more than once; later calls return at once.
+
+        1. Stop accepting streams; idle WebSocket sessions are handed off now.
+        2. Wait up to `timeout` seconds for in-flight streams to finish.
+        3. Interrupt the rest and give them `grace` seconds to send resume tokens.
+        4. Run the flush hooks.
+        """
+        if self.drained:
+            return
+        if not self.draining:
+            self.draining = True
+            started = time.monotonic()
+            logger.info(f"🚰 Draining {self.active} stream(s), deadline {timeout:.0f}s")
+            for handle in list(self._streams):
+                if not handle.streaming:
+                    handle.interrupt()
+
+            if not await self._wait_idle(timeout):
+                remaining = list(self._streams)
+                logger.warning(f"⚠️ Drain deadline passed, interrupting {len(remaining)} stream(s)")
+                metrics.inc("drain_interrupted_total", len(remaining))
+                for handle in remaining:
+                    handle.interrupt()
+                await self._wait_idle(grace)
+
+            for hook in reversed(self._flush_hooks):  # Most recently registered first
+                try:
+                    result = hook()
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    logger.error(f"❌ Drain flush hook {getattr(hook, '__name__', hook)} failed: {e}")
+            self.drained = True
+            logger.info(f"✅ Drain finished in {time.monotonic() - started:.1f}s")
+
+    async def _wait_idle(self, timeout: float) -> bool:
+        if not self._streams:
+            return True
+        self._idle = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return not self._streams
+        finally:
+            self._idle = None
+
+
+def flush_metrics():
+    """Drain hook: logs this worker's final metrics, or writes them to DRAIN_METRICS_PATH."""
+    snapshot = metrics.snapshot()
+    if DRAIN_METRICS_PATH:
+        path = DRAIN_METRICS_PATH.format(pid=os.getpid())
+        with open(path, "w") as f:
+            json.dump(snapshot, f)
+        logger.info(f"📈 Final metrics written to {path}")
+    else:
+        logger.info(f"📈 Final metrics: {json.dumps(snapshot)}")
+
+
+@lru_cache()
+def get_drain_controller() -> DrainController:
+    """Returns the process-wide drain controller (flushes metrics last)."""
+    controller = DrainController()
+    controller.on_flush(flush_metrics)
+    return controller
+
+
+# ─────────────────────────────────────────────────────────────
+# 🛑 Draining uvicorn server
+# ─────────────────────────────────────────────────────────────
+
+WS_CLOSE_SERVICE_RESTART = status.WS_1012_SERVICE_RESTART
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn.Server that drains the app before closing its connections."""
+
+    async def shutdown(self, sockets=None):
+        for server in self.servers:
+            server.close()  # Stop accepting; other workers keep serving the shared socket
+        await get_drain_controller().drain()
+        await super().shutdown(sockets=sockets)
+
+
+def run_server(app, host: str, port: int, reload: bool = False, workers: int = 1, **kwargs):
+    """
+    Equivalent of uvicorn.run() that serves with DrainingServer (single
+    process and reload mode).
+    """
+    from uvicorn.supervisors import ChangeReload, Multiprocess
+
+    kwargs.setdefault("timeout_graceful_shutdown", int(DRAIN_TIMEOUT + DRAIN_HANDOFF_GRACE) + 1)
+    kwargs.setdefault("ws_per_message_deflate", WS_PER_MESSAGE_DEFLATE)
+    config = uvicorn.Config(app, host=host, port=port, reload=reload, workers=workers, **kwargs)
+    server = DrainingServer(config=config)
+    if config.should_reload:
+        ChangeReload(config, target=server.run, sockets=[config.bind_socket()]).run()
+    elif config.workers > 1:
+        # uvicorn's supervisor builds its own plain Server per worker: HTTP streams
+        # still get the graceful timeout and the lifespan flush runs, but open
+        # WebSockets are closed with 1012 without a resume token. Use PRELOAD_APP
+        # (pre-fork workers run DrainingServer) for full WebSocket handoff.
+        Multiprocess(config, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
@@ -46,5 +46,60 @@ class NotFoundException(CustomHTTPException):
     def __init__(self, detail: str = "Not Found"):
         super().__init__(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
 
+class ServiceUnavailableException(CustomHTTPException):
+    """
+    Exception for a temporarily unavailable upstream (HTTP 503).
+
+    Raised when every backend able to serve a request is failing or its
+    circuit breaker is open, so the client can retry later instead of hanging.
+
+    Args:
+        detail (str, optional): Custom error message. Defaults to "Service Unavailable".
+    """
+    def __init__(self, detail: str = "Service Unavailable"):
+        super().__init__(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail)
+
+class TooManyRequestsException(CustomHTTPException):
+    """
+    Exception for rate-limited or over-capacity requests (HTTP 429).
+
+    Raised by admission control when a tenant's token bucket is empty or no
+    stream slot frees up in time.
+
+    Args:
+        detail (str, optional): Custom error message. Defaults to "Too Many Requests".
+        retry_after (float, optional): Seconds the client should wait. Defaults to 1.0.
+    """
+    def __init__(self, detail: str = "Too Many Requests", retry_after: float = 1.0):
+        super().__init__(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=detail)
+        self.retry_after = retry_after
+        self.headers = {"Retry-After": str(max(1, int(retry_after + 0.999)))}
+
+class PayloadTooLargeException(CustomHTTPException):
+    """
+    Exception for request bodies over the configured size limit (HTTP 413).
+
+    Raised while the body is still being read, so an oversized upload is cut
+    off without being buffered.
+
+    Args:
+        detail (str, optional): Custom error message. Defaults to "Payload Too Large".
+    """
+    def __init__(self, detail: str = "Payload Too Large"):
+        super().__init__(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=detail)
+
+class UnprocessableEntityException(CustomHTTPException):
+    """
+    Exception for a well-formed request whose content cannot be used (HTTP 422).
+
+    Raised when a request field passes schema validation but its value is
+    rejected by the service that interprets it (e.g. an unsupported JSON schema).
+
+    Args:
+        detail (str, optional): Custom error message. Defaults to "Unprocessable Entity".
+    """
+    def __init__(self, detail: str = "Unprocessable Entity"):
+        super().__init__(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=detail)
+
 # Note: These exceptions are designed to be caught and handled in app/handlers.py
 # or other exception handling modules to return appropriate JSON responses.
\ No newline at end of file
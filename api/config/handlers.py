@@ -6,11 +6,13 @@ Defines custom handlers for specific exceptions and generic fallbacks.
 Togglable via settings.py to enable/disable custom exception handling.
 """
 
-from fastapi import FastAPI, Request, WebSocketException, status
+from fastapi import FastAPI, Request, WebSocket, WebSocketException, status
 from fastapi.responses import JSONResponse
 from .logging import logger  # Logger instance configured by LOG_LEVEL in settings.py
 from .settings import USE_CUSTOM_EXCEPTION_HANDLERS  # Toggle for custom handlers
-from .exceptions import UnauthorizedException, NotFoundException  # Custom exceptions
+from .exceptions import (  # Custom exceptions
+    UnauthorizedException, NotFoundException, ServiceUnavailableException, PayloadTooLargeException
+)
 
 def apply_exception_handlers(app: FastAPI):
     """
@@ -18,6 +20,7 @@ def apply_exception_handlers(app: FastAPI):
 
     Handlers are applied only if USE_CUSTOM_EXCEPTION_HANDLERS is True in settings.py.
     Includes specific handlers for UnauthorizedException, NotFoundException,
+    ServiceUnavailableException, PayloadTooLargeException,
     WebSocketException, and a generic Exception fallback.
 
     Args:
@@ -70,6 +73,45 @@ def apply_exception_handlers(app: FastAPI):
                 content={"error": exc.detail}
             )
 
+        # Handler for ServiceUnavailableException (HTTP 503)
+        @app.exception_handler(ServiceUnavailableException)
+        async def service_unavailable_handler(request: Request, exc: ServiceUnavailableException):
+            """
+            Handles ServiceUnavailableException, returning a 503 JSON response.
+
+            Args:
+                request (Request): The incoming request that triggered the exception.
+                exc (ServiceUnavailableException): The exception instance with detail message.
+
+            Returns:
+                JSONResponse: A 503 response with the error detail and a Retry-After hint.
+            """
+            logger.error(f"❌ Service Unavailable: {str(exc)}")
+            return JSONResponse(
+                status_code=exc.status_code,
+                content={"error": exc.detail},
+                headers={"Retry-After": "5"}
+            )
+
+        # Handler for PayloadTooLargeException (HTTP 413)
+        @app.exception_handler(PayloadTooLargeException)
+        async def payload_too_large_handler(request: Request, exc: PayloadTooLargeException):
+            """
+            Handles PayloadTooLargeException, returning a 413 JSON response.
+
+            Args:
+                request (Request): The incoming request that triggered the exception.
+                exc (PayloadTooLargeException): The exception instance with detail message.
+
+            Returns:
+                JSONResponse: A 413 response with the error detail.
+            """
+            logger.warning(f"⚠️ Payload Too Large: {str(exc)}")
+            return JSONResponse(
+                status_code=exc.status_code,
+                content={"error": exc.detail}
+            )
+
         # Generic handler for uncaught exceptions (HTTP 500)
         @app.exception_handler(Exception)
         async def general_handler(request: Request, exc: Exception):
@@ -89,24 +131,21 @@ def apply_exception_handlers(app: FastAPI):
                 content={"error": str(exc)}
             )
 
-        # Handler for WebSocketException (WebSocket 1011)
+        # Handler for WebSocketException (closes the socket with the exception's code)
         @app.exception_handler(WebSocketException)
-        async def websocket_handler(request: Request, exc: WebSocketException):
+        async def websocket_handler(websocket: WebSocket, exc: WebSocketException):
             """
-            Handles WebSocketException, returning a 1011 JSON response.
+            Handles WebSocketException by closing the WebSocket with its code and reason.
+
+            Raised before accept (e.g. by an auth dependency), the close refuses
+            the handshake.
 
             Args:
-                request (Request): The incoming request that triggered the exception.
+                websocket (WebSocket): The WebSocket that triggered the exception.
                 exc (WebSocketException): The WebSocket exception instance.
-
-            Returns:
-                JSONResponse: A 1011 response with the error message.
             """
             logger.error(f"❌ WebSocket Exception: {str(exc)}")
-            return JSONResponse(
-                status_code=status.WS_1011_INTERNAL_ERROR,
-                content={"error": "WebSocket failed"}
-            )
+            await websocket.close(code=exc.code, reason=exc.reason)
 
         logger.debug("✅ Custom exception handlers ready")  # Log successful setup
     else:
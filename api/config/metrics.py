@@ -0,0 +1,85 @@
+# api/config/metrics.py
+
+"""
+In-process metrics registry for the FastAPI application.
+Keeps labelled counters and gauges in plain dicts (no external dependency) and
+renders them in the Prometheus text exposition format for GET /v1/metrics.
+
+Values are per worker process; scrape every worker or aggregate downstream.
+"""
+
+from functools import lru_cache
+
+
+class MetricsRegistry:
+    """
+    Labelled counters and gauges.
+
+    Samples are keyed by (metric name, sorted label items) so updates are a
+    single dict operation on the hot path.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._help = {}
+
+    def describe(self, name: str, help_text: str):
+        """Registers a HELP line for `name` (optional)."""
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """Increments counter `name` with the given labels."""
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """Sets gauge `name` with the given labels."""
+        self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def get(self, name: str, **labels) -> float:
+        """Returns the current value of a counter or gauge (0 if unset)."""
+        key = (name, tuple(sorted(labels.items())))
+        return self._counters.get(key, self._gauges.get(key, 0.0))
+
+    def snapshot(self) -> dict:
+        """Returns {name: [{"labels": {...}, "value": v}, ...]} for JSON consumers."""
+        out = {}
+        for (name, labels), value in list(self._counters.items()) + list(self._gauges.items()):
+            out.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        return out
+
+    def render_prometheus(self) -> str:
+        """Renders every sample in Prometheus text format."""
+        lines = []
+        for kind, samples in (("counter", self._counters), ("gauge", self._gauges)):
+            seen = set()
+            for (name, labels), value in sorted(samples.items()):
+                if name not in seen:
+                    seen.add(name)
+                    if name in self._help:
+                        lines.append(f"# HELP {name} {_escape(self._help[name], quote=False)}")
+                    lines.append(f"# TYPE {name} {kind}")
+                label_str = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels)
+                lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        self._counters.clear()
+        self._gauges.clear()
+
+
+def _escape(text: str, quote: bool = True) -> str:
+    """Escapes a label value (or, with quote=False, a HELP text) as the Prometheus text format requires."""
+    text = text.replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if quote else text
+
+
+@lru_cache()
+def get_metrics() -> MetricsRegistry:
+    """Returns the process-wide metrics registry."""
+    return MetricsRegistry()
+
+
+# Default registry instance for the application
+metrics = get_metrics()
@@ -0,0 +1,59 @@
+# api/config/middleware/admission_middleware.py
+
+"""
+Admission-control middleware for FastAPI.
+Rate-limits and caps concurrent LLM streams on ADMISSION_HTTP_PATHS, answering
+429 with Retry-After before any work is done. Registered via middleware_loader
+when ADMISSION_ENABLED is set.
+
+Written as plain ASGI (not BaseHTTPMiddleware) so the stream slot is held for
+the whole streamed response and the body is passed through untouched.
+WebSockets are admitted per message by the /v1/ws/chat route instead.
+"""
+
+import json
+
+from fastapi import FastAPI
+
+from api.config.logging import logger
+from api.config.settings import ADMISSION_ENABLED, ADMISSION_HTTP_PATHS
+from api.services.admission_control.admission_control_service import AdmissionRejected, get_admission_controller
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, paths=ADMISSION_HTTP_PATHS, controller=None):
+        self.app = app
+        self.paths = frozenset(p for p in paths if p)
+        self.controller = controller or get_admission_controller()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        key = self.controller.client_key(scope)
+        try:
+            await self.controller.check_rate(key)
+            await self.controller.acquire_slot()
+        except AdmissionRejected as e:
+            logger.debug(f"🚦 Rejected {scope['path']} for {key}: {e.detail}")
+            body = json.dumps({"error": e.detail}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": e.status_code,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                            (b"retry-after", e.headers["Retry-After"].encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release_slot()
+
+
+def register_middleware(app: FastAPI):
+    """Registers the AdmissionMiddleware with the FastAPI app when ADMISSION_ENABLED."""
+    if ADMISSION_ENABLED:
+        app.add_middleware(AdmissionMiddleware)
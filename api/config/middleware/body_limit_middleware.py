@@ -0,0 +1,84 @@
+# api/config/middleware/body_limit_middleware.py
+
+"""
+Request body size limit for FastAPI.
+Counts HTTP body bytes as they are received and answers 413 as soon as a
+request passes its limit, so an oversized body is never buffered or parsed.
+A declared Content-Length over the limit is rejected before anything is read.
+Registered via middleware_loader unless HTTP_MAX_BODY_BYTES is 0.
+
+HTTP_MAX_BODY_BYTES applies to every path except POST /v1/uploads, which
+streams documents to disk up to UPLOAD_MAX_BYTES. WebSocket frames are
+limited by WS_MAX_FRAME_BYTES in the routes instead.
+"""
+
+import json
+
+from fastapi import FastAPI
+
+from api.config.exceptions import PayloadTooLargeException
+from api.config.logging import logger
+from api.config.settings import HTTP_MAX_BODY_BYTES, UPLOAD_MAX_BYTES
+
+PATH_LIMITS = {"/v1/uploads": UPLOAD_MAX_BYTES}
+
+
+class BodyLimitMiddleware:
+    def __init__(self, app, max_bytes: int = HTTP_MAX_BODY_BYTES, path_limits: dict = PATH_LIMITS):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.path_limits.get(scope["path"], self.max_bytes)
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            await self._reject(scope, send, limit)
+            return
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside the app's body read; FastAPI renders it as a 413
+                    raise PayloadTooLargeException(f"Request body exceeds the {limit} byte limit")
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except PayloadTooLargeException:
+            if started:
+                raise
+            await self._reject(scope, send, limit)  # The app let it escape; answer for it
+
+    @staticmethod
+    async def _reject(scope, send, limit: int):
+        logger.debug(f"📏 Rejected {scope['path']}: body over {limit} bytes")
+        body = json.dumps({"error": f"Request body exceeds the {limit} byte limit"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                        (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def register_middleware(app: FastAPI):
+    """Registers the BodyLimitMiddleware with the FastAPI app unless HTTP_MAX_BODY_BYTES is 0."""
+    if HTTP_MAX_BODY_BYTES > 0:
+        app.add_middleware(BodyLimitMiddleware)
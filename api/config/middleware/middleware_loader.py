@@ -4,34 +4,56 @@
 Dynamic middleware loader for FastAPI.
 Automatically detects and registers middleware from api/config/middleware/ folder.
 Uses ENABLED_MIDDLEWARES list to toggle; empty list enables all for zero-config.
+Middleware with a switch of its own (FLAGGED_MIDDLEWARES) follows that switch instead.
 """
 
 import os
 import importlib
 from fastapi import FastAPI
 from api.config.logging import logger
-from api.config.settings import ENABLED_MIDDLEWARES
+from api.config.settings import ADMISSION_ENABLED, ENABLED_MIDDLEWARES, HTTP_MAX_BODY_BYTES
 
-MIDDLEWARE_FOLDER = "api/config/middleware"
+MIDDLEWARE_FOLDER = os.path.dirname(os.path.abspath(__file__))  # Not cwd-relative: the app imports from anywhere
+
+# Loaded whenever their setting turns them on, whatever ENABLED_MIDDLEWARES lists
+FLAGGED_MIDDLEWARES = {
+    "admission_middleware": ADMISSION_ENABLED,
+    "body_limit_middleware": HTTP_MAX_BODY_BYTES > 0,
+}
 
 def load_custom_middlewares(app: FastAPI):
     """
     Registers all middleware from api/config/middleware/ ending in _middleware.py.
     If ENABLED_MIDDLEWARES is empty, enables all; otherwise, only listed ones.
+    Middleware in FLAGGED_MIDDLEWARES is registered when its setting is on.
     """
     enabled_set = set(ENABLED_MIDDLEWARES) if ENABLED_MIDDLEWARES else None  # None = enable all
 
-    for file in os.listdir(MIDDLEWARE_FOLDER):
+    for file in sorted(os.listdir(MIDDLEWARE_FOLDER)):
         if file.endswith("_middleware.py") and not file.startswith("__"):
             name = file[:-3]  # Remove .py
-            if enabled_set is None or name in enabled_set:  # Load all or only enabled
-                module_path = f"api.config.middleware.{name}"
-                try:
-                    module = importlib.import_module(module_path)
-                    if hasattr(module, "register_middleware"):
-                        module.register_middleware(app)
-                        logger.info(f"✅ Middleware loaded: {name}")
-                    else:
-                        logger.warning(f"⚠️ {name} has no register_middleware()")
-                except Exception as e:
-                    logger.error(f"❌ Failed to load middleware {name}: {e}")
\ No newline at end of file
+            if FLAGGED_MIDDLEWARES.get(name, enabled_set is None or name in enabled_set):  # Load all or only enabled
+                _register(app, name)
+
+
+def load_flagged_middlewares(app: FastAPI):
+    """
+    Registers only the middleware of FLAGGED_MIDDLEWARES whose setting is on (what main.py loads).
+    The rest of the folder, such as the debug template, stays off.
+    """
+    for name, enabled in FLAGGED_MIDDLEWARES.items():
+        if enabled:
+            _register(app, name)
+
+
+def _register(app: FastAPI, name: str):
+    module_path = f"api.config.middleware.{name}"
+    try:
+        module = importlib.import_module(module_path)
+        if hasattr(module, "register_middleware"):
+            module.register_middleware(app)
+            logger.info(f"✅ Middleware loaded: {name}")
+        else:
+            logger.warning(f"⚠️ {name} has no register_middleware()")
+    except Exception as e:
+        logger.error(f"❌ Failed to load middleware {name}: {e}")
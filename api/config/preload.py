@@ -0,0 +1,193 @@
+# api/config/preload.py
+
+"""
+Pre-fork preloading for multi-worker deployments.
+Warms the application once in the master process (heavy imports, compiled
+LangGraph workflows, the AI services registry and tokenizer tables), freezes
+the warmed heap with gc.freeze() and then forks WORKERS children that all
+serve from one inherited listening socket.
+
+Because the children are forked (not spawned), everything loaded in the master
+stays in shared copy-on-write pages. gc.freeze() moves those objects into the
+permanent generation so the collector never touches (and dirties) them.
+
+Togglable via PRELOAD_APP in settings.py; POSIX only (falls back to uvicorn workers).
+"""
+
+import gc
+import os
+import signal
+import socket
+import time
+from fastapi import FastAPI
+from api.config.logging import logger
+from api.config.settings import (
+    PRELOAD_GC_FREEZE, PRELOAD_TOKENIZERS, DRAIN_TIMEOUT, DRAIN_HANDOFF_GRACE, WS_PER_MESSAGE_DEFLATE
+)
+
+
+# ─────────────────────────────────────────────────────────────
+# 🔥 Warmup
+# Everything initialized here is inherited by every worker.
+# ─────────────────────────────────────────────────────────────
+
+def preload_supported() -> bool:
+    """Returns True when the platform can fork workers (POSIX only)."""
+    return hasattr(os, "fork")
+
+
+def load_tokenizers(encodings: list = None) -> dict:
+    """
+    Loads tiktoken encodings so their BPE rank tables live in the master heap.
+
+    Args:
+        encodings (list, optional): Encoding names. Defaults to PRELOAD_TOKENIZERS.
+
+    Returns:
+        dict: Encoding name -> loaded tiktoken.Encoding (missing ones are skipped).
+    """
+    loaded = {}
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("⚠️ tiktoken not installed, skipping tokenizer preload")
+        return loaded
+
+    for name in encodings if encodings is not None else PRELOAD_TOKENIZERS:
+        try:
+            loaded[name] = tiktoken.get_encoding(name)
+        except Exception as e:  # Offline hosts cannot download the BPE files
+            logger.warning(f"⚠️ Tokenizer {name} not preloaded: {e}")
+    return loaded
+
+
+def warm_up(app: FastAPI) -> FastAPI:
+    """
+    Initializes shared, read-mostly state before workers are forked.
+
+    Importing the app has already pulled in LangChain and compiled the service
+    graphs (route modules are imported by register_v1_routes). This adds the
+    AI services registry and tokenizer tables, then freezes the heap.
+
+    Args:
+        app (FastAPI): The fully constructed application.
+
+    Returns:
+        FastAPI: The same app, ready to be served by forked workers.
+    """
+    started = time.perf_counter()
+    gc.disable()  # Avoid collections that would touch objects we are about to freeze
+    try:
+        from api.config.ai_services import get_ai_services
+        services = get_ai_services()
+        tokenizers = load_tokenizers()
+
+        gc.collect()  # Drop import-time garbage so it is not frozen into the shared heap
+        if PRELOAD_GC_FREEZE:
+            gc.freeze()
+    finally:
+        gc.enable()  # Also when warming fails: the master and every worker forked from it need the collector
+
+    logger.info(
+        f"🔥 Preloaded app in {(time.perf_counter() - started) * 1000:.1f} ms "
+        f"(registry categories={len(services)}, tokenizers={list(tokenizers)}, "
+        f"frozen objects={gc.get_freeze_count()})"
+    )
+    return app
+
+
+# ─────────────────────────────────────────────────────────────
+# 🍴 Pre-fork Supervisor
+# Binds once, forks N workers, forwards signals, respawns crashes.
+# ─────────────────────────────────────────────────────────────
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    """Creates the shared listening socket inherited by all workers."""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _serve_worker(app: FastAPI, sock: socket.socket, host: str, port: int):
+    """Runs one uvicorn server inside a forked child. Never returns."""
+    import uvicorn
+    from api.config.drain import DrainingServer
+
+    # Drop the master's forwarding handlers; uvicorn installs its own in the child
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    exit_code = 0
+    try:
+        config = uvicorn.Config(app, host=host, port=port, lifespan="on",
+                                timeout_graceful_shutdown=int(DRAIN_TIMEOUT + DRAIN_HANDOFF_GRACE) + 1,
+                                ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE)
+        DrainingServer(config).run(sockets=[sock])
+    except BaseException:
+        logger.exception(f"🔥 Worker {os.getpid()} crashed")
+        exit_code = 1
+    finally:
+        os._exit(exit_code)
+
+
+def run_prefork(app: FastAPI, host: str, port: int, workers: int):
+    """
+    Serves `app` from `workers` forked processes sharing one preloaded heap.
+
+    Args:
+        app (FastAPI): The application instance (already imported in the master).
+        host (str): Bind host.
+        port (int): Bind port.
+        workers (int): Number of worker processes to fork.
+
+    Notes:
+        - SIGINT/SIGTERM on the master are forwarded to all workers, which
+          shut down gracefully through the normal lifespan.
+        - Workers that exit unexpectedly are respawned from the same warm master.
+    """
+    warm_up(app)
+    sock = _bind_socket(host, port)
+    children = {}
+    stopping = False
+
+    def spawn(slot: int):
+        pid = os.fork()
+        if pid == 0:
+            _serve_worker(app, sock, host, port)
+        children[pid] = slot
+        logger.info(f"🍴 Forked worker {slot} (pid={pid})")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for slot in range(workers):
+        spawn(slot)
+
+    logger.info(f"🚀 Pre-fork master {os.getpid()} serving on {host}:{port} with {workers} workers")
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot = children.pop(pid, None)
+        if slot is None:
+            continue
+        if not stopping:
+            logger.warning(f"⚠️ Worker {slot} (pid={pid}) exited with status {status}, respawning")
+            time.sleep(1)  # Avoid a hot crash loop
+            spawn(slot)
+
+    sock.close()
+    logger.info("👋 Pre-fork master stopped")
@@ -59,6 +59,21 @@ WORKERS = int(os.getenv("WORKERS", str(WORKERS)))
 DEBUG = False
 DEBUG = os.getenv("DEBUG", str(DEBUG)).lower() == "true"
 
+# ----------------------------------------------------------------------------
+# Pre-fork Preload Configuration (for preload.py)
+# ----------------------------------------------------------------------------
+# When WORKERS > 1, warm the app once in the master and fork workers from it
+# so imports, compiled graphs and tokenizer tables stay shared copy-on-write.
+
+PRELOAD_APP = False
+PRELOAD_APP = os.getenv("PRELOAD_APP", str(PRELOAD_APP)).lower() == "true"
+
+PRELOAD_GC_FREEZE = True  # gc.freeze() the warmed heap before forking
+PRELOAD_GC_FREEZE = os.getenv("PRELOAD_GC_FREEZE", str(PRELOAD_GC_FREEZE)).lower() == "true"
+
+PRELOAD_TOKENIZERS = ["o200k_base", "cl100k_base"]  # tiktoken encodings to load pre-fork
+PRELOAD_TOKENIZERS = [t for t in os.getenv("PRELOAD_TOKENIZERS", ",".join(PRELOAD_TOKENIZERS)).split(",") if t]
+
 # ----------------------------------------------------------------------------
 # Logging Configuration (for logging.py)
 # ----------------------------------------------------------------------------
@@ -97,7 +112,8 @@ ENABLE_WEBTRANSPORT_DETECTION = True
 ENABLE_WEBTRANSPORT_DETECTION = os.getenv("ENABLE_WEBTRANSPORT_DETECTION", str(ENABLE_WEBTRANSPORT_DETECTION)).lower() == "true"
 
 ENABLED_MIDDLEWARES = []  # Empty = enable all middleware in api/config/middleware/
-ENABLED_MIDDLEWARES = os.getenv("ENABLED_MIDDLEWARES", ",".join(ENABLED_MIDDLEWARES)).split(",")
+ENABLED_MIDDLEWARES = [m for m in os.getenv("ENABLED_MIDDLEWARES", ",".join(ENABLED_MIDDLEWARES)).split(",") if m]
+# admission_middleware and body_limit_middleware follow their own switches (ADMISSION_ENABLED, HTTP_MAX_BODY_BYTES)
 
 # ----------------------------------------------------------------------------
 # API Documentation Configuration (for loaders.py)
@@ -156,6 +172,414 @@ SELECTED_AI_PROVIDER = os.getenv("SELECTED_AI_PROVIDER", SELECTED_AI_PROVIDER)
 SELECTED_AI_MODEL = None  # None = all models; set to "gpt-4o" to limit
 SELECTED_AI_MODEL = os.getenv("SELECTED_AI_MODEL", SELECTED_AI_MODEL)
 
+# Self-hosted / extra endpoints per model, routed by llm_routing_service.py.
+# Format: {"model_name": [{"url": "http://node-1:8000/v1", "engine": "vllm", "weight": 2}, ...]}
+# Optional per endpoint: "name", "api_key", "api_key_env", "remote_model" (model id sent upstream).
+AI_ENDPOINTS = {}
+AI_ENDPOINTS_ENV = os.getenv("AI_ENDPOINTS", None)
+if AI_ENDPOINTS_ENV:
+    import json
+    AI_ENDPOINTS = json.loads(AI_ENDPOINTS_ENV)
+
+# ----------------------------------------------------------------------------
+# LLM Routing Configuration (for llm_routing_service.py)
+# ----------------------------------------------------------------------------
+# Connection pooling and health-based ejection for routed LLM endpoints.
+
+ROUTING_MAX_CONNECTIONS = 100  # Per-endpoint connection pool size
+ROUTING_MAX_CONNECTIONS = int(os.getenv("ROUTING_MAX_CONNECTIONS", str(ROUTING_MAX_CONNECTIONS)))
+
+ROUTING_MAX_KEEPALIVE = 20  # Idle keep-alive connections kept per endpoint
+ROUTING_MAX_KEEPALIVE = int(os.getenv("ROUTING_MAX_KEEPALIVE", str(ROUTING_MAX_KEEPALIVE)))
+
+ROUTING_REQUEST_TIMEOUT = 120.0  # Seconds for a whole upstream request
+ROUTING_REQUEST_TIMEOUT = float(os.getenv("ROUTING_REQUEST_TIMEOUT", str(ROUTING_REQUEST_TIMEOUT)))
+
+ROUTING_EJECT_AFTER_FAILURES = 3  # Consecutive failures before an endpoint is ejected
+ROUTING_EJECT_AFTER_FAILURES = int(os.getenv("ROUTING_EJECT_AFTER_FAILURES", str(ROUTING_EJECT_AFTER_FAILURES)))
+
+ROUTING_EJECT_SECONDS = 30.0  # How long an ejected endpoint sits out before a trial request
+ROUTING_EJECT_SECONDS = float(os.getenv("ROUTING_EJECT_SECONDS", str(ROUTING_EJECT_SECONDS)))
+
+ROUTING_HEALTH_CHECK_INTERVAL = 10.0  # Seconds between active health probes; 0 disables
+ROUTING_HEALTH_CHECK_INTERVAL = float(os.getenv("ROUTING_HEALTH_CHECK_INTERVAL", str(ROUTING_HEALTH_CHECK_INTERVAL)))
+
+ROUTING_POLICY = "weighted"  # "weighted" (round-robin by weight) or "latency" (prefer lowest TTFT)
+ROUTING_POLICY = os.getenv("ROUTING_POLICY", ROUTING_POLICY)
+
+ROUTING_LATENCY_WINDOW = 200  # Rolling TTFT samples kept per endpoint
+ROUTING_LATENCY_WINDOW = int(os.getenv("ROUTING_LATENCY_WINDOW", str(ROUTING_LATENCY_WINDOW)))
+
+ROUTING_STATS_TTL = 30.0  # Seconds after which an unused endpoint's latency stats are re-explored
+ROUTING_STATS_TTL = float(os.getenv("ROUTING_STATS_TTL", str(ROUTING_STATS_TTL)))
+
+ROUTING_HEDGE_ENABLED = False  # Fire a duplicate request at a second endpoint if the first is slow
+ROUTING_HEDGE_ENABLED = os.getenv("ROUTING_HEDGE_ENABLED", str(ROUTING_HEDGE_ENABLED)).lower() == "true"
+
+ROUTING_HEDGE_PERCENTILE = 95.0  # TTFT percentile of the primary endpoint used as hedge deadline
+ROUTING_HEDGE_PERCENTILE = float(os.getenv("ROUTING_HEDGE_PERCENTILE", str(ROUTING_HEDGE_PERCENTILE)))
+
+ROUTING_HEDGE_MIN_DELAY = 0.05  # Lower bound for the hedge deadline (seconds)
+ROUTING_HEDGE_MIN_DELAY = float(os.getenv("ROUTING_HEDGE_MIN_DELAY", str(ROUTING_HEDGE_MIN_DELAY)))
+
+ROUTING_HEDGE_DEFAULT_DELAY = 2.0  # Hedge deadline until an endpoint has enough TTFT samples
+ROUTING_HEDGE_DEFAULT_DELAY = float(os.getenv("ROUTING_HEDGE_DEFAULT_DELAY", str(ROUTING_HEDGE_DEFAULT_DELAY)))
+
+# ----------------------------------------------------------------------------
+# LLM Resilience Configuration (for llm_resilience_service.py)
+# ----------------------------------------------------------------------------
+# Circuit breakers reuse ROUTING_EJECT_AFTER_FAILURES / ROUTING_EJECT_SECONDS as
+# their failure threshold and open duration.
+
+LLM_CONNECT_TIMEOUT = 5.0  # Seconds to establish a connection to an endpoint
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", str(LLM_CONNECT_TIMEOUT)))
+
+LLM_FIRST_TOKEN_TIMEOUT = 30.0  # Seconds an attempt may take to produce its first chunk
+LLM_FIRST_TOKEN_TIMEOUT = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", str(LLM_FIRST_TOKEN_TIMEOUT)))
+
+LLM_MAX_RETRIES = 2  # Retries per model before the first token (failover counts as a retry)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", str(LLM_MAX_RETRIES)))
+
+LLM_RETRY_BASE_DELAY = 0.1  # Base of the full-jitter exponential backoff (seconds)
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", str(LLM_RETRY_BASE_DELAY)))
+
+LLM_RETRY_MAX_DELAY = 2.0  # Cap of the backoff (seconds)
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", str(LLM_RETRY_MAX_DELAY)))
+
+LLM_RETRY_BUDGET_RATIO = 0.2  # Retries (and hedges) allowed per original request, process-wide
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", str(LLM_RETRY_BUDGET_RATIO)))
+
+LLM_RETRY_BUDGET_MIN_PER_SECOND = 1.0  # Retries always allowed per second regardless of traffic
+LLM_RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("LLM_RETRY_BUDGET_MIN_PER_SECOND", str(LLM_RETRY_BUDGET_MIN_PER_SECOND)))
+
+# Ordered fallback models per model, e.g. '{"gpt-4o": ["claude-3-5-sonnet", "llama-3"]}'
+LLM_FALLBACK_MODELS = {}
+LLM_FALLBACK_MODELS_ENV = os.getenv("LLM_FALLBACK_MODELS", None)
+if LLM_FALLBACK_MODELS_ENV:
+    import json
+    LLM_FALLBACK_MODELS = json.loads(LLM_FALLBACK_MODELS_ENV)
+
+# ----------------------------------------------------------------------------
+# Admission Control Configuration (for admission_control_service.py)
+# ----------------------------------------------------------------------------
+# Per-tenant token buckets (keyed by API key, else client IP) and a per-worker
+# cap on concurrent LLM streams. HTTP is enforced by admission_middleware.py
+# (loaded whenever ADMISSION_ENABLED is set), WebSockets by the /v1/ws routes.
+
+ADMISSION_ENABLED = False  # Master switch for rate limiting and stream admission
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", str(ADMISSION_ENABLED)).lower() == "true"
+
+ADMISSION_RATE_PER_MINUTE = 60.0  # Sustained LLM requests per tenant per minute
+ADMISSION_RATE_PER_MINUTE = float(os.getenv("ADMISSION_RATE_PER_MINUTE", str(ADMISSION_RATE_PER_MINUTE)))
+
+ADMISSION_BURST = 20.0  # Bucket size: requests a tenant may send back-to-back
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", str(ADMISSION_BURST)))
+
+ADMISSION_MAX_STREAMS = 200  # Concurrent LLM streams per worker
+ADMISSION_MAX_STREAMS = int(os.getenv("ADMISSION_MAX_STREAMS", str(ADMISSION_MAX_STREAMS)))
+
+ADMISSION_MAX_QUEUE = 100  # Requests allowed to wait for a stream slot; beyond this they are rejected at once
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", str(ADMISSION_MAX_QUEUE)))
+
+ADMISSION_QUEUE_TIMEOUT = 5.0  # Seconds a queued request waits for a slot before rejection
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", str(ADMISSION_QUEUE_TIMEOUT)))
+
+ADMISSION_STORE = "memory"  # "memory" (per worker) or "sqlite" (buckets shared by all workers on the host)
+ADMISSION_STORE = os.getenv("ADMISSION_STORE", ADMISSION_STORE)
+
+ADMISSION_STORE_PATH = "/tmp/fastapi_admission.sqlite"  # SQLite file used when ADMISSION_STORE="sqlite"
+ADMISSION_STORE_PATH = os.getenv("ADMISSION_STORE_PATH", ADMISSION_STORE_PATH)
+
+ADMISSION_HTTP_PATHS = ["/v1/chat-window"]  # HTTP paths the middleware guards
+ADMISSION_HTTP_PATHS = os.getenv("ADMISSION_HTTP_PATHS", ",".join(ADMISSION_HTTP_PATHS)).split(",")
+
+# ----------------------------------------------------------------------------
+# Graceful Drain Configuration (for drain.py and stream_handoff_service.py)
+# ----------------------------------------------------------------------------
+# On shutdown, in-flight streams get DRAIN_TIMEOUT seconds to finish; the rest
+# are interrupted and WebSocket clients receive a resume token. Conversation
+# state is flushed to a local SQLite file that any worker on the host can read.
+
+DRAIN_TIMEOUT = 30.0  # Seconds in-flight streams may keep running after SIGTERM
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", str(DRAIN_TIMEOUT)))
+
+DRAIN_HANDOFF_GRACE = 2.0  # Seconds interrupted streams get to send their resume token
+DRAIN_HANDOFF_GRACE = float(os.getenv("DRAIN_HANDOFF_GRACE", str(DRAIN_HANDOFF_GRACE)))
+
+DRAIN_HANDOFF_PATH = "/tmp/fastapi_handoff.sqlite"  # Conversation handoff store shared by local workers
+DRAIN_HANDOFF_PATH = os.getenv("DRAIN_HANDOFF_PATH", DRAIN_HANDOFF_PATH)
+
+DRAIN_RESUME_SECRET = os.getenv("DRAIN_RESUME_SECRET", None)  # HMAC key for resume tokens; generated per host if unset
+
+DRAIN_RESUME_TTL = 600.0  # Seconds a resume token and its handed-off conversation stay valid
+DRAIN_RESUME_TTL = float(os.getenv("DRAIN_RESUME_TTL", str(DRAIN_RESUME_TTL)))
+
+DRAIN_METRICS_PATH = os.getenv("DRAIN_METRICS_PATH", None)  # Optional JSON dump of final metrics, e.g. /tmp/metrics-{pid}.json
+
+# ----------------------------------------------------------------------------
+# Stream Replay Configuration (for stream_replay_service.py)
+# ----------------------------------------------------------------------------
+# Every WebSocket reply gets a stream id and a bounded in-memory replay buffer,
+# so a client that drops mid-answer can reconnect to the same worker with
+# (stream_id, last_offset) instead of regenerating the answer.
+
+STREAM_REPLAY_TTL = 120.0  # Seconds a finished stream stays replayable
+STREAM_REPLAY_TTL = float(os.getenv("STREAM_REPLAY_TTL", str(STREAM_REPLAY_TTL)))
+
+STREAM_REPLAY_MAX_CHUNKS = 4096  # Chunks kept per stream; older ones are dropped
+STREAM_REPLAY_MAX_CHUNKS = int(os.getenv("STREAM_REPLAY_MAX_CHUNKS", str(STREAM_REPLAY_MAX_CHUNKS)))
+
+STREAM_REPLAY_MAX_STREAMS = 1000  # Replay buffers kept per worker; oldest finished ones are evicted
+STREAM_REPLAY_MAX_STREAMS = int(os.getenv("STREAM_REPLAY_MAX_STREAMS", str(STREAM_REPLAY_MAX_STREAMS)))
+
+# ----------------------------------------------------------------------------
+# WebSocket Multiplexing Configuration (for ws_multiplex_service.py)
+# ----------------------------------------------------------------------------
+# /v1/ws/mux carries many conversations over one connection. Each request runs
+# as its own generation task; outgoing chunks are interleaved round-robin.
+
+WS_MUX_MAX_INFLIGHT = 8  # Concurrent generations per connection
+WS_MUX_MAX_INFLIGHT = int(os.getenv("WS_MUX_MAX_INFLIGHT", str(WS_MUX_MAX_INFLIGHT)))
+
+WS_MUX_MAX_CONVERSATIONS = 32  # Conversations bound per connection; idle ones are evicted first
+WS_MUX_MAX_CONVERSATIONS = int(os.getenv("WS_MUX_MAX_CONVERSATIONS", str(WS_MUX_MAX_CONVERSATIONS)))
+
+WS_MUX_QUEUE_SIZE = 64  # Outgoing frames buffered per request before its generation waits for the socket
+WS_MUX_QUEUE_SIZE = int(os.getenv("WS_MUX_QUEUE_SIZE", str(WS_MUX_QUEUE_SIZE)))
+
+# ----------------------------------------------------------------------------
+# WebSocket Frame Encoding Configuration (for ws_codec_service.py)
+# ----------------------------------------------------------------------------
+# JSON text frames stay the default. Clients may negotiate a binary encoding
+# with short field ids through Sec-WebSocket-Protocol: "chat.msgpack.v1"
+# (needs ormsgpack) or "chat.cbor.v1" (needs cbor2).
+
+WS_BINARY_FRAMES_ENABLED = True  # Accept the binary subprotocols when a client offers them
+WS_BINARY_FRAMES_ENABLED = os.getenv("WS_BINARY_FRAMES_ENABLED", str(WS_BINARY_FRAMES_ENABLED)).lower() == "true"
+
+WS_PER_MESSAGE_DEFLATE = True  # permessage-deflate for every WebSocket (uvicorn default); see ws_codec_notes.md
+WS_PER_MESSAGE_DEFLATE = os.getenv("WS_PER_MESSAGE_DEFLATE", str(WS_PER_MESSAGE_DEFLATE)).lower() == "true"
+
+WS_MAX_FRAME_BYTES = 65536  # Inbound frames above this are rejected (close 4400) before they are parsed
+WS_MAX_FRAME_BYTES = int(os.getenv("WS_MAX_FRAME_BYTES", str(WS_MAX_FRAME_BYTES)))
+
+# ----------------------------------------------------------------------------
+# Request Size Limits & Uploads Configuration (for body_limit_middleware.py and upload_store_service.py)
+# ----------------------------------------------------------------------------
+# HTTP bodies are counted while they are read and cut off with 413 once over
+# the limit. Documents larger than that go through POST /v1/uploads, which
+# streams them to disk; chat requests then reference them by upload id.
+
+HTTP_MAX_BODY_BYTES = 1048576  # Largest HTTP request body (1 MiB), 0 = no limit; WebSockets use WS_MAX_FRAME_BYTES
+HTTP_MAX_BODY_BYTES = int(os.getenv("HTTP_MAX_BODY_BYTES", str(HTTP_MAX_BODY_BYTES)))
+
+UPLOAD_MAX_BYTES = 67108864  # Largest single upload to /v1/uploads (64 MiB)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(UPLOAD_MAX_BYTES)))
+
+UPLOAD_MAX_TOTAL_BYTES = 1073741824  # Disk budget for all live uploads on the host (1 GiB)
+UPLOAD_MAX_TOTAL_BYTES = int(os.getenv("UPLOAD_MAX_TOTAL_BYTES", str(UPLOAD_MAX_TOTAL_BYTES)))
+
+UPLOAD_TTL = 3600.0  # Seconds an upload stays referenceable after it was written
+UPLOAD_TTL = float(os.getenv("UPLOAD_TTL", str(UPLOAD_TTL)))
+
+UPLOAD_DIR = "/tmp/fastapi_uploads"  # Shared by the workers of a host, so any worker can read an upload
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", UPLOAD_DIR)
+
+# ----------------------------------------------------------------------------
+# Prompt Assembly Configuration (for prompt_assembly_service.py)
+# ----------------------------------------------------------------------------
+# Requests are assembled with one copy of each system prompt first and the
+# turns after it, so the prefix is byte-identical across turns and across
+# conversations sharing a prompt. Engines that support it get prompt-cache
+# hints (see ENGINE_PROFILES in llm_routing_service.py).
+
+PROMPT_CACHE_HINTS = True  # Send cache hints (prompt_cache_key / cache_control / cache_prompt) per engine
+PROMPT_CACHE_HINTS = os.getenv("PROMPT_CACHE_HINTS", str(PROMPT_CACHE_HINTS)).lower() == "true"
+
+PROMPT_CACHE_MIN_TOKENS = 1024  # Smallest prefix (estimated tokens) worth a cache_control breakpoint
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", str(PROMPT_CACHE_MIN_TOKENS)))
+
+# ----------------------------------------------------------------------------
+# Conversation Cold Tier Configuration (for cold_tier_service.py)
+# ----------------------------------------------------------------------------
+# Conversations idle longer than COLD_TIER_IDLE_SECONDS are serialized,
+# compressed and dropped from the LangGraph MemorySaver (with their checkpoint
+# history). The next request for the conversation rehydrates it transparently.
+
+COLD_TIER_ENABLED = True  # Move idle conversations out of resident memory
+COLD_TIER_ENABLED = os.getenv("COLD_TIER_ENABLED", str(COLD_TIER_ENABLED)).lower() == "true"
+
+COLD_TIER_IDLE_SECONDS = 300.0  # Seconds without use before a conversation goes cold
+COLD_TIER_IDLE_SECONDS = float(os.getenv("COLD_TIER_IDLE_SECONDS", str(COLD_TIER_IDLE_SECONDS)))
+
+COLD_TIER_SWEEP_INTERVAL = 30.0  # Seconds between two background sweeps for idle conversations
+COLD_TIER_SWEEP_INTERVAL = float(os.getenv("COLD_TIER_SWEEP_INTERVAL", str(COLD_TIER_SWEEP_INTERVAL)))
+
+COLD_TIER_CODEC = "zstd"  # "zstd" (needs zstandard; falls back to zlib) or "zlib"
+COLD_TIER_CODEC = os.getenv("COLD_TIER_CODEC", COLD_TIER_CODEC)
+
+COLD_TIER_LEVEL = 3  # Compression level
+COLD_TIER_LEVEL = int(os.getenv("COLD_TIER_LEVEL", str(COLD_TIER_LEVEL)))
+
+COLD_TIER_DICTIONARY = os.getenv("COLD_TIER_DICTIONARY", None)  # Optional shared dictionary file (see bench_cold_tier.py)
+
+COLD_TIER_DIR = os.getenv("COLD_TIER_DIR", None)  # Keep cold conversations on disk here; in memory if unset
+
+# ----------------------------------------------------------------------------
+# Session Authentication Configuration (for session_auth_service.py)
+# ----------------------------------------------------------------------------
+# Chat endpoints accept NextAuth session tokens (database sessions) and check
+# them against the Session table of the Next.js app's Prisma SQLite database,
+# through a read-only connection pool and a short-lived in-process cache.
+
+AUTH_ENABLED = False  # Require a valid session token on /v1/chat-window, /v1/ws/chat and /v1/ws/mux
+AUTH_ENABLED = os.getenv("AUTH_ENABLED", str(AUTH_ENABLED)).lower() == "true"
+
+AUTH_DB_PATH = "prisma/app_db.sqlite"  # Prisma SQLite database holding User and Session
+AUTH_DB_PATH = os.getenv("AUTH_DB_PATH", AUTH_DB_PATH)
+
+AUTH_DB_POOL_SIZE = 4  # Read-only connections kept open
+AUTH_DB_POOL_SIZE = int(os.getenv("AUTH_DB_POOL_SIZE", str(AUTH_DB_POOL_SIZE)))
+
+AUTH_CACHE_TTL = 30.0  # Seconds a validated token is trusted without asking the database (bounds sign-out delay)
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", str(AUTH_CACHE_TTL)))
+
+AUTH_NEGATIVE_CACHE_TTL = 5.0  # Seconds an unknown or expired token is rejected without asking the database
+AUTH_NEGATIVE_CACHE_TTL = float(os.getenv("AUTH_NEGATIVE_CACHE_TTL", str(AUTH_NEGATIVE_CACHE_TTL)))
+
+AUTH_CACHE_SIZE = 10000  # Tokens cached per worker; least recently used are evicted
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", str(AUTH_CACHE_SIZE)))
+
+# ----------------------------------------------------------------------------
+# Conversation Persistence Configuration (for conversation_persistence_service.py)
+# ----------------------------------------------------------------------------
+# Completed turns of signed-in users are written behind the stream into the
+# Prisma Conversation table: queued in memory, then upserted in batches.
+
+PERSIST_ENABLED = True  # Persist turns of signed-in users (needs AUTH_ENABLED to know the user)
+PERSIST_ENABLED = os.getenv("PERSIST_ENABLED", str(PERSIST_ENABLED)).lower() == "true"
+
+PERSIST_DB_PATH = AUTH_DB_PATH  # Prisma SQLite database holding the Conversation table
+PERSIST_DB_PATH = os.getenv("PERSIST_DB_PATH", PERSIST_DB_PATH)
+
+PERSIST_QUEUE_SIZE = 10000  # Turns waiting to be written; further turns are dropped (and counted) while full
+PERSIST_QUEUE_SIZE = int(os.getenv("PERSIST_QUEUE_SIZE", str(PERSIST_QUEUE_SIZE)))
+
+PERSIST_BATCH_SIZE = 500  # Turns written per transaction
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", str(PERSIST_BATCH_SIZE)))
+
+PERSIST_FLUSH_INTERVAL = 1.0  # Seconds a turn may wait for a fuller batch
+PERSIST_FLUSH_INTERVAL = float(os.getenv("PERSIST_FLUSH_INTERVAL", str(PERSIST_FLUSH_INTERVAL)))
+
+# ----------------------------------------------------------------------------
+# Preset Catalog Configuration (for preset_catalog_service.py)
+# ----------------------------------------------------------------------------
+# Requests may name a `preset` instead of sending prompt and sampling values.
+# Presets, models and providers are read from the Prisma database into an
+# in-memory snapshot, reloaded only when the database has changed.
+
+PRESET_DB_PATH = AUTH_DB_PATH  # Prisma SQLite database holding preset, Model and AIProvider
+PRESET_DB_PATH = os.getenv("PRESET_DB_PATH", PRESET_DB_PATH)
+
+PRESET_REFRESH_INTERVAL = 30.0  # Seconds between change checks (PRAGMA data_version); 0 disables polling
+PRESET_REFRESH_INTERVAL = float(os.getenv("PRESET_REFRESH_INTERVAL", str(PRESET_REFRESH_INTERVAL)))
+
+# ----------------------------------------------------------------------------
+# Usage Accounting Configuration (for usage_accounting_service.py)
+# ----------------------------------------------------------------------------
+# Tokens and cost of every LLM request, counted per user, conversation and
+# model in per-worker counters and periodically added to a local SQLite store.
+# Prices come from Model.inputCost / cachedInputCost / outputCost.
+
+USAGE_ENABLED = True  # Count tokens and cost of every request
+USAGE_ENABLED = os.getenv("USAGE_ENABLED", str(USAGE_ENABLED)).lower() == "true"
+
+USAGE_DB_PATH = "usage_ledger.sqlite"  # Local store the counters are flushed into (created if missing)
+USAGE_DB_PATH = os.getenv("USAGE_DB_PATH", USAGE_DB_PATH)
+
+USAGE_FLUSH_INTERVAL = 10.0  # Seconds between flushes of the per-worker counters
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", str(USAGE_FLUSH_INTERVAL)))
+
+USAGE_TOKENIZER = "o200k_base"  # tiktoken encoding for estimates when a backend reports no usage; "" = chars / 4
+USAGE_TOKENIZER = os.getenv("USAGE_TOKENIZER", USAGE_TOKENIZER)
+
+# ----------------------------------------------------------------------------
+# Usage Quota Configuration (for usage_quota_service.py)
+# ----------------------------------------------------------------------------
+# Daily token and dollar budgets per user and per Group (UTC days), checked
+# before a stream starts and on every chunk against the usage counters.
+# 0 means no limit. Past the soft ratio a warning is logged; past the hard
+# limit new requests get 429 / close code 4429 and running streams are cut.
+
+QUOTA_ENABLED = True  # Enforce the budgets below for signed-in users
+QUOTA_ENABLED = os.getenv("QUOTA_ENABLED", str(QUOTA_ENABLED)).lower() == "true"
+
+QUOTA_USER_DAILY_TOKENS = 0  # Input plus output tokens per user and day
+QUOTA_USER_DAILY_TOKENS = int(os.getenv("QUOTA_USER_DAILY_TOKENS", str(QUOTA_USER_DAILY_TOKENS)))
+
+QUOTA_USER_DAILY_USD = 0.0  # Dollars per user and day, at the Model table prices
+QUOTA_USER_DAILY_USD = float(os.getenv("QUOTA_USER_DAILY_USD", str(QUOTA_USER_DAILY_USD)))
+
+QUOTA_GROUP_DAILY_TOKENS = 0  # Tokens per Group and day, summed over its members
+QUOTA_GROUP_DAILY_TOKENS = int(os.getenv("QUOTA_GROUP_DAILY_TOKENS", str(QUOTA_GROUP_DAILY_TOKENS)))
+
+QUOTA_GROUP_DAILY_USD = 0.0  # Dollars per Group and day
+QUOTA_GROUP_DAILY_USD = float(os.getenv("QUOTA_GROUP_DAILY_USD", str(QUOTA_GROUP_DAILY_USD)))
+
+QUOTA_SOFT_RATIO = 0.8  # Share of a hard limit at which the soft quota warns
+QUOTA_SOFT_RATIO = float(os.getenv("QUOTA_SOFT_RATIO", str(QUOTA_SOFT_RATIO)))
+
+QUOTA_EXEMPT_ROLES = ["ADMIN"]  # User.role values without quotas
+QUOTA_EXEMPT_ROLES = [r for r in os.getenv("QUOTA_EXEMPT_ROLES", ",".join(QUOTA_EXEMPT_ROLES)).split(",") if r]
+
+QUOTA_DB_PATH = AUTH_DB_PATH  # Prisma SQLite database holding User and GroupUser
+QUOTA_DB_PATH = os.getenv("QUOTA_DB_PATH", QUOTA_DB_PATH)
+
+QUOTA_REFRESH_INTERVAL = 30.0  # Seconds between reloads of group memberships and exempt users
+QUOTA_REFRESH_INTERVAL = float(os.getenv("QUOTA_REFRESH_INTERVAL", str(QUOTA_REFRESH_INTERVAL)))
+
+# ----------------------------------------------------------------------------
+# Prompt Template Configuration (for prompt_template_service.py)
+# ----------------------------------------------------------------------------
+# Prompt templates are parsed once into segments and cached by the SHA-256 of
+# their text; rendering joins precomputed parts.
+
+PROMPT_TEMPLATE_CACHE_SIZE = 256  # Compiled templates kept (LRU); 0 parses on every use
+PROMPT_TEMPLATE_CACHE_SIZE = int(os.getenv("PROMPT_TEMPLATE_CACHE_SIZE", str(PROMPT_TEMPLATE_CACHE_SIZE)))
+
+# ----------------------------------------------------------------------------
+# Structured Output Configuration (for structured_output_service.py)
+# ----------------------------------------------------------------------------
+# Chat requests with a response_schema have their reply validated against it
+# while it streams; the stream is cut as soon as the reply cannot match.
+
+STRUCTURED_SCHEMA_MAX_BYTES = 65536  # Largest response_schema accepted (canonical JSON)
+STRUCTURED_SCHEMA_MAX_BYTES = int(os.getenv("STRUCTURED_SCHEMA_MAX_BYTES", str(STRUCTURED_SCHEMA_MAX_BYTES)))
+
+STRUCTURED_SCHEMA_CACHE_SIZE = 128  # Compiled schemas kept (LRU, keyed by canonical JSON)
+STRUCTURED_SCHEMA_CACHE_SIZE = int(os.getenv("STRUCTURED_SCHEMA_CACHE_SIZE", str(STRUCTURED_SCHEMA_CACHE_SIZE)))
+
+# ----------------------------------------------------------------------------
+# Tool Execution Configuration (for tool_execution_service.py)
+# ----------------------------------------------------------------------------
+# The tool calls of one model turn run concurrently: I/O tools on the event
+# loop, CPU tools in a bounded process pool. Results are cached by arguments.
+
+TOOL_CALL_TIMEOUT = 30.0  # Seconds a tool call may run unless the tool sets its own timeout
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", str(TOOL_CALL_TIMEOUT)))
+
+TOOL_PROCESS_POOL_SIZE = 2  # Worker processes for CPU-bound tools, started on first use
+TOOL_PROCESS_POOL_SIZE = int(os.getenv("TOOL_PROCESS_POOL_SIZE", str(TOOL_PROCESS_POOL_SIZE)))
+
+TOOL_RESULT_CACHE_SIZE = 1024  # Tool results kept, keyed by tool name and arguments (LRU); 0 disables
+TOOL_RESULT_CACHE_SIZE = int(os.getenv("TOOL_RESULT_CACHE_SIZE", str(TOOL_RESULT_CACHE_SIZE)))
+
+TOOL_RESULT_CACHE_TTL = 300.0  # Seconds a cached tool result stays valid
+TOOL_RESULT_CACHE_TTL = float(os.getenv("TOOL_RESULT_CACHE_TTL", str(TOOL_RESULT_CACHE_TTL)))
+
+TOOL_MAX_ROUNDS = 4  # Model turns per message that may call tools; the next one must answer
+TOOL_MAX_ROUNDS = int(os.getenv("TOOL_MAX_ROUNDS", str(TOOL_MAX_ROUNDS)))
+
 # Example manual overrides:
 # LOG_LEVEL = "DEBUG"  # Forces DEBUG logging
 # ENABLE_CORS = False  # Disables CORS
@@ -0,0 +1,12 @@
+from api.config.metrics import MetricsRegistry
+
+
+def test_label_values_and_help_are_escaped_for_prometheus():
+    registry = MetricsRegistry()
+    registry.describe("llm_requests_total", 'Requests per "endpoint"\nand model \\ engine')
+    registry.inc("llm_requests_total", endpoint='http://node-1/"v1"', model="org\\model\nx")
+    assert registry.render_prometheus().splitlines() == [
+        '# HELP llm_requests_total Requests per "endpoint"\\nand model \\\\ engine',
+        "# TYPE llm_requests_total counter",
+        'llm_requests_total{endpoint="http://node-1/\\"v1\\"",model="org\\\\model\\nx"} 1.0',
+    ]
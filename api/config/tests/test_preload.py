@@ -0,0 +1,144 @@
+import gc
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+# A pre-fork master: the real app import and run_prefork, with each worker's uvicorn server
+# replaced by a stand-in that reports what it inherited, then waits for SIGTERM and drains.
+MASTER = """
+import asyncio, functools, json, os, signal, sys
+out = sys.argv[1]
+
+import api.main
+from api.config import preload
+from api.config.drain import get_drain_controller
+from api.services.llm_ws_streaming import llm_ws_streaming_service as service
+
+def singletons():
+    return sorted(f"{name}.{attr}" for name, module in list(sys.modules.items()) if name.startswith("api")
+                  for attr, value in vars(module).items()
+                  if isinstance(value, functools._lru_cache_wrapper) and value.__module__ == name
+                  and value.cache_info().currsize)
+
+def serve(app, sock, host, port):
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    report = {"master": os.getppid(), "inherited": singletons(), "hooks": len(get_drain_controller()._flush_hooks)}
+    bot = service.LLMBot(api_key="sk-test", conversation_id=f"w-{os.getpid()}")
+    bot.update_memory(service.HumanMessage("hi"))
+    service.GLOBAL_COLD_TIER.idle_seconds = 0
+    report["frozen"] = service.GLOBAL_COLD_TIER.sweep()
+    report["cold_dir"] = service.GLOBAL_COLD_TIER.directory
+    with open(os.path.join(out, f"{os.getpid()}.json"), "w") as f:
+        json.dump(report, f)
+    signal.sigwait({signal.SIGTERM})
+    asyncio.run(get_drain_controller().drain(timeout=1, grace=0))
+    os._exit(0)
+
+preload._serve_worker = serve
+with open(os.path.join(out, "master.json"), "w") as f:
+    json.dump({"pid": os.getpid(), "cold": os.listdir(os.environ["COLD_TIER_DIR"])}, f)
+preload.run_prefork(api.main.app, "127.0.0.1", 0, 2)
+"""
+
+
+def wait_for(predicate, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = predicate()
+        if result:
+            return result
+        time.sleep(0.05)
+    raise AssertionError("timed out")
+
+
+def reports(out):
+    found = {}
+    for name in os.listdir(out):
+        if name[0].isdigit() and name.endswith(".json"):
+            try:
+                with open(os.path.join(out, name)) as f:
+                    found[int(name[:-5])] = json.load(f)
+            except ValueError:
+                pass  # Still being written
+    return found
+
+
+@pytest.fixture(scope="module")
+def prefork(tmp_path_factory):
+    """Runs the master once: two workers, one killed and respawned, then SIGTERM to the master."""
+    if not hasattr(os, "fork"):
+        pytest.skip("pre-fork needs os.fork")
+    tmp = tmp_path_factory.mktemp("prefork")
+    out, cold = tmp / "out", tmp / "cold"
+    out.mkdir()
+    cold.mkdir()
+    (cold / "ws-999999999").mkdir()  # Left by a worker that is gone
+    env = {**os.environ, "PYTHONPATH": REPO_ROOT, "OPENAI_API_KEY": "sk-test", "COLD_TIER_DIR": str(cold),
+           "DRAIN_HANDOFF_PATH": str(tmp / "handoff.sqlite"), "DRAIN_METRICS_PATH": str(tmp / "metrics-{pid}.json")}
+    master = subprocess.Popen([sys.executable, "-c", MASTER, str(out)], cwd=str(tmp), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        first = wait_for(lambda: len(reports(out)) == 2 and reports(out))
+        killed = min(first)
+        os.kill(killed, signal.SIGKILL)
+        workers = wait_for(lambda: len(reports(out)) == 3 and reports(out))
+        master.send_signal(signal.SIGTERM)
+        code = master.wait(timeout=60)
+    finally:
+        if master.poll() is None:
+            master.kill()
+    with open(out / "master.json") as f:
+        master_report = json.load(f)
+    return {"tmp": tmp, "cold": cold, "code": code, "killed": killed, "workers": workers, "master": master_report}
+
+
+def test_a_failed_warm_up_leaves_the_collector_enabled(monkeypatch):
+    from api.config import ai_services, preload
+
+    def broken():
+        raise RuntimeError("registry unavailable")
+
+    monkeypatch.setattr(ai_services, "get_ai_services", broken)
+    with pytest.raises(RuntimeError):
+        preload.warm_up(None)
+    assert gc.isenabled()
+
+
+def test_a_dead_worker_is_respawned(prefork):
+    workers = prefork["workers"]
+    assert len(workers) == 3  # Two forked at start, one replacing the killed worker
+    assert {report["master"] for report in workers.values()} == {prefork["master"]["pid"]}
+
+
+def test_sigterm_on_the_master_drains_every_live_worker(prefork):
+    assert prefork["code"] == 0
+    live = set(prefork["workers"]) - {prefork["killed"]}
+    metrics = {int(name[len("metrics-"):-5]) for name in os.listdir(prefork["tmp"]) if name.startswith("metrics-")}
+    assert metrics == live  # Each worker ran its own drain hooks
+    with sqlite3.connect(prefork["tmp"] / "handoff.sqlite") as conn:
+        handed_off = {row[0] for row in conn.execute("SELECT conversation_id FROM conversations")}
+    assert handed_off == {f"w-{pid}" for pid in live}
+
+
+def test_import_side_effects_run_per_worker(prefork):
+    # Nothing on disk from the master's import, only the directory a dead worker left
+    assert prefork["master"]["cold"] == ["ws-999999999"]
+    for pid, report in prefork["workers"].items():
+        # Only read-only singletons are warmed in the master; stores, pools and registries start in the worker
+        assert set(report["inherited"]) <= {"api.config.ai_services.get_ai_services",
+                                            "api.config.drain.get_drain_controller",
+                                            "api.config.logging.get_logger", "api.config.metrics.get_metrics"}
+        assert report["hooks"] == 3  # flush_metrics and both services' flush_conversations, registered once
+        assert report["frozen"] == 1
+        assert report["cold_dir"] == str(prefork["cold"] / f"ws-{pid}")
+    live = set(prefork["workers"]) - {prefork["killed"]}
+    assert sorted(os.listdir(prefork["cold"])) == sorted(f"ws-{pid}" for pid in live)
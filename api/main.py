@@ -7,22 +7,57 @@ No endpoints are defined here; all routes are handled by route_loader.py.
 Uses hardcoded CORS middleware as per original design.
 """
 
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from api.config.settings import (
     APP_NAME, APP_VERSION, APP_DESCRIPTION, HOST, PORT, RELOAD, WORKERS, DEBUG,
-    ENABLE_API_DOCS, DOCS_URL, REDOC_URL, OPENAPI_URL, CONTACT, OPENAPI_SERVER_NAME
+    ENABLE_API_DOCS, DOCS_URL, REDOC_URL, OPENAPI_URL, CONTACT, OPENAPI_SERVER_NAME,
+    PRELOAD_APP, ROUTING_HEALTH_CHECK_INTERVAL, PRESET_REFRESH_INTERVAL, QUOTA_REFRESH_INTERVAL
 )
 from api.config.logging import logger
+from api.config.drain import get_drain_controller
 from api.config.route_loader import register_v1_routes
+from api.config.middleware.middleware_loader import load_flagged_middlewares
+from api.services.llm_routing.llm_routing_service import get_router
+from api.services.preset_catalog.preset_catalog_service import get_preset_catalog
+from api.services.usage_quota.usage_quota_service import get_quota_manager
+from api.services.llm_ws_streaming.llm_ws_streaming_service import GLOBAL_COLD_TIER as WS_COLD_TIER
+from api.services.llm_http_streaming.llm_http_streaming_service import GLOBAL_COLD_TIER as HTTP_COLD_TIER
 
 # Define lifespan event handler
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info(f"Starting {APP_NAME} v{APP_VERSION} on {HOST}:{PORT} with reload={RELOAD}, workers={WORKERS}")
+    router = get_router()
+    health_task = None
+    if ROUTING_HEALTH_CHECK_INTERVAL > 0 and router.has_self_hosted():
+        # Actively probe self-hosted inference nodes so dead ones are ejected early
+        health_task = asyncio.create_task(router.run_health_checks(ROUTING_HEALTH_CHECK_INTERVAL))
+    # Presets are read once here, then reloaded only when the database changes
+    catalog = get_preset_catalog()
+    catalog.refresh()
+    preset_task = None
+    if PRESET_REFRESH_INTERVAL > 0:
+        preset_task = asyncio.create_task(catalog.run(PRESET_REFRESH_INTERVAL))
+    # Quotas start from every worker's spend so far today, then follow group membership changes
+    quota_task = asyncio.create_task(get_quota_manager().run(QUOTA_REFRESH_INTERVAL))
+    # Idle conversations are frozen here, in the background, never by the request that touches one
+    cold_tasks = [asyncio.create_task(tier.run()) for tier in (WS_COLD_TIER, HTTP_COLD_TIER)]
     yield
     logger.info(f"Shutting down {APP_NAME}")
+    # No-op if DrainingServer already drained; otherwise waits for streams and flushes state
+    await get_drain_controller().drain()
+    if health_task:
+        health_task.cancel()
+    if preset_task:
+        preset_task.cancel()
+    quota_task.cancel()
+    for task in cold_tasks:
+        task.cancel()
+    catalog.close()
+    await router.aclose()  # Close every endpoint's connection pool
 
 
 # Initialize the FastAPI app with settings
@@ -61,10 +96,19 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+# Admission and body limit middleware, per their own settings; the rest of api/config/middleware/ stays off
+load_flagged_middlewares(app)
+
 # Apply route registration only (no other configs for now)
 register_v1_routes(app)  # Automatically registers all routes from api/v1/, including llm_ws_route.py
 
 if __name__ == "__main__":
-    import uvicorn
-    logger.info(f"Booting server with config: host={HOST}, port={PORT}, reload={RELOAD}, workers={WORKERS}")
-    uvicorn.run("main:app", host=HOST, port=PORT, reload=RELOAD, workers=WORKERS)
\ No newline at end of file
+    from api.config.drain import run_server
+    from api.config.preload import preload_supported, run_prefork
+    logger.info(f"Booting server with config: host={HOST}, port={PORT}, reload={RELOAD}, workers={WORKERS}, preload={PRELOAD_APP}")
+    if PRELOAD_APP and WORKERS > 1 and not RELOAD and preload_supported():
+        # Warm once in this process and fork workers that share the loaded heap
+        run_prefork(app, host=HOST, port=PORT, workers=WORKERS)
+    else:
+        # uvicorn.run() equivalent whose server drains streams before closing connections
+        run_server("api.main:app", host=HOST, port=PORT, reload=RELOAD, workers=WORKERS)
\ No newline at end of file
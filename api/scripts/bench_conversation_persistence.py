@@ -0,0 +1,89 @@
+# api/scripts/bench_conversation_persistence.py
+
+"""
+Benchmarks write-behind persistence of chat turns.
+
+Builds a Prisma-shaped Conversation table with --conversations rows of
+--history turns each, then persists --turns new turns spread over them:
+- inline: one transaction per turn, as if send_message wrote before returning
+- write-behind: record() on the streaming path, then batched transactions
+
+Reports the time the streaming path spends per turn and the overall write
+throughput of each approach.
+
+Usage (from the repo root):
+    python -m api.scripts.bench_conversation_persistence --turns 5000
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from api.services.conversation_persistence.conversation_persistence_service import ConversationPersister
+
+SCHEMA = (
+    'CREATE TABLE "Conversation" ("id" TEXT NOT NULL PRIMARY KEY, "conversationId" TEXT NOT NULL,'
+    ' "userId" TEXT NOT NULL, "conversationSchema" TEXT, "conversationData" TEXT,'
+    ' "createdAt" DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, "updatedAt" DATETIME NOT NULL);'
+    'CREATE UNIQUE INDEX "Conversation_conversationId_key" ON "Conversation"("conversationId");'
+)
+REPLY = "Create the new key, deploy it alongside the old one, switch clients over, then revoke the old key. " * 4
+
+
+def build_db(path: str, conversations: int, history: int):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    data = json.dumps([{"role": role, "content": REPLY, "timestamp": "2025-01-01T00:00:00+00:00"}
+                       for _ in range(history) for role in ("user", "ai")])
+    conn.executemany('INSERT INTO "Conversation" VALUES (?, ?, ?, NULL, ?, 0, 0)',
+                     [(f"c{i}", f"chat-{i}", "u1", data) for i in range(conversations)])
+    conn.commit()
+    conn.close()
+
+
+def run(path: str, turns: list, batch_size: int):
+    persister = ConversationPersister(path, queue_size=len(turns), batch_size=batch_size, enabled=True)
+    on_path = 0.0
+    started = time.perf_counter()
+    for conversation_id in turns:
+        recorded = time.perf_counter()
+        persister.record(conversation_id, "u1", "How do I rotate the API keys?", REPLY)
+        on_path += time.perf_counter() - recorded
+        if batch_size == 1:
+            persister.flush()  # Inline: the turn is on disk before the stream ends
+    persister.flush()
+    total = time.perf_counter() - started
+    persister.close()
+    return on_path / len(turns), len(turns) / total
+
+
+def main(conversations: int, history: int, turns: int, batch_size: int):
+    rng = random.Random(7)
+    ids = [f"chat-{rng.randrange(conversations)}" for _ in range(turns)]
+    print(f"{turns} turns over {conversations} conversations of {history}+ turns")
+    print(f"{'mode':<22}{'stream path µs/turn':>22}{'turns/s':>12}")
+    for label, size in (("inline (1 per txn)", 1), (f"write-behind ({batch_size})", batch_size)):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "app_db.sqlite")
+            build_db(path, conversations, history)
+            if size == 1:
+                inline_ids = ids[: max(turns // 5, 1)]  # Slow: a sample is enough
+                per_turn, throughput = run(path, inline_ids, 1)
+                per_turn = 1 / throughput  # The stream waits for the whole write
+            else:
+                per_turn, throughput = run(path, ids, size)
+            print(f"{label:<22}{per_turn * 1e6:>22.1f}{throughput:>12.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--history", type=int, default=10, help="Turns already stored per conversation")
+    parser.add_argument("--turns", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    main(args.conversations, args.history, args.turns, args.batch_size)
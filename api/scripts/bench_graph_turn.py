@@ -0,0 +1,113 @@
+# api/scripts/bench_graph_turn.py
+
+"""
+Benchmarks the bookkeeping of one chat turn: the old send_message (the
+HumanMessage and the AIMessage each written with update_state, around
+get_state reads) against one GLOBAL_APP run that checkpoints once when the
+turn ends.
+
+The model is a local fake streaming --chunks chunks with no delay, so only
+the turn's own overhead is timed. Conversations start with --turns earlier
+turns. Every checkpoint serializes the whole conversation and MemorySaver
+keeps each one, so "stored" (the bytes one turn adds) grows with the
+conversation's length. Prints are silenced in both paths.
+
+Usage (from the repo root):
+    python -m api.scripts.bench_graph_turn --turns 0,20,200 --chunks 50 --number 20
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+import uuid
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+
+from api.services.llm_ws_streaming import llm_ws_streaming_service as service
+
+
+class FakeRouter:
+    def __init__(self, chunks: int):
+        self.chunks = chunks
+
+    def resolve(self, model_name):
+        return model_name
+
+    async def astream(self, model_name, messages, **params):
+        for i in range(self.chunks):
+            yield AIMessageChunk(content=f"tok{i} ")
+
+
+async def legacy_turn(bot, router, text: str):
+    """The replaced send_message (no tools registered): update_state for each message, get_state around them."""
+    started = time.time()
+    quota = service.get_quota_manager().admit(bot.user_id, bot.model_name)
+    bot.update_memory(HumanMessage(content=text))
+    messages = bot.conversation()
+    tools = service.tool_specs(messages)
+    meter = service.get_usage_ledger().meter(bot.model_name, bot.user_id, bot.conversation_id, messages)
+    chunks = []
+    try:
+        quota.start(messages)
+        async for chunk in router.astream(bot.model_name, messages, tools=tools):
+            meter.observe(chunk)
+            quota.consume(chunk.content)
+            chunks.append(chunk.content)
+    finally:
+        meter.finish("".join(chunks))
+        quota.release()
+    reply = "".join(chunks)
+    bot.update_memory(AIMessage(content=reply))
+    service.get_conversation_persister().record(bot.conversation_id, bot.user_id, text, reply, started)
+
+
+async def graph_turn(bot, router, text: str):
+    async for _ in bot.send_message(text):
+        pass
+
+
+async def timed(fn, bot, router, number: int) -> float:
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for i in range(number):
+            await fn(bot, router, f"question {i}")
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+def checkpoints(conversation_id: str) -> tuple:
+    """Checkpoints of a conversation, and the bytes MemorySaver holds for them (every version is kept)."""
+    count = len(list(service.GLOBAL_MEMORY.list({"configurable": {"thread_id": conversation_id}})))
+    blobs = sum(len(value[1]) for key, value in service.GLOBAL_MEMORY.blobs.items() if key[0] == conversation_id)
+    return count, blobs
+
+
+async def main(turns: list, chunks: int, number: int):
+    router = FakeRouter(chunks)
+    service.get_router = lambda: router
+    print(f"{chunks} chunks per reply, {number} turns timed (best of 3)")
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for label, fn in (("old send_message", legacy_turn), ("GLOBAL_APP run", graph_turn)):
+            for history in turns:
+                bot = service.LLMBot(api_key="sk-bench", conversation_id=str(uuid.uuid4()))
+                for i in range(history):
+                    await legacy_turn(bot, router, f"earlier question {i}")
+                count, size = checkpoints(bot.conversation_id)
+                await fn(bot, router, "one more question")
+                after = checkpoints(bot.conversation_id)
+                results[(label, history)] = (await timed(fn, bot, router, number), after[0] - count, after[1] - size)
+    print(f"{'':<30}{'per turn':>12}{'checkpoints':>13}{'stored':>12}")
+    for (label, history), (best, count, size) in results.items():
+        print(f"{f'{label}, {history} turns':<30}{best * 1e3:>9.2f} ms{count:>13}{size / 1024:>9.1f} KiB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", default="0,20,200", help="Comma-separated earlier turns per conversation")
+    parser.add_argument("--chunks", type=int, default=50)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main([int(turns) for turns in args.turns.split(",")], args.chunks, args.number))
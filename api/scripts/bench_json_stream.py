@@ -0,0 +1,106 @@
+# api/scripts/bench_json_stream.py
+
+"""
+Benchmarks JSON extraction from LLM output: the regex of the old
+extract_json_from_text against the incremental JsonStreamParser.
+
+The reply is --prose characters of text around a JSON object with --records
+entries, streamed in --chunk character chunks. Timed:
+- whole text: the regex once vs extract_json once (a one-level object, the
+  only shape the regex matches)
+- streaming: the regex re-run on the accumulated text after every chunk (what
+  a caller of extract_json_from_text has to do to see an object as soon as it
+  completes) vs feeding each chunk to the parser
+- nested object: the regex (matches a fragment that json.loads rejects) vs the parser vs json.loads on the
+  bare JSON (C lower bound)
+
+Usage (from the repo root):
+    python -m api.scripts.bench_json_stream --records 2000
+"""
+
+import argparse
+import json
+import re
+import time
+
+from api.services.json_stream.json_stream_service import JsonStreamParser, extract_json
+
+
+def legacy_extract(text: str, json_root_key: str):
+    """The regex path of the old extract_json_from_text (without its print)."""
+    text = text.replace("{{", "{").replace("}}", "}")
+    pattern = r'{{\s*"{}":\s*{{[^}}]*}}\s*}}'.format(re.escape(json_root_key))
+    match = re.search(pattern, text)
+    return json.loads(match.group()) if match else None
+
+
+def stream_parser(chunks: list):
+    parser = JsonStreamParser(paths=False)
+    for chunk in chunks:
+        for event in parser.feed(chunk):
+            if event.kind == "document":
+                return event.value
+    return None
+
+
+def stream_regex(chunks: list, key: str):
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        found = legacy_extract(text, key)
+        if found is not None:
+            return found
+    return None
+
+
+def attempt(fn) -> str:
+    try:
+        return "found" if fn() else "not found"
+    except ValueError as e:  # The regex matched a fragment of a nested object
+        return type(e).__name__
+
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(records: int, prose: int, chunk: int):
+    words = ("The quarterly figures are summarised below as requested. " * (prose // 58 + 1))[:prose]
+    flat = {"system_variables": {f"field_{i}": f"value {i}" for i in range(records)}}
+    nested = {"system_variables": {"records": [{"id": i, "tags": ["a", "b"], "meta": {"ok": True}}
+                                               for i in range(records)]}}
+    flat_text = f"{words}\n```json\n{json.dumps(flat, indent=2)}\n```\n{words}"
+    nested_json = json.dumps(nested, indent=2)
+    nested_text = f"{words}\n```json\n{nested_json}\n```\n{words}"
+    chunks = [flat_text[i:i + chunk] for i in range(0, len(flat_text), chunk)]
+
+    assert legacy_extract(flat_text, "system_variables") == flat == extract_json(flat_text, "system_variables")
+    assert stream_parser(chunks) == flat
+    print(f"{len(flat_text) / 1e3:.0f} kB flat reply, {len(nested_text) / 1e3:.0f} kB nested, {len(chunks)} chunks")
+
+    cases = [
+        ("whole text: regex", lambda: legacy_extract(flat_text, "system_variables")),
+        ("whole text: extract_json", lambda: extract_json(flat_text, "system_variables")),
+        ("streaming: regex per chunk", lambda: stream_regex(chunks, "system_variables")),
+        ("streaming: parser.feed", lambda: stream_parser(chunks)),
+        ("nested: regex", lambda: legacy_extract(nested_text, "system_variables")),
+        ("nested: extract_json", lambda: extract_json(nested_text, "system_variables")),
+        ("nested: parser.feed", lambda: stream_parser([nested_text])),
+        ("nested: json.loads (bare)", lambda: json.loads(nested_json)),
+    ]
+    for label, fn in cases:
+        print(f"{label:<30}{timed(lambda: attempt(fn)) * 1e3:>10.2f} ms   {attempt(fn)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--prose", type=int, default=20000)
+    parser.add_argument("--chunk", type=int, default=16)
+    args = parser.parse_args()
+    main(args.records, args.prose, args.chunk)
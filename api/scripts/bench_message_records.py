@@ -0,0 +1,89 @@
+# api/scripts/bench_message_records.py
+
+"""
+Benchmarks memory of stored conversation history: LangChain messages vs
+MessageRecords.
+
+Builds the same history both ways, alternating short user and assistant turns
+in conversations of 20 messages, and reports:
+- live memory (tracemalloc) for all messages
+- checkpoint bytes per message (the MemorySaver serializer)
+- the cost of converting the records back to LangChain messages for one request
+
+Usage (from the repo root):
+    python -m api.scripts.bench_message_records --messages 1000000
+"""
+
+import argparse
+import gc
+import timeit
+import tracemalloc
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from api.services.conversation_memory.conversation_memory_service import SERDE, add_records, to_messages
+
+TURNS = [
+    "Can you move the standup to 10?",
+    "Done, standup is now at 10:00.",
+    "thanks",
+    "You're welcome!",
+    "What's left on the release checklist?",
+    "Changelog, version bump and the smoke test on staging.",
+]
+PER_CONVERSATION = 20
+
+
+def turn(index: int) -> str:
+    # A fresh str per message, as read from a request body or a stream
+    return "".join(TURNS[index % len(TURNS)])
+
+
+def langchain_history(count: int) -> list:
+    return [
+        (HumanMessage if i % 2 == 0 else AIMessage)(content=turn(i), id=str(uuid.uuid4()))
+        for i in range(count)
+    ]
+
+
+def record_history(count: int) -> list:
+    conversations = []
+    for start in range(0, count, PER_CONVERSATION):
+        conversations.append(add_records([], langchain_history(min(PER_CONVERSATION, count - start))))
+    return conversations
+
+
+def held(build, count: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    history = build(count)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del history
+    return size
+
+
+def main(count: int):
+    print(f"{count} stored messages, {PER_CONVERSATION} per conversation")
+    message_bytes = held(langchain_history, count)
+    record_bytes = held(record_history, count)
+    print(f"{'LangChain messages':<22}{message_bytes / 2**20:>10.1f} MiB{message_bytes / count:>8.0f} B/msg")
+    print(f"{'MessageRecords':<22}{record_bytes / 2**20:>10.1f} MiB{record_bytes / count:>8.0f} B/msg")
+
+    sample = langchain_history(PER_CONVERSATION)
+    for label, history in (("LangChain messages", sample), ("MessageRecords", add_records([], sample))):
+        _, blob = SERDE.dumps_typed(history)
+        print(f"{'checkpoint, ' + label:<34}{len(blob) / PER_CONVERSATION:>6.0f} B/msg")
+
+    records = add_records([], sample)
+    best = min(timeit.repeat(lambda: to_messages(records), number=1000, repeat=5)) / 1000
+    print(f"to_messages() for a {PER_CONVERSATION}-message request: {best * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000000)
+    args = parser.parse_args()
+    main(args.messages)
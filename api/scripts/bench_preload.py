@@ -0,0 +1,132 @@
+# api/scripts/bench_preload.py
+
+"""
+Measures boot time and per-worker memory with PRELOAD_APP on and off.
+
+Starts `python -m api.main` twice (WORKERS=N, PRELOAD_APP=false/true), waits
+until all workers are up and the port answers, then reads each worker's
+RSS, PSS and private memory from /proc/<pid>/smaps_rollup. PSS splits shared
+pages between the processes mapping them, so it is the number that shows the
+copy-on-write savings.
+
+Usage (from the repo root, Linux only):
+    python api/scripts/bench_preload.py --workers 4
+"""
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def child_pids(pid: int) -> list:
+    """Returns direct children of `pid` (uvicorn/pre-fork workers)."""
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                children.extend(int(p) for p in f.read().split())
+        except FileNotFoundError:
+            continue
+    return children
+
+
+def memory_kb(pid: int) -> dict:
+    """Reads Rss/Pss/Private totals (kB) for one process."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].rstrip(":") in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    fields["Private"] = fields.pop("Private_Clean", 0) + fields.pop("Private_Dirty", 0)
+    return fields
+
+
+def cmdline(pid: int) -> str:
+    with open(f"/proc/{pid}/cmdline") as f:
+        return f.read().replace("\0", " ")
+
+
+def port_ready(port: int) -> bool:
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.2) as s:
+            s.sendall(b"GET /v1/__ready HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+            return s.recv(12).startswith(b"HTTP/1.1")
+    except OSError:
+        return False
+
+
+def run_mode(preload: bool, workers: int, settle: float, timeout: float) -> dict:
+    port = free_port()
+    env = dict(os.environ, WORKERS=str(workers), PORT=str(port), HOST="127.0.0.1",
+               RELOAD="false", PRELOAD_APP=str(preload).lower(), LOG_LEVEL="WARNING")
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "api.main"], cwd=REPO_ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        # Boot is complete when every worker exists and the port answers
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited early with code {proc.returncode}")
+            if time.perf_counter() - started > timeout:
+                raise TimeoutError("server did not become ready")
+            if len(child_pids(proc.pid)) >= workers and port_ready(port):
+                break
+            time.sleep(0.05)
+        boot_s = time.perf_counter() - started
+        time.sleep(settle)  # Let every worker finish its own startup before sampling
+
+        # Uvicorn's spawn-based workers come with a resource-tracker child; skip it
+        pids = [p for p in child_pids(proc.pid) if "resource_tracker" not in cmdline(p)]
+        samples = [memory_kb(p) for p in pids]
+        master = memory_kb(proc.pid)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    def avg(key):
+        return sum(s[key] for s in samples) / max(len(samples), 1) / 1024
+
+    return {
+        "mode": "preload" if preload else "default",
+        "boot_s": boot_s,
+        "workers": len(samples),
+        "rss_mb": avg("Rss"),
+        "pss_mb": avg("Pss"),
+        "private_mb": avg("Private"),
+        "total_pss_mb": (sum(s["Pss"] for s in samples) + master["Pss"]) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds to wait after ready before sampling")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    rows = [run_mode(preload, args.workers, args.settle, args.timeout) for preload in (False, True)]
+
+    print(f"{'mode':<10}{'boot s':>9}{'workers':>9}{'RSS MB':>10}{'PSS MB':>10}{'priv MB':>10}{'total PSS':>11}")
+    for r in rows:
+        print(f"{r['mode']:<10}{r['boot_s']:>9.2f}{r['workers']:>9}{r['rss_mb']:>10.1f}"
+              f"{r['pss_mb']:>10.1f}{r['private_mb']:>10.1f}{r['total_pss_mb']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
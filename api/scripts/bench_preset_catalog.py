@@ -0,0 +1,67 @@
+# api/scripts/bench_preset_catalog.py
+
+"""
+Benchmarks preset resolution from the in-memory catalog.
+
+Copies the Prisma database (--db) and times, per request:
+- resolve_params() with a preset, from the catalog snapshot
+- the same resolution with a per-request SQLite query (what the snapshot replaces)
+- the change check run by the polling task (PRAGMA data_version)
+and compares a chat payload carrying its own prompt and sampling values with
+one naming the preset.
+
+Usage (from the repo root):
+    python -m api.scripts.bench_preset_catalog --db prisma/app_db.sqlite
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import timeit
+
+from api.services.preset_catalog import preset_catalog_service as presets
+from api.services.preset_catalog.preset_catalog_service import _MODELS, _PRESETS, PresetCatalog, resolve_params
+
+
+def main(db: str, number: int):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "app_db.sqlite")
+        shutil.copy(db, path)
+        catalog = PresetCatalog(path)
+        presets.get_preset_catalog = lambda: catalog
+        name = next(iter(catalog.snapshot.presets))
+        payload = {"preset": name, "user_input": "Summarise yesterday's incident report.", "temperature": 0.2}
+
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+        def per_request_query():
+            models = {row[0]: row[1] for row in conn.execute(_MODELS)}
+            row = next(r for r in conn.execute(_PRESETS) if r[0] == payload["preset"])
+            return models[row[1]], row
+
+        cases = [
+            ("resolve_params (snapshot)", lambda: resolve_params(payload), number),
+            ("per-request SQLite query", per_request_query, number // 10),
+            ("change check (polling)", catalog.refresh, number // 10),
+        ]
+        print(f"{len(catalog.snapshot.presets)} preset(s), {len(catalog.snapshot.models)} model(s)")
+        for label, fn, count in cases:
+            best = min(timeit.repeat(fn, number=count, repeat=5)) / count
+            print(f"{label:<30}{best * 1e6:>8.2f} µs")
+
+        full = {**resolve_params(payload), "user_input": payload["user_input"]}
+        print(f"{'payload with values':<30}{len(json.dumps(full)):>8} B")
+        print(f"{'payload with preset':<30}{len(json.dumps(payload)):>8} B")
+        conn.close()
+        catalog.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="prisma/app_db.sqlite")
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+    main(args.db, args.number)
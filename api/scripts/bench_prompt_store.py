@@ -0,0 +1,76 @@
+# api/scripts/bench_prompt_store.py
+
+"""
+Benchmarks memory held by conversations sharing one large system prompt.
+
+Each conversation gets the prompt the way LLMBot does (read per bot, so a
+fresh str each time) plus two turns, in a MemorySaver-backed graph like
+GLOBAL_APP. Compares:
+- inline: the SystemMessage carries the text (before the prompt store)
+- ref: the SystemMessage carries a prompt_ref into the prompt store
+
+Usage (from the repo root):
+    python -m api.scripts.bench_prompt_store --conversations 1000 --prompt-kb 50
+"""
+
+import argparse
+import gc
+import tracemalloc
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import START, MessagesState, StateGraph
+
+from api.services.prompt_assembly.prompt_assembly_service import assemble, with_system_prompt
+from api.services.prompt_assembly.prompt_store import get_prompt_store
+
+
+def build_app():
+    workflow = StateGraph(state_schema=MessagesState)
+    workflow.add_node("model", lambda state: {"messages": []})
+    workflow.add_edge(START, "model")
+    return workflow.compile(checkpointer=MemorySaver())
+
+
+def fill(app, conversations: int, prompt: bytes, by_ref: bool):
+    for index in range(conversations):
+        config = {"configurable": {"thread_id": f"c{index}"}}
+        text = prompt.decode()  # A fresh copy per bot, as load_text() returns
+        if by_ref:
+            app.update_state(config, {"messages": with_system_prompt([], text)})
+        else:
+            app.update_state(config, {"messages": [SystemMessage(content=text)]})
+        app.update_state(config, {"messages": [HumanMessage(content="What changed since yesterday?")]})
+        app.update_state(config, {"messages": [AIMessage(content="Two deploys and one config change.")]})
+
+
+def measure(conversations: int, prompt: bytes, by_ref: bool) -> int:
+    gc.collect()
+    tracemalloc.start()
+    app = build_app()
+    fill(app, conversations, prompt, by_ref)
+    assemble(app.get_state({"configurable": {"thread_id": "c0"}}).values["messages"])  # Still resolves
+    gc.collect()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del app
+    return held
+
+
+def main(conversations: int, prompt_kb: int):
+    prompt = (b"You follow the house style guide. " * (prompt_kb * 1024 // 34 + 1))[:prompt_kb * 1024]
+    print(f"{conversations} conversations, {prompt_kb} KB system prompt, 3 checkpointed updates each")
+    results = {}
+    for label, by_ref in (("inline", False), ("ref", True)):
+        results[label] = measure(conversations, prompt, by_ref)
+        print(f"{label:<8}{results[label] / 2**20:>10.1f} MiB")
+    print(f"{'saved':<8}{(results['inline'] - results['ref']) / 2**20:>10.1f} MiB")
+    print(f"prompt store: {get_prompt_store().stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=1000)
+    parser.add_argument("--prompt-kb", type=int, default=50)
+    args = parser.parse_args()
+    main(args.conversations, args.prompt_kb)
@@ -0,0 +1,79 @@
+# api/scripts/bench_prompt_template.py
+
+"""
+Benchmarks prompt variable updates: the old update_json_in_text (re.search
+and re.sub over the whole prompt) against compiled prompt templates.
+
+For each prompt size in --sizes (kB of instructions around one
+system_variables block of --variables variables), one variable changes per
+update, as on every turn of a conversation. Timed per update:
+- old update_json_in_text
+- update_json_in_text now (content-hash lookup, then render)
+- PromptTemplate.render() on a held template (no hashing)
+- PromptTemplate.format() with fields filled (the final prompt text)
+- compile (a cache miss: parsing the template)
+
+Usage (from the repo root):
+    python -m api.scripts.bench_prompt_template --sizes 10,100,1000 --variables 100
+"""
+
+import argparse
+import json
+import re
+import timeit
+
+from api.services.prompt_template.prompt_template_service import TemplateCache, compile_template
+from api.utils.llm_utils import update_json_in_text
+
+
+def legacy_update(text: str, json_to_update: dict) -> str:
+    """The replace path of the old update_json_in_text (without its prints)."""
+    json_root_key = list(json_to_update.keys())[0]
+    json_to_update_str = json.dumps(json_to_update, indent=4)
+    pattern = r'{{\s*"{}":\s*{{[^}}]*}}\s*}}'.format(re.escape(json_root_key))
+    match = re.search(pattern, text)
+    json_to_update_str = json_to_update_str.replace("{", "{{").replace("}", "}}")
+    if match:
+        text = re.sub(pattern, json_to_update_str, text)
+    return text
+
+
+def main(sizes: list, variables: int, number: int):
+    for size in sizes:
+        words = ("Answer with care and cite the policy section you rely on. " * (size * 1024 // 58 + 1))
+        half = words[:size * 512]
+        block = json.dumps({"system_variables": {f"var_{i}": f"value {i}" for i in range(variables)}}, indent=4)
+        prompt = f"You are {{role}}.\n{half}\nContext:\n{block}\n{half}"
+        state = {f"var_{i}": f"value {i}" for i in range(variables)}
+        template = compile_template(prompt)
+        turn = [0]
+
+        def update():
+            turn[0] += 1
+            state["var_0"] = turn[0] % 50  # A small rotation, like a turn counter
+            return {"system_variables": state}
+
+        fixed = {"system_variables": dict(state, var_0=7)}
+        assert legacy_update(prompt, fixed) == update_json_in_text(prompt, fixed)
+        cold = TemplateCache(size=0)
+        cases = [
+            ("old update_json_in_text", lambda: legacy_update(prompt, update())),
+            ("update_json_in_text", lambda: update_json_in_text(prompt, update())),
+            ("template.render()", lambda: template.render(update())),
+            ("template.format()", lambda: template.format({"role": "an assistant"}, update())),
+            ("compile (cache miss)", lambda: cold.get(prompt)),
+        ]
+        print(f"{len(prompt) / 1024:.0f} kB prompt, {variables} variables")
+        for label, fn in cases:
+            count = max(1, number // max(1, size))
+            best = min(timeit.repeat(fn, number=count, repeat=5)) / count
+            print(f"  {label:<28}{best * 1e6:>12.2f} µs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000", help="Comma-separated prompt sizes in kB")
+    parser.add_argument("--variables", type=int, default=100)
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+    main([int(size) for size in args.sizes.split(",")], args.variables, args.number)
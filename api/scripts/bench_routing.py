@@ -0,0 +1,99 @@
+# api/scripts/bench_routing.py
+
+"""
+Benchmarks routing policies against local stub servers that inject delays.
+
+Starts three OpenAI-compatible stub endpoints for one model:
+- fast:      ~20 ms TTFT
+- slow:      ~120 ms TTFT
+- straggler: ~20 ms TTFT, but 10% of requests stall for 1 s
+
+and streams N requests through the router with each policy:
+weighted round-robin, latency-aware, and latency-aware + hedging.
+Prints TTFT p50/p95/p99 and how requests spread across endpoints.
+
+Usage (from the repo root):
+    python -m api.scripts.bench_routing --requests 300 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from langchain_core.messages import HumanMessage
+
+from api.services.llm_routing.llm_routing_service import LLMRouter
+from api.services.llm_routing.stub_openai_server import StubOpenAIServer
+
+
+def percentile(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * q / 100.0), len(ordered) - 1)]
+
+
+async def run_policy(label: str, servers: dict, policy: str, hedge: bool, requests: int, concurrency: int) -> dict:
+    router = LLMRouter(
+        {"llama-3": [{"url": s.url, "engine": "vllm", "name": name, "max_retries": 0} for name, s in servers.items()]},
+        policy=policy, hedge=hedge,
+    )
+    before = {name: len(s.requests) for name, s in servers.items()}
+    ttfts = []
+    gate = asyncio.Semaphore(concurrency)
+    messages = [HumanMessage(content="bench")]
+
+    async def one():
+        async with gate:
+            started = time.perf_counter()
+            first = None
+            async for _ in router.astream("llama-3", messages, max_tokens=16):
+                if first is None:
+                    first = time.perf_counter() - started
+            ttfts.append(first)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    await router.aclose()
+    return {
+        "label": label,
+        "p50": percentile(ttfts, 50) * 1000,
+        "p95": percentile(ttfts, 95) * 1000,
+        "p99": percentile(ttfts, 99) * 1000,
+        "mean": statistics.fmean(ttfts) * 1000,
+        "spread": {name: len(s.requests) - before[name] for name, s in servers.items()},
+        "hedges": router.hedges_fired,
+    }
+
+
+async def main(requests: int, concurrency: int):
+    rng = random.Random(7)
+    servers = {
+        "fast": StubOpenAIServer(first_token_delay=lambda: rng.uniform(0.015, 0.025), name="fast"),
+        "slow": StubOpenAIServer(first_token_delay=lambda: rng.uniform(0.10, 0.14), name="slow"),
+        "straggler": StubOpenAIServer(
+            first_token_delay=lambda: 1.0 if rng.random() < 0.10 else rng.uniform(0.015, 0.025), name="straggler"
+        ),
+    }
+    for server in servers.values():
+        await server.start()
+    try:
+        rows = [
+            await run_policy("weighted", servers, "weighted", False, requests, concurrency),
+            await run_policy("latency", servers, "latency", False, requests, concurrency),
+            await run_policy("latency+hedge", servers, "latency", True, requests, concurrency),
+        ]
+    finally:
+        for server in servers.values():
+            await server.stop()
+
+    print(f"{'policy':<15}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'mean ms':>9}{'hedges':>8}  spread")
+    for r in rows:
+        print(f"{r['label']:<15}{r['p50']:>9.1f}{r['p95']:>9.1f}{r['p99']:>9.1f}{r['mean']:>9.1f}{r['hedges']:>8}  {r['spread']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
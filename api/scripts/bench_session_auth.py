@@ -0,0 +1,75 @@
+# api/scripts/bench_session_auth.py
+
+"""
+Benchmarks per-request cost of session token validation.
+
+Builds a Prisma-shaped SQLite database with --sessions sessions, then times:
+- a cache hit (the steady state: clients reuse their token)
+- a cache miss (read-only pooled SQLite lookup through the unique index)
+- a rejected token answered from the negative cache
+- session_token() extracting the token from a request's cookies
+
+Usage (from the repo root):
+    python -m api.scripts.bench_session_auth --sessions 100000
+"""
+
+import argparse
+import os
+import secrets
+import sqlite3
+import tempfile
+import time
+import timeit
+
+from starlette.requests import Request
+
+from api.services.session_auth.session_auth_service import SessionStore, session_token
+
+
+def build_db(path: str, sessions: int) -> list:
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        'CREATE TABLE "User" ("id" TEXT PRIMARY KEY, "role" TEXT);'
+        'CREATE TABLE "Session" ("id" TEXT PRIMARY KEY, "sessionToken" TEXT NOT NULL, "userId" TEXT NOT NULL,'
+        ' "expires" DATETIME NOT NULL);'
+        'CREATE UNIQUE INDEX "Session_sessionToken_key" ON "Session"("sessionToken");'
+    )
+    expires = int(time.time() * 1000) + 86_400_000
+    tokens = [secrets.token_hex(32) for _ in range(sessions)]
+    conn.executemany('INSERT INTO "User" VALUES (?, ?)', [(f"u{i}", "USER") for i in range(sessions)])
+    conn.executemany('INSERT INTO "Session" VALUES (?, ?, ?, ?)',
+                     [(f"s{i}", token, f"u{i}", expires) for i, token in enumerate(tokens)])
+    conn.commit()
+    conn.close()
+    return tokens
+
+
+def main(sessions: int, number: int):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "app_db.sqlite")
+        tokens = build_db(path, sessions)
+        store = SessionStore(path, max_entries=sessions + 1)
+        store.lookup(tokens[0])
+        store.lookup("not-a-session")
+
+        misses = iter(tokens[1:])
+        request = Request({"type": "http", "headers": [(b"cookie", f"next-auth.session-token={tokens[0]}".encode())]})
+        cases = [
+            ("cache hit", lambda: store.lookup(tokens[0]), number),
+            ("cache miss (SQLite)", lambda: store.lookup(next(misses)), min(number, sessions - 1) // 5),
+            ("negative cache hit", lambda: store.lookup("not-a-session"), number),
+            ("session_token() from cookie", lambda: session_token(request), number),
+        ]
+        print(f"{sessions} sessions in the Session table")
+        for label, fn, count in cases:
+            best = min(timeit.repeat(fn, number=count, repeat=5)) / count
+            print(f"{label:<30}{best * 1e6:>8.2f} µs")
+        store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+    main(args.sessions, args.number)
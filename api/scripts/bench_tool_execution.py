@@ -0,0 +1,95 @@
+# api/scripts/bench_tool_execution.py
+
+"""
+Benchmarks tool execution for one model turn: running its tool calls one
+after another (what a plain loop over AIMessage.tool_calls does) against
+ToolExecutor, which runs them all at once.
+
+Per turn of --calls calls, timed:
+- I/O tools (an awaited --latency second request each): serial vs concurrent
+- blocking I/O tools (time.sleep, run in threads): serial vs concurrent
+- CPU tools (--work squares summed each): serial on the event loop vs the
+  process pool of --workers workers
+- the same turn again, served from the argument cache
+
+Usage (from the repo root):
+    python -m api.scripts.bench_tool_execution --calls 8 --latency 0.05 --workers 4
+"""
+
+import argparse
+import asyncio
+import time
+
+from api.services.tool_execution.tool_execution_service import ToolExecutor, ToolRegistry
+
+LATENCY = [0.05]
+
+
+async def fetch(key: int) -> str:
+    """An I/O-bound tool: one remote request."""
+    await asyncio.sleep(LATENCY[0])
+    return f"value {key}"
+
+
+def read_file(key: int) -> str:
+    """A blocking I/O tool."""
+    time.sleep(LATENCY[0])
+    return f"value {key}"
+
+
+def crunch(key: int, n: int) -> int:
+    """A CPU-bound tool."""
+    return sum(i * i for i in range(n)) + key
+
+
+async def serial(registry: ToolRegistry, calls: list):
+    for call in calls:
+        fn = registry.get(call["name"]).fn
+        result = fn(**call["args"])
+        if asyncio.iscoroutine(result):
+            await result
+
+
+async def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+async def main(calls: int, latency: float, work: int, workers: int):
+    LATENCY[0] = latency
+    registry = ToolRegistry()
+    registry.register(fetch)
+    registry.register(read_file)
+    registry.register(crunch, kind="cpu")
+    executor = ToolExecutor(registry, pool_size=workers, cache_size=0)
+    cached = ToolExecutor(registry, pool_size=workers)
+    executor.pool().submit(int).result()  # Workers started outside the timings
+
+    def turn(name: str, **args) -> list:
+        return [{"name": name, "args": {"key": i, **args}, "id": f"call_{i}"} for i in range(calls)]
+
+    print(f"{calls} calls per turn, {latency * 1e3:.0f} ms per I/O call, {work} squares per CPU call")
+    for label, batch in (("I/O (async)", turn("fetch")), ("I/O (blocking)", turn("read_file")),
+                         ("CPU", turn("crunch", n=work))):
+        before = await timed(lambda: serial(registry, batch))
+        after = await timed(lambda: executor.execute(batch))
+        print(f"{label + ': serial':<30}{before * 1e3:>10.2f} ms")
+        print(f"{label + ': ToolExecutor':<30}{after * 1e3:>10.2f} ms   ({before / after:.1f}x)")
+    batch = turn("fetch")
+    await cached.execute(batch)
+    print(f"{'I/O (async): cached':<30}{await timed(lambda: cached.execute(batch)) * 1e3:>10.2f} ms")
+    executor.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--work", type=int, default=2_000_000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.latency, args.work, args.workers))
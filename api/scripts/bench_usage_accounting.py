@@ -0,0 +1,82 @@
+# api/scripts/bench_usage_accounting.py
+
+"""
+Benchmarks the usage accounting added to every LLM request.
+
+Copies the Prisma database (--db) for its Model prices and times:
+- UsageLedger.record(): pricing plus the in-memory counters, per request
+- the same request written to SQLite inline (what the counters replace)
+- one flush of --keys pending counters (user, conversation, model)
+- the local estimate used when a backend reports no usage
+
+Usage (from the repo root):
+    python -m api.scripts.bench_usage_accounting --db prisma/app_db.sqlite
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import timeit
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from api.services.preset_catalog.preset_catalog_service import PresetCatalog
+from api.services.usage_accounting.usage_accounting_service import (
+    _ADD, _SCHEMA, UsageLedger, count_tokens, estimate_prompt_tokens,
+)
+
+
+def main(db: str, number: int, keys: int):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "app_db.sqlite")
+        shutil.copy(db, path)
+        catalog = PresetCatalog(path)
+        model = next(iter(catalog.snapshot.models))
+        ledger = UsageLedger(os.path.join(directory, "usage.sqlite"), catalog=catalog)
+
+        inline = sqlite3.connect(os.path.join(directory, "inline.sqlite"), isolation_level=None)
+        inline.execute("PRAGMA journal_mode=WAL")
+        inline.executescript(_SCHEMA)
+
+        def record_inline():
+            cost = ledger.price(model, 1200, 300, 400) or 0.0
+            inline.execute(_ADD, (time.strftime("%Y-%m-%d", time.gmtime()), "user", "conversation", model,
+                                  1, 1200, 400, 300, cost, int(time.time() * 1000)))
+
+        messages = [HumanMessage(content="Summarise yesterday's incident report. " * 20),
+                    AIMessage(content="The incident started when the cache was cold. " * 20)] * 5
+        reply = "The outage lasted twelve minutes and was caused by a cold cache. " * 10
+
+        cases = [
+            ("record() (counters)", lambda: ledger.record(model, "user", "conversation", 1200, 300, 400), number),
+            ("inline SQLite write", record_inline, number // 100),
+            ("estimate (10 messages)", lambda: estimate_prompt_tokens(messages) + count_tokens(reply), number // 100),
+        ]
+        print(f"model {model}, {len(catalog.snapshot.models)} model(s) in the catalog")
+        for label, fn, count in cases:
+            best = min(timeit.repeat(fn, number=count, repeat=5)) / count
+            print(f"{label:<30}{best * 1e6:>10.2f} µs")
+        ledger.flush()
+
+        for i in range(keys):
+            ledger.record(model, f"user-{i % 100}", f"conversation-{i}", 1200, 300, 400)
+        started = time.perf_counter()
+        rows = ledger.flush()
+        elapsed = time.perf_counter() - started
+        print(f"{'flush of ' + str(rows) + ' counters':<30}{elapsed * 1e3:>10.2f} ms")
+
+        inline.close()
+        ledger.close()
+        catalog.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="prisma/app_db.sqlite")
+    parser.add_argument("--number", type=int, default=100000)
+    parser.add_argument("--keys", type=int, default=10000)
+    args = parser.parse_args()
+    main(args.db, args.number, args.keys)
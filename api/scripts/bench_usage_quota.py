@@ -0,0 +1,93 @@
+# api/scripts/bench_usage_quota.py
+
+"""
+Benchmarks the quota checks added to every chat request.
+
+Fills a usage store with --users users' spend for today (every user in one of
+--groups groups) and times:
+- QuotaManager.admit(): the check before a request starts
+- QuotaGuard.consume(): the re-check on every streamed chunk
+- the same check as a SQLite query of the day's totals (what the in-memory
+  counters replace)
+- one flush that re-reads every worker's totals (the background reconcile)
+
+Usage (from the repo root):
+    python -m api.scripts.bench_usage_quota --users 10000
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import timeit
+
+from langchain_core.messages import HumanMessage
+
+from api.services.usage_accounting.usage_accounting_service import _TOTALS, UsageLedger
+from api.services.usage_quota.usage_quota_service import QuotaManager
+
+
+class Prices:
+    """Stands in for the preset catalog: one price for every model."""
+
+    price = type("Model", (), {"input_cost": 2.5, "cached_input_cost": None, "output_cost": 10.0})
+
+    def model(self, model_name):
+        return self.price
+
+
+def main(users: int, groups: int, number: int):
+    with tempfile.TemporaryDirectory() as directory:
+        prisma = os.path.join(directory, "app_db.sqlite")
+        conn = sqlite3.connect(prisma)
+        conn.executescript('CREATE TABLE "User" ("id" TEXT PRIMARY KEY, "role" TEXT);'
+                           'CREATE TABLE "GroupUser" ("id" TEXT PRIMARY KEY, "userId" TEXT, "groupId" TEXT);')
+        conn.executemany('INSERT INTO "User" VALUES (?, ?)', [(f"user-{i}", "USER") for i in range(users)])
+        conn.executemany('INSERT INTO "GroupUser" VALUES (?, ?, ?)',
+                         [(f"m{i}", f"user-{i}", f"group-{i % groups}") for i in range(users)])
+        conn.commit()
+        conn.close()
+
+        ledger = UsageLedger(os.path.join(directory, "usage.sqlite"), catalog=Prices())
+        quotas = QuotaManager(ledger, prisma, limits={"user": (10**9, 1000.0), "group": (10**12, 10**6)})
+        quotas.refresh()
+        for i in range(users):
+            ledger.record("gpt-4o", f"user-{i}", f"conversation-{i}", 1200, 300)
+        ledger.flush()
+
+        guard = quotas.admit("user-1", "gpt-4o")
+        guard.start([HumanMessage(content="Summarise yesterday's incident report.")])
+        store = sqlite3.connect(f"file:{ledger.path}?mode=ro", uri=True)
+        day = time.strftime("%Y-%m-%d", time.gmtime())
+
+        def per_request_query():
+            members = [f"user-{i}" for i in range(1, users, groups)]
+            totals = {row[0]: row for row in store.execute(_TOTALS, (day,))}
+            return totals["user-1"], sum(totals[m][1] for m in members)
+
+        cases = [
+            ("admit() (counters)", lambda: quotas.admit("user-1", "gpt-4o"), number),
+            ("consume() per chunk", lambda: guard.consume(" token"), number),
+            ("SQLite totals per request", per_request_query, max(1, number // 1000)),
+        ]
+        print(f"{users} user(s) in {groups} group(s)")
+        for label, fn, count in cases:
+            best = min(timeit.repeat(fn, number=count, repeat=5)) / count
+            print(f"{label:<30}{best * 1e6:>12.2f} µs")
+        guard.release()
+
+        started = time.perf_counter()
+        ledger.flush()
+        print(f"{'reconcile (flush + totals)':<30}{(time.perf_counter() - started) * 1e3:>12.2f} ms")
+        store.close()
+        ledger.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+    main(args.users, args.groups, args.number)
@@ -0,0 +1,102 @@
+# api/scripts/bench_ws_codecs.py
+
+"""
+Benchmarks the WebSocket frame encodings on streamed chat replies.
+
+Builds the frames the server sends for a reply of N tokens (one chunk per
+token, as OpenAI-compatible backends stream them) for /v1/ws/chat and
+/v1/ws/mux, and for each encoding reports per 1k tokens:
+
+- bytes on the wire (payload + WebSocket frame header), raw and with
+  permessage-deflate (zlib, context takeover, as uvicorn negotiates it)
+- server CPU to encode the frames, and to encode + deflate them
+
+Usage (from the repo root):
+    python -m api.scripts.bench_ws_codecs --tokens 1000 --repeat 50
+"""
+
+import argparse
+import random
+import time
+import uuid
+import zlib
+
+from api.services.ws_codec.ws_codec_service import CODECS, JSON_CODEC
+
+WORDS = ("the", " model", " streams", " a", " reply", " token", " by", " token", ",", " and", " each",
+         " chunk", " is", " sent", " as", " one", " frame", ".", " Latency", " matters", " here", "\n")
+
+
+def frame_header(size: int) -> int:
+    """Bytes of an unmasked server-to-client WebSocket frame header."""
+    return 2 if size < 126 else 4 if size < 65536 else 10
+
+
+def reply_frames(tokens: int, mux: bool) -> list:
+    rng = random.Random(7)
+    stream_id = uuid.uuid4().hex
+    frames = []
+    for offset in range(tokens):
+        frame = {"role": "ai", "content": rng.choice(WORDS), "stream_id": stream_id, "offset": offset}
+        if mux:
+            frame = {"type": "chunk", "request_id": "r42", "conversation_id": "pane-3", **frame}
+        frames.append(frame)
+    return frames
+
+
+def deflate_all(payloads: list) -> list:
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    out = []
+    for payload in payloads:
+        data = payload.encode() if isinstance(payload, str) else payload
+        out.append(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)[:-4])
+    return out
+
+
+def wire_bytes(payloads: list) -> int:
+    sizes = [len(p.encode()) if isinstance(p, str) else len(p) for p in payloads]
+    return sum(size + frame_header(size) for size in sizes)
+
+
+def measure(codec, frames: list, repeat: int) -> dict:
+    encode = codec.encode
+    payloads = [encode(f) for f in frames]
+    assert [codec.decode(p) for p in payloads] == frames  # Round trip
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            encode(frame)
+    encode_s = (time.perf_counter() - started) / repeat
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        deflate_all([encode(f) for f in frames])
+    deflate_s = (time.perf_counter() - started) / repeat
+
+    per_k = 1000.0 / len(frames)
+    return {
+        "bytes": wire_bytes(payloads) * per_k,
+        "bytes_deflate": wire_bytes(deflate_all(payloads)) * per_k,
+        "encode_us": encode_s * 1e6 * per_k,
+        "deflate_us": deflate_s * 1e6 * per_k,
+    }
+
+
+def main(tokens: int, repeat: int):
+    codecs = {"json": JSON_CODEC, **{name.split(".")[1]: c for name, c in CODECS.items() if "json" not in name}}
+    for mux in (False, True):
+        frames = reply_frames(tokens, mux)
+        print(f"\n{'/v1/ws/mux' if mux else '/v1/ws/chat'} chunk frames, per 1k tokens ({tokens} tokens, {repeat} runs)")
+        print(f"{'encoding':<10}{'wire B':>10}{'deflate B':>12}{'encode µs':>12}{'+deflate µs':>14}")
+        for name, codec in codecs.items():
+            r = measure(codec, frames, repeat)
+            print(f"{name:<10}{r['bytes']:>10.0f}{r['bytes_deflate']:>12.0f}{r['encode_us']:>12.0f}{r['deflate_us']:>14.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    main(args.tokens, args.repeat)
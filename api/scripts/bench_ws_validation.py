@@ -0,0 +1,79 @@
+# api/scripts/bench_ws_validation.py
+
+"""
+Benchmarks per-message validation of inbound /v1/ws/chat frames.
+
+Compares, per message:
+- the old handler: json.loads + dict.get with no checks
+- the precompiled TypeAdapter: validate_json straight from the wire
+- parse_frame(): size check + validate_json (what the route runs)
+- parse_frame() on a MessagePack frame
+- a pydantic BaseModel (WebSocketChatRequest) for reference
+- rejection cost for an oversized and an invalid frame
+
+Usage (from the repo root):
+    python -m api.scripts.bench_ws_validation --number 100000
+"""
+
+import argparse
+import json
+import timeit
+
+from api.services.ws_codec.ws_codec_service import CODECS, JSON_CODEC, InvalidFrame, parse_frame
+from api.services.ws_codec.ws_frames import CHAT_FRAME
+
+FRAME = {
+    "user_input": "Summarise the last three messages and suggest a reply that keeps the tone friendly. " * 2,
+    "model_name": "gpt-4o",
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "max_length": 256,
+    "conversation_id": "c0a8012e-6f1d-4d7b-9d55-3c2f6e7a9b10",
+}
+FIELDS = ("user_input", "model_name", "system_prompt", "temperature", "top_p", "max_length", "conversation_id")
+
+
+def old_handler(raw: str) -> dict:
+    data = json.loads(raw)
+    return {field: data.get(field) for field in FIELDS}
+
+
+def rejected(raw) -> None:
+    try:
+        parse_frame(JSON_CODEC, raw, CHAT_FRAME)
+    except InvalidFrame:
+        pass
+
+
+def main(number: int):
+    from api.v1.llm_ws_streaming_route import WebSocketChatRequest
+
+    raw = JSON_CODEC.encode(FRAME)
+    cases = [
+        ("json.loads + .get (old)", lambda: old_handler(raw)),
+        ("TypeAdapter.validate_json", lambda: CHAT_FRAME.validate_json(raw)),
+        ("parse_frame (json)", lambda: parse_frame(JSON_CODEC, raw, CHAT_FRAME)),
+        ("BaseModel.model_validate_json", lambda: WebSocketChatRequest.model_validate_json(raw)),
+    ]
+    if "chat.msgpack.v1" in CODECS:
+        codec = CODECS["chat.msgpack.v1"]
+        packed = codec.encode(FRAME)
+        cases.append(("parse_frame (msgpack)", lambda: parse_frame(codec, packed, CHAT_FRAME)))
+    oversized = json.dumps({"user_input": "x" * 1_000_000})
+    invalid = json.dumps({**FRAME, "temperature": 5})
+    cases += [
+        ("reject oversized (1 MB)", lambda: rejected(oversized)),
+        ("reject invalid field", lambda: rejected(invalid)),
+    ]
+
+    print(f"Per-message cost, {len(raw)} byte frame, best of 5 x {number}")
+    for label, fn in cases:
+        best = min(timeit.repeat(fn, number=number, repeat=5)) / number
+        print(f"{label:<32}{best * 1e6:>8.2f} µs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+    main(args.number)
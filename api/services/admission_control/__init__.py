@@ -0,0 +1 @@
+# Init for admission_control module
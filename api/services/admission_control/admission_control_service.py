@@ -0,0 +1,310 @@
+"""
+Admission control for LLM streams.
+
+Two independent gates run before a stream is started:
+
+1. Rate limit: a token bucket per tenant, keyed by API key (hashed) or client
+   IP. Buckets live in a BucketStore; the in-memory store is per worker, the
+   SQLite store shares buckets between all workers on a host.
+2. Concurrency: a per-worker cap on concurrent streams with a bounded wait
+   queue. When the queue is full, or a slot does not free up within the
+   queue timeout, the request is rejected at once instead of piling up.
+
+Rejections raise AdmissionRejected (an HTTP 429). The HTTP middleware turns
+it into a 429 response and the WebSocket route into a close frame
+(4429 for rate limits, 1013 when the worker is saturated).
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+from api.config.exceptions import TooManyRequestsException
+from api.config.logging import logger
+from api.config.metrics import metrics
+from api.config.settings import (
+    ADMISSION_ENABLED, ADMISSION_RATE_PER_MINUTE, ADMISSION_BURST, ADMISSION_MAX_STREAMS,
+    ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT, ADMISSION_STORE, ADMISSION_STORE_PATH
+)
+
+WS_CLOSE_RATE_LIMITED = 4429  # Application close code mirroring HTTP 429
+WS_CLOSE_TRY_AGAIN_LATER = 1013  # RFC 6455: server overloaded, retry later
+
+metrics.describe("admission_rejected_total", "Requests rejected by admission control")
+metrics.describe("admission_active_streams", "LLM streams currently admitted on this worker")
+metrics.describe("admission_queue_depth", "Requests waiting for a stream slot on this worker")
+metrics.describe("admission_rate_errors_total", "Rate checks that failed (store error) and let the request through")
+
+
+class AdmissionRejected(TooManyRequestsException):
+    """
+    A request refused by admission control.
+
+    Args:
+        reason (str): "rate_limited" (tenant bucket empty) or "busy" (no stream slot).
+        detail (str): Message returned to the client.
+        retry_after (float): Seconds the client should wait.
+    """
+
+    def __init__(self, reason: str, detail: str, retry_after: float):
+        super().__init__(detail=detail, retry_after=retry_after)
+        self.reason = reason
+
+    @property
+    def ws_code(self) -> int:
+        return WS_CLOSE_RATE_LIMITED if self.reason == "rate_limited" else WS_CLOSE_TRY_AGAIN_LATER
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, burst: float) -> float:
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+class MemoryBucketStore:
+    """
+    Token buckets in a dict, private to this worker.
+
+    Buckets that have refilled completely are indistinguishable from new ones,
+    so they are pruned once the dict grows past `max_keys`.
+    """
+
+    blocking = False  # take() is called on the event loop
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets = {}
+
+    def take(self, key: str, rate: float, burst: float, now: float, cost: float = 1.0) -> float:
+        """Takes `cost` tokens; returns 0 on success, else seconds until they are available."""
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = _refill(tokens, updated, now, rate, burst)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / rate if rate > 0 else float("inf")
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._prune(rate, burst, now)
+        return wait
+
+    def _prune(self, rate: float, burst: float, now: float):
+        full = [k for k, (t, u) in self._buckets.items() if _refill(t, u, now, rate, burst) >= burst]
+        for key in full:
+            del self._buckets[key]
+
+
+class SQLiteBucketStore:
+    """
+    Token buckets in a local SQLite file shared by every worker on the host.
+
+    Each take is one short `BEGIN IMMEDIATE` transaction (WAL mode, no fsync),
+    so workers see a single bucket per tenant. Connections are opened lazily
+    per process, which keeps the store safe across pre-fork workers.
+
+    A take waits up to a second for another worker's write lock, so the
+    controller runs it in a thread (`blocking`), never on the event loop. The
+    worker's takes share one connection and run one at a time.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str = ADMISSION_STORE_PATH):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()  # One transaction at a time on the shared connection
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def take(self, key: str, rate: float, burst: float, now: float, cost: float = 1.0) -> float:
+        """Takes `cost` tokens; returns 0 on success, else seconds until they are available. Blocks."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = burst if row is None else _refill(row[0], row[1], now, rate, burst)
+                wait = 0.0
+                if tokens >= cost:
+                    tokens -= cost
+                else:
+                    wait = (cost - tokens) / rate if rate > 0 else float("inf")
+                conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                             (key, tokens, now))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return wait
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+
+
+class AdmissionController:
+    """
+    Rate limiting plus concurrency admission for LLM streams.
+
+    Args:
+        rate_per_minute (float): Sustained requests per tenant per minute.
+        burst (float): Token bucket size per tenant.
+        max_streams (int): Concurrent streams admitted by this worker.
+        max_queue (int): Requests allowed to wait for a slot.
+        queue_timeout (float): Seconds a queued request waits before rejection.
+        store (MemoryBucketStore | SQLiteBucketStore, optional): Bucket storage.
+    """
+
+    def __init__(self, rate_per_minute: float = ADMISSION_RATE_PER_MINUTE, burst: float = ADMISSION_BURST,
+                 max_streams: int = ADMISSION_MAX_STREAMS, max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT, store=None):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_streams = max_streams
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.store = store or MemoryBucketStore()
+        self.active = 0
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(max_streams)
+
+    @staticmethod
+    def client_key(scope: dict) -> str:
+        """
+        Tenant key for an ASGI scope: the API key if one is sent, else the client IP.
+
+        API keys are hashed so raw secrets never reach the (possibly shared) store.
+        """
+        headers = dict(scope.get("headers") or [])
+        api_key = headers.get(b"x-api-key", b"")
+        authorization = headers.get(b"authorization", b"")
+        if not api_key and authorization.lower().startswith(b"bearer "):
+            api_key = authorization[7:]
+        if api_key:
+            return "key:" + hashlib.sha256(api_key.strip()).hexdigest()[:32]
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def check_rate(self, key: str):
+        """
+        Takes one token from `key`'s bucket; a blocking store (SQLite) is called in a thread.
+        A store that fails (e.g. a locked database) lets the request through: the
+        concurrency slots still bound the load, and a 500 would help no one.
+
+        Raises:
+            AdmissionRejected: If the bucket is empty.
+        """
+        try:
+            if self.store.blocking:
+                wait = await asyncio.to_thread(self.store.take, key, self.rate, self.burst, time.time())
+            else:
+                wait = self.store.take(key, self.rate, self.burst, time.time())
+        except Exception as e:
+            metrics.inc("admission_rate_errors_total")
+            logger.warning(f"⚠️ Rate check for {key} failed, admitting: {e}")
+            return
+        if wait > 0:
+            metrics.inc("admission_rejected_total", reason="rate_limited")
+            raise AdmissionRejected("rate_limited", f"Rate limit exceeded, retry in {wait:.1f}s", wait)
+
+    async def acquire_slot(self):
+        """
+        Waits (boundedly) for a stream slot.
+
+        Raises:
+            AdmissionRejected: If the wait queue is full or the wait times out.
+        """
+        if self._slots.locked():
+            if self.waiting >= self.max_queue:
+                metrics.inc("admission_rejected_total", reason="queue_full")
+                raise AdmissionRejected("busy", "Server busy, too many concurrent streams", self.queue_timeout)
+            self.waiting += 1
+            metrics.set("admission_queue_depth", self.waiting)
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                metrics.inc("admission_rejected_total", reason="queue_timeout")
+                raise AdmissionRejected("busy", "Server busy, no stream slot freed up in time", self.queue_timeout)
+            finally:
+                self.waiting -= 1
+                metrics.set("admission_queue_depth", self.waiting)
+        else:
+            await self._slots.acquire()
+        self.active += 1
+        metrics.set("admission_active_streams", self.active)
+
+    def release_slot(self):
+        self.active -= 1
+        metrics.set("admission_active_streams", self.active)
+        self._slots.release()
+
+    async def enter(self, key: str):
+        """
+        Admits one stream for tenant `key` whose slot outlives the caller, such as a
+        reply generated in the background: rate check, then a concurrency slot.
+
+        Returns:
+            callable: Frees the slot; calls after the first do nothing.
+
+        Raises:
+            AdmissionRejected: When either gate refuses the request.
+        """
+        await self.check_rate(key)
+        await self.acquire_slot()
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.release_slot()
+        return release
+
+    @asynccontextmanager
+    async def admit(self, key: str):
+        """
+        Admits one stream for tenant `key`: rate check, then a concurrency slot
+        held until the block exits.
+
+        Raises:
+            AdmissionRejected: When either gate refuses the request.
+        """
+        release = await self.enter(key)
+        try:
+            yield
+        finally:
+            release()
+
+    def snapshot(self) -> dict:
+        return {
+            "active_streams": self.active,
+            "max_streams": self.max_streams,
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+            "rate_per_minute": self.rate * 60.0,
+            "burst": self.burst,
+            "store": type(self.store).__name__,
+        }
+
+
+@lru_cache()
+def get_admission_controller() -> AdmissionController:
+    """Returns the process-wide admission controller configured from settings."""
+    store = SQLiteBucketStore(ADMISSION_STORE_PATH) if ADMISSION_STORE == "sqlite" else MemoryBucketStore()
+    controller = AdmissionController(store=store)
+    logger.info(f"🚦 Admission control {'enabled' if ADMISSION_ENABLED else 'disabled'}: {controller.snapshot()}")
+    return controller
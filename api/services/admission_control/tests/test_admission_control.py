@@ -0,0 +1,184 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.config import settings
+from api.config.middleware import admission_middleware, middleware_loader
+from api.config.middleware.admission_middleware import AdmissionMiddleware
+from api.services.admission_control.admission_control_service import (
+    AdmissionController, AdmissionRejected, MemoryBucketStore, SQLiteBucketStore
+)
+from api.services.stream_replay.stream_replay_service import StreamRegistry
+
+
+def test_bucket_allows_burst_then_rejects_with_retry_after():
+    store = MemoryBucketStore()
+    assert [store.take("t", rate=1.0, burst=3, now=100.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert store.take("t", rate=1.0, burst=3, now=100.0) == pytest.approx(1.0)
+    assert store.take("t", rate=1.0, burst=3, now=101.5) == 0.0  # Refilled
+    assert store.take("other", rate=1.0, burst=3, now=101.5) == 0.0  # Buckets are per tenant
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "buckets.sqlite")
+    worker_a, worker_b = SQLiteBucketStore(path), SQLiteBucketStore(path)
+    assert worker_a.take("t", rate=0.1, burst=2, now=10.0) == 0.0
+    assert worker_b.take("t", rate=0.1, burst=2, now=10.0) == 0.0
+    assert worker_a.take("t", rate=0.1, burst=2, now=10.0) > 0  # Bucket drained by both workers
+    worker_a.close()
+    worker_b.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_rate_check_waits_for_a_locked_store_off_the_event_loop(tmp_path):
+    path = str(tmp_path / "buckets.sqlite")
+    controller = AdmissionController(rate_per_minute=60, burst=5, store=SQLiteBucketStore(path))
+    await controller.check_rate("t")  # Creates the table
+    other_worker = sqlite3.connect(path, isolation_level=None)
+    other_worker.execute("BEGIN IMMEDIATE")  # Holds the write lock
+
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    clock = asyncio.create_task(ticker())
+    check = asyncio.create_task(controller.check_rate("t"))
+    await asyncio.sleep(0.3)
+    other_worker.execute("COMMIT")
+    await check
+    clock.cancel()
+    other_worker.close()
+    controller.store.close()
+    assert len(ticks) >= 20 and max(b - a for a, b in zip(ticks, ticks[1:])) < 0.1  # The loop kept running
+
+
+def test_client_key_prefers_hashed_api_key():
+    scope = {"headers": [(b"authorization", b"Bearer sk-secret")], "client": ("10.0.0.1", 1234)}
+    key = AdmissionController.client_key(scope)
+    assert key.startswith("key:") and "sk-secret" not in key
+    assert AdmissionController.client_key({"headers": [], "client": ("10.0.0.1", 1)}) == "ip:10.0.0.1"
+
+
+@pytest.mark.asyncio
+async def test_concurrency_gate_queues_then_rejects():
+    controller = AdmissionController(rate_per_minute=6000, burst=100, max_streams=1, max_queue=1, queue_timeout=0.2)
+    release = asyncio.Event()
+
+    async def stream():
+        async with controller.admit("t"):
+            await release.wait()
+
+    first = asyncio.create_task(stream())
+    await asyncio.sleep(0)
+    queued = asyncio.create_task(stream())
+    await asyncio.sleep(0)
+    assert controller.waiting == 1
+
+    with pytest.raises(AdmissionRejected) as rejected:  # Queue full: rejected without waiting
+        async with controller.admit("t"):
+            pass
+    assert rejected.value.ws_code == 1013
+
+    release.set()
+    await asyncio.gather(first, queued)
+    assert (controller.active, controller.waiting) == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_background_generation_keeps_its_slot_after_the_client_leaves():
+    controller = AdmissionController(rate_per_minute=6000, burst=100, max_streams=1, max_queue=0)
+    registry, finish = StreamRegistry(), asyncio.Event()
+
+    async def reply():
+        yield {"role": "ai", "content": "a"}
+        await finish.wait()
+        yield {"role": "ai", "content": "b"}
+
+    buffer = registry.start(reply(), release=await controller.enter("t"))
+    tail = buffer.tail(0)
+    await anext(tail)
+    await tail.aclose()  # The client left; generation carries on upstream
+    with pytest.raises(AdmissionRejected):
+        await controller.enter("t")  # So a reconnect-and-resend cannot open a second stream
+    finish.set()
+    await buffer.producer
+    assert controller.active == 0
+
+    cancelled = registry.start(reply(), release=await controller.enter("t"))
+    cancelled.cancel()  # Before the producer's first step
+    await asyncio.gather(cancelled.producer, return_exceptions=True)
+    assert controller.active == 0
+
+
+def test_middleware_answers_429_on_guarded_paths_only():
+    app = FastAPI()
+
+    @app.post("/v1/chat-window")
+    async def chat():
+        return {"ok": True}
+
+    @app.get("/health")
+    async def health():
+        return {"ok": True}
+
+    controller = AdmissionController(rate_per_minute=1, burst=2, max_streams=10)
+    app.add_middleware(AdmissionMiddleware, paths=["/v1/chat-window"], controller=controller)
+    client = TestClient(app)
+
+    statuses = [client.post("/v1/chat-window").status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    response = client.post("/v1/chat-window")
+    assert int(response.headers["retry-after"]) >= 1
+    assert all(client.get("/health").status_code == 200 for _ in range(5))
+    assert controller.active == 0
+
+
+def test_a_failing_rate_store_lets_requests_through():
+    class LockedStore(MemoryBucketStore):
+        def take(self, key, rate, burst, now):
+            raise sqlite3.OperationalError("database is locked")
+
+    app = FastAPI()
+
+    @app.post("/v1/chat-window")
+    async def chat():
+        return {"ok": True}
+
+    controller = AdmissionController(rate_per_minute=1, burst=1, max_streams=10, store=LockedStore())
+    app.add_middleware(AdmissionMiddleware, paths=["/v1/chat-window"], controller=controller)
+    client = TestClient(app)
+    assert [client.post("/v1/chat-window").status_code for _ in range(3)] == [200, 200, 200]
+    assert controller.active == 0
+
+
+def test_loader_registers_switched_middlewares_from_any_directory(monkeypatch, tmp_path):
+    assert "" not in settings.ENABLED_MIDDLEWARES  # An unset env var means "all", not a list of one blank name
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(middleware_loader, "ENABLED_MIDDLEWARES", ["debug_middleware"])
+    monkeypatch.setattr(middleware_loader, "FLAGGED_MIDDLEWARES",
+                        {"admission_middleware": True, "body_limit_middleware": True})
+    monkeypatch.setattr(admission_middleware, "ADMISSION_ENABLED", True)
+    app = FastAPI()
+    middleware_loader.load_custom_middlewares(app)
+    assert {middleware.cls.__name__ for middleware in app.user_middleware} == {
+        "AdmissionMiddleware", "BodyLimitMiddleware", "TemplateMiddleware"}
+
+    monkeypatch.setattr(middleware_loader, "FLAGGED_MIDDLEWARES",
+                        {"admission_middleware": False, "body_limit_middleware": False})
+    app = FastAPI()
+    middleware_loader.load_custom_middlewares(app)
+    assert [middleware.cls.__name__ for middleware in app.user_middleware] == ["TemplateMiddleware"]
+
+    monkeypatch.setattr(middleware_loader, "FLAGGED_MIDDLEWARES",
+                        {"admission_middleware": True, "body_limit_middleware": True})
+    app = FastAPI()
+    middleware_loader.load_flagged_middlewares(app)  # What main.py loads: never the debug template
+    assert {middleware.cls.__name__ for middleware in app.user_middleware} == {
+        "AdmissionMiddleware", "BodyLimitMiddleware"}
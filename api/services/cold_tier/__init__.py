@@ -0,0 +1 @@
+# Init for cold_tier module
@@ -0,0 +1,338 @@
+"""
+Cold tier for idle conversations.
+
+Each LLMBot graph keeps every conversation in its MemorySaver, together with
+every checkpointed version of its message list, for as long as the worker
+lives. Most conversations are idle after a few minutes. ColdTier moves them
+out:
+
+- `checkout(thread_id)` runs before a bot reads or writes its conversation.
+  It marks the conversation as used and, if it is cold, rehydrates it into
+  the graph (one checkpoint holding the latest messages). It does nothing
+  else, so a request never pays for a sweep.
+- `in_use(thread_id)` brackets a turn. A conversation with a turn running is
+  never frozen, however long its tool rounds or its background producer take,
+  and its idle clock starts when the turn ends.
+- `sweep()` freezes conversations idle longer than COLD_TIER_IDLE_SECONDS.
+  Their latest messages are serialized with the checkpointer's serde and
+  compressed (zstd, or zlib, optionally with a shared dictionary) into memory
+  or COLD_TIER_DIR. The thread and its checkpoint history are then deleted
+  from the MemorySaver.
+- `run()` is the app lifespan's background task: every
+  COLD_TIER_SWEEP_INTERVAL seconds it sweeps in batches of SWEEP_BATCH
+  conversations, giving the event loop back between batches.
+- `conversations()` decodes every cold conversation, so a drain can hand them
+  off with the resident ones.
+
+Checkpoint history older than the latest state is not kept: a rehydrated
+conversation starts a new history.
+"""
+
+import asyncio
+import os
+import re
+import shutil
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+
+from api.config.logging import logger
+from api.config.metrics import metrics
+from api.config.settings import (
+    COLD_TIER_CODEC,
+    COLD_TIER_DICTIONARY,
+    COLD_TIER_DIR,
+    COLD_TIER_ENABLED,
+    COLD_TIER_IDLE_SECONDS,
+    COLD_TIER_LEVEL,
+    COLD_TIER_SWEEP_INTERVAL,
+)
+from api.services.conversation_memory.conversation_memory_service import to_messages
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SWEEP_BATCH = 64  # Conversations frozen between two yields to the event loop
+
+metrics.describe("cold_tier_conversations", "Conversations held compressed in the cold tier")
+metrics.describe("cold_tier_bytes", "Compressed bytes held by the cold tier")
+metrics.describe("cold_tier_compression_ratio", "Serialized / compressed size of the cold conversations")
+metrics.describe("cold_tier_frozen_total", "Idle conversations moved to the cold tier")
+metrics.describe("cold_tier_rehydrated_total", "Conversations rehydrated from the cold tier")
+metrics.describe("cold_tier_rehydrate_seconds_total", "Time spent rehydrating conversations (divide by the count)")
+metrics.describe("conversations_resident", "Conversations held in the graph's MemorySaver")
+metrics.describe("conversations_resident_bytes", "Serialized checkpoint bytes held in the graph's MemorySaver")
+
+
+class Compressor:
+    """zstd or zlib, with an optional shared dictionary."""
+
+    def __init__(self, codec: str = "zstd", level: int = 3, dictionary: bytes = None):
+        if codec == "zstd" and zstandard is None:
+            logger.warning("⚠️ zstandard is not installed; the cold tier uses zlib")
+            codec = "zlib"
+        if codec not in ("zstd", "zlib"):
+            raise ValueError(f"Unknown cold tier codec '{codec}'")
+        self.codec = codec
+        self.level = level
+        self.dictionary = dictionary
+        if codec == "zstd":
+            zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            self._zc = zstandard.ZstdCompressor(level=level, dict_data=zdict)
+            self._zd = zstandard.ZstdDecompressor(dict_data=zdict)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.codec == "zstd":
+            return self._zc.compress(data)
+        compressor = zlib.compressobj(self.level, zdict=self.dictionary) if self.dictionary else zlib.compressobj(self.level)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.codec == "zstd":
+            return self._zd.decompress(data)
+        decompressor = zlib.decompressobj(zdict=self.dictionary) if self.dictionary else zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+def train_dictionary(samples: list, size: int = 16384) -> bytes:
+    """
+    Trains a shared zstd dictionary from serialized conversations (needs
+    zstandard). The result also works as a zlib preset dictionary.
+    """
+    if zstandard is None:
+        raise RuntimeError("Training a dictionary needs the zstandard package")
+    return zstandard.train_dictionary(size, samples).as_bytes()
+
+
+class ColdTier:
+    """
+    Idle-conversation tier for one compiled graph and its MemorySaver.
+
+    Args:
+        app: The compiled graph (GLOBAL_APP).
+        memory (MemorySaver): Its checkpointer (GLOBAL_MEMORY).
+        name (str): Metrics label and on-disk subdirectory, e.g. "ws".
+        idle_seconds (float): Idle time before a conversation goes cold.
+        sweep_interval (float): Seconds between two sweeps of run().
+        compressor (Compressor): Defaults to the COLD_TIER_* settings.
+        directory (str, optional): Keep cold conversations on disk under this
+            directory instead of in memory.
+        enabled (bool): When False, checkout() only returns and run() does not sweep.
+    """
+
+    def __init__(self, app, memory, name: str, idle_seconds: float = COLD_TIER_IDLE_SECONDS,
+                 sweep_interval: float = COLD_TIER_SWEEP_INTERVAL, compressor: Compressor = None,
+                 directory: str = COLD_TIER_DIR, enabled: bool = COLD_TIER_ENABLED):
+        self.app = app
+        self.memory = memory
+        self.name = name
+        self.idle_seconds = idle_seconds
+        self.sweep_interval = sweep_interval
+        self.compressor = compressor or default_compressor()
+        self.enabled = enabled
+        # Nothing is created here: under PRELOAD_APP this runs in the pre-fork master (see directory)
+        self.root = directory
+        self._directory = None
+        self._directory_pid = None
+        self._last_used = {}
+        self._busy = Counter()  # thread_id -> turns running
+        self._cold = {}  # thread_id -> (serde type, serialized size, compressed bytes, or their size when on disk)
+        self._raw_bytes = 0
+        self._cold_bytes = 0
+
+    @property
+    def directory(self):
+        """
+        This worker's own directory under the root (`<name>-<pid>`), created on first use,
+        or None when cold conversations are kept in memory. Per process: another worker must
+        not rehydrate (or delete) this one's conversations.
+        """
+        if not self.root:
+            return None
+        if self._directory_pid != os.getpid():
+            directory = os.path.join(self.root, f"{self.name}-{os.getpid()}")
+            _remove_dead_worker_dirs(self.root, self.name)
+            shutil.rmtree(directory, ignore_errors=True)  # Left by an earlier process with the same pid
+            os.makedirs(directory)
+            self._directory, self._directory_pid = directory, os.getpid()
+        return self._directory
+
+    def checkout(self, thread_id: str) -> bool:
+        """
+        Marks `thread_id` as used, rehydrating it first if it is cold. O(1) unless it is.
+
+        Returns:
+            bool: True if the conversation was rehydrated.
+        """
+        if not self.enabled:
+            return False
+        self._last_used[thread_id] = time.monotonic()
+        return thread_id in self._cold and self._thaw(thread_id)
+
+    @contextmanager
+    def in_use(self, thread_id: str):
+        """Keeps `thread_id` resident while the block runs (a turn, with its tool rounds)."""
+        self._busy[thread_id] += 1
+        try:
+            yield
+        finally:
+            self._busy[thread_id] -= 1
+            if not self._busy[thread_id]:
+                del self._busy[thread_id]
+            self._last_used[thread_id] = time.monotonic()  # Idle from the end of the turn
+
+    async def run(self, interval: float = None):
+        """Sweeps every `interval` (sweep_interval) seconds until cancelled; the app lifespan starts it."""
+        interval = self.sweep_interval if interval is None else interval
+        while self.enabled:
+            await asyncio.sleep(interval)
+            try:
+                for _ in self._sweep():
+                    await asyncio.sleep(0)  # One batch at a time: requests run in between
+            except Exception as e:
+                logger.warning(f"⚠️ Cold tier sweep of {self.name} failed: {e}")
+
+    def sweep(self, now: float = None) -> int:
+        """Freezes every conversation idle longer than idle_seconds, all at once. Returns how many."""
+        return sum(self._sweep(now))
+
+    def _sweep(self, now: float = None):
+        """
+        Yields the number frozen per batch of SWEEP_BATCH, then 0 per batch of the walk
+        that sizes the resident checkpoints. Nothing awaits between freezing a batch and
+        deleting it from the MemorySaver, and each conversation is checked again when its
+        batch runs, so one used since the sweep began stays resident.
+        """
+        now = time.monotonic() if now is None else now
+        for thread_id in list(self.memory.storage.keys()):
+            self._last_used.setdefault(thread_id, now)  # Unseen threads start their idle clock now
+        idle = [tid for tid, used in self._last_used.items() if now - used >= self.idle_seconds]
+        total = 0
+        for start in range(0, len(idle), SWEEP_BATCH):
+            frozen = []
+            for thread_id in idle[start:start + SWEEP_BATCH]:
+                used = self._last_used.get(thread_id)
+                if used is None or used > now or thread_id in self._busy:
+                    continue  # Used or turned busy since the sweep began
+                del self._last_used[thread_id]
+                if thread_id in self.memory.storage and self._freeze(thread_id):
+                    frozen.append(thread_id)
+            if frozen:
+                self._forget(set(frozen))
+                total += len(frozen)
+            yield len(frozen)
+        if total:
+            metrics.inc("cold_tier_frozen_total", total, memory=self.name)
+            logger.info(f"🧊 Froze {total} idle conversation(s) of {self.name}")
+        self._publish()
+        size = sum(len(blob) for _, blob in list(self.memory.blobs.values()))
+        threads = list(self.memory.storage.values())
+        for start in range(0, len(threads), SWEEP_BATCH):
+            size += sum(self._thread_bytes(namespaces) for namespaces in threads[start:start + SWEEP_BATCH])
+            yield 0
+        metrics.set("conversations_resident_bytes", size, memory=self.name)
+
+    def conversations(self) -> dict:
+        """Returns {thread_id: [LangChain messages]} of every cold conversation."""
+        return {thread_id: to_messages(self._load(thread_id)) for thread_id in list(self._cold)}
+
+    def stats(self) -> dict:
+        return {
+            "cold": len(self._cold),
+            "cold_bytes": self._cold_bytes,
+            "raw_bytes": self._raw_bytes,
+            "compression_ratio": round(self._raw_bytes / self._cold_bytes, 2) if self._cold_bytes else None,
+            "resident": len(self.memory.storage),
+            "resident_bytes": self._resident_bytes(),
+        }
+
+    def _freeze(self, thread_id: str) -> bool:
+        messages = self.app.get_state({"configurable": {"thread_id": thread_id}}).values.get("messages")
+        if not messages:
+            return False
+        kind, raw = self.memory.serde.dumps_typed(messages)
+        blob = self.compressor.compress(raw)
+        if self.root:
+            with open(self._path(thread_id), "wb") as f:
+                f.write(blob)
+            self._cold[thread_id] = (kind, len(raw), len(blob))
+        else:
+            self._cold[thread_id] = (kind, len(raw), blob)
+        self._raw_bytes += len(raw)
+        self._cold_bytes += len(blob)
+        return True
+
+    def _load(self, thread_id: str) -> list:
+        kind, _, blob = self._cold[thread_id]
+        if self.root:
+            with open(self._path(thread_id), "rb") as f:
+                blob = f.read()
+        return self.memory.serde.loads_typed((kind, self.compressor.decompress(blob)))
+
+    def _thaw(self, thread_id: str) -> bool:
+        started = time.perf_counter()
+        messages = self._load(thread_id)
+        _, raw_size, blob = self._cold.pop(thread_id)
+        self._raw_bytes -= raw_size
+        self._cold_bytes -= blob if isinstance(blob, int) else len(blob)
+        if self.root:
+            os.remove(self._path(thread_id))
+        self.app.update_state({"configurable": {"thread_id": thread_id}}, {"messages": messages})
+        metrics.inc("cold_tier_rehydrated_total", memory=self.name)
+        metrics.inc("cold_tier_rehydrate_seconds_total", time.perf_counter() - started, memory=self.name)
+        self._publish()
+        return True
+
+    def _forget(self, thread_ids: set):
+        """Deletes threads with their checkpoints, writes and blobs (one pass, unlike delete_thread per id)."""
+        for thread_id in thread_ids:
+            self.memory.storage.pop(thread_id, None)
+        for store in (self.memory.writes, self.memory.blobs):
+            for key in [key for key in store if key[0] in thread_ids]:
+                del store[key]
+
+    def _resident_bytes(self) -> int:
+        size = sum(len(blob) for _, blob in self.memory.blobs.values())
+        return size + sum(self._thread_bytes(namespaces) for namespaces in list(self.memory.storage.values()))
+
+    @staticmethod
+    def _thread_bytes(namespaces: dict) -> int:
+        return sum(len(checkpoint[1]) + len(metadata[1])
+                   for checkpoints in list(namespaces.values()) for checkpoint, metadata, _ in list(checkpoints.values()))
+
+    def _path(self, thread_id: str) -> str:
+        return os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", thread_id) + ".cold")
+
+    def _publish(self):
+        metrics.set("cold_tier_conversations", len(self._cold), memory=self.name)
+        metrics.set("cold_tier_bytes", self._cold_bytes, memory=self.name)
+        metrics.set("cold_tier_compression_ratio",
+                    round(self._raw_bytes / self._cold_bytes, 2) if self._cold_bytes else 0, memory=self.name)
+        metrics.set("conversations_resident", len(self.memory.storage), memory=self.name)
+
+
+def default_compressor() -> Compressor:
+    dictionary = None
+    if COLD_TIER_DICTIONARY:
+        with open(COLD_TIER_DICTIONARY, "rb") as f:
+            dictionary = f.read()
+    return Compressor(COLD_TIER_CODEC, COLD_TIER_LEVEL, dictionary)
+
+
+def _remove_dead_worker_dirs(directory: str, name: str):
+    """Removes cold tier directories left by workers of this host that are gone."""
+    if not os.path.isdir(directory):
+        return
+    for entry in os.listdir(directory):
+        prefix, _, pid = entry.rpartition("-")
+        if prefix != name or not pid.isdigit():
+            continue
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+        except PermissionError:
+            pass  # Alive, another user's process
@@ -0,0 +1,113 @@
+import asyncio
+import os
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import START, StateGraph
+
+from api.services.cold_tier.cold_tier_service import ColdTier, Compressor, train_dictionary
+from api.services.conversation_memory.conversation_memory_service import SERDE, ConversationState, to_messages
+
+
+def graph():
+    workflow = StateGraph(state_schema=ConversationState)
+    workflow.add_node("model", lambda state: {"messages": []})
+    workflow.add_edge(START, "model")
+    memory = MemorySaver(serde=SERDE)
+    return workflow.compile(checkpointer=memory), memory
+
+
+def talk(app, thread_id, turns=3):
+    config = {"configurable": {"thread_id": thread_id}}
+    for i in range(turns):
+        app.update_state(config, {"messages": [HumanMessage(f"question {i} " * 20), AIMessage(f"answer {i} " * 20)]})
+    return app.get_state(config).values["messages"]
+
+
+@pytest.mark.parametrize("codec", ["zstd", "zlib"])
+def test_idle_conversations_freeze_and_rehydrate(codec, tmp_path):
+    app, memory = graph()
+    tier = ColdTier(app, memory, name="test", idle_seconds=0, sweep_interval=3600,
+                    compressor=Compressor(codec), directory=None)
+    before = {tid: to_messages(talk(app, tid)) for tid in ("a", "b")}
+
+    assert tier.sweep() == 2
+    assert len(memory.storage) == 0 and len(memory.blobs) == 0  # Checkpoint history dropped too
+    stats = tier.stats()
+    assert stats["cold"] == 2 and stats["compression_ratio"] > 2
+
+    assert tier.checkout("a") is True
+    assert to_messages(app.get_state({"configurable": {"thread_id": "a"}}).values["messages"]) == before["a"]
+    assert tier.checkout("a") is False
+    assert tier.conversations() == {"b": before["b"]}
+
+
+def test_disk_tier_with_shared_dictionary(tmp_path):
+    app, memory = graph()
+    samples = [memory.serde.dumps_typed(talk(app, f"s{i}", turns=i % 4 + 1))[1] for i in range(200)]
+    dictionary = train_dictionary(samples, size=4096)
+    stale = tmp_path / "test-999999999"
+    stale.mkdir()
+    tier = ColdTier(app, memory, name="test", idle_seconds=0, sweep_interval=0,
+                    compressor=Compressor("zlib", dictionary=dictionary), directory=str(tmp_path))
+    assert os.listdir(tmp_path) == ["test-999999999"]  # Nothing created before the first freeze
+
+    history = to_messages(talk(app, "c1"))
+    with tier.in_use("c1"):
+        assert tier.checkout("c1") is False  # Never sweeps
+        assert tier.sweep() == 200
+    assert "c1" in memory.storage and tier.stats()["cold"] == 200
+    assert tier.directory == str(tmp_path / f"test-{os.getpid()}")
+    assert len(os.listdir(tier.directory)) == 200
+    assert not stale.exists()  # Left by a worker that is gone
+
+    tier.sweep()
+    assert tier.checkout("c1") is True
+    assert to_messages(app.get_state({"configurable": {"thread_id": "c1"}}).values["messages"]) == history
+    assert len(os.listdir(tier.directory)) == 200
+
+
+def test_background_sweep_yields_between_batches_and_spares_busy_threads(monkeypatch):
+    from api.services.cold_tier import cold_tier_service
+
+    monkeypatch.setattr(cold_tier_service, "SWEEP_BATCH", 4)
+    app, memory = graph()
+    tier = ColdTier(app, memory, name="test", idle_seconds=0, sweep_interval=0, directory=None)
+    for i in range(10):
+        talk(app, f"t{i}", turns=1)
+
+    async def scenario():
+        sweeper = asyncio.create_task(tier.run(interval=0))
+        steps = 0
+        with tier.in_use("t9"):  # A turn still running, e.g. a replay producer after its client left
+            while tier.stats()["cold"] < 9:
+                steps += 1
+                await asyncio.sleep(0)
+            assert "t9" in memory.storage
+        sweeper.cancel()
+        return steps
+
+    assert asyncio.run(scenario()) >= 3  # One step per batch of 4, never the whole sweep at once
+    assert tier.stats()["cold"] == 9 and list(memory.storage) == ["t9"]
+
+
+def test_bot_rehydrates_its_conversation_transparently():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+    from api.services.llm_ws_streaming import llm_ws_streaming_service as service
+
+    bot = service.LLMBot(api_key="sk-test", conversation_id="cold-bot", system_prompt="Be brief.")
+    bot.update_memory(HumanMessage("hi"))
+    history = bot.conversation()
+
+    tier = service.GLOBAL_COLD_TIER
+    idle_seconds, tier.idle_seconds = tier.idle_seconds, 0
+    try:
+        tier.sweep()
+    finally:
+        tier.idle_seconds = idle_seconds
+    assert "cold-bot" not in service.GLOBAL_MEMORY.storage
+    assert "cold-bot" in tier.conversations()  # Still handed off on drain
+
+    again = service.LLMBot(api_key="sk-test", conversation_id="cold-bot", system_prompt="Be brief.")
+    assert again.conversation() == history
@@ -0,0 +1 @@
+# Init for conversation_memory module
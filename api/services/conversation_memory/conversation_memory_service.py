@@ -0,0 +1,143 @@
+"""
+Compact storage for conversation history.
+
+A LangChain message is a pydantic model: a __dict__, content, id, name,
+type, additional_kwargs and response_metadata dicts, and more. For short chat
+turns that overhead is most of the message. Conversation state therefore
+stores `MessageRecord`s: three slots (role, content, id) and no __dict__.
+
+- `ConversationState` replaces `MessagesState` in the LLMBot graphs. Its
+  reducer, `add_records()`, has `add_messages` semantics: messages get an id,
+  the same id replaces in place, and `RemoveMessage` deletes. Updates may
+  pass LangChain messages, records, or a mix of both.
+- `to_messages()` converts back at the boundary: the provider request,
+  `with_system_prompt()`, and the handoff store. The content str is shared,
+  not copied.
+- Messages that do not fit a record are stored unchanged: non-str content,
+  tool calls, names, or extra kwargs. The conversion is never lossy.
+
+Short contents ("ok", "thanks", "yes") are interned, so repeated turns share
+one str across all conversations.
+"""
+
+import sys
+import uuid
+from enum import IntEnum
+from typing import Annotated, TypedDict
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, RemoveMessage, SystemMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from api.services.prompt_assembly.prompt_store import PROMPT_REF, prompt_ref
+
+INTERN_MAX_CHARS = 64
+
+
+class Role(IntEnum):
+    SYSTEM = 0
+    HUMAN = 1
+    AI = 2
+    PROMPT = 3  # System prompt by reference: content is its prompt_ref
+
+
+_TYPES = {Role.SYSTEM: "system", Role.HUMAN: "human", Role.AI: "ai", Role.PROMPT: "system"}
+
+
+class MessageRecord:
+    """One stored turn: role, content and id, in slots."""
+
+    __slots__ = ("role", "content", "id")
+
+    def __init__(self, role: int, content: str, id: str):
+        self.role = Role(role)
+        self.content = sys.intern(content) if len(content) <= INTERN_MAX_CHARS else content
+        self.id = id
+
+    @property
+    def type(self) -> str:
+        return _TYPES[self.role]
+
+    def to_message(self) -> BaseMessage:
+        """The LangChain message for this record; `content` is shared, not copied."""
+        if self.role == Role.HUMAN:
+            return HumanMessage(content=self.content, id=self.id)
+        if self.role == Role.AI:
+            return AIMessage(content=self.content, id=self.id)
+        if self.role == Role.PROMPT:
+            return SystemMessage(content="", additional_kwargs={PROMPT_REF: self.content}, id=self.id)
+        return SystemMessage(content=self.content, id=self.id)
+
+    def _asdict(self) -> dict:
+        # Checkpoint serialization (JsonPlusSerializer encodes objects with _asdict by keyword)
+        return {"role": int(self.role), "content": self.content, "id": self.id}
+
+    def __eq__(self, other):
+        if not isinstance(other, MessageRecord):
+            return NotImplemented
+        return (self.role, self.content, self.id) == (other.role, other.content, other.id)
+
+    def __repr__(self):
+        return f"MessageRecord({self.role.name}, {self.content[:40]!r}, id={self.id!r})"
+
+
+def to_record(message):
+    """
+    Returns `message` as a MessageRecord, or the message itself if a record
+    cannot hold it without loss. The message must have an id.
+    """
+    if isinstance(message, MessageRecord):
+        return message
+    if not isinstance(message.content, str) or message.name or message.response_metadata:
+        return message
+    if isinstance(message, AIMessage) and (message.tool_calls or message.invalid_tool_calls or message.usage_metadata):
+        return message
+    kwargs = message.additional_kwargs
+    if isinstance(message, SystemMessage) and kwargs.keys() == {PROMPT_REF} and not message.content:
+        return MessageRecord(Role.PROMPT, prompt_ref(message), message.id)
+    if kwargs:
+        return message
+    role = {HumanMessage: Role.HUMAN, AIMessage: Role.AI, SystemMessage: Role.SYSTEM}.get(type(message))
+    return message if role is None else MessageRecord(role, message.content, message.id)
+
+
+def to_messages(items: list) -> list:
+    """Converts stored records (and pass-through messages) to LangChain messages."""
+    return [item.to_message() if isinstance(item, MessageRecord) else item for item in items]
+
+
+def add_records(left: list, right) -> list:
+    """
+    Conversation state reducer: `add_messages` semantics over MessageRecords.
+
+    New messages get an id; an item whose id is already stored replaces it in
+    place; RemoveMessage deletes by id. Returns a new list.
+    """
+    if not isinstance(right, list):
+        right = [right]
+    merged = list(left)
+    index = {item.id: i for i, item in enumerate(merged)}
+    removed = set()
+    for item in right:
+        if item.id is None:
+            item = item.model_copy(update={"id": str(uuid.uuid4())})
+        if isinstance(item, RemoveMessage):
+            if item.id not in index:
+                raise ValueError(f"Attempting to delete a message with an ID that doesn't exist ('{item.id}')")
+            removed.add(item.id)
+            continue
+        record = to_record(item)
+        if record.id in index:
+            merged[index[record.id]] = record
+            removed.discard(record.id)
+        else:
+            index[record.id] = len(merged)
+            merged.append(record)
+    return [item for item in merged if item.id not in removed] if removed else merged
+
+
+class ConversationState(TypedDict):
+    messages: Annotated[list, add_records]
+
+
+# Checkpoints must be allowed to rebuild MessageRecord
+SERDE = JsonPlusSerializer(allowed_msgpack_modules=[(MessageRecord.__module__, MessageRecord.__name__)])
@@ -0,0 +1,53 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import START, StateGraph
+
+from api.services.conversation_memory.conversation_memory_service import (
+    SERDE,
+    ConversationState,
+    MessageRecord,
+    Role,
+    add_records,
+    to_messages,
+)
+from api.services.prompt_assembly.prompt_store import prompt_message
+
+
+def test_reducer_has_add_messages_semantics():
+    stored = add_records([], [SystemMessage("Be brief."), HumanMessage("hi"), AIMessage("hel")])
+    assert [type(m) for m in stored] == [MessageRecord] * 3 and all(m.id for m in stored)
+    assert not hasattr(stored[0], "__dict__")
+
+    stored = add_records(stored, [AIMessage("hello", id=stored[2].id), RemoveMessage(id=stored[0].id)])
+    assert [(m.role, m.content) for m in stored] == [(Role.HUMAN, "hi"), (Role.AI, "hello")]
+    with pytest.raises(ValueError):
+        add_records(stored, [RemoveMessage(id="missing")])
+
+
+def test_records_convert_back_without_loss():
+    tool_call = AIMessage("", tool_calls=[{"name": "search", "args": {"q": "x"}, "id": "t1"}], id="a1")
+    prompt = prompt_message("You are terse.", id="s1")
+    long_turn = "a long answer " * 20
+    stored = add_records([], [prompt, HumanMessage("ok", id="h1"), AIMessage(long_turn, id="a0"), tool_call])
+    assert [type(m) for m in stored] == [MessageRecord, MessageRecord, MessageRecord, AIMessage]  # Kept as is
+    assert stored[0].role == Role.PROMPT
+
+    messages = to_messages(stored)
+    assert messages[0] == prompt and messages[3] is tool_call
+    assert messages[1] == HumanMessage("ok", id="h1")
+    assert messages[2].content is stored[2].content  # Shared, not copied
+    assert add_records([], [HumanMessage("o" + "k", id="h2")])[0].content is stored[1].content  # Interned
+
+
+def test_records_survive_checkpoints():
+    workflow = StateGraph(state_schema=ConversationState)
+    workflow.add_node("model", lambda state: {"messages": [AIMessage("pong")]})
+    workflow.add_edge(START, "model")
+    app = workflow.compile(checkpointer=MemorySaver(serde=SERDE))
+    config = {"configurable": {"thread_id": "t1"}}
+
+    app.invoke({"messages": [HumanMessage("ping")]}, config)
+    stored = app.get_state(config).values["messages"]
+    assert [(m.type, m.content) for m in stored] == [("human", "ping"), ("ai", "pong")]
+    assert all(isinstance(m, MessageRecord) for m in stored)
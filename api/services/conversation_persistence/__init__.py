@@ -0,0 +1 @@
+# Init for conversation_persistence module
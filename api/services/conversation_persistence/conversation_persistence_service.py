@@ -0,0 +1,266 @@
+"""
+Write-behind persistence of chat turns into the Prisma Conversation table.
+
+The Next.js app stores each conversation as a row of `Conversation`. The
+messages are kept in `conversationData` as a JSON array:
+`[{"role": "user" | "ai", "content": "...", "timestamp": "..."}, ...]`.
+
+`LLMBot.send_message` hands each completed turn (user message and reply) to
+`ConversationPersister.record()`. That call only appends to a bounded
+in-memory queue, so the streaming path never touches the disk. A background
+task then:
+- waits up to PERSIST_FLUSH_INTERVAL seconds for a batch of up to
+  PERSIST_BATCH_SIZE turns;
+- writes the batch from a worker thread in one SQLite transaction, with one
+  upsert per conversation.
+
+Failure handling:
+- While the queue is full, new turns are dropped and counted in
+  `persist_turns_total{result="dropped"}`. Streams are never slowed down.
+- A failed transaction is rolled back, and its turns go back to the front
+  of the queue.
+- `aclose()` runs as a drain flush hook. It stops the task and writes every
+  queued turn before the worker exits.
+
+Only turns with a user id are persisted, because `Conversation.userId` is
+required. In practice that means AUTH_ENABLED must be on.
+"""
+
+import asyncio
+import json
+import secrets
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from api.config.drain import get_drain_controller
+from api.config.logging import logger
+from api.config.metrics import metrics
+from api.config.settings import (
+    PERSIST_BATCH_SIZE,
+    PERSIST_DB_PATH,
+    PERSIST_ENABLED,
+    PERSIST_FLUSH_INTERVAL,
+    PERSIST_QUEUE_SIZE,
+)
+
+_SELECT = 'SELECT "conversationData" FROM "Conversation" WHERE "conversationId" = ? AND "userId" = ?'
+_UPSERT = (
+    'INSERT INTO "Conversation" ("id", "conversationId", "userId", "conversationData", "createdAt", "updatedAt") '
+    'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT ("conversationId") DO UPDATE SET '
+    '"conversationData" = excluded."conversationData", "updatedAt" = excluded."updatedAt" '
+    'WHERE "Conversation"."userId" = excluded."userId"'  # Never append to another user's conversation
+)
+
+metrics.describe("persist_queue_depth", "Chat turns waiting to be written to the Conversation table")
+metrics.describe("persist_turns_total", "Chat turns by result (queued, dropped, written)")
+metrics.describe("persist_batches_total", "Transactions writing queued chat turns")
+metrics.describe("persist_errors_total", "Failed Conversation table transactions (their turns are retried)")
+metrics.describe("persist_write_seconds_total", "Time spent in Conversation table transactions (divide by batches)")
+
+
+def _timestamp(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat(timespec="seconds")
+
+
+def _cuid() -> str:
+    """A primary key shaped like Prisma's @default(cuid()): 'c' and 24 lowercase characters."""
+    return "c" + secrets.token_hex(12)
+
+
+class ConversationPersister:
+    """
+    Bounded write-behind queue in front of the Prisma Conversation table.
+
+    Args:
+        path (str): The Prisma SQLite database. It must exist already; it is never created.
+        queue_size (int): Turns held in memory; further turns are dropped while full.
+        batch_size (int): Turns written per transaction.
+        flush_interval (float): Longest a queued turn waits for its batch to fill.
+        enabled (bool): When False, record() only returns.
+    """
+
+    def __init__(self, path: str = PERSIST_DB_PATH, queue_size: int = PERSIST_QUEUE_SIZE,
+                 batch_size: int = PERSIST_BATCH_SIZE, flush_interval: float = PERSIST_FLUSH_INTERVAL,
+                 enabled: bool = PERSIST_ENABLED):
+        self.path = path
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self._queue = deque()  # (conversation_id, user_id, [conversationData entries])
+        self._wakeup = None  # asyncio.Event on the writer task's loop
+        self._task = None
+        self._conn = None
+        self._closing = False
+        self._full = False
+
+    def record(self, conversation_id: str, user_id: str, user_text: str, reply: str, started: float = None) -> bool:
+        """
+        Queues one completed turn. Never blocks and never touches the disk.
+
+        Args:
+            started (float, optional): Epoch seconds the user message arrived; defaults to now.
+
+        Returns:
+            bool: False if the turn was not queued (no user, disabled, or queue full).
+        """
+        if not self.enabled or not user_id:
+            return False
+        if len(self._queue) >= self.queue_size:
+            metrics.inc("persist_turns_total", result="dropped")
+            if not self._full:
+                self._full = True
+                logger.warning(f"⚠️ Persistence queue full ({self.queue_size} turns); dropping new turns")
+            return False
+        self._full = False
+        now = time.time()
+        self._queue.append((conversation_id, user_id, [
+            {"role": "user", "content": user_text, "timestamp": _timestamp(started or now)},
+            {"role": "ai", "content": reply, "timestamp": _timestamp(now)},
+        ]))
+        metrics.inc("persist_turns_total", result="queued")
+        metrics.set("persist_queue_depth", len(self._queue))
+        self._ensure_writer()
+        if self._wakeup is not None and (len(self._queue) == 1 or len(self._queue) >= self.batch_size):
+            self._wakeup.set()
+        return True
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def flush(self) -> int:
+        """
+        Writes every queued turn from the calling thread; stops at the first
+        failed transaction, leaving the rest queued. Returns the turns written.
+        """
+        written = 0
+        while self._queue:
+            batch = self._take()
+            try:
+                self._write(batch)
+            except sqlite3.Error as e:
+                self._requeue(batch)
+                logger.error(f"❌ Could not persist {len(self._queue)} queued turn(s): {e}")
+                break
+            written += len(batch)
+        return written
+
+    async def aclose(self):
+        """Drain flush hook: lets the writer finish its batch, then writes every queued turn."""
+        self._closing = True
+        task = self._task
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            self._wakeup.set()
+            await task
+        written = await asyncio.to_thread(self.flush)
+        if written:
+            logger.info(f"💾 Persisted {written} queued turn(s) on shutdown")
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _ensure_writer(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # No event loop (scripts): flush() writes the queue
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._closing = False
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        failures = 0
+        while True:
+            if not self._queue:
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if len(self._queue) < self.batch_size and not self._closing:
+                # Give the batch up to flush_interval seconds to fill
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self._take()
+            try:
+                await asyncio.to_thread(self._write, batch)
+                failures = 0
+            except sqlite3.Error as e:
+                self._requeue(batch)
+                if self._closing:
+                    return  # aclose() makes the last attempt
+                failures += 1
+                logger.error(f"❌ Persisting {len(batch)} turn(s) failed (attempt {failures}), retrying: {e}")
+                await asyncio.sleep(min(self.flush_interval * 2 ** failures, 30.0))
+
+    def _take(self) -> list:
+        batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        metrics.set("persist_queue_depth", len(self._queue))
+        return batch
+
+    def _requeue(self, batch: list):
+        self._queue.extendleft(reversed(batch))  # Back in front, in order; may briefly exceed queue_size
+        metrics.set("persist_queue_depth", len(self._queue))
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # isolation_level=None: transactions are opened and committed explicitly
+            self._conn = sqlite3.connect(f"file:{self.path}?mode=rw", uri=True, timeout=5.0,
+                                         isolation_level=None, check_same_thread=False)
+        return self._conn
+
+    def _write(self, batch: list):
+        """Appends the batch's turns to their conversations in one transaction."""
+        started = time.perf_counter()
+        turns = {}  # conversation_id -> (user_id, entries), in queue order
+        for conversation_id, user_id, entries in batch:
+            turns.setdefault(conversation_id, (user_id, []))[1].extend(entries)
+        now = int(time.time() * 1000)  # Prisma's SQLite DateTime: epoch milliseconds
+        conn = self._connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")  # Take the write lock up front, not halfway through
+            for conversation_id, (user_id, entries) in turns.items():
+                row = conn.execute(_SELECT, (conversation_id, user_id)).fetchone()
+                data = _entries(row[0], conversation_id) if row else []
+                conn.execute(_UPSERT, (_cuid(), conversation_id, user_id, json.dumps(data + entries), now, now))
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            metrics.inc("persist_errors_total")
+            self.close()  # Closing rolls the transaction back
+            raise
+        metrics.inc("persist_batches_total")
+        metrics.inc("persist_turns_total", len(batch), result="written")
+        metrics.inc("persist_write_seconds_total", time.perf_counter() - started)
+
+
+def _entries(data, conversation_id: str) -> list:
+    """The stored conversationData array; anything else is replaced."""
+    if not data:
+        return []
+    try:
+        entries = json.loads(data)
+    except ValueError:
+        entries = None
+    if not isinstance(entries, list):
+        logger.warning(f"⚠️ conversationData of {conversation_id} is not a message array; replacing it")
+        return []
+    return entries
+
+
+@lru_cache()
+def get_conversation_persister() -> ConversationPersister:
+    """Returns the process-wide persister; its queue is flushed when the worker drains."""
+    persister = ConversationPersister()
+    get_drain_controller().on_flush(persister.aclose)
+    return persister
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+from api.services.conversation_persistence.conversation_persistence_service import ConversationPersister
+
+SCHEMA = (
+    'CREATE TABLE "Conversation" ("id" TEXT NOT NULL PRIMARY KEY, "conversationId" TEXT NOT NULL,'
+    ' "userId" TEXT NOT NULL, "conversationSchema" TEXT, "conversationData" TEXT,'
+    ' "createdAt" DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, "updatedAt" DATETIME NOT NULL);'
+    'CREATE UNIQUE INDEX "Conversation_conversationId_key" ON "Conversation"("conversationId");'
+)
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "app_db.sqlite")
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.execute('INSERT INTO "Conversation" VALUES (?, ?, ?, NULL, ?, 0, 0)',
+                 ("c-existing", "chat-1", "u1", json.dumps([{"role": "user", "content": "earlier", "timestamp": "9:00"}])))
+    conn.execute('INSERT INTO "Conversation" VALUES (?, ?, ?, NULL, ?, 0, 0)', ("c-other", "chat-2", "u2", "[]"))
+    conn.commit()
+    yield path, conn
+    conn.close()
+
+
+def stored(conn, conversation_id):
+    row = conn.execute('SELECT "userId", "conversationData", "updatedAt" FROM "Conversation" WHERE "conversationId" = ?',
+                       (conversation_id,)).fetchone()
+    return row and (row[0], json.loads(row[1]), row[2])
+
+
+def test_turns_are_appended_and_upserted(db):
+    path, conn = db
+    persister = ConversationPersister(path, batch_size=2, enabled=True)
+    assert not persister.record("chat-1", None, "anonymous", "not persisted")
+    persister.record("chat-1", "u1", "hi", "hello")
+    persister.record("chat-new", "u1", "new", "conversation")
+    persister.record("chat-1", "u1", "again", "still here")
+    persister.record("chat-2", "u1", "not", "yours")  # chat-2 belongs to u2
+
+    assert persister.flush() == 4 and persister.depth == 0
+    user_id, data, updated = stored(conn, "chat-1")
+    assert [(m["role"], m["content"]) for m in data] == [
+        ("user", "earlier"), ("user", "hi"), ("ai", "hello"), ("user", "again"), ("ai", "still here")]
+    assert updated > 0
+    assert [m["content"] for m in stored(conn, "chat-new")[1]] == ["new", "conversation"]
+    assert stored(conn, "chat-2") == ("u2", [], 0)
+    persister.close()
+
+
+def test_full_queue_drops_and_failed_writes_are_retried(tmp_path):
+    path = str(tmp_path / "app_db.sqlite")
+    sqlite3.connect(path).close()  # No Conversation table yet: every write fails
+    persister = ConversationPersister(path, queue_size=2, enabled=True)
+    assert persister.record("a", "u1", "1", "one")
+    assert persister.record("b", "u1", "2", "two")
+    assert not persister.record("c", "u1", "3", "three")
+
+    assert persister.flush() == 0 and persister.depth == 2  # Rolled back and kept, in order
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    assert persister.flush() == 2
+    assert [stored(conn, cid)[1][0]["content"] for cid in ("a", "b")] == ["1", "2"]
+    assert stored(conn, "c") is None
+    persister.close()
+    conn.close()
+
+
+def test_writer_task_batches_and_drain_flushes(db):
+    path, conn = db
+
+    async def scenario():
+        persister = ConversationPersister(path, batch_size=3, flush_interval=60, enabled=True)
+        for index in range(4):
+            persister.record("chat-1", "u1", f"q{index}", f"a{index}")
+        await asyncio.sleep(0.2)  # A full batch is written at once, the fourth turn waits for more
+        assert persister.depth == 1
+        assert len(stored(conn, "chat-1")[1]) == 1 + 6
+        await persister.aclose()  # Drain: the rest is written without waiting for the interval
+        assert persister.depth == 0
+
+    asyncio.run(scenario())
+    assert [m["content"] for m in stored(conn, "chat-1")[1]][-2:] == ["q3", "a3"]
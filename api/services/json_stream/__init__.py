@@ -0,0 +1 @@
+# Init for json_stream module
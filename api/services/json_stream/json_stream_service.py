@@ -0,0 +1,353 @@
+"""
+Incremental JSON extraction from streamed LLM output.
+
+`JsonStreamParser` is fed the chunks of a reply as they arrive (for example
+the content of `LLMBot.send_message` chunks) and returns events as soon as
+they are known:
+
+- ("start", path, "object" | "array"): a container opened at `path`
+- ("key", path): an object key was read; `path` ends with it
+- ("value", path, value): the value at `path` is complete (scalar or container)
+- ("document", (), value): a top-level object (or array) is complete
+- ("invalid", path, reason): the document being read turned out not to be JSON
+
+Paths are tuples of keys and list indexes: ("user", "tags", 0).
+
+Scanning:
+- Prose, markdown fences and anything else outside a document is skipped
+  with one regex search for the next `{` (or `[` with roots="{[").
+- Inside a document the text is tokenized with compiled regexes: whitespace,
+  numbers, string bodies. Strings are decoded by json's C `scanstring`, so
+  braces inside strings are just characters. Nesting is an explicit stack,
+  not recursion, so depth is only limited by memory.
+- A number or literal cut by a chunk boundary waits for the next chunk. A
+  string still open at the end of a chunk is kept as pieces, and only the
+  new text is scanned for its end. Every character is therefore looked at a
+  bounded number of times, and a reply is parsed in linear time however it
+  is chunked.
+- When a candidate turns out not to be JSON (a `{name}` placeholder in
+  prose), an "invalid" event is emitted and seeking resumes at the offending
+  character, never back at the candidate's start, which keeps the scan
+  linear. A document that starts inside the rejected candidate's strings is
+  missed.
+"""
+
+import re
+from json.decoder import JSONDecoder, scanstring
+
+_WS = re.compile(r"[ \t\n\r]*")
+_STRING_BODY = re.compile(r'(?:[^"\\]+|\\.)*', re.DOTALL)
+_NUMBER = re.compile(r"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?")
+_NUMBER_TAIL = re.compile(r"\.|[eE][+-]?")  # A number cut right after "." or "e"
+_LITERALS = {"t": ("true", True), "f": ("false", False), "n": ("null", None)}
+_CLOSERS = {"}": dict, "]": list}
+
+
+def _reject_constant(name: str):
+    raise ValueError(f"invalid literal {name!r}")
+
+
+_DECODER = JSONDecoder(parse_constant=_reject_constant)  # NaN and Infinity are not JSON
+
+# What the next token may be
+_SEEK = 0  # Outside a document: skip to the next root character
+_VALUE = 1  # Any value (after ":" or after "," in an array)
+_FIRST_VALUE = 2  # A value or "]" (just after "[")
+_FIRST_KEY = 3  # A key or "}" (just after "{")
+_KEY = 4  # A key (after "," in an object)
+_COLON = 5
+_AFTER = 6  # "," or the closer of the innermost container
+
+
+def _decode(buf: str, pos: int) -> str:
+    """Decodes the terminated JSON string whose opening quote is at `pos`."""
+    try:
+        return scanstring(buf, pos + 1, False)[0]
+    except ValueError as e:  # A bad escape such as "\\x"
+        raise InvalidJson(getattr(e, "msg", str(e)), pos)
+
+
+class JsonEvent:
+    """One parser event; see the module docstring for the kinds."""
+
+    __slots__ = ("kind", "path", "value")
+
+    def __init__(self, kind: str, path: tuple, value=None):
+        self.kind = kind
+        self.path = path
+        self.value = value
+
+    def __repr__(self):
+        return f"JsonEvent({self.kind!r}, {self.path!r}, {self.value!r})"
+
+    def __eq__(self, other):
+        return (isinstance(other, JsonEvent)
+                and (self.kind, self.path, self.value) == (other.kind, other.path, other.value))
+
+
+class InvalidJson(ValueError):
+    """Raised inside the scanner when a document breaks at `pos`; surfaces as an "invalid" event."""
+
+    def __init__(self, reason: str, pos: int):
+        super().__init__(reason)
+        self.pos = pos
+
+
+class JsonStreamParser:
+    """
+    Push parser for JSON documents embedded in streamed text.
+
+    Args:
+        roots (str): Characters that start a document: "{" (objects only) or "{[".
+        paths (bool): Emit start/key/value events for every path, not just documents.
+    """
+
+    def __init__(self, roots: str = "{", paths: bool = True):
+        self.roots = roots
+        self.paths = paths
+        self.documents = 0
+        self._seek = re.compile("[" + re.escape(roots) + "]")
+        self._buf = ""  # A token cut by the end of the last chunk (a number or literal: a few characters)
+        self._pieces = None  # Raw pieces of a string still open at the end of the last chunk
+        self._tail = ""  # A backslash that ended the last chunk inside that string
+        self._state = _SEEK
+        self._stack = []  # Open containers, innermost last
+        self._keys = []  # Key being filled in each open object (None for arrays)
+
+    @property
+    def in_document(self) -> bool:
+        return self._state != _SEEK
+
+    def feed(self, chunk: str) -> list:
+        """Scans `chunk`, returning the events it completed."""
+        events = []
+        state = self._state
+        pos = 0
+        if self._pieces is not None:
+            # Only the new text is scanned for the end of an open string: long strings stay linear
+            buf = self._tail + chunk
+            stop = _STRING_BODY.match(buf).end()
+            if stop == len(buf) or buf[stop] != '"':
+                self._pieces.append(buf[:stop])
+                self._tail = buf[stop:]
+                return events
+            raw = "".join(self._pieces) + buf[:stop + 1]
+            self._pieces, self._tail = None, ""
+            pos = stop + 1
+            try:
+                state = self._accept_string(events, state, _decode(raw, 0))
+            except InvalidJson as e:
+                state = self._invalid(events, e)
+        else:
+            buf = self._buf + chunk if self._buf else chunk
+
+        while True:
+            try:
+                state, pos = self._scan_tokens(events, buf, pos, state)
+                break
+            except InvalidJson as e:
+                state = self._invalid(events, e)
+                pos = e.pos  # Resume seeking at the offending character (it may start the next document)
+
+        self._state = state
+        self._buf = buf[pos:] if state != _SEEK and pos < len(buf) else ""
+        return events
+
+    def _invalid(self, events: list, error: InvalidJson) -> int:
+        events.append(JsonEvent("invalid", self._path(), str(error)))
+        self._stack.clear()
+        self._keys.clear()
+        return _SEEK
+
+    def _accept_string(self, events: list, state: int, value: str) -> int:
+        if state == _FIRST_KEY or state == _KEY:
+            self._keys[-1] = value
+            if self.paths:
+                events.append(JsonEvent("key", self._path()))
+            return _COLON
+        return self._complete(events, value)
+
+    def _scan_tokens(self, events: list, buf: str, pos: int, state: int) -> tuple:
+        """Consumes complete tokens from `pos`; returns the state and where the unconsumed text starts."""
+        end = len(buf)
+        stack, keys = self._stack, self._keys
+        while pos < end:
+            if state == _SEEK:
+                match = self._seek.search(buf, pos)
+                if match is None:
+                    return state, end
+                pos = match.end()
+                self._open(events, dict if match.group() == "{" else list)
+                state = _FIRST_KEY if match.group() == "{" else _FIRST_VALUE
+                continue
+
+            pos = _WS.match(buf, pos).end()
+            if pos == end:
+                break
+            ch = buf[pos]
+
+            if state == _AFTER:
+                if ch == ",":
+                    if type(stack[-1]) is dict:
+                        keys[-1] = None
+                        state = _KEY
+                    else:
+                        state = _VALUE
+                    pos += 1
+                elif _CLOSERS.get(ch) is type(stack[-1]):
+                    pos += 1
+                    state = self._close(events)
+                else:
+                    raise InvalidJson(f"expected ',' or a closing bracket, got {ch!r}", pos)
+
+            elif state == _VALUE or state == _FIRST_VALUE:
+                if ch == "]" and state == _FIRST_VALUE:
+                    pos += 1
+                    state = self._close(events)
+                elif ch == '"':
+                    value, pos = self._string(buf, pos)
+                    if value is None:
+                        break
+                    state = self._accept_string(events, state, value)
+                elif ch == "{" or ch == "[":
+                    pos += 1
+                    self._open(events, dict if ch == "{" else list)
+                    state = _FIRST_KEY if ch == "{" else _FIRST_VALUE
+                elif ch in _LITERALS:
+                    word, value = _LITERALS[ch]
+                    if buf.startswith(word, pos):
+                        pos += len(word)
+                        state = self._complete(events, value)
+                    elif end - pos < len(word) and word.startswith(buf[pos:]):
+                        break  # "tr" at the end of the chunk: wait for the rest
+                    else:
+                        raise InvalidJson(f"invalid literal {buf[pos:pos + len(word)]!r}", pos)
+                else:
+                    match = _NUMBER.match(buf, pos)
+                    if match is None:
+                        if ch == "-" and pos + 1 == end:
+                            break
+                        raise InvalidJson(f"unexpected {ch!r}", pos)
+                    if match.end() == end or _NUMBER_TAIL.fullmatch(buf, match.end()):
+                        break  # The number may go on in the next chunk
+                    text = match.group()
+                    pos = match.end()
+                    number = int(text) if text.isdigit() or text[1:].isdigit() else float(text)
+                    state = self._complete(events, number)
+
+            elif state == _FIRST_KEY or state == _KEY:
+                if ch == "}" and state == _FIRST_KEY:
+                    pos += 1
+                    state = self._close(events)
+                elif ch == '"':
+                    key, pos = self._string(buf, pos)
+                    if key is None:
+                        break
+                    state = self._accept_string(events, state, key)
+                else:
+                    raise InvalidJson(f"expected a key, got {ch!r}", pos)
+
+            else:  # _COLON
+                if ch != ":":
+                    raise InvalidJson(f"expected ':', got {ch!r}", pos)
+                pos += 1
+                state = _VALUE
+        return state, pos
+
+    def close(self) -> list:
+        """Ends the stream: a document still open is reported as invalid (truncated)."""
+        events = []
+        if self._state != _SEEK:
+            events.append(JsonEvent("invalid", self._path(), "unexpected end of stream"))
+        self._buf, self._pieces, self._tail, self._state = "", None, "", _SEEK
+        self._stack.clear()
+        self._keys.clear()
+        return events
+
+    def _string(self, buf: str, pos: int):
+        """Decodes the string at `pos`: (value, end), or (None, len(buf)) if it goes on in the next chunk."""
+        stop = _STRING_BODY.match(buf, pos + 1).end()
+        if stop == len(buf) or buf[stop] != '"':
+            self._pieces = [buf[pos:stop]]
+            self._tail = buf[stop:]  # A trailing backslash is scanned again with the next chunk
+            return None, len(buf)
+        return _decode(buf, pos), stop + 1
+
+    def _path(self) -> tuple:
+        path = tuple(key if type(container) is dict else len(container)
+                     for container, key in zip(self._stack, self._keys))
+        return path[:-1] if path and path[-1] is None else path  # An object before its next key
+
+    def _open(self, events: list, kind: type):
+        if self.paths:
+            events.append(JsonEvent("start", self._path(), "object" if kind is dict else "array"))
+        self._stack.append(kind())
+        self._keys.append(None)
+
+    def _close(self, events: list) -> int:
+        self._keys.pop()
+        return self._complete(events, self._stack.pop())
+
+    def _complete(self, events: list, value) -> int:
+        stack = self._stack
+        if not stack:
+            self.documents += 1
+            events.append(JsonEvent("document", (), value))
+            return _SEEK
+        container = stack[-1]
+        if self.paths:
+            events.append(JsonEvent("value", self._path(), value))
+        if type(container) is dict:
+            container[self._keys[-1]] = value
+        else:
+            container.append(value)
+        return _AFTER
+
+
+def extract_json(text: str, root_key: str = None, roots: str = "{"):
+    """
+    Returns the first JSON document in `text` (with `root_key` at its top level, if given), else None.
+
+    Candidates are first decoded whole by json's C decoder. From the first one it rejects, the
+    rest of the text goes to JsonStreamParser, so a text full of broken candidates stays linear.
+    """
+    seek = re.compile("[" + re.escape(roots) + "]")
+    match = seek.search(text)
+    while match is not None:
+        try:
+            value, end = _DECODER.raw_decode(text, match.start())
+        except ValueError:
+            break
+        if root_key is None or (isinstance(value, dict) and root_key in value):
+            return value
+        match = seek.search(text, end)
+    else:
+        return None
+
+    parser = JsonStreamParser(roots=roots, paths=False)
+    for event in parser.feed(text[match.start():]):
+        if event.kind == "document" and (root_key is None or (isinstance(event.value, dict)
+                                                             and root_key in event.value)):
+            return event.value
+    return None
+
+
+async def stream_json(chunks, roots: str = "{", paths: bool = True):
+    """
+    Parses an async stream of LLM chunks, yielding JsonEvents as they complete.
+
+    Args:
+        chunks: Async iterable of strings, message chunks (`.content`) or dicts with "content",
+            such as `LLMBot.send_message(...)`.
+    """
+    parser = JsonStreamParser(roots=roots, paths=paths)
+    async for chunk in chunks:
+        if isinstance(chunk, dict):
+            text = chunk.get("content")
+        else:
+            text = getattr(chunk, "content", chunk)
+        if text:
+            for event in parser.feed(text):
+                yield event
+    for event in parser.close():
+        yield event
@@ -0,0 +1,81 @@
+import json
+import random
+
+import pytest
+
+from api.services.json_stream.json_stream_service import JsonEvent, JsonStreamParser, extract_json, stream_json
+from api.utils.llm_utils import extract_json_from_text, update_json_in_text
+
+DOCUMENT = {
+    "system_variables": {
+        "user": {"name": "Zoë {admin}", "tags": ["a", "}", "\"quoted\""], "age": -12.5e2},
+        "matrix": [[1, 2], [], [{"deep": [True, False, None]}]],
+        "path": "C:\\temp\\{x}",
+    },
+    "empty": {},
+}
+
+
+def feed_chunks(parser, text, rng):
+    events, pos = [], 0
+    while pos < len(text):
+        size = rng.randint(1, 7)
+        events += parser.feed(text[pos:pos + size])
+        pos += size
+    return events + parser.close()
+
+
+def test_any_chunking_yields_the_document_and_its_paths():
+    text = f"Here is the result: ```json\n{json.dumps(DOCUMENT, ensure_ascii=False, indent=1)}\n``` Done {{x}}"
+    reference = JsonStreamParser().feed(text)
+    # The trailing "{x}" is prose: it is reported invalid, the document itself is unaffected
+    assert [event for event in reference if event.kind in ("document", "invalid")] == [
+        JsonEvent("document", (), DOCUMENT), JsonEvent("invalid", (), "expected a key, got 'x'")]
+    assert JsonEvent("value", ("system_variables", "user", "tags", 1), "}") in reference
+    assert JsonEvent("value", ("system_variables", "matrix", 2, 0, "deep", 2), None) in reference
+    assert JsonEvent("start", ("system_variables", "matrix", 1), "array") in reference
+
+    rng = random.Random(7)
+    for _ in range(200):
+        parser = JsonStreamParser()
+        assert feed_chunks(parser, text, rng) == reference
+        assert parser.documents == 1
+
+
+def test_invalid_candidates_resync_and_truncation_is_reported():
+    parser = JsonStreamParser(paths=False)
+    events = parser.feed('Fill {name} in, {"a": tru} then {"b": [1, {"c": 2}]} and {"d": "unfinished')
+    assert [event.kind for event in events] == ["invalid", "invalid", "document"]
+    assert events[1].path == ("a",)
+    assert events[2].value == {"b": [1, {"c": 2}]}
+    assert parser.in_document
+    assert parser.close() == [JsonEvent("invalid", ("d",), "unexpected end of stream")]
+
+    assert JsonStreamParser(roots="{[").feed("[1, 2.5e3, -0]")[-1].value == [1, 2500.0, 0]
+    assert extract_json('{"a": NaN} {"b": 1}') == {"b": 1}
+    assert extract_json("{" * 10000 + '{"ok": 1}') == {"ok": 1}
+
+
+def test_extract_json_from_text_handles_nesting_and_escaped_prompts():
+    reply = f"Sure!\n{json.dumps({'other': 1})}\n{json.dumps(DOCUMENT)}"
+    assert extract_json_from_text(reply, "system_variables") == DOCUMENT
+
+    prompt = update_json_in_text("You are a helpful assistant.", {"system_variables": {"user": {"id": 7}}})
+    assert "{{" in prompt
+    assert extract_json_from_text(prompt, "system_variables") == {"system_variables": {"user": {"id": 7}}}
+    assert extract_json_from_text("no json here", "system_variables") is None
+
+
+@pytest.mark.asyncio
+async def test_stream_json_reads_llm_chunks():
+    text = json.dumps({"answer": {"items": [1, 2]}})
+
+    async def chunks():
+        yield {"content": "", "message_id": "m1"}
+        for i in range(0, len(text), 3):
+            yield {"content": text[i:i + 3]}
+
+    events = [event async for event in stream_json(chunks())]
+    assert events[0] == JsonEvent("start", (), "object")
+    assert JsonEvent("value", ("answer", "items", 1), 2) in events
+    assert events[-1] == JsonEvent("document", (), {"answer": {"items": [1, 2]}})
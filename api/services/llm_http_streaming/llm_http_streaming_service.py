@@ -1,44 +1,103 @@
 import os
 import asyncio
+import time
 import uuid
+from contextlib import aclosing
 from dotenv import load_dotenv
 
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages.ai import add_ai_message_chunks
 from langchain_community.document_loaders import TextLoader
+from langchain_core.runnables import RunnableConfig
 from langgraph.checkpoint.memory import MemorySaver
-from langgraph.graph import START, MessagesState, StateGraph
+from langgraph.config import get_stream_writer
+from langgraph.graph import END, START, StateGraph
+
+from api.config.drain import get_drain_controller
+from api.services.cold_tier.cold_tier_service import ColdTier
+from api.services.conversation_memory.conversation_memory_service import SERDE, ConversationState, to_messages
+from api.services.conversation_persistence.conversation_persistence_service import get_conversation_persister
+from api.services.llm_routing.llm_routing_service import get_router
+from api.services.prompt_assembly.prompt_assembly_service import with_system_prompt
+from api.services.stream_handoff.stream_handoff_service import collect_conversations, get_handoff_store
+from api.services.tool_execution.tool_execution_service import call_tools, route_tools, tool_specs
+from api.services.usage_accounting.usage_accounting_service import get_usage_ledger
+from api.services.usage_quota.usage_quota_service import get_quota_manager
 
 # ---------------------------------------------------------------------------
 # A global MemorySaver & Workflow to hold ALL conversation threads separately.
 # Each conversation_id is stored as a separate "thread" in memory.
 # ---------------------------------------------------------------------------
 
-GLOBAL_MEMORY = MemorySaver()
-GLOBAL_WORKFLOW = StateGraph(state_schema=MessagesState)
+GLOBAL_MEMORY = MemorySaver(serde=SERDE)
+GLOBAL_WORKFLOW = StateGraph(state_schema=ConversationState)  # History stored as compact MessageRecords
 
-# We'll define a single node that calls the LLM with the entire conversation:
-def call_model(state: MessagesState):
+# The model node streams one request for the entire conversation. Chunks go out on the
+# graph's custom stream as they arrive; the completed reply is the node's update:
+async def call_model(state: ConversationState, config: RunnableConfig):
     print("📝 Calling model with stored messages for conversation...")
-    response = GLOBAL_LLM.invoke(state["messages"])
-    print(f"🤖 AI Response: {response.content}")
-    return {"messages": state["messages"] + [response]}
+    settings = config["configurable"]
+    model_name = settings.get("model_name", DEFAULT_MODEL)
+    user_id = settings.get("user_id")
+    # send_message admits the turn once; each model request of it holds the quota while it streams
+    quota = settings.get("quota") or get_quota_manager().admit(user_id, model_name)
+    messages = to_messages(state["messages"])
+    tools = tool_specs(messages)
+    write = get_stream_writer()
+    # Counted even if the client leaves mid-stream: the tokens were spent
+    meter = get_usage_ledger().meter(model_name, user_id, settings["thread_id"], messages)
+    chunks = []
+    try:
+        quota.start(messages)
+        async with aclosing(get_router().astream(model_name, messages, tools=tools,
+                                                 **settings.get("params", {}))) as stream:
+            async for response_chunk in stream:
+                meter.observe(response_chunk)
+                quota.consume(response_chunk.content)  # Cuts the stream (and the upstream request) at the quota
+                chunks.append(response_chunk)
+                write(response_chunk)
+    finally:
+        reply = "".join(chunk.content or "" for chunk in chunks)
+        meter.finish(reply)
+        quota.release()
+
+    # Only a request that offered tools can get calls back; merging chunks is skipped otherwise
+    calls = tools and any(c.tool_call_chunks for c in chunks) and add_ai_message_chunks(*chunks).tool_calls
+    print(f"🤖 AI Response: {reply}")
+    return {"messages": [AIMessage(content=reply, tool_calls=calls or [])]}
+
 
 GLOBAL_WORKFLOW.add_edge(START, "model")
 GLOBAL_WORKFLOW.add_node("model", call_model)
+# A reply that calls tools goes to the tools node, which runs every call at once and hands the results back:
+GLOBAL_WORKFLOW.add_node("tools", call_tools)
+GLOBAL_WORKFLOW.add_conditional_edges("model", route_tools, ["tools", END])
+GLOBAL_WORKFLOW.add_edge("tools", "model")
 
 # Compile once, referencing the same MemorySaver for all threads:
 GLOBAL_APP = GLOBAL_WORKFLOW.compile(checkpointer=GLOBAL_MEMORY)
 
-# We set up a global LLM that we only initialize once we know the API key/model:
-GLOBAL_LLM = None
+# Idle conversations are compressed out of GLOBAL_MEMORY and rehydrated on use:
+GLOBAL_COLD_TIER = ColdTier(GLOBAL_APP, GLOBAL_MEMORY, name="http")
+
+def flush_conversations():
+    """Drain hook: hands every conversation of this worker to the shared handoff store."""
+    conversations = {**GLOBAL_COLD_TIER.conversations(), **collect_conversations(GLOBAL_APP, GLOBAL_MEMORY)}
+    get_handoff_store().save_conversations(conversations)
+
+get_drain_controller().on_flush(flush_conversations)
+
+# Requests are routed per model_name through the registry-driven LLM router;
+# this is only the fallback when a client does not name a model:
+DEFAULT_MODEL = "gpt-4o"
 
 def load_text(input_value: str) -> str:
     """
     Checks if 'input_value' is a path; if so, load its text content. 
     Otherwise, return input_value as-is.
     """
-    if os.path.exists(input_value):
+    # Longer than any path: skip the stat, which would encode a copy of a large input
+    if len(input_value) <= 4096 and os.path.exists(input_value):
         loader = TextLoader(input_value)
         docs = loader.load()
         return " ".join(doc.page_content for doc in docs)
@@ -60,48 +119,72 @@ class LLMBot:
         temperature: float = 0.0,
         top_p: float = 1.0,
         max_length: int = 4096,
+        frequency_penalty: float = 0.0,
+        presence_penalty: float = 0.0,
         streaming: bool = True,
-        conversation_id: str = None
+        conversation_id: str = None,
+        user_id: str = None,  # Signed-in user; completed turns are persisted to their Conversation row
     ):
         if not api_key:
             raise ValueError("An API key is required to initialize the bot.")
         
-        model_name = model_name or "gpt-4o"
-        # Lazily initialize the global LLM if it's still None:
-        global GLOBAL_LLM
-        if GLOBAL_LLM is None:
-            GLOBAL_LLM = ChatOpenAI(
-                model=model_name, 
-                api_key=api_key,
-                streaming=streaming,
-                temperature=temperature,
-                top_p=top_p,
-                max_completion_tokens=max_length
-            )
+        # Resolve the model against the AI services registry up front so an
+        # unknown model fails here rather than mid-stream:
+        self.model_name = model_name or DEFAULT_MODEL
+        get_router().resolve(self.model_name)
+        self.temperature = temperature
+        self.top_p = top_p
+        self.max_length = max_length
+        self.frequency_penalty = frequency_penalty
+        self.presence_penalty = presence_penalty
 
         # Each instance can either use an existing conversation_id 
         # or generate a new one if none was provided:
         self.conversation_id = conversation_id or str(uuid.uuid4())
+        self.user_id = user_id
+
+        # A conversation this worker has never seen may have been handed off
+        # by a drained worker; restore it before adding anything new:
+        if conversation_id:
+            self.restore_handoff()
 
-        # If a system prompt is provided, we store it as a system message:
+        # If a system prompt is provided, it becomes the conversation's only system message
+        # (re-creating a bot for the same conversation_id must not stack duplicates):
         if system_prompt:
-            prompt_text = load_text(system_prompt)
-            self.update_memory(SystemMessage(content=prompt_text))
+            self.set_system_prompt(load_text(system_prompt))
 
         print(f"🚀 LLMBot initialized with conversation_id={self.conversation_id}")
 
+    def restore_handoff(self):
+        """Loads this conversation from the cold tier, or from the handoff store if it is not in local memory."""
+        if GLOBAL_COLD_TIER.checkout(self.conversation_id):
+            return
+        config = {"configurable": {"thread_id": self.conversation_id}}
+        if GLOBAL_APP.get_state(config).values.get("messages"):
+            return
+        messages = get_handoff_store().load_conversation(self.conversation_id)
+        if messages:
+            GLOBAL_APP.update_state(config, {"messages": messages})
+            print(f"♻️ Restored {len(messages)} handed-off messages for conversation_id={self.conversation_id}")
+
+    def set_system_prompt(self, text: str):
+        """Stores `text` as this conversation's single system prompt, replacing any previous one."""
+        GLOBAL_COLD_TIER.checkout(self.conversation_id)
+        config = {"configurable": {"thread_id": self.conversation_id}}
+        update = with_system_prompt(to_messages(GLOBAL_APP.get_state(config).values.get("messages", [])), text)
+        if update:
+            GLOBAL_APP.update_state(config, {"messages": update})
+
     def update_memory(self, message):
         """
         Appends a message (System/Human/AI) to this conversation's memory
         under self.conversation_id.
         """
+        GLOBAL_COLD_TIER.checkout(self.conversation_id)
         config = {"configurable": {"thread_id": self.conversation_id}}
-        state = GLOBAL_APP.get_state(config).values
-        current_msgs = state.get("messages", [])
-        updated_msgs = current_msgs + [message]
 
         print(f"📌 Storing message under conversation_id={self.conversation_id}: {message.content}")
-        GLOBAL_APP.update_state(config, {"messages": updated_msgs})
+        GLOBAL_APP.update_state(config, {"messages": [message]})
 
         # Debug: Print entire conversation for clarity
         new_state = GLOBAL_APP.get_state(config).values
@@ -111,30 +194,51 @@ class LLMBot:
 
     async def send_message(self, user_input: str):
         """
-        Receives the user_input, updates memory with a HumanMessage, 
-        streams the model's new answer, then stores the final AIMessage.
+        Receives the user_input and runs the turn through GLOBAL_APP: the HumanMessage
+        is the graph's input, the model's new answer streams from its custom stream, and
+        the turn is checkpointed once, when the run ends. Tool rounds run inside the graph;
+        only the answer's chunks are yielded.
         """
+        started = time.time()
         user_text = load_text(user_input)
-        human_message = HumanMessage(content=user_text)
-        self.update_memory(human_message)
+        # A spent daily quota refuses the message before it is stored (429 / 4429)
+        quota = get_quota_manager().admit(self.user_id, self.model_name)
+        # Resident until the turn ends, tool rounds included: a sweep never freezes it mid-run
+        with GLOBAL_COLD_TIER.in_use(self.conversation_id):
+            GLOBAL_COLD_TIER.checkout(self.conversation_id)
 
-        # Now retrieve the entire conversation from memory 
-        # and stream the LLM's response:
-        config = {"configurable": {"thread_id": self.conversation_id}}
-        state = GLOBAL_APP.get_state(config).values
-        print(f"🧠 Memory State (conversation_id={self.conversation_id}):")
-        for msg in state["messages"]:
-            print(f"  - {msg.type}: {msg.content}")
-
-        streamed_chunks = []
-        async for response_chunk in GLOBAL_LLM.astream(state["messages"]):
-            # Each chunk is an AIMessage with partial content
-            streamed_chunks.append(response_chunk.content or "")
-            yield response_chunk  # Pass chunks to FastAPI StreamingResponse
-
-        # Combine all chunks into one final string and store it in memory
-        final_response = "".join(streamed_chunks)
-        self.update_memory(AIMessage(content=final_response))
+            reply = None
+            async with aclosing(GLOBAL_APP.astream(
+                {"messages": [HumanMessage(content=user_text)]},
+                self.graph_config(quota),
+                stream_mode=["custom", "updates"],
+                durability="exit",  # One checkpoint per turn, written when the run ends
+            )) as run:
+                async for mode, item in run:
+                    if mode == "custom":
+                        if not isinstance(item, dict):  # Tool progress events have no place in a text stream
+                            yield item  # Pass chunks to FastAPI StreamingResponse
+                    elif "model" in item:
+                        reply = item["model"]["messages"][-1].content
+
+            # Queued for the Conversation table; written behind the stream
+            get_conversation_persister().record(self.conversation_id, self.user_id, user_text, reply, started)
+
+    def graph_config(self, quota) -> dict:
+        """The GLOBAL_APP run config of one turn: this conversation's thread and the model request settings."""
+        return {"configurable": {
+            "thread_id": self.conversation_id,
+            "model_name": self.model_name,
+            "user_id": self.user_id,
+            "quota": quota,
+            "params": {
+                "temperature": self.temperature,
+                "top_p": self.top_p,
+                "max_tokens": self.max_length,
+                "frequency_penalty": self.frequency_penalty,
+                "presence_penalty": self.presence_penalty,
+            },
+        }}
 
     # No reset method: we keep conversation memory indefinitely for each conversation_id.
 
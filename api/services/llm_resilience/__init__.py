@@ -0,0 +1 @@
+# Init for llm_resilience module
@@ -0,0 +1,181 @@
+"""
+Resilience primitives for provider streaming.
+
+- CircuitBreaker: per-endpoint closed → open → half-open state machine. An
+  open breaker fails fast instead of sending traffic to a browned-out backend;
+  after a cool-down a single trial request decides whether it closes again.
+- RetryBudget: process-wide token bucket that caps retries (and hedges) to a
+  fraction of original requests, so a brownout cannot turn into a retry storm.
+- backoff_delay(): full-jitter exponential backoff between attempts.
+
+Every state change is counted in the metrics registry (api/config/metrics.py).
+The LLM router (llm_routing_service.py) owns one breaker per endpoint and one
+retry budget per process.
+"""
+
+import random
+import time
+from functools import lru_cache
+
+from api.config.logging import logger
+from api.config.metrics import metrics
+from api.config.settings import (
+    ROUTING_EJECT_AFTER_FAILURES, ROUTING_EJECT_SECONDS, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY,
+    LLM_RETRY_BUDGET_RATIO, LLM_RETRY_BUDGET_MIN_PER_SECOND
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}  # Gauge encoding of breaker states
+
+metrics.describe("llm_circuit_state", "Circuit breaker state per endpoint (0=closed, 1=half_open, 2=open)")
+metrics.describe("llm_circuit_transitions_total", "Circuit breaker state transitions")
+metrics.describe("llm_retries_total", "Retries issued before the first token")
+metrics.describe("llm_retry_budget_exhausted_total", "Retries or hedges denied by the retry budget")
+metrics.describe("llm_first_token_timeouts_total", "Attempts abandoned for not producing a first token in time")
+metrics.describe("llm_fallbacks_total", "Requests served by a fallback model")
+
+
+class FirstTokenTimeout(Exception):
+    """Raised (as an attempt error) when an endpoint produces no chunk in time."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one endpoint.
+
+    Args:
+        name (str): Endpoint name used in logs and metric labels.
+        failure_threshold (int): Consecutive failures that open the circuit.
+        reset_timeout (float): Seconds the circuit stays open before a trial.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = ROUTING_EJECT_AFTER_FAILURES,
+                 reset_timeout: float = ROUTING_EJECT_SECONDS):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        metrics.set("llm_circuit_state", STATE_VALUES[CLOSED], endpoint=name)
+
+    def __repr__(self):
+        return f"CircuitBreaker({self.name!r}, state={self.state}, failures={self.consecutive_failures})"
+
+    @property
+    def retry_at(self) -> float:
+        """Monotonic time at which an open circuit admits a trial request."""
+        return self.opened_at + self.reset_timeout if self.state == OPEN else 0.0
+
+    def available(self, now: float = None) -> bool:
+        """
+        Returns True if a request may be sent now. Does not change state.
+
+        Closed: always. Open: once the reset timeout elapsed. Half-open: only
+        while no trial request is in flight.
+        """
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return (now if now is not None else time.monotonic()) >= self.retry_at
+        return not self.trial_in_flight
+
+    def on_attempt(self):
+        """Marks a request as sent; an expired open circuit becomes half-open."""
+        if self.state == OPEN and time.monotonic() >= self.retry_at:
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            self.trial_in_flight = True
+
+    def on_cancel(self):
+        """Releases the half-open trial slot of an attempt cancelled without a verdict."""
+        self.trial_in_flight = False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.trial_in_flight = False
+        if self.state != CLOSED:
+            self._transition(CLOSED)
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            self._transition(OPEN)
+        elif self.state == OPEN:
+            self.opened_at = time.monotonic()  # Failed again (e.g. health probe): restart cool-down
+
+    def _transition(self, state: str):
+        previous, self.state = self.state, state
+        metrics.inc("llm_circuit_transitions_total", endpoint=self.name, from_state=previous, to_state=state)
+        metrics.set("llm_circuit_state", STATE_VALUES[state], endpoint=self.name)
+        if state == OPEN:
+            logger.warning(
+                f"⚠️ Circuit for {self.name} opened for {self.reset_timeout:.0f}s "
+                f"after {self.consecutive_failures} consecutive failures"
+            )
+        elif state == CLOSED:
+            logger.info(f"✅ Circuit for {self.name} closed, endpoint healthy again")
+        else:
+            logger.info(f"🔄 Circuit for {self.name} half-open, sending trial request")
+
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to a share of original requests.
+
+    Every original request deposits `ratio` tokens and every retry withdraws
+    one; the bucket also refills at `min_per_second` so low-traffic workers can
+    still retry. The balance is capped at ten seconds' worth of the floor (or
+    ten tokens) so a quiet period cannot bank an unlimited burst.
+
+    Args:
+        ratio (float): Tokens deposited per original request.
+        min_per_second (float): Tokens added per second regardless of traffic.
+    """
+
+    def __init__(self, ratio: float = LLM_RETRY_BUDGET_RATIO, min_per_second: float = LLM_RETRY_BUDGET_MIN_PER_SECOND):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = max(10.0, min_per_second * 10.0)
+        self.balance = self.capacity
+        self._refilled_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.balance = min(self.capacity, self.balance + (now - self._refilled_at) * self.min_per_second)
+        self._refilled_at = now
+
+    def record_request(self):
+        """Deposits the per-request share of retry tokens."""
+        self._refill()
+        self.balance = min(self.capacity, self.balance + self.ratio)
+
+    def try_acquire(self) -> bool:
+        """Withdraws one retry token; returns False (and counts it) if the budget is spent."""
+        self._refill()
+        if self.balance >= 1.0:
+            self.balance -= 1.0
+            return True
+        metrics.inc("llm_retry_budget_exhausted_total")
+        return False
+
+    def snapshot(self) -> dict:
+        self._refill()
+        return {"balance": round(self.balance, 2), "capacity": self.capacity, "ratio": self.ratio}
+
+
+def backoff_delay(attempt: int, base: float = LLM_RETRY_BASE_DELAY, cap: float = LLM_RETRY_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**attempt))."""
+    return random.uniform(0.0, min(cap, base * (2 ** attempt)))
+
+
+@lru_cache()
+def get_retry_budget() -> RetryBudget:
+    """Returns the process-wide retry budget shared by every route."""
+    return RetryBudget()
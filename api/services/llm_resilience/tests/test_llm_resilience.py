@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from api.config.exceptions import ServiceUnavailableException
+from api.config.metrics import metrics
+from api.services.llm_resilience.llm_resilience_service import CircuitBreaker, RetryBudget
+from api.services.llm_routing.llm_routing_service import LLMRouter
+from api.services.llm_routing.stub_openai_server import StubOpenAIServer
+
+MESSAGES = [HumanMessage(content="hi")]
+
+
+async def collect(router, model_name, **params):
+    return "".join([chunk.content async for chunk in router.astream(model_name, MESSAGES, **params)])
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker("node-a", failure_threshold=2, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    breaker.on_attempt()  # Reset timeout elapsed: one trial goes through
+    assert breaker.state == "half_open" and not breaker.available()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    breaker.on_attempt()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert metrics.get("llm_circuit_transitions_total", endpoint="node-a", from_state="half_open", to_state="open") == 1
+    assert metrics.get("llm_circuit_state", endpoint="node-a") == 0
+
+
+def test_retry_budget_is_a_share_of_requests():
+    budget = RetryBudget(ratio=0.5, min_per_second=0.0)
+    budget.balance = 0.0
+    budget.record_request()
+    budget.record_request()
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+
+
+@pytest.mark.asyncio
+async def test_first_token_timeout_retries_on_another_endpoint():
+    async with StubOpenAIServer(first_token_delay=5.0, name="stalled") as stalled, StubOpenAIServer(name="ok") as ok:
+        router = LLMRouter({"llama-3": [
+            {"url": stalled.url, "engine": "vllm", "weight": 1000, "name": "stalled"},
+            {"url": ok.url, "engine": "vllm", "weight": 1, "name": "ok"},
+        ]}, first_token_timeout=0.2, retry_budget=RetryBudget())
+
+        assert await asyncio.wait_for(collect(router, "llama-3"), timeout=2.0) == "Hello world"
+        assert metrics.get("llm_first_token_timeouts_total", endpoint="stalled") >= 1
+        await asyncio.sleep(0.05)
+        assert stalled.cancelled == 1
+        await router.aclose()
+
+
+@pytest.mark.asyncio
+async def test_fallback_chain_and_open_circuit_fail_fast():
+    async with StubOpenAIServer(status=500, name="down") as down, StubOpenAIServer(name="backup") as backup:
+        router = LLMRouter({
+            "llama-3": [{"url": down.url, "engine": "vllm", "name": "down"}],
+            "mistral-7b": [{"url": backup.url, "engine": "vllm", "name": "backup"}],
+        }, eject_after=2, eject_seconds=60, max_retries=1, fallbacks={"llama-3": ["mistral-7b"]},
+            retry_budget=RetryBudget())
+
+        assert await collect(router, "llama-3") == "Hello world"  # Failed, retried, fell back
+        assert len(down.requests) == 2
+        assert router.resolve("llama-3").endpoints[0].breaker.state == "open"
+
+        assert await collect(router, "llama-3") == "Hello world"  # Circuit open: straight to fallback
+        assert len(down.requests) == 2
+        assert len(backup.requests) == 2
+        await router.aclose()
+
+
+@pytest.mark.asyncio
+async def test_brownout_without_fallback_fails_fast_within_budget():
+    async with StubOpenAIServer(status=500, name="brownout") as brownout:
+        budget = RetryBudget(ratio=0.0, min_per_second=0.0)
+        budget.balance = 0.0
+        router = LLMRouter({"llama-3": [{"url": brownout.url, "engine": "vllm"}]}, max_retries=3, retry_budget=budget)
+
+        with pytest.raises(ServiceUnavailableException):
+            await asyncio.wait_for(collect(router, "llama-3"), timeout=2.0)
+        assert len(brownout.requests) == 1  # Budget spent: no retry storm
+        await router.aclose()
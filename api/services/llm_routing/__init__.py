@@ -0,0 +1 @@
+# Init for llm_routing module
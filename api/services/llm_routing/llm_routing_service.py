@@ -0,0 +1,654 @@
+"""
+Multi-provider LLM routing driven by the get_ai_services() registry.
+
+Resolves a client-facing `model_name` to a route of one or more concrete
+OpenAI-compatible endpoints (hosted OpenAI/Anthropic/xAI, vLLM, llama.cpp
+server, LiteLLM proxy), balances requests across them with smooth weighted
+round-robin, and ejects endpoints that keep failing via a per-endpoint
+circuit breaker (see llm_resilience_service.py).
+
+Every endpoint owns its own httpx connection pool and ChatOpenAI client, both
+created lazily on first use so they are never shared across forked workers.
+
+With ROUTING_POLICY="latency" the router tracks rolling time-to-first-token
+(TTFT) and error rates per endpoint and prefers the fastest one; with
+ROUTING_HEDGE_ENABLED it also fires a duplicate request at a second endpoint
+when the first has not produced a token by its p95 TTFT, keeping whichever
+answers first and cancelling the other.
+
+Before the first token, failed or stalled attempts (connect timeout, no
+first chunk within LLM_FIRST_TOKEN_TIMEOUT) are retried with jittered backoff
+as long as the process-wide retry budget allows; if the whole route is down
+the request moves on to the model's LLM_FALLBACK_MODELS chain, and only then
+fails fast with ServiceUnavailableException.
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from functools import lru_cache
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from api.config.ai_services import find_ai_model, get_ai_endpoints
+from api.config.exceptions import NotFoundException, ServiceUnavailableException
+from api.config.logging import logger
+from api.config.metrics import metrics
+from api.config.settings import (
+    ROUTING_MAX_CONNECTIONS, ROUTING_MAX_KEEPALIVE, ROUTING_REQUEST_TIMEOUT,
+    ROUTING_EJECT_AFTER_FAILURES, ROUTING_EJECT_SECONDS, ROUTING_POLICY, ROUTING_LATENCY_WINDOW,
+    ROUTING_STATS_TTL, ROUTING_HEDGE_ENABLED, ROUTING_HEDGE_PERCENTILE, ROUTING_HEDGE_MIN_DELAY,
+    ROUTING_HEDGE_DEFAULT_DELAY, LLM_CONNECT_TIMEOUT, LLM_FIRST_TOKEN_TIMEOUT, LLM_MAX_RETRIES,
+    LLM_FALLBACK_MODELS
+)
+from api.services.llm_resilience.llm_resilience_service import (
+    CircuitBreaker, FirstTokenTimeout, RetryBudget, backoff_delay, get_retry_budget
+)
+from api.services.prompt_assembly.prompt_assembly_service import assemble, cache_hints
+
+# ---------------------------------------------------------------------------
+# Engine profiles: how each backend flavour differs on the OpenAI wire format.
+# ---------------------------------------------------------------------------
+
+# "continue_body" makes the server extend a trailing assistant message instead of
+# starting a new turn (used to resume replies interrupted by a drain). Engines
+# without it get the trailing message as plain context.
+# "prompt_cache" is the engine's prompt-cache hint (see prompt_assembly_service.cache_hints);
+# vLLM's automatic prefix caching only needs the byte-stable prefix.
+# "stream_usage" asks for a final usage chunk (stream_options.include_usage); without it
+# usage_accounting_service estimates the tokens locally.
+ENGINE_PROFILES = {
+    "openai": {"max_tokens_param": "max_completion_tokens", "default_api_key": None, "continue_body": None,
+               "prompt_cache": "prompt_cache_key", "stream_usage": True},
+    "vllm": {"max_tokens_param": "max_tokens", "default_api_key": "EMPTY",
+             "continue_body": {"continue_final_message": True, "add_generation_prompt": False},
+             "prompt_cache": None, "stream_usage": True},
+    "llama.cpp": {"max_tokens_param": "max_tokens", "default_api_key": "EMPTY", "continue_body": None,
+                  "prompt_cache": "cache_prompt", "stream_usage": False},
+    "litellm": {"max_tokens_param": "max_tokens", "default_api_key": "EMPTY", "continue_body": None,
+                "prompt_cache": "cache_control", "stream_usage": True},
+}
+
+
+class EndpointStats:
+    """
+    Rolling latency and error statistics for one endpoint.
+
+    Keeps the last `window` TTFT samples for percentiles plus EWMAs of TTFT and
+    error rate for cheap scoring on every pick.
+    """
+
+    MIN_SAMPLES = 20  # Percentiles below this many samples are not trusted
+    ALPHA = 0.2  # EWMA smoothing factor
+
+    def __init__(self, window: int = ROUTING_LATENCY_WINDOW):
+        self.ttfts = deque(maxlen=window)
+        self.ewma_ttft = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.updated_at = 0.0
+        self._sorted = None  # Cached sorted copy of ttfts, invalidated on new samples
+
+    def record_ttft(self, seconds: float):
+        self.ttfts.append(seconds)
+        self._sorted = None
+        self.ewma_ttft = seconds if self.ewma_ttft is None else self.ALPHA * seconds + (1 - self.ALPHA) * self.ewma_ttft
+        self.updated_at = time.monotonic()
+
+    def record_outcome(self, ok: bool):
+        self.requests += 1
+        self.errors += 0 if ok else 1
+        self.error_rate = self.ALPHA * (0.0 if ok else 1.0) + (1 - self.ALPHA) * self.error_rate
+        self.updated_at = time.monotonic()
+
+    def percentile(self, q: float):
+        """Returns the q-th percentile TTFT, or None with too few samples."""
+        if len(self.ttfts) < self.MIN_SAMPLES:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.ttfts)
+        index = min(int(len(self._sorted) * q / 100.0), len(self._sorted) - 1)
+        return self._sorted[index]
+
+    def score(self, now: float, ttl: float = ROUTING_STATS_TTL) -> float:
+        """
+        Expected latency cost; lower is better.
+
+        Endpoints with no (or stale) samples score 0 so they get explored and
+        re-measured instead of being starved by an early bad reading.
+        """
+        if self.ewma_ttft is None or now - self.updated_at > ttl:
+            return 0.0
+        return self.ewma_ttft * (1.0 + 4.0 * self.error_rate)
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 4),
+            "ttft_ewma_ms": round(self.ewma_ttft * 1000, 2) if self.ewma_ttft is not None else None,
+            "ttft_p50_ms": round(self.percentile(50) * 1000, 2) if self.percentile(50) is not None else None,
+            "ttft_p95_ms": round(self.percentile(95) * 1000, 2) if self.percentile(95) is not None else None,
+        }
+
+
+class Endpoint:
+    """
+    One concrete backend node able to serve a model.
+
+    Guards itself with a circuit breaker for health-based ejection and lazily
+    owns a dedicated connection pool plus the ChatOpenAI client bound to it.
+    """
+
+    def __init__(self, model_name: str, spec: dict, eject_after: int = ROUTING_EJECT_AFTER_FAILURES,
+                 eject_seconds: float = ROUTING_EJECT_SECONDS):
+        self.engine = spec.get("engine", "openai").lower()
+        if self.engine not in ENGINE_PROFILES:
+            raise ValueError(f"Unsupported inference engine '{self.engine}' for model {model_name}")
+        self.model_name = model_name
+        self.url = spec["url"].rstrip("/")
+        self.name = spec.get("name") or f"{self.engine}@{self.url}"
+        self.weight = int(spec.get("weight", 1))
+        self.remote_model = spec.get("remote_model", model_name)
+        self.max_retries = int(spec.get("max_retries", 0))  # SDK retries; the router retries itself
+        self._api_key = spec.get("api_key")
+        self._api_key_env = spec.get("api_key_env")
+
+        self.breaker = CircuitBreaker(self.name, eject_after, eject_seconds)
+        self.current_weight = 0  # Smooth weighted round-robin state
+        self.stats = EndpointStats()
+
+        self._http_client = None
+        self._llm = None
+
+    def __repr__(self):
+        return f"Endpoint({self.name!r}, weight={self.weight}, circuit={self.breaker.state})"
+
+    @property
+    def api_key(self) -> str:
+        key = self._api_key or (os.getenv(self._api_key_env) if self._api_key_env else None)
+        return key or ENGINE_PROFILES[self.engine]["default_api_key"] or ""
+
+    # ─── Health ────────────────────────────────────────────
+
+    def available(self, now: float = None) -> bool:
+        """Returns True unless the endpoint's circuit is open (or its half-open trial is busy)."""
+        return self.breaker.available(now)
+
+    def record_success(self):
+        self.stats.record_outcome(True)
+        self.breaker.record_success()
+
+    def record_failure(self):
+        self.stats.record_outcome(False)
+        self.breaker.record_failure()
+
+    # ─── Clients ───────────────────────────────────────────
+
+    def http_client(self) -> httpx.AsyncClient:
+        """Returns this endpoint's own pooled async HTTP client."""
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=ROUTING_MAX_CONNECTIONS,
+                                    max_keepalive_connections=ROUTING_MAX_KEEPALIVE),
+                timeout=httpx.Timeout(ROUTING_REQUEST_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            )
+        return self._http_client
+
+    def llm(self) -> ChatOpenAI:
+        """Returns the ChatOpenAI client bound to this endpoint's pool."""
+        if self._llm is None:
+            self._llm = ChatOpenAI(
+                model=self.remote_model,
+                api_key=self.api_key,
+                base_url=self.url,
+                streaming=True,
+                stream_usage=ENGINE_PROFILES[self.engine]["stream_usage"],
+                max_retries=self.max_retries,
+                http_async_client=self.http_client(),
+            )
+        return self._llm
+
+    def request_params(self, temperature: float = None, top_p: float = None, max_tokens: int = None,
+                       frequency_penalty: float = None, presence_penalty: float = None,
+                       continue_final: bool = False, tools: list = None) -> dict:
+        """Maps generic sampling params (and the OpenAI tool definitions offered) to this engine's request fields."""
+        params = {}
+        if tools:
+            params["tools"] = tools
+        if temperature is not None:
+            params["temperature"] = temperature
+        if top_p is not None:
+            params["top_p"] = top_p
+        # 0 is every engine's default; leave it out of the body
+        if frequency_penalty:
+            params["frequency_penalty"] = frequency_penalty
+        if presence_penalty:
+            params["presence_penalty"] = presence_penalty
+        if max_tokens is not None:
+            field = ENGINE_PROFILES[self.engine]["max_tokens_param"]
+            if field == "max_completion_tokens":
+                params[field] = max_tokens
+            else:
+                # ChatOpenAI rewrites max_tokens to max_completion_tokens, which older
+                # vLLM / llama.cpp builds ignore; send the raw field in the body instead
+                params["extra_body"] = {field: max_tokens}
+        continue_body = ENGINE_PROFILES[self.engine]["continue_body"]
+        if continue_final and continue_body:
+            params["extra_body"] = dict(params.get("extra_body", {}), **continue_body)
+        return params
+
+    def prepare(self, messages: list, **params):
+        """Returns the messages and request kwargs for one attempt, with this engine's cache hint."""
+        kwargs = self.request_params(**params)
+        messages, cache_body = cache_hints(messages, ENGINE_PROFILES[self.engine]["prompt_cache"])
+        if cache_body:
+            kwargs["extra_body"] = dict(kwargs.get("extra_body", {}), **cache_body)
+        return messages, kwargs
+
+    async def probe(self) -> bool:
+        """Actively checks `GET {url}/models`; updates health accordingly."""
+        try:
+            response = await self.http_client().get(
+                f"{self.url}/models", headers={"Authorization": f"Bearer {self.api_key}"}, timeout=5.0
+            )
+            healthy = response.status_code < 500
+        except httpx.HTTPError:
+            healthy = False
+        if healthy:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        return healthy
+
+    def hedge_delay(self, percentile: float = ROUTING_HEDGE_PERCENTILE) -> float:
+        """Seconds to wait for this endpoint's first token before hedging."""
+        observed = self.stats.percentile(percentile)
+        if observed is None:
+            return ROUTING_HEDGE_DEFAULT_DELAY
+        return max(observed, ROUTING_HEDGE_MIN_DELAY)
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._http_client = None
+        self._llm = None
+
+
+class ModelRoute:
+    """All endpoints serving one model, with weighted selection."""
+
+    def __init__(self, model_name: str, category: str, provider: str, endpoints: list):
+        self.model_name = model_name
+        self.category = category
+        self.provider = provider
+        self.endpoints = endpoints
+
+    def pick(self, exclude=()) -> Endpoint:
+        """
+        Picks the next endpoint by smooth weighted round-robin (nginx style).
+
+        Endpoints with an open circuit are skipped, so a browned-out route
+        fails fast instead of queueing requests behind a dead backend.
+
+        Args:
+            exclude (iterable): Endpoints already tried for this request.
+
+        Returns:
+            Endpoint | None: The chosen endpoint, or None if none is available.
+        """
+        now = time.monotonic()
+        candidates = self._candidates(exclude, now)
+        if len(candidates) <= 1:
+            return candidates[0] if candidates else None
+
+        total = 0
+        best = None
+        for endpoint in candidates:
+            endpoint.current_weight += endpoint.weight
+            total += endpoint.weight
+            if best is None or endpoint.current_weight > best.current_weight:
+                best = endpoint
+        best.current_weight -= total
+        return best
+
+    def pick_fastest(self, exclude=()) -> Endpoint:
+        """
+        Picks the endpoint with the best latency score by "power of two choices".
+
+        Two distinct candidates are drawn at random in proportion to their weights and
+        the one with the lower TTFT/error score wins. This prefers fast nodes
+        while still spreading load, unlike always taking the global minimum.
+
+        Args:
+            exclude (iterable): Endpoints already tried for this request.
+
+        Returns:
+            Endpoint | None: The chosen endpoint, or None if none is available.
+        """
+        now = time.monotonic()
+        candidates = self._candidates(exclude, now)
+        if len(candidates) <= 1:
+            return candidates[0] if candidates else None
+        first = random.choices(candidates, weights=[e.weight for e in candidates])[0]
+        others = [e for e in candidates if e is not first]
+        second = random.choices(others, weights=[e.weight for e in others])[0]
+        return min((first, second), key=lambda e: e.stats.score(now))
+
+    def _candidates(self, exclude, now: float) -> list:
+        """Non-excluded endpoints whose circuit admits a request."""
+        return [e for e in self.endpoints if e not in exclude and e.weight > 0 and e.available(now)]
+
+
+class LLMRouter:
+    """
+    Resolves model names to routes and streams completions from them.
+
+    Args:
+        endpoints (dict, optional): {model: [endpoint specs]}. Defaults to get_ai_endpoints().
+        eject_after (int): Consecutive failures before an endpoint's circuit opens.
+        eject_seconds (float): How long an open circuit waits before a trial request.
+        policy (str): "weighted" (smooth weighted round-robin) or "latency" (TTFT-aware).
+        hedge (bool): Hedge slow first tokens with a duplicate request to another endpoint.
+        fallbacks (dict, optional): {model: [fallback models]}. Defaults to LLM_FALLBACK_MODELS.
+        max_retries (int): Retries per model before the first token.
+        first_token_timeout (float): Seconds an attempt may take to produce its first chunk.
+        retry_budget (RetryBudget, optional): Defaults to the process-wide budget.
+    """
+
+    def __init__(self, endpoints: dict = None, eject_after: int = ROUTING_EJECT_AFTER_FAILURES,
+                 eject_seconds: float = ROUTING_EJECT_SECONDS, policy: str = ROUTING_POLICY,
+                 hedge: bool = ROUTING_HEDGE_ENABLED, fallbacks: dict = None, max_retries: int = LLM_MAX_RETRIES,
+                 first_token_timeout: float = LLM_FIRST_TOKEN_TIMEOUT, retry_budget: RetryBudget = None):
+        if policy not in ("weighted", "latency"):
+            raise ValueError(f"Unknown routing policy '{policy}'")
+        self._specs = endpoints if endpoints is not None else get_ai_endpoints()
+        self._eject_after = eject_after
+        self._eject_seconds = eject_seconds
+        self.policy = policy
+        self.hedge = hedge
+        self.fallbacks = fallbacks if fallbacks is not None else LLM_FALLBACK_MODELS
+        self.max_retries = max_retries
+        self.first_token_timeout = first_token_timeout
+        self.retry_budget = retry_budget or get_retry_budget()
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self._routes = {}
+
+    def resolve(self, model_name: str) -> ModelRoute:
+        """
+        Resolves `model_name` to its route (cached after the first lookup).
+
+        Raises:
+            NotFoundException: If the model has no configured endpoint.
+        """
+        route = self._routes.get(model_name)
+        if route is not None:
+            return route
+
+        specs = self._specs.get(model_name)
+        if not specs:
+            raise NotFoundException(f"Model '{model_name}' is not available on any configured endpoint")
+        category, provider = find_ai_model(model_name) or ("Custom", "Custom")
+        endpoints = [Endpoint(model_name, spec, self._eject_after, self._eject_seconds) for spec in specs]
+        route = self._routes[model_name] = ModelRoute(model_name, category, provider, endpoints)
+        logger.info(f"🧭 Route resolved: {model_name} → {provider} ({category}) via {[e.name for e in endpoints]}")
+        return route
+
+    def pick(self, route: ModelRoute, exclude=()) -> Endpoint:
+        """Picks an endpoint of `route` according to the routing policy."""
+        if self.policy == "latency":
+            return route.pick_fastest(exclude)
+        return route.pick(exclude)
+
+    def client_for(self, model_name: str) -> ChatOpenAI:
+        """Returns the ChatOpenAI client of the next endpoint for `model_name`."""
+        endpoint = self.pick(self.resolve(model_name))
+        if endpoint is None:
+            raise ServiceUnavailableException(f"Every endpoint for '{model_name}' has an open circuit")
+        return endpoint.llm()
+
+    async def astream(self, model_name: str, messages: list, **params):
+        """
+        Streams a completion for `model_name`, falling back along its chain.
+
+        Tries `model_name` first and then each model in its LLM_FALLBACK_MODELS
+        entry, moving on only if a model could not produce a first chunk. Once a
+        chunk has been yielded, errors propagate to the caller unchanged.
+        `messages` are assembled first (prompt_assembly_service): one copy of
+        each system prompt, then the turns, plus each engine's cache hint.
+
+        Args:
+            model_name (str): Client-facing model name.
+            messages (list): LangChain messages for the conversation.
+            **params: temperature, top_p, max_tokens, frequency_penalty, presence_penalty, continue_final, tools.
+
+        Yields:
+            AIMessageChunk: Streamed response chunks.
+
+        Raises:
+            NotFoundException: If `model_name` has no configured endpoint.
+            ServiceUnavailableException: If no model of the chain could start a stream.
+        """
+        messages = assemble(messages)  # Stable, deduplicated prefix; same for every attempt and fallback
+        chain = [model_name] + [m for m in self.fallbacks.get(model_name, []) if m != model_name]
+        last_error = None
+        for index, candidate in enumerate(chain):
+            if index:
+                try:
+                    route = self.resolve(candidate)
+                except NotFoundException as e:
+                    logger.warning(f"⚠️ Fallback model {candidate} for {model_name} skipped: {e.detail}")
+                    continue
+                logger.warning(f"🔀 Falling back from {model_name} to {candidate}: {last_error}")
+            else:
+                route = self.resolve(candidate)
+
+            streamed = False
+            try:
+                async for chunk in self._astream_route(route, messages, params):
+                    if not streamed and index:
+                        metrics.inc("llm_fallbacks_total", from_model=model_name, to_model=candidate)
+                    streamed = True
+                    if chunk.usage_metadata:
+                        chunk.response_metadata["route_model"] = candidate  # Priced as the model that answered
+                    yield chunk
+                return
+            except Exception as e:
+                if streamed:
+                    raise
+                last_error = e
+
+        detail = f"No endpoint could serve '{model_name}'"
+        if last_error is not None:
+            detail = f"{detail}: {getattr(last_error, 'detail', last_error)}"
+        raise ServiceUnavailableException(detail) from last_error
+
+    async def _astream_route(self, route: ModelRoute, messages: list, params: dict):
+        """
+        Streams a completion from the best available endpoint of one route.
+
+        Each attempt runs in its own task feeding a shared queue, which lets the
+        router time the first token (TTFT), hedge, time out and retry:
+
+        - An attempt that fails, or produces no chunk within the first-token
+          timeout, is abandoned and retried with jittered backoff on another
+          endpoint (or the same one if it is the only one left), up to
+          `max_retries` times and only while the retry budget allows.
+        - With hedging on, if no chunk arrived within the primary endpoint's
+          p95 TTFT, a duplicate goes to a second endpoint (also paid from the
+          retry budget); the first to emit a chunk wins and the loser is
+          cancelled (closing its connection).
+        - Once a chunk has been yielded, errors propagate to the caller.
+        """
+        queue = asyncio.Queue()
+        attempts = {}  # attempt id -> (endpoint, task)
+        deadlines = {}  # attempt id -> first-token deadline, for attempts still racing
+        abandoned = set()  # attempt ids cancelled by the first-token timeout
+        tried = []
+        retries = 0
+        last_error = None
+        winner = None
+        hedge = None
+
+        def launch(endpoint):
+            attempt = len(attempts)
+            endpoint.breaker.on_attempt()
+            tried.append(endpoint)
+            attempts[attempt] = (endpoint, asyncio.create_task(self._pump(attempt, endpoint, messages, params, queue)))
+            deadlines[attempt] = time.monotonic() + self.first_token_timeout
+
+        self.retry_budget.record_request()
+        primary = self.pick(route)
+        if primary is None:
+            raise ServiceUnavailableException(f"Every endpoint for '{route.model_name}' has an open circuit")
+        launch(primary)
+        hedge_at = time.monotonic() + primary.hedge_delay() if self.hedge else None
+
+        try:
+            while True:
+                timeout = None
+                if winner is None:
+                    timers = list(deadlines.values()) + ([hedge_at] if hedge_at is not None else [])
+                    timeout = max(min(timers) - time.monotonic(), 0.0) if timers else None
+                try:
+                    attempt, kind, payload = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    now = time.monotonic()
+                    for attempt, deadline in list(deadlines.items()):
+                        if now >= deadline:
+                            del deadlines[attempt]
+                            abandoned.add(attempt)
+                            endpoint, task = attempts[attempt]
+                            task.cancel()
+                            endpoint.record_failure()
+                            metrics.inc("llm_first_token_timeouts_total", endpoint=endpoint.name)
+                            queue.put_nowait((attempt, "timeout", FirstTokenTimeout(
+                                f"{endpoint.name} produced no token within {self.first_token_timeout:.1f}s"
+                            )))
+                    if hedge_at is not None and now >= hedge_at:
+                        hedge_at = None  # Hedge at most once per request
+                        secondary = self.pick(route, exclude=tried)
+                        if secondary is not None and self.retry_budget.try_acquire():
+                            self.hedges_fired += 1
+                            logger.debug(f"⏱️ Hedging {route.model_name}: {primary.name} slow, also trying {secondary.name}")
+                            hedge = len(attempts)
+                            launch(secondary)
+                    continue
+
+                if winner is not None and attempt != winner:
+                    continue  # Late output from a cancelled loser
+                if attempt in abandoned and kind != "timeout":
+                    continue  # Output that raced the first-token timeout
+                if kind == "chunk":
+                    if winner is None:
+                        winner = attempt
+                        if attempt == hedge:
+                            self.hedges_won += 1
+                        for other, (_, task) in attempts.items():
+                            if other != winner:
+                                task.cancel()
+                        deadlines.clear()
+                    yield payload
+                elif kind == "done":
+                    return
+                else:  # "error" or "timeout"
+                    if winner is not None:
+                        raise payload
+                    deadlines.pop(attempt, None)
+                    hedge_at = None  # Only the original attempt is hedged; retries stand alone
+                    last_error = payload
+                    endpoint = attempts[attempt][0]
+                    logger.warning(f"⚠️ Endpoint {endpoint.name} failed before first token: {payload}")
+                    if deadlines:
+                        continue  # A hedge or retry is still in flight
+                    if retries >= self.max_retries or not self.retry_budget.try_acquire():
+                        raise last_error
+                    await asyncio.sleep(backoff_delay(retries))
+                    retries += 1
+                    retry = self.pick(route, exclude=tried) or self.pick(route)
+                    if retry is None:
+                        raise last_error
+                    metrics.inc("llm_retries_total", model=route.model_name)
+                    launch(retry)
+        finally:
+            for endpoint, task in attempts.values():
+                task.cancel()
+
+    async def _pump(self, attempt: int, endpoint: Endpoint, messages: list, params: dict, queue: asyncio.Queue):
+        """Streams one attempt into `queue`, recording TTFT and the outcome."""
+        started = time.monotonic()
+        first = True
+        messages, kwargs = endpoint.prepare(messages, **params)
+        try:
+            async for chunk in endpoint.llm().astream(messages, **kwargs):
+                if first:
+                    endpoint.stats.record_ttft(time.monotonic() - started)
+                    first = False
+                queue.put_nowait((attempt, "chunk", chunk))
+        except asyncio.CancelledError:
+            endpoint.breaker.on_cancel()  # Lost a hedge race or the client went away; not the endpoint's fault
+            raise
+        except Exception as e:
+            endpoint.record_failure()
+            queue.put_nowait((attempt, "error", e))
+            return
+        endpoint.record_success()
+        queue.put_nowait((attempt, "done", None))
+
+    def snapshot(self) -> dict:
+        """Per-endpoint rolling TTFT/error stats, circuit states, hedge and retry-budget counters."""
+        return {
+            "policy": self.policy,
+            "hedge": {"enabled": self.hedge, "fired": self.hedges_fired, "won": self.hedges_won},
+            "retry_budget": self.retry_budget.snapshot(),
+            "fallbacks": self.fallbacks,
+            "routes": {
+                model: {
+                    e.name: dict(e.stats.snapshot(), weight=e.weight, circuit=e.breaker.state,
+                                 ejected=not e.available())
+                    for e in route.endpoints
+                }
+                for model, route in self._routes.items()
+            },
+        }
+
+    async def check_health(self):
+        """Probes every self-hosted endpoint of the configured routes once."""
+        for model_name in self._specs:
+            try:
+                route = self.resolve(model_name)
+            except NotFoundException:
+                continue
+            probes = [e.probe() for e in route.endpoints if e.engine != "openai"]
+            if probes:
+                await asyncio.gather(*probes)
+
+    async def run_health_checks(self, interval: float):
+        """Background loop re-probing endpoints every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error(f"❌ Endpoint health check failed: {e}")
+
+    def has_self_hosted(self) -> bool:
+        return any(spec.get("engine", "openai").lower() != "openai"
+                   for specs in self._specs.values() for spec in specs)
+
+    async def aclose(self):
+        """Closes every endpoint's connection pool."""
+        for route in self._routes.values():
+            for endpoint in route.endpoints:
+                await endpoint.aclose()
+
+
+@lru_cache()
+def get_router() -> LLMRouter:
+    """Returns the process-wide router built from the AI services registry."""
+    return LLMRouter()
@@ -0,0 +1,164 @@
+"""
+Local OpenAI-compatible stub server for routing tests and benchmarks.
+
+Speaks just enough HTTP/1.1 (keep-alive, chunked SSE) to stand in for an
+OpenAI, vLLM, llama.cpp or LiteLLM endpoint:
+
+- POST /v1/chat/completions  → streams `tokens` as chat.completion.chunk events
+                               (plus a usage chunk with stream_options.include_usage)
+- GET  /v1/models, /health   → 200 while healthy, 503 otherwise
+
+Delays and failures can be injected per server to simulate slow or broken nodes.
+"""
+
+import asyncio
+import json
+import time
+
+
+class StubOpenAIServer:
+    """
+    A tiny asyncio HTTP server emulating a streaming chat-completions backend.
+
+    Args:
+        tokens (list | callable, optional): Content pieces streamed per request. Defaults to ["Hello", " world"].
+            A dict piece is sent as the chunk's delta as it is (e.g. {"tool_calls": [...]}); a callable
+            is given each request body and returns that request's pieces.
+        first_token_delay (float | callable): Seconds to wait before the first chunk
+            (simulates TTFT); a callable is evaluated per request for jitter/stragglers.
+        token_delay (float): Seconds to wait between chunks.
+        status (int): HTTP status for completions; non-200 returns an error body.
+        name (str, optional): Tag included in every chunk id, handy for assertions.
+        cached_tokens (int): Prompt tokens reported as cached when the client asks for usage.
+    """
+
+    def __init__(self, tokens: list = None, first_token_delay: float = 0.0, token_delay: float = 0.0,
+                 status: int = 200, name: str = "stub", cached_tokens: int = 0):
+        self.tokens = tokens if tokens is not None else ["Hello", " world"]
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.status = status
+        self.healthy = True
+        self.name = name
+        self.cached_tokens = cached_tokens
+        self.requests = []  # Parsed JSON bodies of completion requests
+        self.cancelled = 0  # Streams whose client went away mid-response
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/v1"
+
+    async def start(self) -> "StubOpenAIServer":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            if hasattr(self._server, "close_clients"):
+                self._server.close_clients()
+            await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    # ─── HTTP plumbing ─────────────────────────────────────
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                if method == "POST" and path.endswith("/chat/completions"):
+                    if not await self._completions(reader, writer, json.loads(body or b"{}")):
+                        self.cancelled += 1
+                        break
+                else:
+                    status = 200 if self.healthy else 503
+                    await self._send_json(writer, status, {"object": "list", "data": []})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.cancelled += 1
+        except asyncio.CancelledError:
+            pass  # Server shutting down with idle keep-alive connections
+        finally:
+            writer.close()
+
+    async def _send_json(self, writer, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+
+    async def _write_chunk(self, writer, data: bytes):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        await writer.drain()
+
+    async def _client_gone_within(self, reader, seconds: float) -> bool:
+        """Sleeps up to `seconds`, returning True early if the client hangs up."""
+        try:
+            return await asyncio.wait_for(reader.read(1), seconds) == b""
+        except asyncio.TimeoutError:
+            return False
+
+    async def _completions(self, reader, writer, body: dict) -> bool:
+        """Serves one completion; returns False if the client went away mid-stream."""
+        self.requests.append(body)
+        if self.status != 200:
+            await self._send_json(writer, self.status, {"error": {"message": f"{self.name} failure", "type": "server_error"}})
+            return True
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        await writer.drain()
+        created = int(time.time())
+        model = body.get("model", "stub")
+        delay = self.first_token_delay() if callable(self.first_token_delay) else self.first_token_delay
+        if delay and await self._client_gone_within(reader, delay):
+            return False
+        tokens = self.tokens(body) if callable(self.tokens) else self.tokens
+        for i, token in enumerate(tokens):
+            if i and self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            event = {
+                "id": f"chatcmpl-{self.name}", "object": "chat.completion.chunk", "created": created,
+                "model": model, "choices": [{"index": 0, "finish_reason": None,
+                             "delta": token if isinstance(token, dict) else {"role": "assistant", "content": token}}],
+            }
+            await self._write_chunk(writer, f"data: {json.dumps(event)}\n\n".encode())
+        done = {
+            "id": f"chatcmpl-{self.name}", "object": "chat.completion.chunk", "created": created,
+            "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        await self._write_chunk(writer, f"data: {json.dumps(done)}\n\n".encode())
+        if (body.get("stream_options") or {}).get("include_usage"):
+            # Like OpenAI: a last chunk without choices carrying the request's usage
+            prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+            usage = {
+                "id": f"chatcmpl-{self.name}", "object": "chat.completion.chunk", "created": created,
+                "model": model, "choices": [],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                          "total_tokens": prompt_tokens + len(tokens),
+                          "prompt_tokens_details": {"cached_tokens": self.cached_tokens}},
+            }
+            await self._write_chunk(writer, f"data: {json.dumps(usage)}\n\n".encode())
+        await self._write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return True
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from api.config.exceptions import NotFoundException
+from api.services.llm_routing.llm_routing_service import LLMRouter
+from api.services.llm_routing.stub_openai_server import StubOpenAIServer
+
+MESSAGES = [HumanMessage(content="hi")]
+
+
+async def collect(router, model_name, **params):
+    return "".join([chunk.content async for chunk in router.astream(model_name, MESSAGES, **params)])
+
+
+@pytest.mark.asyncio
+async def test_weighted_balancing_across_endpoints():
+    async with StubOpenAIServer(name="a") as a, StubOpenAIServer(name="b") as b:
+        router = LLMRouter({"llama-3": [
+            {"url": a.url, "engine": "vllm", "weight": 3},
+            {"url": b.url, "engine": "llama.cpp", "weight": 1},
+        ]})
+        for _ in range(8):
+            assert await collect(router, "llama-3") == "Hello world"
+        assert (len(a.requests), len(b.requests)) == (6, 2)
+        await router.aclose()
+
+
+@pytest.mark.asyncio
+async def test_engine_specific_request_params():
+    async with StubOpenAIServer() as vllm:
+        router = LLMRouter({"llama-3": [{"url": vllm.url, "engine": "vllm", "remote_model": "meta/llama-3-8b"}]})
+        await collect(router, "llama-3", temperature=0.2, top_p=0.5, max_tokens=32, frequency_penalty=0.4,
+                      presence_penalty=0.0)
+        body = vllm.requests[0]
+        assert body["model"] == "meta/llama-3-8b"
+        assert (body["temperature"], body["top_p"], body["max_tokens"]) == (0.2, 0.5, 32)
+        assert body["frequency_penalty"] == 0.4 and "presence_penalty" not in body
+        await router.aclose()
+
+
+@pytest.mark.asyncio
+async def test_failing_endpoint_fails_over_and_is_ejected():
+    async with StubOpenAIServer(status=500, name="bad") as bad, StubOpenAIServer(name="good") as good:
+        router = LLMRouter({"mistral-7b": [
+            {"url": bad.url, "engine": "vllm", "max_retries": 0},
+            {"url": good.url, "engine": "vllm", "max_retries": 0},
+        ]}, eject_after=2, eject_seconds=60)
+        for _ in range(6):
+            assert await collect(router, "mistral-7b") == "Hello world"
+
+        bad_endpoint, good_endpoint = router.resolve("mistral-7b").endpoints
+        assert not bad_endpoint.available()
+        assert len(bad.requests) == 2  # Skipped entirely once ejected
+        assert len(good.requests) == 6
+        assert bad_endpoint.http_client() is not good_endpoint.http_client()  # One pool per backend
+        await router.aclose()
+
+
+@pytest.mark.asyncio
+async def test_health_probe_ejects_and_readmits():
+    async with StubOpenAIServer() as node:
+        router = LLMRouter({"llama-3": [{"url": node.url, "engine": "vllm"}]}, eject_after=1, eject_seconds=60)
+        node.healthy = False
+        await router.check_health()
+        assert not router.resolve("llama-3").endpoints[0].available()
+        node.healthy = True
+        await router.check_health()
+        assert router.resolve("llama-3").endpoints[0].available()
+        await router.aclose()
+
+
+def test_unknown_model_is_rejected():
+    with pytest.raises(NotFoundException):
+        LLMRouter({}).resolve("no-such-model")
+
+
+@pytest.mark.asyncio
+async def test_latency_policy_prefers_fastest_endpoint():
+    async with StubOpenAIServer(first_token_delay=0.08, name="slow") as slow, StubOpenAIServer(name="fast") as fast:
+        router = LLMRouter({"llama-3": [
+            {"url": slow.url, "engine": "vllm"},
+            {"url": fast.url, "engine": "vllm"},
+        ]}, policy="latency")
+        for _ in range(20):
+            await collect(router, "llama-3")
+        assert len(fast.requests) > 3 * len(slow.requests)
+        stats = router.snapshot()["routes"]["llama-3"]
+        assert all(s["ttft_ewma_ms"] is not None for s in stats.values())
+        await router.aclose()
+
+
+@pytest.mark.asyncio
+async def test_hedge_fires_on_slow_primary_and_cancels_loser():
+    async with StubOpenAIServer(first_token_delay=5.0, name="stuck") as stuck, StubOpenAIServer(name="ok") as ok:
+        router = LLMRouter({"llama-3": [
+            {"url": stuck.url, "engine": "vllm", "weight": 1000},
+            {"url": ok.url, "engine": "vllm", "weight": 1},
+        ]}, hedge=True)
+        stuck_endpoint = router.resolve("llama-3").endpoints[0]
+        stuck_endpoint.hedge_delay = lambda: 0.05
+
+        assert await asyncio.wait_for(collect(router, "llama-3"), timeout=2.0) == "Hello world"
+        assert (router.hedges_fired, router.hedges_won) == (1, 1)
+        await asyncio.sleep(0.05)
+        assert stuck.cancelled == 1  # Loser's upstream connection was closed
+        await router.aclose()
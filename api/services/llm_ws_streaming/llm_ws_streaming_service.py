@@ -1,14 +1,28 @@
 import os
 import asyncio
 import uuid
+from contextlib import aclosing
 from dotenv import load_dotenv
 import time  # Added for telemetry timestamps
 
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages.ai import add_ai_message_chunks
 from langchain_community.document_loaders import TextLoader
+from langchain_core.runnables import RunnableConfig
 from langgraph.checkpoint.memory import MemorySaver
-from langgraph.graph import START, MessagesState, StateGraph
+from langgraph.config import get_stream_writer
+from langgraph.graph import END, START, StateGraph
+
+from api.config.drain import get_drain_controller
+from api.services.cold_tier.cold_tier_service import ColdTier
+from api.services.conversation_memory.conversation_memory_service import SERDE, ConversationState, to_messages
+from api.services.conversation_persistence.conversation_persistence_service import get_conversation_persister
+from api.services.llm_routing.llm_routing_service import get_router
+from api.services.prompt_assembly.prompt_assembly_service import with_system_prompt
+from api.services.stream_handoff.stream_handoff_service import collect_conversations, get_handoff_store
+from api.services.tool_execution.tool_execution_service import call_tools, route_tools, tool_specs
+from api.services.usage_accounting.usage_accounting_service import get_usage_ledger
+from api.services.usage_quota.usage_quota_service import get_quota_manager
 
 # Added logger import for telemetry logging
 from api.config.logging import logger
@@ -18,26 +32,68 @@ from api.config.logging import logger
 # Each conversation_id is stored as a separate "thread" in memory.
 # ---------------------------------------------------------------------------
 
-GLOBAL_MEMORY = MemorySaver()
-GLOBAL_WORKFLOW = StateGraph(state_schema=MessagesState)
+GLOBAL_MEMORY = MemorySaver(serde=SERDE)
+GLOBAL_WORKFLOW = StateGraph(state_schema=ConversationState)  # History stored as compact MessageRecords
 
 
-# We'll define a single node that calls the LLM with the entire conversation:
-def call_model(state: MessagesState):
+# The model node streams one request for the entire conversation. Chunks go out on the
+# graph's custom stream as they arrive; the completed reply is the node's update:
+async def call_model(state: ConversationState, config: RunnableConfig):
     print("📝 Calling model with stored messages for conversation...")
-    response = GLOBAL_LLM.invoke(state["messages"])
-    print(f"🤖 AI Response: {response.content}")
-    return {"messages": state["messages"] + [response]}
+    settings = config["configurable"]
+    model_name = settings.get("model_name", DEFAULT_MODEL)
+    user_id = settings.get("user_id")
+    # send_message admits the turn once; each model request of it holds the quota while it streams
+    quota = settings.get("quota") or get_quota_manager().admit(user_id, model_name)
+    messages = to_messages(state["messages"])
+    tools = tool_specs(messages)
+    write = get_stream_writer()
+    # Counted even if the client leaves mid-stream: the tokens were spent
+    meter = get_usage_ledger().meter(model_name, user_id, settings["thread_id"], messages)
+    chunks = []
+    try:
+        quota.start(messages)
+        async with aclosing(get_router().astream(model_name, messages, tools=tools,
+                                                 **settings.get("params", {}))) as stream:
+            async for response_chunk in stream:
+                meter.observe(response_chunk)
+                quota.consume(response_chunk.content)  # Cuts the stream (and the upstream request) at the quota
+                chunks.append(response_chunk)
+                write(response_chunk)
+    finally:
+        reply = "".join(chunk.content or "" for chunk in chunks)
+        meter.finish(reply)
+        quota.release()
+
+    # Only a request that offered tools can get calls back; merging chunks is skipped otherwise
+    calls = tools and any(c.tool_call_chunks for c in chunks) and add_ai_message_chunks(*chunks).tool_calls
+    print(f"🤖 AI Response: {reply}")
+    return {"messages": [AIMessage(content=reply, tool_calls=calls or [])]}
 
 
 GLOBAL_WORKFLOW.add_edge(START, "model")
 GLOBAL_WORKFLOW.add_node("model", call_model)
+# A reply that calls tools goes to the tools node, which runs every call at once and hands the results back:
+GLOBAL_WORKFLOW.add_node("tools", call_tools)
+GLOBAL_WORKFLOW.add_conditional_edges("model", route_tools, ["tools", END])
+GLOBAL_WORKFLOW.add_edge("tools", "model")
 
 # Compile once, referencing the same MemorySaver for all threads:
 GLOBAL_APP = GLOBAL_WORKFLOW.compile(checkpointer=GLOBAL_MEMORY)
 
-# We set up a global LLM that we only initialize once we know the API key/model:
-GLOBAL_LLM = None
+# Idle conversations are compressed out of GLOBAL_MEMORY and rehydrated on use:
+GLOBAL_COLD_TIER = ColdTier(GLOBAL_APP, GLOBAL_MEMORY, name="ws")
+
+def flush_conversations():
+    """Drain hook: hands every conversation of this worker to the shared handoff store."""
+    conversations = {**GLOBAL_COLD_TIER.conversations(), **collect_conversations(GLOBAL_APP, GLOBAL_MEMORY)}
+    get_handoff_store().save_conversations(conversations)
+
+get_drain_controller().on_flush(flush_conversations)
+
+# Requests are routed per model_name through the registry-driven LLM router;
+# this is only the fallback when a client does not name a model:
+DEFAULT_MODEL = "gpt-4o"
 
 
 def load_text(input_value: str) -> str:
@@ -45,7 +101,8 @@ def load_text(input_value: str) -> str:
     Checks if 'input_value' is a path; if so, load its text content.
     Otherwise, return input_value as-is.
     """
-    if os.path.exists(input_value):
+    # Longer than any path: skip the stat, which would encode a copy of a large input
+    if len(input_value) <= 4096 and os.path.exists(input_value):
         loader = TextLoader(input_value)
         docs = loader.load()
         return " ".join(doc.page_content for doc in docs)
@@ -67,42 +124,76 @@ class LLMBot:
         temperature: float = 0.0,
         top_p: float = 1.0,
         max_length: int = 4096,
+        frequency_penalty: float = 0.0,
+        presence_penalty: float = 0.0,
         streaming: bool = True,
         conversation_id: str = None,
         enable_telemetry: bool = False,  # Added for telemetry toggle
+        user_id: str = None,  # Signed-in user; completed turns are persisted to their Conversation row
     ):
         if not api_key:
             raise ValueError("An API key is required to initialize the bot.")
 
-        model_name = model_name or "gpt-4o"
-        # Lazily initialize the global LLM if it's still None:
-        global GLOBAL_LLM
-        if GLOBAL_LLM is None:
-            GLOBAL_LLM = ChatOpenAI(
-                model=model_name,
-                api_key=api_key,
-                streaming=streaming,
-                temperature=temperature,
-                top_p=top_p,
-                max_completion_tokens=max_length,
-            )
+        # Resolve the model against the AI services registry up front so an
+        # unknown model fails here rather than mid-stream:
+        self.model_name = model_name or DEFAULT_MODEL
+        get_router().resolve(self.model_name)
+        self.temperature = temperature
+        self.top_p = top_p
+        self.max_length = max_length
+        self.frequency_penalty = frequency_penalty
+        self.presence_penalty = presence_penalty
 
         # Each instance can either use an existing conversation_id
         # or generate a new one if none was provided:
         self.conversation_id = conversation_id or str(uuid.uuid4())
+        self.user_id = user_id
+        # HumanMessages of the turns still running: their run checkpoints them only when it ends
+        self.pending = []
+
+        # A conversation this worker has never seen may have been handed off
+        # by a drained worker; restore it before adding anything new:
+        if conversation_id:
+            self.restore_handoff()
 
         # Store telemetry toggle
         self.enable_telemetry = enable_telemetry
 
-        # If a system prompt is provided, we store it as a system message:
+        # If a system prompt is provided, it becomes the conversation's only system message
+        # (re-creating a bot for the same conversation_id must not stack duplicates):
         if system_prompt:
-            prompt_text = load_text(system_prompt)
-            self.update_memory(SystemMessage(content=prompt_text))
+            self.set_system_prompt(load_text(system_prompt))
 
         print(
             f"🚀 LLMBot initialized with conversation_id={self.conversation_id}, telemetry={'enabled' if self.enable_telemetry else 'disabled'}"
         )
 
+    def restore_handoff(self):
+        """Loads this conversation from the cold tier, or from the handoff store if it is not in local memory."""
+        if GLOBAL_COLD_TIER.checkout(self.conversation_id):
+            return
+        config = {"configurable": {"thread_id": self.conversation_id}}
+        if GLOBAL_APP.get_state(config).values.get("messages"):
+            return
+        messages = get_handoff_store().load_conversation(self.conversation_id)
+        if messages:
+            GLOBAL_APP.update_state(config, {"messages": messages})
+            print(f"♻️ Restored {len(messages)} handed-off messages for conversation_id={self.conversation_id}")
+
+    def conversation(self) -> list:
+        """Returns this conversation's messages from memory."""
+        GLOBAL_COLD_TIER.checkout(self.conversation_id)
+        config = {"configurable": {"thread_id": self.conversation_id}}
+        return to_messages(GLOBAL_APP.get_state(config).values.get("messages", []))
+
+    def set_system_prompt(self, text: str):
+        """Stores `text` as this conversation's single system prompt, replacing any previous one."""
+        GLOBAL_COLD_TIER.checkout(self.conversation_id)
+        config = {"configurable": {"thread_id": self.conversation_id}}
+        update = with_system_prompt(to_messages(GLOBAL_APP.get_state(config).values.get("messages", [])), text)
+        if update:
+            GLOBAL_APP.update_state(config, {"messages": update})
+
     def update_memory(self, message):
         """
         Appends a message (System/Human/AI) to this conversation's memory
@@ -111,15 +202,13 @@ class LLMBot:
         Args:
             message (Message): The message to store in memory (SystemMessage, HumanMessage, or AIMessage).
         """
+        GLOBAL_COLD_TIER.checkout(self.conversation_id)
         config = {"configurable": {"thread_id": self.conversation_id}}
-        state = GLOBAL_APP.get_state(config).values
-        current_msgs = state.get("messages", [])
-        updated_msgs = current_msgs + [message]
 
         print(
             f"📌 Storing message under conversation_id={self.conversation_id}: {message.content}"
         )
-        GLOBAL_APP.update_state(config, {"messages": updated_msgs})
+        GLOBAL_APP.update_state(config, {"messages": [message]})
 
         # Debug: Print entire conversation for clarity
         new_state = GLOBAL_APP.get_state(config).values
@@ -127,26 +216,132 @@ class LLMBot:
         for idx, msg in enumerate(new_state["messages"], start=1):
             print(f"  {idx}. [{msg.type}] {msg.content}")
 
-    async def send_message(self, user_input: str):
+    async def send_message(self, user_input: str, settings: dict = None):
         """
-        Handles user input, updates memory with a HumanMessage, streams the model's response,
-        and stores the final AIMessage in memory.
+        Handles user input and runs the turn through GLOBAL_APP: the HumanMessage is the
+        graph's input, the model's response streams from its custom stream, and the turn
+        (the message, any tool rounds and the final AIMessage) is checkpointed once, when
+        the run ends. A turn cut short keeps only the HumanMessage. Until then the message
+        is in `pending`, so a drain that cuts the turn still hands it off.
+
+        When tools are registered (tool_execution_service), a reply may call them: every call
+        of that reply runs at once, their progress is yielded as tool events, and the model is
+        asked again with the results, for up to TOOL_MAX_ROUNDS rounds.
 
         Args:
             user_input (str): The user's input message.
+            settings (dict, optional): model_name and sampling values for this turn only, over
+                the bot's own (a /v1/ws/mux request on a conversation already bound).
 
         Yields:
-            dict: Partial AI response chunks streamed to the client, including the role.
+            dict: Partial AI response chunks streamed to the client, including the role, and
+                {"type": "tool", ...} progress events while tools run.
         """
+        started = time.time()
         user_text = load_text(user_input)
-        human_message = HumanMessage(content=user_text)
-        self.update_memory(human_message)
+        # A spent daily quota refuses the message before it is stored (429 / 4429)
+        quota = get_quota_manager().admit(self.user_id, (settings or {}).get("model_name", self.model_name))
+        # Resident until the turn ends, tool rounds included: a sweep never freezes it mid-run
+        with GLOBAL_COLD_TIER.in_use(self.conversation_id):
+            GLOBAL_COLD_TIER.checkout(self.conversation_id)
+
+            reply = None
+            message = HumanMessage(content=user_text, id=str(uuid.uuid4()))
+            self.pending.append(message)  # Not checkpointed before the run ends; hand_off stores it
+            try:
+                async with aclosing(GLOBAL_APP.astream(
+                    {"messages": [message]},
+                    self.graph_config(quota, settings),
+                    stream_mode=["custom", "updates"],
+                    durability="exit",  # One checkpoint per turn, written when the run ends
+                )) as run:
+                    async for mode, item in run:
+                        if mode == "custom":
+                            # The model's chunks, and the tools node's progress events (dicts) as they are
+                            yield item if isinstance(item, dict) else {"role": "ai", "content": item.content}
+                        elif "model" in item:
+                            reply = item["model"]["messages"][-1].content
+            finally:
+                self.pending.remove(message)
+
+            # Queued for the Conversation table; written behind the stream
+            get_conversation_persister().record(self.conversation_id, self.user_id, user_text, reply, started)
+
+    def graph_config(self, quota, settings: dict = None) -> dict:
+        """
+        The GLOBAL_APP run config of one turn: this conversation's thread and the model request
+        settings, the bot's own overridden by `settings` for this turn only.
+        """
+        turn = {
+            "model_name": self.model_name,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "max_length": self.max_length,
+            "frequency_penalty": self.frequency_penalty,
+            "presence_penalty": self.presence_penalty,
+            **(settings or {}),
+        }
+        return {"configurable": {
+            "thread_id": self.conversation_id,
+            "model_name": turn["model_name"],
+            "user_id": self.user_id,
+            "quota": quota,
+            "params": {
+                "temperature": turn["temperature"],
+                "top_p": turn["top_p"],
+                "max_tokens": turn["max_length"],
+                "frequency_penalty": turn["frequency_penalty"],
+                "presence_penalty": turn["presence_penalty"],
+            },
+        }}
+
+    async def continue_message(self):
+        """
+        Continues a reply that was interrupted by a drain on another worker.
 
-        config = {"configurable": {"thread_id": self.conversation_id}}
-        state = GLOBAL_APP.get_state(config).values
+        The partial reply is the last AIMessage in memory; it is sent to the
+        model as an assistant prefix and replaced by the completed text.
 
-        async for response_chunk in GLOBAL_LLM.astream(state["messages"]):
-            yield {"role": "ai", "content": response_chunk.content}
+        Yields:
+            dict: The continuation's chunks, including the role.
+        """
+        with GLOBAL_COLD_TIER.in_use(self.conversation_id):
+            config = {"configurable": {"thread_id": self.conversation_id}}
+            messages = self.conversation()
+            if not messages or not isinstance(messages[-1], AIMessage):
+                return
+            partial = messages[-1]
+
+            quota = get_quota_manager().admit(self.user_id, self.model_name)
+            meter = get_usage_ledger().meter(self.model_name, self.user_id, self.conversation_id, messages)
+            streamed_chunks = []
+            try:
+                quota.start(messages)
+                async with aclosing(get_router().astream(
+                    self.model_name,
+                    messages,
+                    temperature=self.temperature,
+                    top_p=self.top_p,
+                    max_tokens=self.max_length,
+                    frequency_penalty=self.frequency_penalty,
+                    presence_penalty=self.presence_penalty,
+                    continue_final=True,
+                )) as stream:
+                    async for response_chunk in stream:
+                        meter.observe(response_chunk)
+                        quota.consume(response_chunk.content)
+                        streamed_chunks.append(response_chunk.content or "")
+                        yield {"role": "ai", "content": response_chunk.content}
+            finally:
+                meter.finish("".join(streamed_chunks))
+                quota.release()
+
+            completed = AIMessage(content=partial.content + "".join(streamed_chunks), id=partial.id)
+            GLOBAL_APP.update_state(config, {"messages": [completed]})
+            # The interrupted send_message never persisted this turn
+            if len(messages) > 1 and isinstance(messages[-2], HumanMessage):
+                get_conversation_persister().record(self.conversation_id, self.user_id, messages[-2].content,
+                                                    completed.content)
 
     # No reset method: we keep conversation memory indefinitely for each conversation_id.
 
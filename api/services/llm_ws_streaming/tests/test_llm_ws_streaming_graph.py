@@ -0,0 +1,144 @@
+import asyncio
+import time
+from contextlib import aclosing
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from api.services.conversation_memory.conversation_memory_service import to_messages
+from api.services.llm_http_streaming import llm_http_streaming_service as http_service
+from api.services.llm_routing.llm_routing_service import LLMRouter
+from api.services.llm_routing.stub_openai_server import StubOpenAIServer
+from api.services.llm_ws_streaming import llm_ws_streaming_service as ws_service
+from api.services.stream_handoff import stream_handoff_service
+from api.services.stream_handoff.stream_handoff_service import HandoffStore, hand_off
+from api.services.stream_replay.stream_replay_service import StreamRegistry
+
+
+def checkpoints(service, conversation_id: str) -> int:
+    return len(list(service.GLOBAL_MEMORY.list({"configurable": {"thread_id": conversation_id}})))
+
+
+def stored(service, conversation_id: str) -> list:
+    state = service.GLOBAL_APP.get_state({"configurable": {"thread_id": conversation_id}})
+    return to_messages(state.values["messages"])
+
+
+def content(item) -> str:
+    return (item["content"] if isinstance(item, dict) else item.content) or ""
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("service", [ws_service, http_service], ids=["ws", "http"])
+async def test_a_turn_streams_through_the_graph_and_checkpoints_once(service, monkeypatch):
+    tokens = ["The ", "answer ", "is ", "42."]
+    async with StubOpenAIServer(tokens=tokens, token_delay=0.05) as stub:
+        router = LLMRouter({"gpt-4o": [{"url": stub.url, "engine": "vllm"}]})
+        monkeypatch.setattr(service, "get_router", lambda: router)
+        conversation_id = f"graph-turn-{service.__name__}"
+        bot = service.LLMBot(api_key="sk-test", conversation_id=conversation_id, system_prompt="Be brief.")
+        before = checkpoints(service, conversation_id)
+
+        started, first, items = time.monotonic(), None, []
+        async for item in bot.send_message("What is the answer?"):
+            first = first or time.monotonic() - started
+            items.append(item)
+        total = time.monotonic() - started
+        assert first < total - 0.1  # Tokens arrive as generated, not when the run ends
+        assert "".join(content(item) for item in items) == "The answer is 42."
+        assert checkpoints(service, conversation_id) == before + 1  # Message and reply in one checkpoint
+
+        async for _ in bot.send_message("And again?"):
+            pass
+        assert checkpoints(service, conversation_id) == before + 2
+        await router.aclose()
+
+    messages = stored(service, conversation_id)
+    assert [message.type for message in messages] == ["system", "human", "ai", "human", "ai"]
+    assert messages[2].content == "The answer is 42."
+    assert stub.requests[1]["temperature"] == bot.temperature and stub.requests[1]["max_tokens"] == bot.max_length
+    assert [message["role"] for message in stub.requests[1]["messages"]] == [
+        "system", "user", "assistant", "user"]
+
+
+@pytest.mark.asyncio
+async def test_a_cut_turn_keeps_the_message_and_cancels_generation(monkeypatch):
+    async with StubOpenAIServer(tokens=["tok "] * 100, token_delay=0.01) as stub:
+        router = LLMRouter({"gpt-4o": [{"url": stub.url, "engine": "vllm"}]})
+        monkeypatch.setattr(ws_service, "get_router", lambda: router)
+        bot = ws_service.LLMBot(api_key="sk-test", conversation_id="graph-cut")
+        async with aclosing(bot.send_message("Tell me everything")) as stream:
+            async for item in stream:
+                break  # The client went away after the first chunk
+        for _ in range(50):
+            if stub.cancelled:
+                break
+            await asyncio.sleep(0.01)
+        assert stub.cancelled == 1
+        assert [message.type for message in bot.conversation()] == ["human"]  # Stored without a reply
+
+        stub.tokens = ["Short ", "answer."]
+        replies = [item["content"] async for item in bot.send_message("Briefly, then")]
+        await router.aclose()
+    assert "".join(replies) == "Short answer."
+    assert [message.content for message in bot.conversation()] == [
+        "Tell me everything", "Briefly, then", "Short answer."]
+
+
+@pytest.mark.asyncio
+async def test_the_compiled_graph_runs_without_blocking_the_event_loop(monkeypatch):
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async with StubOpenAIServer(tokens=["slow "] * 10, token_delay=0.03) as stub:
+        router = LLMRouter({"gpt-4o": [{"url": stub.url, "engine": "vllm"}]})
+        monkeypatch.setattr(ws_service, "get_router", lambda: router)
+        clock = asyncio.create_task(ticker())
+        state = await ws_service.GLOBAL_APP.ainvoke(
+            {"messages": [HumanMessage(content="Hi")]}, {"configurable": {"thread_id": "graph-direct"}},
+        )
+        clock.cancel()
+        await router.aclose()
+    assert state["messages"][-1].type == "ai" and state["messages"][-1].content == "slow " * 10
+    # A blocking invoke() would stall the loop for the whole ~0.3 s generation
+    assert len(ticks) >= 20 and max(b - a for a, b in zip(ticks, ticks[1:])) < 0.25
+
+
+@pytest.mark.asyncio
+async def test_a_reply_cut_by_a_drain_is_handed_off_with_its_question(monkeypatch, tmp_path):
+    store = HandoffStore(path=str(tmp_path / "handoff.sqlite"))
+    monkeypatch.setattr(stream_handoff_service, "get_handoff_store", lambda: store)
+    async with StubOpenAIServer(tokens=["tok "] * 100, token_delay=0.01) as stub:
+        router = LLMRouter({"gpt-4o": [{"url": stub.url, "engine": "vllm"}]})
+        monkeypatch.setattr(ws_service, "get_router", lambda: router)
+        bot = ws_service.LLMBot(api_key="sk-test", conversation_id="graph-handoff")
+        buffer = StreamRegistry().start(bot.send_message("What is up?"), bot)
+        while len(buffer.chunks) < 3:
+            await asyncio.sleep(0.01)
+        frame = hand_off(bot, buffer, sent=3)
+        await asyncio.sleep(0.05)
+        await router.aclose()
+
+    messages = store.load_conversation("graph-handoff")
+    assert [(message.type, message.content) for message in messages] == [("human", "What is up?"), ("ai", "tok " * 3)]
+    assert frame["offset"] == len("tok " * 3) and bot.pending == []
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_turn_settings_override_the_bot_for_that_turn_only(monkeypatch):
+    async with StubOpenAIServer(tokens=["ok"]) as stub:
+        router = LLMRouter({"gpt-4o": [{"url": stub.url, "engine": "vllm"}]})
+        monkeypatch.setattr(ws_service, "get_router", lambda: router)
+        bot = ws_service.LLMBot(api_key="sk-test", conversation_id="graph-settings", temperature=0.7)
+        async for _ in bot.send_message("One", {"temperature": 0.2, "max_length": 10}):
+            pass
+        async for _ in bot.send_message("Two"):
+            pass
+        await router.aclose()
+    assert [(r["temperature"], r["max_tokens"]) for r in stub.requests] == [(0.2, 10), (0.7, bot.max_length)]
+    assert bot.temperature == 0.7
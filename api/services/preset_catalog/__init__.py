@@ -0,0 +1 @@
+# Init for preset_catalog module
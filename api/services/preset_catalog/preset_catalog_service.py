@@ -0,0 +1,264 @@
+"""
+Preset catalog: the Prisma preset, Model and AIProvider tables, in memory.
+
+A client can name a `preset` instead of sending its own prompt and sampling
+values. `resolve_params()` fills the request in from the preset. Values the
+client sent explicitly still win. The preset's `prompt` becomes the system
+prompt. Every conversation using the preset shares that prompt, so it is
+stored once (prompt_assembly) and gives a stable, cacheable prefix.
+
+The tables are never queried per request. `PresetCatalog` holds an immutable
+`CatalogSnapshot` with a version number:
+- It is loaded on first use.
+- Every PRESET_REFRESH_INTERVAL seconds, `run()` checks SQLite's
+  `PRAGMA data_version`. That value only changes after another connection
+  commits, so the check costs microseconds.
+- After a commit, the three tables are re-read. A new snapshot (version + 1)
+  is swapped in only if their content actually changed.
+- If a reload fails, the last good snapshot stays in place.
+
+Model rows use display names ("GPT-4o Mini"). They are matched to the
+router's model names by lowercasing them and turning spaces into hyphens
+("gpt-4o-mini").
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from functools import lru_cache
+
+from api.config.exceptions import NotFoundException
+from api.config.logging import logger
+from api.config.metrics import metrics
+from api.config.settings import PRESET_DB_PATH
+
+_MODELS = (
+    'SELECT m."id", m."name", m."type", m."inputCost", m."cachedInputCost", m."outputCost", p."provider", '
+    'p."category" FROM "Model" m JOIN "AIProvider" p ON p."id" = m."providerId" ORDER BY m."id"'
+)
+_PRESETS = (
+    'SELECT "name", "modelId", "prompt", "temperature", "maxTokens", "topP", "frequencyPenalty", "presencePenalty" '
+    'FROM "preset" ORDER BY "id"'
+)
+
+# Request parameters a preset can supply, by LLMBot keyword
+PRESET_PARAMS = ("model_name", "system_prompt", "temperature", "top_p", "max_length", "frequency_penalty",
+                 "presence_penalty")
+
+metrics.describe("preset_catalog_version", "Version of the in-memory preset catalog snapshot")
+metrics.describe("preset_catalog_reloads_total", "Preset catalog reloads by result (changed, unchanged, error)")
+metrics.describe("preset_requests_total", "Requests resolved through a preset")
+
+
+def routable_name(display_name: str) -> str:
+    """Maps a Model row's display name to the router's model name: "GPT-4o Mini" -> "gpt-4o-mini"."""
+    return "-".join(display_name.lower().split())
+
+
+class ModelInfo:
+    """A Model row with its provider. Costs are USD per million tokens, None when unpriced."""
+
+    __slots__ = ("model_name", "display_name", "type", "input_cost", "cached_input_cost", "output_cost",
+                 "provider", "category")
+
+    def __init__(self, display_name: str, type: str, input_cost, cached_input_cost, output_cost, provider: str,
+                 category: str):
+        self.model_name = routable_name(display_name)
+        self.display_name = display_name
+        self.type = type
+        self.input_cost = input_cost
+        self.cached_input_cost = cached_input_cost
+        self.output_cost = output_cost
+        self.provider = provider
+        self.category = category
+
+    def __repr__(self):
+        return f"ModelInfo({self.model_name!r}, provider={self.provider!r})"
+
+
+class Preset:
+    """A preset row, with its model resolved to a router model name."""
+
+    __slots__ = ("name", "model_name", "prompt", "temperature", "max_tokens", "top_p", "frequency_penalty",
+                 "presence_penalty")
+
+    def __init__(self, name: str, model_name: str, prompt, temperature: float, max_tokens: int, top_p: float,
+                 frequency_penalty: float, presence_penalty: float):
+        self.name = name
+        self.model_name = model_name
+        self.prompt = prompt
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.top_p = top_p
+        self.frequency_penalty = frequency_penalty
+        self.presence_penalty = presence_penalty
+
+    def params(self) -> dict:
+        """The preset as LLMBot keyword arguments."""
+        return {
+            "model_name": self.model_name,
+            "system_prompt": self.prompt or None,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "max_length": self.max_tokens,
+            "frequency_penalty": self.frequency_penalty,
+            "presence_penalty": self.presence_penalty,
+        }
+
+    def __repr__(self):
+        return f"Preset({self.name!r}, model={self.model_name!r})"
+
+
+class CatalogSnapshot:
+    """One immutable version of the catalog; readers keep theirs while a new one is swapped in."""
+
+    __slots__ = ("version", "fingerprint", "presets", "models", "loaded_at")
+
+    def __init__(self, version: int = 0, fingerprint: str = None, presets: dict = None, models: dict = None):
+        self.version = version
+        self.fingerprint = fingerprint
+        self.presets = presets or {}  # name -> Preset
+        self.models = models or {}  # router model name -> ModelInfo
+        self.loaded_at = time.time()
+
+
+class PresetCatalog:
+    """
+    Change-detecting, in-memory view of the preset, Model and AIProvider tables.
+
+    Args:
+        path (str): The Prisma SQLite database (opened read-only).
+    """
+
+    def __init__(self, path: str = PRESET_DB_PATH):
+        self.path = path
+        self._snapshot = None
+        self._conn = None
+        self._data_version = None
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        """The current snapshot, loaded on first use."""
+        if self._snapshot is None:
+            self.refresh()
+        return self._snapshot
+
+    def get(self, name: str) -> Preset:
+        """
+        Returns the preset called `name`.
+
+        Raises:
+            NotFoundException: If no preset has that name.
+        """
+        preset = self.snapshot.presets.get(name)
+        if preset is None:
+            raise NotFoundException(f"Preset '{name}' not found")
+        return preset
+
+    def apply(self, name: str, params: dict) -> dict:
+        """
+        Returns preset `name` as LLMBot keyword arguments, overridden by `params`
+        (the values the client sent itself).
+
+        Raises:
+            NotFoundException: If no preset has that name.
+        """
+        preset = self.get(name)
+        metrics.inc("preset_requests_total", preset=name)
+        resolved = {key: value for key, value in preset.params().items() if value is not None}
+        resolved.update(params)
+        return resolved
+
+    def model(self, model_name: str):
+        """The ModelInfo (provider, prices) of a router model name, or None if no Model row matches."""
+        return self.snapshot.models.get(model_name)
+
+    def refresh(self) -> bool:
+        """
+        Reloads the tables if the database changed since the last check.
+
+        Returns:
+            bool: True if a new snapshot version was swapped in.
+        """
+        try:
+            conn = self._connection()
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if self._snapshot is not None and data_version == self._data_version:
+                return False
+            snapshot = self._load(conn)
+            self._data_version = data_version
+        except sqlite3.Error as e:
+            self.close()
+            metrics.inc("preset_catalog_reloads_total", result="error")
+            if self._snapshot is None:
+                logger.warning(f"⚠️ Preset catalog unavailable ({self.path}): {e}")
+                self._snapshot = CatalogSnapshot()
+            else:
+                logger.error(f"❌ Preset catalog reload failed, keeping version {self._snapshot.version}: {e}")
+            return False
+
+        if self._snapshot is not None and snapshot.fingerprint == self._snapshot.fingerprint:
+            metrics.inc("preset_catalog_reloads_total", result="unchanged")
+            return False  # Some other table was written
+        snapshot.version = (self._snapshot.version if self._snapshot else 0) + 1
+        self._snapshot = snapshot
+        metrics.inc("preset_catalog_reloads_total", result="changed")
+        metrics.set("preset_catalog_version", snapshot.version)
+        logger.info(f"🎛️ Preset catalog v{snapshot.version}: {len(snapshot.presets)} preset(s), "
+                    f"{len(snapshot.models)} model(s)")
+        return True
+
+    async def run(self, interval: float):
+        """Checks for changes every `interval` seconds, off the event loop, until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.refresh)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._data_version = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=1.0, check_same_thread=False)
+        return self._conn
+
+    def _load(self, conn: sqlite3.Connection) -> CatalogSnapshot:
+        model_rows = conn.execute(_MODELS).fetchall()
+        preset_rows = conn.execute(_PRESETS).fetchall()
+        fingerprint = hashlib.sha256(json.dumps([model_rows, preset_rows]).encode()).hexdigest()
+
+        by_id = {row[0]: ModelInfo(*row[1:]) for row in model_rows}
+        presets = {}
+        for name, model_id, *values in preset_rows:
+            model = by_id.get(model_id)
+            if model is None:
+                logger.warning(f"⚠️ Preset '{name}' references unknown Model {model_id}; skipped")
+                continue
+            presets[name] = Preset(name, model.model_name, *values)
+        return CatalogSnapshot(fingerprint=fingerprint, presets=presets,
+                               models={model.model_name: model for model in by_id.values()})
+
+
+@lru_cache()
+def get_preset_catalog() -> PresetCatalog:
+    """Returns the process-wide preset catalog."""
+    return PresetCatalog()
+
+
+def resolve_params(data: dict, defaults: dict = None) -> dict:
+    """
+    LLMBot keyword arguments for a chat payload: the values the client sent,
+    then those of its `preset` (if any), then `defaults`.
+
+    Raises:
+        NotFoundException: If the payload names an unknown preset.
+    """
+    params = {key: data[key] for key in PRESET_PARAMS if data.get(key) is not None}
+    if data.get("preset"):
+        params = get_preset_catalog().apply(data["preset"], params)
+    return {**(defaults or {}), **params}
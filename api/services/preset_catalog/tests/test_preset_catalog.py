@@ -0,0 +1,81 @@
+import sqlite3
+
+import pytest
+
+from api.config.exceptions import NotFoundException
+from api.services.preset_catalog import preset_catalog_service as presets
+from api.services.preset_catalog.preset_catalog_service import PresetCatalog, resolve_params
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "app_db.sqlite")
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        'CREATE TABLE "AIProvider" ("id" INTEGER PRIMARY KEY, "category" TEXT, "provider" TEXT, "modelType" TEXT);'
+        'CREATE TABLE "Model" ("id" INTEGER PRIMARY KEY, "name" TEXT, "description" TEXT, "type" TEXT,'
+        ' "inputCost" REAL, "cachedInputCost" REAL, "outputCost" REAL, "totalCost" REAL, "providerId" INTEGER);'
+        'CREATE TABLE "preset" ("id" INTEGER PRIMARY KEY, "name" TEXT, "description" TEXT, "modelId" INTEGER,'
+        ' "prompt" TEXT, "temperature" REAL, "maxTokens" INTEGER, "topP" REAL, "frequencyPenalty" REAL,'
+        ' "presencePenalty" REAL, "createdAt" DATETIME);'
+        'CREATE TABLE "Session" ("id" TEXT PRIMARY KEY);'
+        "INSERT INTO AIProvider VALUES (1, 'Chat', 'OpenAI', 'LLM');"
+        "INSERT INTO Model VALUES (1, 'GPT-4o', NULL, 'GPT-4', 2.5, 1.25, 10.0, NULL, 1);"
+        "INSERT INTO Model VALUES (4, 'GPT-4o Mini', NULL, 'GPT-4', 0.15, 0.075, 0.6, NULL, 1);"
+        "INSERT INTO preset VALUES (8, 'GPT Main Preset', NULL, 1, 'You are an AI assistant', 0.3, 4450, 1.0,"
+        " 0.5, 0.0, 0);"
+    )
+    conn.commit()
+    yield path, conn
+    conn.close()
+
+
+def test_presets_resolve_to_request_params(db):
+    path, _ = db
+    catalog = PresetCatalog(path)
+    preset = catalog.get("GPT Main Preset")
+    assert preset.params() == {"model_name": "gpt-4o", "system_prompt": "You are an AI assistant", "temperature": 0.3,
+                               "top_p": 1.0, "max_length": 4450, "frequency_penalty": 0.5, "presence_penalty": 0.0}
+    mini = catalog.model("gpt-4o-mini")
+    assert (mini.display_name, mini.provider, mini.input_cost, mini.output_cost) == ("GPT-4o Mini", "OpenAI", 0.15, 0.6)
+    assert catalog.apply("GPT Main Preset", {"temperature": 0.9})["temperature"] == 0.9
+    with pytest.raises(NotFoundException):
+        catalog.get("missing")
+    catalog.close()
+
+
+def test_reloads_only_when_the_tables_change(db):
+    path, conn = db
+    catalog = PresetCatalog(path)
+    first = catalog.snapshot
+    assert first.version == 1
+    assert not catalog.refresh()  # Nothing committed: PRAGMA data_version is unchanged
+
+    conn.execute('INSERT INTO "Session" VALUES (?)', ("s1",))
+    conn.commit()
+    assert not catalog.refresh() and catalog.snapshot is first  # Re-read, same content: same version
+
+    conn.execute('UPDATE "preset" SET "temperature" = 0.8')
+    conn.commit()
+    assert catalog.refresh()
+    assert catalog.snapshot.version == 2 and catalog.get("GPT Main Preset").temperature == 0.8
+    assert first.presets["GPT Main Preset"].temperature == 0.3  # Readers of the old snapshot are unaffected
+
+    conn.execute('DROP TABLE "preset"')
+    conn.commit()
+    assert not catalog.refresh() and catalog.snapshot.version == 2  # A failed reload keeps the last snapshot
+    catalog.close()
+
+
+def test_sent_values_win_over_the_preset_and_defaults(db, monkeypatch):
+    path, _ = db
+    monkeypatch.setattr(presets, "get_preset_catalog", lambda: PresetCatalog(path))
+    defaults = {"model_name": "gpt-4o-mini", "temperature": 0.7, "max_length": 256}
+
+    assert resolve_params({"temperature": 0.1}, defaults) == {"model_name": "gpt-4o-mini", "temperature": 0.1,
+                                                              "max_length": 256}
+    params = resolve_params({"preset": "GPT Main Preset", "max_length": 64, "system_prompt": None}, defaults)
+    assert (params["model_name"], params["temperature"], params["max_length"]) == ("gpt-4o", 0.3, 64)
+    assert params["system_prompt"] == "You are an AI assistant" and params["frequency_penalty"] == 0.5
+    with pytest.raises(NotFoundException):
+        resolve_params({"preset": "nope"})
@@ -0,0 +1 @@
+# Init for prompt_assembly module
@@ -0,0 +1,170 @@
+"""
+Prompt assembly: the stage between conversation memory and the LLM router.
+
+Providers cache the longest previously seen prefix of a request (OpenAI and
+Anthropic server-side, vLLM / llama.cpp in their KV cache), so a request
+should start with the same bytes every turn:
+
+- `with_system_prompt()` keeps exactly one system prompt per conversation.
+  A bot re-created for an existing conversation_id no longer appends a
+  duplicate SystemMessage; a different prompt replaces the old one in place.
+- Conversation state holds a reference to its system prompt, not the text
+  (see prompt_store.py). The text is kept once per process and resolved here.
+- `assemble()` orders a request as unique system prompts first, then the
+  turns in order, and accounts how much of it is cache-eligible: everything
+  before the newest user message was already sent, either on an earlier turn
+  or by another conversation with the same system prompt.
+- `cache_hints()` adds the engine's prompt-cache hint, if it has one.
+
+Token counts are estimates (CHARS_PER_TOKEN); they are for the cache-share
+metrics, not for billing.
+"""
+
+import hashlib
+
+from langchain_core.messages import HumanMessage, RemoveMessage, SystemMessage
+
+from api.config.metrics import metrics
+from api.config.settings import PROMPT_CACHE_HINTS, PROMPT_CACHE_MIN_TOKENS
+from api.services.prompt_assembly.prompt_store import get_prompt_store, prompt_message, prompt_ref, resolve
+
+CHARS_PER_TOKEN = 4
+
+metrics.describe("prompt_tokens_total", "Estimated prompt tokens sent to LLMs")
+metrics.describe("prompt_cache_eligible_tokens_total", "Estimated prompt tokens in a prefix already sent before")
+metrics.describe("prompt_cache_eligible_share", "Cache-eligible share of prompt tokens since start")
+
+_totals = {"tokens": 0, "eligible": 0}
+
+
+def with_system_prompt(messages: list, text: str):
+    """
+    Returns the memory update that makes `text` the conversation's only
+    system prompt, or None if it already is.
+
+    The first stored SystemMessage is replaced in place (same id) by a
+    reference into the prompt store, and any others are removed, so
+    conversations that accumulated duplicates heal on their next bot.
+    """
+    store = get_prompt_store()
+    message = prompt_message(text)
+    ref = prompt_ref(message)
+    systems = [m for m in messages if isinstance(m, SystemMessage)]
+    if len(systems) == 1 and prompt_ref(systems[0]) == ref:
+        return None
+    store.retain(ref)
+    for old in systems:
+        if prompt_ref(old) is not None:
+            store.release(prompt_ref(old))
+    message.id = systems[0].id if systems else None
+    return [message] + [RemoveMessage(id=m.id) for m in systems[1:]]
+
+
+def estimate_tokens(message) -> int:
+    content = message.content
+    size = len(content) if isinstance(content, str) else sum(len(str(part)) for part in content)
+    return size // CHARS_PER_TOKEN + 1
+
+
+def assemble(messages: list) -> list:
+    """
+    Orders `messages` for a request: each distinct system prompt once, first,
+    then the turns in their stored order. Prompt references are resolved to
+    their shared text. Records the cache-eligible share.
+    """
+    seen = set()
+    systems, turns = [], []
+    for message in resolve(messages):
+        if isinstance(message, SystemMessage):
+            key = message.content if isinstance(message.content, str) else repr(message.content)
+            if key not in seen:
+                seen.add(key)
+                systems.append(message)
+        else:
+            turns.append(message)
+    request = systems + turns
+    record_cache_share(request)
+    return request
+
+
+def prefix_length(messages: list) -> int:
+    """Number of leading messages already sent before: everything up to the newest user message."""
+    for index in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[index], HumanMessage):
+            return index
+    return len(messages)
+
+
+def record_cache_share(messages: list):
+    tokens = [estimate_tokens(m) for m in messages]
+    eligible = sum(tokens[:prefix_length(messages)])
+    _totals["tokens"] += sum(tokens)
+    _totals["eligible"] += eligible
+    metrics.inc("prompt_tokens_total", sum(tokens))
+    metrics.inc("prompt_cache_eligible_tokens_total", eligible)
+    metrics.set("prompt_cache_eligible_share", round(_totals["eligible"] / max(_totals["tokens"], 1), 4))
+
+
+def cache_report() -> dict:
+    """Estimated prompt tokens, the cache-eligible share since start, and the prompt store's memory."""
+    return {
+        "prompt_tokens": _totals["tokens"],
+        "cache_eligible_tokens": _totals["eligible"],
+        "cache_eligible_share": round(_totals["eligible"] / max(_totals["tokens"], 1), 4),
+        "prompt_store": get_prompt_store().stats(),
+    }
+
+
+def prefix_key(messages: list) -> str:
+    """Stable id of the request's system prompts, shared by every conversation using them."""
+    digest = hashlib.sha256()
+    for message in messages:
+        if isinstance(message, SystemMessage):
+            digest.update(str(message.content).encode())
+    return digest.hexdigest()[:32]
+
+
+def _mark(message):
+    """Copy of `message` with an Anthropic-style cache breakpoint on its content."""
+    if not isinstance(message.content, str):
+        return message
+    block = {"type": "text", "text": message.content, "cache_control": {"type": "ephemeral"}}
+    return message.model_copy(update={"content": [block]})
+
+
+def cache_hints(messages: list, style: str):
+    """
+    Applies one engine's prompt-cache hint to an assembled request.
+
+    Args:
+        messages (list): Output of assemble().
+        style (str | None): ENGINE_PROFILES[engine]["prompt_cache"]:
+            "prompt_cache_key" (OpenAI: route same-prefix requests to the same cache),
+            "cache_control" (LiteLLM → Anthropic: breakpoints after the system prompt
+            and on the newest user message, whose cache entry the next turn reads),
+            "cache_prompt" (llama.cpp server: reuse the slot's KV cache), or None
+            (vLLM prefix caching needs no hint).
+
+    Returns:
+        tuple: (messages, extra request body fields)
+    """
+    if not PROMPT_CACHE_HINTS or not style:
+        return messages, {}
+    if style == "prompt_cache_key":
+        return messages, {"prompt_cache_key": prefix_key(messages)}
+    if style == "cache_prompt":
+        return messages, {"cache_prompt": True}
+    if style == "cache_control":
+        breakpoints = set()
+        prefix = prefix_length(messages)
+        systems = [i for i, m in enumerate(messages[:prefix]) if isinstance(m, SystemMessage)]
+        if systems and sum(estimate_tokens(m) for m in messages[:systems[-1] + 1]) >= PROMPT_CACHE_MIN_TOKENS:
+            breakpoints.add(systems[-1])
+        # On the newest user message, not the last assistant turn: langchain_openai drops
+        # cache_control from assistant content blocks
+        if prefix < len(messages) and sum(estimate_tokens(m) for m in messages[:prefix + 1]) >= PROMPT_CACHE_MIN_TOKENS:
+            breakpoints.add(prefix)
+        if breakpoints:
+            messages = [_mark(m) if i in breakpoints else m for i, m in enumerate(messages)]
+        return messages, {}
+    raise ValueError(f"Unknown prompt cache style '{style}'")
@@ -0,0 +1,131 @@
+"""
+Content-addressed store for system prompts.
+
+Conversation state holds a reference to its system prompt instead of the
+text. The reference is a SystemMessage with empty content and
+`additional_kwargs["prompt_ref"]`, the SHA-256 of the text. The text is kept
+once per process in PromptStore:
+
+- `resolve()` puts it back when a request is assembled, by pointing the
+  message copy at the shared string (no copy of the text).
+- `resolve()` also runs wherever messages leave the process (the handoff
+  store), and `compact()` turns inline prompts back into references when
+  they come in. So references never escape a worker.
+
+Without this, a 50 KB prompt used by 100k conversations is held 100k times
+live, and once more in every LangGraph checkpoint of each conversation
+(MemorySaver keeps every version of the message list).
+
+Texts are immutable and never evicted. There are few distinct prompts, and a
+reference must always resolve.
+"""
+
+import hashlib
+from collections import Counter
+from functools import lru_cache
+
+from langchain_core.messages import SystemMessage
+
+from api.config.metrics import metrics
+
+PROMPT_REF = "prompt_ref"
+
+metrics.describe("prompt_store_texts", "Distinct system prompt texts held by the prompt store")
+metrics.describe("prompt_store_bytes", "UTF-8 bytes of the texts held by the prompt store")
+metrics.describe("prompt_store_refs", "Conversations referencing a stored system prompt")
+metrics.describe("prompt_store_bytes_saved", "Bytes per-conversation prompt copies would take beyond the shared ones")
+
+
+class PromptStore:
+    """Process-wide map of SHA-256 -> one shared prompt text, with reference counts for accounting."""
+
+    def __init__(self):
+        self._texts = {}
+        self._sizes = {}
+        self._refs = Counter()
+
+    def put(self, text: str) -> str:
+        """Stores `text` (once) and returns its reference."""
+        ref = hashlib.sha256(text.encode()).hexdigest()
+        if ref not in self._texts:
+            self._texts[ref] = text
+            self._sizes[ref] = len(text.encode())
+            self._publish()
+        return ref
+
+    def get(self, ref: str) -> str:
+        """
+        Returns the shared text of `ref`.
+
+        Raises:
+            KeyError: If `ref` was never stored in this process.
+        """
+        return self._texts[ref]
+
+    def retain(self, ref: str):
+        """Counts one more conversation referencing `ref`."""
+        self._refs[ref] += 1
+        self._publish()
+
+    def release(self, ref: str):
+        """Counts one conversation fewer referencing `ref`."""
+        if self._refs[ref] > 0:
+            self._refs[ref] -= 1
+            self._publish()
+
+    def stats(self) -> dict:
+        """Texts and bytes held, references, and the bytes per-conversation copies would have added."""
+        return {
+            "texts": len(self._texts),
+            "bytes": sum(self._sizes.values()),
+            "refs": sum(self._refs.values()),
+            "bytes_saved": sum(self._sizes[ref] * (count - 1) for ref, count in self._refs.items() if count > 1),
+        }
+
+    def _publish(self):
+        stats = self.stats()
+        metrics.set("prompt_store_texts", stats["texts"])
+        metrics.set("prompt_store_bytes", stats["bytes"])
+        metrics.set("prompt_store_refs", stats["refs"])
+        metrics.set("prompt_store_bytes_saved", stats["bytes_saved"])
+
+
+@lru_cache()
+def get_prompt_store() -> PromptStore:
+    """Returns the process-wide prompt store."""
+    return PromptStore()
+
+
+def prompt_ref(message):
+    """The prompt reference of a stored SystemMessage, or None if it holds its text inline."""
+    return message.additional_kwargs.get(PROMPT_REF) if isinstance(message, SystemMessage) else None
+
+
+def prompt_message(text: str, id: str = None) -> SystemMessage:
+    """A SystemMessage referencing `text` in the prompt store."""
+    return SystemMessage(content="", additional_kwargs={PROMPT_REF: get_prompt_store().put(text)}, id=id)
+
+
+def resolve(messages: list) -> list:
+    """Returns `messages` with every prompt reference replaced by its shared text."""
+    store = get_prompt_store()
+    resolved = []
+    for message in messages:
+        ref = prompt_ref(message)
+        if ref is not None:
+            kwargs = {k: v for k, v in message.additional_kwargs.items() if k != PROMPT_REF}
+            message = message.model_copy(update={"content": store.get(ref), "additional_kwargs": kwargs})
+        resolved.append(message)
+    return resolved
+
+
+def compact(messages: list) -> list:
+    """Returns `messages` with inline system prompts turned into references (counted as retained)."""
+    store = get_prompt_store()
+    compacted = []
+    for message in messages:
+        if isinstance(message, SystemMessage) and prompt_ref(message) is None and isinstance(message.content, str):
+            message = prompt_message(message.content, id=message.id)
+            store.retain(prompt_ref(message))
+        compacted.append(message)
+    return compacted
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langgraph.graph.message import add_messages
+
+from api.services.llm_routing.llm_routing_service import LLMRouter
+from api.services.llm_routing.stub_openai_server import StubOpenAIServer
+from api.services.prompt_assembly import prompt_assembly_service as assembly
+from api.services.prompt_assembly.prompt_store import get_prompt_store, prompt_ref
+
+PROMPT = "You are a meticulous assistant. " * 200  # ~1.6k estimated tokens
+
+
+def test_system_prompt_is_deduplicated_and_replaced_in_place():
+    stored = add_messages([], [SystemMessage(PROMPT), HumanMessage("hi"), SystemMessage(PROMPT), AIMessage("yo")])
+    stored = add_messages(stored, assembly.with_system_prompt(stored, PROMPT))
+    assert [m.type for m in stored] == ["system", "human", "ai"]
+    assert assembly.with_system_prompt(stored, PROMPT) is None
+
+    replaced = add_messages(stored, assembly.with_system_prompt(stored, "Be brief."))
+    assert assembly.assemble(replaced)[0].content == "Be brief."
+    assert replaced[0].id == stored[0].id and len(replaced) == 3
+
+
+def test_conversations_reference_one_shared_prompt():
+    store = get_prompt_store()
+    before = store.stats()
+    conversations = [add_messages([], assembly.with_system_prompt([], PROMPT + "shared")) for _ in range(3)]
+    refs = {prompt_ref(c[0]) for c in conversations}
+    assert len(refs) == 1 and all(c[0].content == "" for c in conversations)
+
+    texts = [assembly.assemble(c)[0].content for c in conversations]
+    assert texts[0] == PROMPT + "shared" and texts[0] is texts[1] is texts[2]
+    after = store.stats()
+    assert after["texts"] == before["texts"] + 1
+    assert after["bytes_saved"] - before["bytes_saved"] == 2 * len(PROMPT + "shared")
+    with pytest.raises(KeyError):
+        store.get("0" * 64)
+
+
+def test_assemble_orders_system_first_and_reports_cache_share():
+    before = assembly.cache_report()
+    request = assembly.assemble([HumanMessage("q1"), SystemMessage(PROMPT), AIMessage("a1"),
+                                 SystemMessage(PROMPT), HumanMessage("q2")])
+    assert [m.type for m in request] == ["system", "human", "ai", "human"]
+    after = assembly.cache_report()
+    sent = after["prompt_tokens"] - before["prompt_tokens"]
+    eligible = after["cache_eligible_tokens"] - before["cache_eligible_tokens"]
+    assert sent == sum(assembly.estimate_tokens(m) for m in request)
+    assert eligible == sent - assembly.estimate_tokens(request[-1])  # All but the new question
+
+
+@pytest.mark.asyncio
+async def test_engines_receive_their_cache_hints():
+    messages = [SystemMessage(PROMPT), HumanMessage("q1"), AIMessage("a1"), HumanMessage("q2")]
+    async with StubOpenAIServer() as openai, StubOpenAIServer() as litellm, StubOpenAIServer() as llamacpp:
+        router = LLMRouter({
+            "gpt-4o": [{"url": openai.url, "engine": "openai", "api_key": "sk-test"}],
+            "claude": [{"url": litellm.url, "engine": "litellm"}],
+            "llama-3": [{"url": llamacpp.url, "engine": "llama.cpp"}],
+        })
+        for model in ("gpt-4o", "claude", "llama-3"):
+            [chunk async for chunk in router.astream(model, messages)]
+        await router.aclose()
+
+    assert openai.requests[0]["prompt_cache_key"] == assembly.prefix_key(messages)
+    assert llamacpp.requests[0]["cache_prompt"] is True
+    sent = litellm.requests[0]["messages"]
+    assert sent[0]["content"][0]["cache_control"] == {"type": "ephemeral"}  # After the system prompt
+    assert sent[1]["content"] == "q1"
+    assert sent[3]["content"][0]["cache_control"] == {"type": "ephemeral"}  # Read back by the next turn
+
+
+def test_recreated_bot_does_not_stack_system_prompts():
+    os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+    from api.services.llm_ws_streaming.llm_ws_streaming_service import LLMBot
+
+    for _ in range(3):
+        bot = LLMBot(api_key="sk-test", conversation_id="prompt-dedupe", system_prompt=PROMPT)
+    assert [m.type for m in bot.conversation()] == ["system"]
+    assert bot.conversation()[0].content == ""  # Held by reference; resolved when assembled
+    assert assembly.assemble(bot.conversation())[0].content == PROMPT
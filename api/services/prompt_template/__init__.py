@@ -0,0 +1 @@
+# Init for prompt_template module
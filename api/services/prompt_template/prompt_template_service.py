@@ -0,0 +1,331 @@
+"""
+Compiled prompt templates.
+
+Prompts are LangChain f-string templates: `{name}` is a field, `{{` and `}}`
+are literal braces. A prompt may also carry variable blocks, the JSON
+objects written by `update_json_in_text`:
+
+    {{
+        "system_variables": {{
+            "customer_id": 992343434
+        }}
+    }}
+
+A block is a JSON object with a single key whose value is an object, escaped
+as above or written as raw JSON. Its key (here "system_variables") names it.
+
+- `compile_template()` parses a template once into
+  segments: literal text, fields and blocks. Templates are cached by the
+  SHA-256 of their text (PROMPT_TEMPLATE_CACHE_SIZE entries, LRU), the same
+  key the prompt store uses.
+- A compiled template keeps every literal precomputed in two forms: as
+  template source (braces doubled) and as final text. Rendering copies that
+  list, fills the field and block slots, and joins it. The cost grows with
+  the number of segments, not with the prompt's length.
+- A block given new variables renders exactly as
+  `json.dumps({key: variables}, indent=4)`. Each variable's line is cached
+  per template, so changing one variable serializes only that variable.
+  Blocks not given keep their text as found.
+- `render()` returns the template with new block values, which is what
+  `update_json_in_text` returns. `render_template()` does so through the
+  cache and remembers the result by identity with its compiled form, so a
+  chain of updates never hashes or re-parses. `format()` returns
+  the final prompt, with fields filled and braces single.
+"""
+
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from functools import lru_cache
+
+from api.config.metrics import metrics
+from api.config.settings import PROMPT_TEMPLATE_CACHE_SIZE
+
+_BLOCK_HEAD = re.compile(r'(\{\{|\{)\s*"(?:[^"\\]|\\.)*"\s*:\s*\{')  # Where a variable block may start
+_TOKEN = re.compile(r"\{\{|\{([A-Za-z_][A-Za-z0-9_]*)\}")  # At a "{": an escaped brace or a field
+_SCALARS = (str, int, float, bool, type(None))
+_DECODER = json.JSONDecoder()
+
+metrics.describe("prompt_template_compiles_total", "Prompt templates parsed (cache misses)")
+metrics.describe("prompt_template_cache_hits_total", "Prompt template lookups served by the compiled cache")
+
+
+def escape(text: str) -> str:
+    """Doubles braces so LangChain's f-string templating keeps them literal."""
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def unescape(text: str) -> str:
+    return text.replace("{{", "{").replace("}}", "}")
+
+
+def _entry(name, value) -> str:
+    # '        "name": value' as json.dumps(indent=4) writes it two levels deep
+    return "    " + json.dumps({name: value}, indent=4)[2:-2].replace("\n", "\n    ")
+
+
+class _Block:
+    """
+    One variable block in a template: its key, its variables, its text as
+    found (template source and plain) and the cached line of each variable.
+    """
+
+    __slots__ = ("key", "head", "variables", "source", "plain", "entries")
+
+    def __init__(self, key: str, variables: dict, source: str, plain: str, entries: dict = None):
+        self.key = key
+        self.head = json.dumps(key)
+        self.variables = variables
+        self.source = source
+        self.plain = plain
+        self.entries = {} if entries is None else entries  # name -> (value, line), scalar values only
+
+    def dumps(self, variables: dict) -> str:
+        """json.dumps({key: variables}, indent=4), re-serializing only the variables that changed."""
+        if not variables:
+            return f"{{\n    {self.head}: {{}}\n}}"
+        entries = self.entries
+        lines = []
+        for name, value in variables.items():
+            cached = entries.get(name)
+            if cached is not None and type(cached[0]) is type(value) and cached[0] == value:
+                lines.append(cached[1])
+                continue
+            line = _entry(name, value)
+            if isinstance(value, _SCALARS):  # Containers can change in place, so they are never cached
+                entries[name] = (value, line)
+            lines.append(line)
+        return f"{{\n    {self.head}: {{\n" + ",\n".join(lines) + "\n    }\n}"
+
+
+class PromptTemplate:
+    """
+    A parsed template. Build with `compile_template()`, which caches it.
+
+    Attributes:
+        fields (tuple): Field names, in order of first use.
+        blocks (dict): Variable block key -> its variables as parsed (the first block, if repeated).
+    """
+
+    def __init__(self, source: list, plain: list, fields: dict, blocks: dict):
+        self._source = source  # Segments as template source; "" in block slots
+        self._plain = plain  # Segments as final text; "" in field and block slots
+        self._fields = fields  # name -> indexes of its slots
+        self._blocks = blocks  # key -> [(index, _Block)]
+        self.fields = tuple(fields)
+        self.blocks = {key: slots[0][1].variables for key, slots in blocks.items()}
+
+    def render(self, blocks: dict = None) -> str:
+        """
+        Returns the template source with the given blocks re-rendered (escaped, indent=4).
+
+        Args:
+            blocks (dict, optional): Block key -> new variables. Keys the template has no block for
+                are ignored; blocks not given keep their text as found.
+        """
+        return self._render(blocks)[0]
+
+    def _render(self, blocks: dict):
+        parts = self._source.copy()
+        rendered = {}
+        for key, slots in self._blocks.items():
+            if blocks and key in blocks:
+                plain = slots[0][1].dumps(blocks[key])
+                rendered[key] = (dict(blocks[key]), plain)  # A copy: the caller may change its dict
+                text = escape(plain)
+                for index, _ in slots:
+                    parts[index] = text
+            else:
+                for index, block in slots:
+                    parts[index] = block.source
+        return "".join(parts), rendered
+
+    def format(self, values: dict = None, blocks: dict = None) -> str:
+        """
+        Returns the final prompt: fields filled from `values`, blocks rendered, braces single.
+
+        Raises:
+            KeyError: If a field has no value, like str.format.
+        """
+        parts = self._plain.copy()
+        for key, slots in self._blocks.items():
+            if blocks and key in blocks:
+                text = slots[0][1].dumps(blocks[key])
+                for index, _ in slots:
+                    parts[index] = text
+            else:
+                for index, block in slots:
+                    parts[index] = block.plain
+        for name, indexes in self._fields.items():
+            text = str((values or {})[name])
+            for index in indexes:
+                parts[index] = text
+        return "".join(parts)
+
+    def _with_blocks(self, rendered: dict):
+        """This template with re-rendered blocks ({key: (variables, plain)}), sharing its segments."""
+        slots = dict(self._blocks)
+        for key, (variables, plain) in rendered.items():
+            old = self._blocks[key][0][1]
+            block = _Block(key, variables, escape(plain), plain, old.entries)  # Unchanged lines carry over
+            slots[key] = [(index, block) for index, _ in self._blocks[key]]
+        return PromptTemplate(self._source, self._plain, self._fields, slots)
+
+
+def _next_head(text: str, pos: int):
+    brace = text.find("{", pos)
+    while brace != -1:
+        match = _BLOCK_HEAD.match(text, brace)
+        if match is not None:
+            return match
+        brace = text.find("{", brace + 1)
+    return None
+
+
+def _find_blocks(text: str) -> list:
+    """
+    Returns (start, end, key, variables, plain) of each variable block in `text`, escaped
+    ({{ ... }}) or raw JSON. A candidate that does not decode is skipped. Decoding an escaped
+    candidate unescapes the text after it, so a prompt with k of them costs O(k * n); prompts
+    hold a block or two.
+    """
+    found, pos = [], 0
+    match = _next_head(text, 0)
+    while match is not None:
+        start = match.start()
+        escaped = match.group(1) == "{{"
+        try:
+            if escaped:
+                # Every brace of an escaped block is doubled: decode the unescaped text and map its end back
+                rest = unescape(text[start:])
+                value, stop = _DECODER.raw_decode(rest)
+                plain = rest[:stop]
+                end = start + stop + plain.count("{") + plain.count("}")
+                if escape(plain) != text[start:end]:
+                    raise ValueError("not an escaped block")
+            else:
+                value, end = _DECODER.raw_decode(text, start)
+                plain = text[start:end]
+        except ValueError:
+            match = _next_head(text, start + 1)
+            continue
+        if len(value) == 1 and isinstance(next(iter(value.values())), dict):
+            key, variables = next(iter(value.items()))
+            found.append((start, end, key, variables, plain))
+            pos = end
+        else:
+            pos = start + 1
+        match = _next_head(text, pos)
+    return found
+
+
+def _compile(text: str) -> PromptTemplate:
+    source, plain, fields, blocks = [], [], {}, {}
+
+    def literal(start: int, end: int):
+        # Escaped braces and {field}s; a lone brace is kept as it is
+        pos = start
+        brace = text.find("{", start, end)  # str.find, not a regex search: prose is skipped at memchr speed
+        while brace != -1:
+            match = _TOKEN.match(text, brace, end)
+            if match is None or match.group(1) is None:
+                brace = text.find("{", brace + (2 if match else 1), end)
+                continue
+            if match.start() > pos:
+                source.append(text[pos:match.start()])
+                plain.append(unescape(text[pos:match.start()]))
+            fields.setdefault(match.group(1), []).append(len(source))
+            source.append(match.group())
+            plain.append("")
+            pos = match.end()
+            brace = text.find("{", pos, end)
+        if end > pos:
+            source.append(text[pos:end])
+            plain.append(unescape(text[pos:end]))
+
+    pos = 0
+    for start, end, key, variables, block_plain in _find_blocks(text) if "{" in text else ():
+        literal(pos, start)
+        blocks.setdefault(key, []).append((len(source), _Block(key, variables, text[start:end], block_plain)))
+        source.append("")
+        plain.append("")
+        pos = end
+    literal(pos, len(text))
+    return PromptTemplate(source, plain, fields, blocks)
+
+
+class TemplateCache:
+    """
+    LRU cache of compiled templates keyed by the SHA-256 of their text.
+
+    The last `recent` texts looked up or rendered are also remembered by
+    identity (and held alive), so passing the same prompt object again, or a
+    prompt returned by `render()` as chained `update_json_in_text` calls do,
+    neither hashes nor parses it.
+
+    Args:
+        size (int): Templates kept; 0 disables caching (every lookup parses).
+        recent (int): Texts remembered by identity.
+    """
+
+    def __init__(self, size: int = PROMPT_TEMPLATE_CACHE_SIZE, recent: int = 32):
+        self.size = size
+        self.recent = recent if size > 0 else 0
+        self._templates = OrderedDict()  # SHA-256 -> PromptTemplate
+        self._recent = OrderedDict()  # id(text) -> (text, PromptTemplate)
+
+    def get(self, text: str) -> PromptTemplate:
+        """Returns the compiled form of `text`, parsing it only if it is not cached."""
+        entry = self._recent.get(id(text))
+        if entry is not None and entry[0] is text:
+            metrics.inc("prompt_template_cache_hits_total")
+            return entry[1]
+        ref = hashlib.sha256(text.encode()).hexdigest()
+        template = self._templates.get(ref)
+        if template is not None:
+            self._templates.move_to_end(ref)
+            metrics.inc("prompt_template_cache_hits_total")
+        else:
+            metrics.inc("prompt_template_compiles_total")
+            template = _compile(text)
+            if self.size > 0:
+                self._templates[ref] = template
+                if len(self._templates) > self.size:
+                    self._templates.popitem(last=False)
+        self._remember(text, template)
+        return template
+
+    def render(self, text: str, blocks: dict) -> str:
+        """`get(text).render(blocks)`, remembering the result with its compiled form."""
+        template = self.get(text)
+        result, rendered = template._render(blocks)
+        if rendered:
+            self._remember(result, template._with_blocks(rendered))
+        return result
+
+    def _remember(self, text: str, template: PromptTemplate):
+        if self.recent > 0:
+            self._recent[id(text)] = (text, template)
+            self._recent.move_to_end(id(text))
+            if len(self._recent) > self.recent:
+                self._recent.popitem(last=False)
+
+    def __len__(self):
+        return len(self._templates)
+
+
+@lru_cache()
+def get_template_cache() -> TemplateCache:
+    """Returns the process-wide template cache."""
+    return TemplateCache()
+
+
+def compile_template(text: str) -> PromptTemplate:
+    """Returns the compiled form of `text`, parsing it only if it is not cached."""
+    return get_template_cache().get(text)
+
+
+def render_template(text: str, blocks: dict) -> str:
+    """Renders `text` with new `blocks` through the process-wide cache (see TemplateCache.render())."""
+    return get_template_cache().render(text, blocks)
@@ -0,0 +1,64 @@
+import json
+
+from api.config.metrics import metrics
+from api.services.prompt_template.prompt_template_service import TemplateCache, compile_template, escape
+from api.utils.llm_utils import extract_json_from_text, update_json_in_text
+
+PROMPT = """You are {role}. Reply in {{"answer": "..."}} form.
+Context:
+{
+    "system_variables": {
+        "conversation_id": "1234234",
+        "nested": {"ids": [1, 2]}
+    }
+}
+Thanks, {role}!"""
+
+
+def test_blocks_render_like_json_dumps_and_the_rest_is_kept():
+    template = compile_template(PROMPT)
+    assert template.fields == ("role",)
+    assert template.blocks == {"system_variables": {"conversation_id": "1234234", "nested": {"ids": [1, 2]}}}
+    assert template.render() == PROMPT  # Untouched blocks keep their text as found
+
+    variables = {"conversation_id": "1", "nested": {"ids": [3]}, "note": "a {b} c", "ok": True}
+    rendered = template.render({"system_variables": variables})
+    block = escape(json.dumps({"system_variables": variables}, indent=4))
+    assert rendered == PROMPT[:PROMPT.index("{\n")] + block + PROMPT[PROMPT.index("\n}\n") + 2:]
+
+    final = compile_template(rendered).format({"role": "a tutor"})
+    assert final.startswith('You are a tutor. Reply in {"answer": "..."} form.')
+    assert json.dumps({"system_variables": variables}, indent=4) in final and final.endswith("Thanks, a tutor!")
+
+
+def test_chained_updates_are_served_from_the_cache():
+    text = update_json_in_text(PROMPT, {"system_variables": {"turn": 0}})
+    compiles = metrics.get("prompt_template_compiles_total")
+    for turn in range(1, 20):
+        text = update_json_in_text(text, {"system_variables": {"turn": turn, "conversation_id": "1234234"}})
+    assert metrics.get("prompt_template_compiles_total") == compiles  # Each result was adopted, never parsed
+    assert extract_json_from_text(text, "system_variables") == {
+        "system_variables": {"turn": 19, "conversation_id": "1234234"}}
+
+    fresh = TemplateCache(size=4).get(text)  # The adopted template matches a parse of the same text
+    cached = compile_template(text)
+    assert cached.render({"system_variables": {"x": 1}}) == fresh.render({"system_variables": {"x": 1}})
+    assert cached.format({"role": "r"}) == fresh.format({"role": "r"})
+
+    inserted = update_json_in_text("Intro:\nOutro.", {"user_profile": {"name": "Zoë"}}, insert_after_text="Intro:")
+    assert inserted == "Intro:\n" + escape(json.dumps({"user_profile": {"name": "Zoë"}}, indent=4)) + "\nOutro."
+
+
+def test_cache_is_keyed_by_content_and_bounded():
+    cache = TemplateCache(size=2, recent=0)
+    first = cache.get("Hello {name}")
+    assert cache.get("".join(["Hello ", "{name}"])) is first
+    cache.get("Two {a}")
+    cache.get("Three {b}")
+    assert len(cache) == 2 and cache.get("Hello {name}") is not first
+    assert TemplateCache(size=0).get("x {y}").format({"y": 1}) == "x 1"
+
+    odd = '{"a": 1, "b": {"c": 2}} and {"sv": {"k": 1}} and { lone brace'
+    template = cache.get(odd)
+    assert template.blocks == {"sv": {"k": 1}}  # A two-key object is not a block
+    assert template.render() == odd
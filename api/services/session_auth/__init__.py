@@ -0,0 +1 @@
+# Init for session_auth module
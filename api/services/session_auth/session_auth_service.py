@@ -0,0 +1,211 @@
+"""
+NextAuth session authentication for the API.
+
+The Next.js app signs users in with NextAuth and its Prisma adapter, which
+stores database sessions in `Session(sessionToken, userId, expires)` in
+prisma/app_db.sqlite. A client sends the same token to this API:
+
+- `Authorization: Bearer <sessionToken>`, or
+- the NextAuth cookie (`next-auth.session-token`, or
+  `__Secure-next-auth.session-token` over HTTPS), or
+- `?token=<sessionToken>` on WebSocket URLs, since browsers cannot set
+  headers on a WebSocket.
+
+`current_user` is the FastAPI dependency for both HTTP routes and WebSocket
+handshakes. It is a no-op (None) unless AUTH_ENABLED is set.
+
+Lookups go through a small pool of read-only SQLite connections. The results
+are cached per worker in an LRU:
+- valid tokens for AUTH_CACHE_TTL, never past the session's expiry;
+- unknown or expired tokens for AUTH_NEGATIVE_CACHE_TTL.
+A cache hit is a dict lookup. A sign-out takes effect within AUTH_CACHE_TTL.
+"""
+
+import queue
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+from fastapi import WebSocketException, status
+from starlette.requests import HTTPConnection
+
+from api.config.exceptions import ServiceUnavailableException, UnauthorizedException
+from api.config.logging import logger
+from api.config.metrics import metrics
+from api.config.settings import (
+    AUTH_CACHE_SIZE,
+    AUTH_CACHE_TTL,
+    AUTH_DB_PATH,
+    AUTH_DB_POOL_SIZE,
+    AUTH_ENABLED,
+    AUTH_NEGATIVE_CACHE_TTL,
+)
+
+SESSION_COOKIES = ("__Secure-next-auth.session-token", "next-auth.session-token")
+
+_LOOKUP = (
+    'SELECT s."userId", u."role", s."expires" FROM "Session" s '
+    'JOIN "User" u ON u."id" = s."userId" WHERE s."sessionToken" = ?'
+)
+
+metrics.describe("auth_requests_total", "Session token checks by result")
+metrics.describe("auth_cache_hits_total", "Session token checks answered from the cache")
+
+
+class SessionUser:
+    """The signed-in user behind a session token."""
+
+    __slots__ = ("user_id", "role", "expires")
+
+    def __init__(self, user_id: str, role: str, expires: float):
+        self.user_id = user_id
+        self.role = role or "USER"
+        self.expires = expires  # Epoch seconds
+
+    def __repr__(self):
+        return f"SessionUser({self.user_id!r}, role={self.role!r})"
+
+
+def _epoch(value) -> float:
+    """Prisma stores SQLite DateTime as epoch milliseconds (older clients: ISO 8601 text)."""
+    if isinstance(value, (int, float)):
+        return value / 1000
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+class SessionStore:
+    """
+    Read-only, cached view of the Prisma Session table.
+
+    Args:
+        path (str): The Prisma SQLite database.
+        pool_size (int): Read-only connections kept open.
+        ttl (float): Seconds a valid token stays cached.
+        negative_ttl (float): Seconds an invalid token stays cached.
+        max_entries (int): Cached tokens; least recently used are evicted.
+    """
+
+    def __init__(self, path: str = AUTH_DB_PATH, pool_size: int = AUTH_DB_POOL_SIZE, ttl: float = AUTH_CACHE_TTL,
+                 negative_ttl: float = AUTH_NEGATIVE_CACHE_TTL, max_entries: int = AUTH_CACHE_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._cache = OrderedDict()  # token -> (SessionUser or None, cached until)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=1.0, check_same_thread=False)
+        conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        except sqlite3.Error:
+            conn.close()  # Do not return a connection in an unknown state
+            raise
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def lookup(self, token: str):
+        """Returns the SessionUser of a valid token, or None (cached either way)."""
+        now = time.time()
+        cached = self._cache.get(token)
+        if cached is not None and cached[1] > now:
+            self._cache.move_to_end(token)
+            metrics.inc("auth_cache_hits_total")
+            return cached[0]
+
+        try:
+            with self._connection() as conn:
+                row = conn.execute(_LOOKUP, (token,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"❌ Session lookup failed: {e}")
+            raise ServiceUnavailableException("Session store unavailable")
+
+        user = None
+        if row is not None and _epoch(row[2]) > now:
+            user = SessionUser(row[0], row[1], _epoch(row[2]))
+        until = min(now + self.ttl, user.expires) if user else now + self.negative_ttl
+        self._cache[token] = (user, until)
+        self._cache.move_to_end(token)
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return user
+
+    def authenticate(self, token: str) -> SessionUser:
+        """
+        Returns the user of a valid session token.
+
+        Raises:
+            UnauthorizedException: If the token is missing, unknown or expired.
+            ServiceUnavailableException: If the session database cannot be read.
+        """
+        if not token:
+            metrics.inc("auth_requests_total", result="missing")
+            raise UnauthorizedException("Missing session token")
+        user = self.lookup(token)
+        if user is None:
+            metrics.inc("auth_requests_total", result="invalid")
+            raise UnauthorizedException("Invalid or expired session token")
+        metrics.inc("auth_requests_total", result="ok")
+        return user
+
+    def invalidate(self, token: str):
+        """Forgets a cached token (e.g. after signing it out)."""
+        self._cache.pop(token, None)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+@lru_cache()
+def get_session_store() -> SessionStore:
+    """Returns the process-wide session store."""
+    return SessionStore()
+
+
+def session_token(connection: HTTPConnection):
+    """The session token sent with a request or WebSocket handshake, if any."""
+    authorization = connection.headers.get("authorization", "")
+    if authorization[:7].lower() == "bearer ":
+        return authorization[7:].strip()
+    for name in SESSION_COOKIES:
+        if name in connection.cookies:
+            return connection.cookies[name]
+    if connection.scope["type"] == "websocket":
+        return connection.query_params.get("token")
+    return None
+
+
+async def current_user(connection: HTTPConnection):
+    """
+    FastAPI dependency: the signed-in user, or None when AUTH_ENABLED is off.
+
+    HTTP requests without a valid token get 401. WebSocket handshakes are
+    closed with 1008 (policy violation) before they are accepted, which
+    uvicorn answers as HTTP 403.
+    """
+    if not AUTH_ENABLED:
+        return None
+    try:
+        return get_session_store().authenticate(session_token(connection))
+    except UnauthorizedException as e:
+        if connection.scope["type"] == "websocket":
+            raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+        raise
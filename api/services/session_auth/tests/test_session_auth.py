@@ -0,0 +1,93 @@
+import sqlite3
+import time
+
+import pytest
+from fastapi import Depends, FastAPI, WebSocket
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from api.config.exceptions import UnauthorizedException
+from api.config.handlers import apply_exception_handlers
+from api.services.session_auth import session_auth_service as auth
+from api.services.session_auth.session_auth_service import SessionStore
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "app_db.sqlite")
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        'CREATE TABLE "User" ("id" TEXT PRIMARY KEY, "email" TEXT, "role" TEXT DEFAULT \'USER\');'
+        'CREATE TABLE "Session" ("id" TEXT PRIMARY KEY, "sessionToken" TEXT UNIQUE, "userId" TEXT, "expires" DATETIME);'
+        "INSERT INTO User VALUES ('u1', 'a@example.com', 'ADMIN');"
+    )
+    now_ms = int(time.time() * 1000)
+    conn.executemany('INSERT INTO "Session" VALUES (?, ?, ?, ?)', [
+        ("s1", "good", "u1", now_ms + 3_600_000),
+        ("s2", "expired", "u1", now_ms - 1000),
+        ("s3", "iso", "u1", "2999-01-01T00:00:00.000Z"),
+    ])
+    conn.commit()
+    yield path, conn
+    conn.close()
+
+
+def test_tokens_are_validated_and_cached(db):
+    path, conn = db
+    store = SessionStore(path, ttl=60, negative_ttl=60)
+    user = store.authenticate("good")
+    assert (user.user_id, user.role) == ("u1", "ADMIN")
+    assert store.authenticate("iso").user_id == "u1"
+    for token in ("expired", "unknown", None):
+        with pytest.raises(UnauthorizedException):
+            store.authenticate(token)
+
+    conn.execute('DELETE FROM "Session" WHERE "sessionToken" = \'good\'')
+    conn.execute('INSERT INTO "Session" VALUES (\'s4\', \'unknown\', \'u1\', ?)', (int(time.time() * 1000) + 60_000,))
+    conn.commit()
+    assert store.lookup("good") is user  # Cached until AUTH_CACHE_TTL
+    assert store.lookup("unknown") is None  # Negative entry, too
+    store.invalidate("good")
+    assert store.lookup("good") is None
+    store.close()
+
+
+def test_cache_is_bounded_and_expiring(db):
+    path, _ = db
+    store = SessionStore(path, ttl=0, negative_ttl=60, max_entries=2)
+    store.lookup("good")
+    assert "good" not in store._cache or store._cache["good"][1] <= time.time()
+    for token in ("a", "b", "c"):
+        store.lookup(token)
+    assert list(store._cache) == ["b", "c"]
+
+
+def test_dependency_guards_http_and_websocket_handshake(db, monkeypatch):
+    store = SessionStore(db[0])
+    monkeypatch.setattr(auth, "AUTH_ENABLED", True)
+    monkeypatch.setattr(auth, "get_session_store", lambda: store)
+    app = FastAPI()
+    apply_exception_handlers(app)
+
+    @app.get("/me")
+    async def me(user=Depends(auth.current_user)):
+        return {"user_id": user.user_id}
+
+    @app.websocket("/ws")
+    async def ws(websocket: WebSocket, user=Depends(auth.current_user)):
+        await websocket.accept()
+        await websocket.send_json({"user_id": user.user_id})
+        await websocket.close()
+
+    client = TestClient(app)
+    assert client.get("/me", headers={"Authorization": "Bearer good"}).json() == {"user_id": "u1"}
+    assert client.get("/me", cookies={"next-auth.session-token": "good"}).json() == {"user_id": "u1"}
+    response = client.get("/me", headers={"Authorization": "Bearer expired"})
+    assert response.status_code == 401 and "error" in response.json()
+
+    with client.websocket_connect("/ws?token=good") as websocket:
+        assert websocket.receive_json() == {"user_id": "u1"}
+    with pytest.raises(WebSocketDisconnect) as refused:
+        with client.websocket_connect("/ws"):
+            pass
+    assert refused.value.code == 1008  # Before accept: uvicorn answers the handshake with 403
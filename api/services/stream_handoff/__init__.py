@@ -0,0 +1 @@
+# Init for stream_handoff module
@@ -0,0 +1,199 @@
+"""
+Conversation handoff between workers.
+
+When a worker drains, its conversations are flushed to a local SQLite file
+(DRAIN_HANDOFF_PATH) that every worker on the host can read. A WebSocket
+session interrupted by the drain receives a signed resume token naming its
+conversation, model and sampling params and how much of the reply it already
+received; on reconnecting to any worker it sends the token back and the
+conversation is restored there (and an interrupted reply continued) instead
+of being regenerated.
+
+Tokens are HMAC-SHA256 signed with DRAIN_RESUME_SECRET, or with a random
+per-host secret kept in the store when that is unset. A token names the
+user it was issued to and is only honoured for that user.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import time
+from functools import lru_cache
+
+from langchain_core.messages import AIMessage, messages_from_dict, messages_to_dict
+
+from api.config.exceptions import UnauthorizedException
+from api.config.metrics import metrics
+from api.config.settings import DRAIN_HANDOFF_PATH, DRAIN_RESUME_SECRET, DRAIN_RESUME_TTL
+from api.services.conversation_memory.conversation_memory_service import to_messages
+from api.services.prompt_assembly.prompt_store import compact, resolve
+
+metrics.describe("handoff_conversations_flushed_total", "Conversations written to the handoff store")
+metrics.describe("handoff_resumes_total", "Sessions resumed from a resume token")
+
+
+class HandoffStore:
+    """
+    Local SQLite store for handed-off conversations.
+
+    Connections are opened lazily per process (safe across forked workers)
+    and every write is a single short transaction.
+
+    Args:
+        path (str): SQLite file shared by the workers on this host.
+        secret (str, optional): HMAC key for resume tokens.
+        ttl (float): Seconds tokens and stored conversations stay valid.
+    """
+
+    def __init__(self, path: str = DRAIN_HANDOFF_PATH, secret: str = DRAIN_RESUME_SECRET, ttl: float = DRAIN_RESUME_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._secret = secret.encode() if secret else None
+        self._conn = None
+        self._pid = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations "
+                "(conversation_id TEXT PRIMARY KEY, messages TEXT, saved_at REAL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    # ─── Conversations ─────────────────────────────────────
+
+    def save_conversations(self, conversations: dict):
+        """Writes {conversation_id: [messages]} in one transaction, with system prompts inline."""
+        if not conversations:
+            return
+        now = time.time()
+        rows = [(cid, json.dumps(messages_to_dict(resolve(msgs))), now) for cid, msgs in conversations.items()]
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany("INSERT OR REPLACE INTO conversations VALUES (?, ?, ?)", rows)
+        conn.execute("DELETE FROM conversations WHERE saved_at < ?", (now - self.ttl,))
+        conn.execute("COMMIT")
+        metrics.inc("handoff_conversations_flushed_total", len(rows))
+
+    def load_conversation(self, conversation_id: str):
+        """Returns the stored messages of `conversation_id`, or None if absent or expired."""
+        row = self._connection().execute(
+            "SELECT messages, saved_at FROM conversations WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return compact(messages_from_dict(json.loads(row[0])))  # System prompts back into the prompt store
+
+    # ─── Resume tokens ─────────────────────────────────────
+
+    def _key(self) -> bytes:
+        if self._secret is None:
+            conn = self._connection()
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('resume_secret', ?)", (secrets.token_hex(32),))
+            self._secret = conn.execute("SELECT value FROM meta WHERE key = 'resume_secret'").fetchone()[0].encode()
+        return self._secret
+
+    def issue_token(self, conversation_id: str, model_name: str, params: dict, offset: int, partial: bool,
+                    user_id: str = None) -> str:
+        """
+        Signs a resume token for a handed-off session.
+
+        Args:
+            conversation_id (str): Conversation to restore.
+            model_name (str): Model the session was using.
+            params (dict): temperature / top_p / max_length / penalties of the session.
+            offset (int): Characters of the interrupted reply the client already has.
+            partial (bool): True if a reply was cut mid-generation and should be continued.
+            user_id (str, optional): The session's signed-in user; None without AUTH_ENABLED.
+        """
+        claims = {"cid": conversation_id, "uid": user_id, "model": model_name, "params": params, "offset": offset,
+                  "partial": partial, "exp": time.time() + self.ttl}
+        body = base64.urlsafe_b64encode(json.dumps(claims, separators=(",", ":")).encode()).rstrip(b"=")
+        signature = base64.urlsafe_b64encode(hmac.new(self._key(), body, hashlib.sha256).digest()).rstrip(b"=")
+        return (body + b"." + signature).decode()
+
+    def verify_token(self, token: str, user_id: str = None) -> dict:
+        """
+        Returns the claims of a valid resume token presented by `user_id`.
+
+        Raises:
+            UnauthorizedException: If the token is malformed, forged, expired, or was issued to another user.
+        """
+        try:
+            body, signature = token.encode().split(b".")
+            expected = base64.urlsafe_b64encode(hmac.new(self._key(), body, hashlib.sha256).digest()).rstrip(b"=")
+            if not hmac.compare_digest(signature, expected):
+                raise ValueError("bad signature")
+            claims = json.loads(base64.urlsafe_b64decode(body + b"=" * (-len(body) % 4)))
+        except ValueError as e:
+            raise UnauthorizedException(f"Invalid resume token: {e}")
+        if claims["exp"] < time.time():
+            raise UnauthorizedException("Resume token expired")
+        if claims.get("uid") != user_id:
+            raise UnauthorizedException("Resume token was issued to another user")
+        metrics.inc("handoff_resumes_total")
+        return claims
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = None
+
+
+def collect_conversations(app, memory) -> dict:
+    """Returns {thread_id: [messages]} for every conversation held by a compiled graph's MemorySaver."""
+    conversations = {}
+    for thread_id in list(memory.storage.keys()):
+        state = app.get_state({"configurable": {"thread_id": thread_id}}).values
+        if state.get("messages"):
+            conversations[thread_id] = to_messages(state["messages"])
+    return conversations
+
+
+def hand_off(bot, buffer=None, sent: int = 0) -> dict:
+    """
+    Saves a WebSocket session's conversation for another worker and returns
+    the resume_token frame to send before closing with 1012.
+
+    Args:
+        bot (LLMBot): The session's bot.
+        buffer (ReplayBuffer, optional): Replay buffer of a reply cut mid-generation, if any.
+        sent (int): Chunks of that reply the client already has.
+    """
+    partial = None
+    if buffer is not None and not (buffer.done and buffer.error is None):
+        buffer.cancel()  # The reply is stored here, cut where the client stopped receiving
+        partial = buffer.text(sent)
+    if partial is not None:
+        # The cut turn's run never checkpointed its question; store it ahead of the partial reply
+        stored = {message.id for message in bot.conversation()}
+        for message in [message for message in bot.pending if message.id not in stored]:
+            bot.update_memory(message)
+        bot.update_memory(AIMessage(content=partial))  # Keep what the client already has
+    store = get_handoff_store()
+    token = store.issue_token(
+        bot.conversation_id,
+        bot.model_name,
+        {"temperature": bot.temperature, "top_p": bot.top_p, "max_length": bot.max_length,
+         "frequency_penalty": bot.frequency_penalty, "presence_penalty": bot.presence_penalty},
+        offset=len(partial or ""),
+        partial=partial is not None,
+        user_id=bot.user_id,
+    )
+    store.save_conversations({bot.conversation_id: bot.conversation()})
+    return {"type": "resume_token", "resume_token": token, "conversation_id": bot.conversation_id,
+            "offset": len(partial or "")}
+
+
+@lru_cache()
+def get_handoff_store() -> HandoffStore:
+    """Returns the process-wide handoff store."""
+    return HandoffStore()
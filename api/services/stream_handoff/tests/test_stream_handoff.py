@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from api.config.drain import DrainController, StreamInterrupted
+from api.config.exceptions import ServiceUnavailableException, UnauthorizedException
+from api.services.prompt_assembly.prompt_store import prompt_message, prompt_ref
+from api.services.stream_handoff.stream_handoff_service import HandoffStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HandoffStore(str(tmp_path / "handoff.sqlite"), ttl=60)
+    yield store
+    store.close()
+
+
+def test_resume_token_round_trip_and_tamper(store):
+    token = store.issue_token("c1", "gpt-4o", {"temperature": 0.2}, offset=12, partial=True)
+    claims = store.verify_token(token)
+    assert (claims["cid"], claims["model"], claims["offset"], claims["partial"]) == ("c1", "gpt-4o", 12, True)
+
+    body, signature = token.split(".")
+    with pytest.raises(UnauthorizedException):
+        store.verify_token(body[:-2] + "xx." + signature)
+    with pytest.raises(UnauthorizedException):
+        store.verify_token("garbage")
+
+
+def test_resume_token_is_bound_to_its_user(store):
+    token = store.issue_token("c1", "gpt-4o", {}, offset=0, partial=True, user_id="alice")
+    assert store.verify_token(token, "alice")["uid"] == "alice"
+    for other in ("mallory", None):  # Another signed-in user, or a session without one
+        with pytest.raises(UnauthorizedException):
+            store.verify_token(token, other)
+    anonymous = store.issue_token("c2", "gpt-4o", {}, offset=0, partial=False)
+    with pytest.raises(UnauthorizedException):
+        store.verify_token(anonymous, "mallory")
+
+
+def test_resume_token_is_shared_by_workers_and_expires(tmp_path):
+    path = str(tmp_path / "handoff.sqlite")
+    worker_a, worker_b = HandoffStore(path, ttl=60), HandoffStore(path, ttl=-1)
+    token = worker_a.issue_token("c1", "gpt-4o", {}, offset=0, partial=False)
+    assert HandoffStore(path).verify_token(token)["cid"] == "c1"  # Same per-host secret
+    with pytest.raises(UnauthorizedException):
+        worker_b.verify_token(worker_b.issue_token("c1", "gpt-4o", {}, offset=0, partial=False))
+    worker_a.close()
+    worker_b.close()
+
+
+def test_conversations_round_trip(store):
+    system = prompt_message("Be brief.", id="sys-1")
+    messages = [system, HumanMessage(content="hi"), AIMessage(content="hel", id="ai-1")]
+    store.save_conversations({"c1": messages})
+    row = store._connection().execute("SELECT messages FROM conversations WHERE conversation_id = 'c1'").fetchone()
+    assert "Be brief." in row[0] and "prompt_ref" not in row[0]  # Other workers may not hold the prompt
+
+    restored = store.load_conversation("c1")
+    assert [m.content for m in restored] == ["", "hi", "hel"]
+    assert prompt_ref(restored[0]) == prompt_ref(system) and restored[0].id == "sys-1"
+    assert restored[2].id == "ai-1"
+    assert store.load_conversation("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_drain_hands_off_idle_and_lets_streams_finish():
+    drain = DrainController()
+    flushed = []
+    drain.on_flush(lambda: flushed.append("sync"))
+
+    async def async_hook():
+        flushed.append("async")
+    drain.on_flush(async_hook)
+
+    idle, busy = drain.open_stream("ws"), drain.open_stream("http")
+    busy.streaming = True
+
+    async def idle_session():
+        try:
+            await idle.guard(asyncio.sleep(10))
+        except StreamInterrupted:
+            drain.close_stream(idle)
+
+    async def busy_stream():
+        await busy.guard(asyncio.sleep(0.05))
+        drain.close_stream(busy)
+
+    tasks = [asyncio.create_task(idle_session()), asyncio.create_task(busy_stream())]
+    await asyncio.sleep(0)
+    await drain.drain(timeout=1.0, grace=0.1)
+    await asyncio.gather(*tasks)
+
+    assert drain.active == 0 and drain.drained
+    assert flushed == ["async", "sync"]
+    with pytest.raises(ServiceUnavailableException):
+        drain.open_stream("http")
+    await drain.drain()  # Idempotent
+    assert flushed == ["async", "sync"]
+
+
+@pytest.mark.asyncio
+async def test_drain_deadline_interrupts_stream_iteration():
+    drain = DrainController()
+    handle = drain.open_stream("http")
+    handle.streaming = True
+    received, closed = [], []
+
+    async def tokens():
+        try:
+            for i in range(100):
+                await asyncio.sleep(0.02)
+                yield i
+        finally:
+            closed.append(True)
+
+    async def consume():
+        try:
+            async for item in handle.iterate(tokens()):
+                received.append(item)
+        except StreamInterrupted:
+            pass
+        finally:
+            drain.close_stream(handle)
+
+    task = asyncio.create_task(consume())
+    await drain.drain(timeout=0.1, grace=0.5)
+    await task
+    assert 0 < len(received) < 100
+    assert closed == [True]  # Upstream generator was closed
+
+
+@pytest.mark.asyncio
+async def test_http_reply_is_released_when_the_client_leaves_before_the_body(monkeypatch):
+    from starlette.requests import ClientDisconnect
+
+    from api.v1 import llm_http_streaming_route as route
+
+    closed = []
+
+    class FakeBot:
+        def __init__(self, **kwargs):
+            pass
+
+        async def send_message(self, user_input):
+            try:
+                yield "first"
+                yield "second"
+            finally:
+                closed.append(True)  # Where the quota hold and the cold tier pin are given back
+
+    drain = DrainController()
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(route, "LLMBot", FakeBot)
+    monkeypatch.setattr(route, "get_drain_controller", lambda: drain)
+    response = await route.chat_endpoint(route.ChatRequest(user_input="hi"), None)
+    assert drain.active == 1 and not closed
+
+    async def gone(message):
+        raise OSError("client went away")
+
+    with pytest.raises(ClientDisconnect):
+        await response({"type": "http", "asgi": {"spec_version": "2.4"}}, None, gone)
+    assert closed == [True] and drain.active == 0
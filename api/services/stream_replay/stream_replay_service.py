@@ -0,0 +1,215 @@
+"""
+Resumable WebSocket streams.
+
+Every reply generated for /v1/ws/chat runs as a background producer that
+writes its chunks to a ReplayBuffer identified by a stream id. The WebSocket
+only tails that buffer, so when the client drops (1006) generation carries on,
+the completed reply is stored in the conversation once, and the chunks stay
+replayable for STREAM_REPLAY_TTL seconds. A client that reconnects with
+(stream_id, last_offset) receives the chunks it missed and then the live tail.
+
+Buffers live in the worker's memory: reconnects must reach the same worker
+(sticky sessions); drained workers hand sessions off with resume tokens.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+
+from api.config.drain import get_drain_controller
+from api.config.logging import logger
+from api.config.metrics import metrics
+from api.config.settings import STREAM_REPLAY_TTL, STREAM_REPLAY_MAX_CHUNKS, STREAM_REPLAY_MAX_STREAMS
+
+WS_CLOSE_STREAM_GONE = 4410  # Application close code mirroring HTTP 410
+
+metrics.describe("stream_replay_buffers", "Replay buffers held by this worker")
+metrics.describe("stream_replay_resumes_total", "Stream resume attempts by result")
+
+
+class ReplayGone(Exception):
+    """The stream expired, is unknown to this worker, or the offset is no longer buffered."""
+
+
+class ReplayBuffer:
+    """
+    Chunks emitted by one generation, readable by any number of tails.
+
+    Offsets are chunk indices and never change; once more than `max_chunks`
+    are held the oldest are dropped and `base` moves forward.
+
+    Args:
+        stream_id (str): Id sent to the client with every chunk.
+        bot (LLMBot): The bot generating the reply, reused by resuming sessions.
+        max_chunks (int): Chunks kept for replay.
+    """
+
+    def __init__(self, stream_id: str, bot=None, max_chunks: int = STREAM_REPLAY_MAX_CHUNKS):
+        self.stream_id = stream_id
+        self.bot = bot
+        self.max_chunks = max_chunks
+        self.chunks = []
+        self.base = 0
+        self.done = False
+        self.error = None
+        self.finished_at = None
+        self.producer = None
+        self._changed = asyncio.Event()
+
+    @property
+    def end(self) -> int:
+        """Offset of the next chunk."""
+        return self.base + len(self.chunks)
+
+    def append(self, chunk: dict):
+        self.chunks.append(chunk)
+        if len(self.chunks) > self.max_chunks:
+            drop = len(self.chunks) - self.max_chunks
+            del self.chunks[:drop]
+            self.base += drop
+        self._notify()
+
+    def text(self, upto: int):
+        """Content of chunks [0, upto), or None if some of them were dropped."""
+        if self.base > 0:
+            return None
+        return "".join(chunk.get("content") or "" for chunk in self.chunks[:upto])
+
+    def finish(self, error: BaseException = None):
+        self.done, self.error = True, error
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def tail(self, offset: int = 0):
+        """
+        Yields (offset, chunk) from `offset` on, waiting for new chunks until the
+        generation finishes.
+
+        Raises:
+            ReplayGone: If `offset` has already been dropped from the buffer.
+            Exception: The producer's error, after the chunks before it.
+        """
+        while True:
+            if offset < self.base:
+                raise ReplayGone(f"Offset {offset} of stream {self.stream_id} is no longer buffered")
+            while offset < self.end:
+                yield offset, self.chunks[offset - self.base]
+                offset += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+    def cancel(self):
+        """Stops the producer; its partial reply is not stored."""
+        if self.producer is not None and not self.producer.done():
+            self.producer.cancel()
+
+
+class StreamRegistry:
+    """
+    Replay buffers of this worker, pruned by TTL and count.
+
+    Args:
+        ttl (float): Seconds a finished stream stays replayable.
+        max_streams (int): Buffers kept; the oldest finished ones are evicted first.
+        max_chunks (int): Chunks kept per buffer.
+    """
+
+    def __init__(self, ttl: float = STREAM_REPLAY_TTL, max_streams: int = STREAM_REPLAY_MAX_STREAMS,
+                 max_chunks: int = STREAM_REPLAY_MAX_CHUNKS):
+        self.ttl = ttl
+        self.max_streams = max_streams
+        self.max_chunks = max_chunks
+        self._buffers = OrderedDict()
+
+    def start(self, stream, bot=None, release=None) -> ReplayBuffer:
+        """
+        Starts a background producer that drains async iterator `stream` (of
+        {"role", "content"} chunks) into a new replay buffer.
+
+        The producer is tracked by the drain controller, so a deploy lets it
+        finish (and store its reply) even if no client is listening.
+
+        Args:
+            stream: The reply's chunks.
+            bot (LLMBot, optional): The bot generating them.
+            release (callable, optional): Called once the producer ends, however it ends; frees the
+                admission slot of the generation (AdmissionController.enter()), which the client
+                tailing it may leave long before.
+        """
+        self._prune()
+        buffer = ReplayBuffer(uuid.uuid4().hex, bot=bot, max_chunks=self.max_chunks)
+        self._buffers[buffer.stream_id] = buffer
+        metrics.set("stream_replay_buffers", len(self._buffers))
+        buffer.producer = asyncio.create_task(self._produce(buffer, stream))
+        if release is not None:
+            # A done callback rather than _produce's finally: a producer cancelled before its first step never runs it
+            buffer.producer.add_done_callback(lambda _: release())
+        return buffer
+
+    async def _produce(self, buffer: ReplayBuffer, stream):
+        drain = get_drain_controller()
+        handle = None
+        try:
+            handle = drain.open_stream("replay")
+            handle.streaming = True
+            async for chunk in handle.iterate(stream):
+                buffer.append(chunk)
+            buffer.finish()
+        except asyncio.CancelledError:
+            buffer.finish(ReplayGone(f"Stream {buffer.stream_id} was cancelled"))
+            raise
+        except Exception as e:
+            buffer.finish(e)
+        finally:
+            if handle is not None:
+                drain.close_stream(handle)
+
+    def get(self, stream_id: str, user_id: str = None) -> ReplayBuffer:
+        """
+        Returns a replayable buffer of `user_id` (None without AUTH_ENABLED).
+
+        Raises:
+            ReplayGone: If the stream is unknown to this worker, has expired, or belongs to another
+                user (answered alike, so stream ids cannot be probed).
+        """
+        self._prune()
+        buffer = self._buffers.get(stream_id)
+        if buffer is None:
+            metrics.inc("stream_replay_resumes_total", result="gone")
+            raise ReplayGone(f"Stream {stream_id} is unknown or expired")
+        if getattr(buffer.bot, "user_id", None) != user_id:
+            metrics.inc("stream_replay_resumes_total", result="foreign")
+            raise ReplayGone(f"Stream {stream_id} is unknown or expired")
+        metrics.inc("stream_replay_resumes_total", result="ok")
+        return buffer
+
+    def _prune(self):
+        now = time.monotonic()
+        expired = [sid for sid, b in self._buffers.items() if b.done and now - b.finished_at > self.ttl]
+        for sid in expired:
+            del self._buffers[sid]
+        if len(self._buffers) >= self.max_streams:
+            finished = [sid for sid, b in self._buffers.items() if b.done]
+            for sid in finished[:len(self._buffers) - self.max_streams + 1]:
+                del self._buffers[sid]
+            if len(self._buffers) >= self.max_streams:
+                logger.warning(f"⚠️ {len(self._buffers)} replay buffers still streaming, over the limit")
+        metrics.set("stream_replay_buffers", len(self._buffers))
+
+    def __len__(self):
+        return len(self._buffers)
+
+
+@lru_cache()
+def get_stream_registry() -> StreamRegistry:
+    """Returns the process-wide stream registry."""
+    return StreamRegistry()
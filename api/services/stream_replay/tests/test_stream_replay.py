@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from api.services.stream_replay.stream_replay_service import ReplayGone, StreamRegistry
+
+
+async def chunks(words, delay=0.01, stored=None):
+    for word in words:
+        await asyncio.sleep(delay)
+        yield {"role": "ai", "content": word}
+    if stored is not None:
+        stored.append("".join(words))
+
+
+@pytest.mark.asyncio
+async def test_reconnect_replays_missed_chunks_then_live_tail():
+    registry, stored = StreamRegistry(), []
+    buffer = registry.start(chunks(["a", "b", "c", "d"], stored=stored))
+
+    first = buffer.tail(0)
+    assert await anext(first) == (0, {"role": "ai", "content": "a"})
+    await first.aclose()  # Client dropped; generation carries on
+
+    resumed = registry.get(buffer.stream_id)
+    assert [(o, c["content"]) async for o, c in resumed.tail(1)] == [(1, "b"), (2, "c"), (3, "d")]
+    assert stored == ["abcd"]  # Reply completed exactly once
+
+
+@pytest.mark.asyncio
+async def test_buffer_is_bounded_and_expires():
+    registry = StreamRegistry(ttl=0.05, max_chunks=2)
+    buffer = registry.start(chunks(["a", "b", "c"], delay=0))
+    await buffer.producer
+    assert (buffer.base, buffer.end) == (1, 3)
+    with pytest.raises(ReplayGone):
+        [item async for item in buffer.tail(0)]
+    assert buffer.text(3) is None
+
+    await asyncio.sleep(0.1)
+    with pytest.raises(ReplayGone):
+        registry.get(buffer.stream_id)
+
+
+@pytest.mark.asyncio
+async def test_evicts_oldest_finished_stream_over_the_limit():
+    registry = StreamRegistry(max_streams=2)
+    old = registry.start(chunks(["a"], delay=0))
+    await old.producer
+    live = registry.start(chunks(["b"] * 5))
+    registry.start(chunks(["c"]))
+    assert len(registry) == 2
+    with pytest.raises(ReplayGone):
+        registry.get(old.stream_id)
+    assert registry.get(live.stream_id) is live
+
+
+@pytest.mark.asyncio
+async def test_producer_error_reaches_tail_and_cancel_stores_nothing():
+    async def failing():
+        yield {"role": "ai", "content": "a"}
+        raise RuntimeError("backend down")
+
+    registry = StreamRegistry()
+    buffer = registry.start(failing())
+    received = []
+    with pytest.raises(RuntimeError):
+        async for _, chunk in buffer.tail(0):
+            received.append(chunk["content"])
+    assert received == ["a"]
+
+    stored = []
+    cancelled = registry.start(chunks(["a", "b", "c"], delay=0.05, stored=stored))
+    await asyncio.sleep(0.07)
+    cancelled.cancel()
+    with pytest.raises(ReplayGone):
+        [item async for item in cancelled.tail(0)]
+    assert cancelled.text(cancelled.end) == "a" and stored == []
+
+
+@pytest.mark.asyncio
+async def test_only_the_streams_user_can_resume_it():
+    registry = StreamRegistry()
+    buffer = registry.start(chunks(["a"], delay=0), bot=SimpleNamespace(user_id="alice"))
+    await buffer.producer
+    assert registry.get(buffer.stream_id, "alice") is buffer
+    for other in ("mallory", None):
+        with pytest.raises(ReplayGone, match="unknown or expired"):  # Told apart from a missing stream by nothing
+            registry.get(buffer.stream_id, other)
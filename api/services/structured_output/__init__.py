@@ -0,0 +1 @@
+# Init for structured_output module
@@ -0,0 +1,352 @@
+"""
+Structured output: replies validated against a JSON schema while they stream.
+
+A chat request may carry `response_schema`. The reply is then fed, chunk by
+chunk, through the incremental parser of json_stream, and every parser event
+is checked against the schema as soon as it completes:
+
+- a container opening where the schema wants another type, a key that
+  `additionalProperties: false` forbids, or an array item beyond `maxItems`
+  fails at once, before the value is even read;
+- a scalar is checked (type, enum / const, length, pattern, bounds) when it
+  completes; an object's `required` keys and an array's `minItems` when it
+  closes.
+
+Each validated scalar is sent to the client as a field event, and the whole
+document once it completes. When the output can no longer satisfy the schema,
+a violation event is sent and the stream is closed: the upstream request is
+cancelled instead of generating the rest of a reply that will be rejected.
+
+Supported keywords: type, properties, required, additionalProperties, items,
+enum, const, minLength, maxLength, pattern, minimum, maximum,
+exclusiveMinimum, exclusiveMaximum, multipleOf, minItems, maxItems,
+minProperties, maxProperties. Annotations (title, description, ...) and
+unknown keywords are ignored; keywords that need look-ahead or references
+(anyOf, oneOf, $ref, ...) are refused with InvalidSchema.
+"""
+
+import json
+import re
+from contextlib import aclosing
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from api.config.exceptions import UnprocessableEntityException
+from api.config.metrics import metrics
+from api.config.settings import STRUCTURED_SCHEMA_CACHE_SIZE, STRUCTURED_SCHEMA_MAX_BYTES
+from api.services.json_stream.json_stream_service import JsonStreamParser
+from api.services.ws_codec.ws_codec_service import WS_CLOSE_INVALID_PAYLOAD
+
+_TYPES = {
+    "object": (dict,),
+    "array": (list,),
+    "string": (str,),
+    "number": (int, float),
+    "integer": (int, float),  # 1.0 is an integer in JSON Schema; checked below
+    "boolean": (bool,),
+    "null": (type(None),),
+}
+_UNSUPPORTED = {"$ref", "anyOf", "oneOf", "allOf", "not", "if", "then", "else", "patternProperties",
+                "prefixItems", "contains", "uniqueItems", "propertyNames", "dependentRequired",
+                "dependentSchemas", "dependencies", "unevaluatedProperties", "unevaluatedItems"}
+
+metrics.describe("structured_output_streams_total",
+                 "Structured-output replies by result (valid, violation, incomplete)")
+
+
+class InvalidSchema(UnprocessableEntityException):
+    """A response_schema this validator cannot use: 422, or WebSocket close code 4400."""
+
+    ws_code = WS_CLOSE_INVALID_PAYLOAD
+
+
+class SchemaViolation(ValueError):
+    """The reply broke the schema at `path` (a tuple of keys and indexes)."""
+
+    def __init__(self, path: tuple, detail: str):
+        super().__init__(detail)
+        self.path = path
+        self.detail = detail
+
+
+class _Node:
+    """One compiled (sub)schema."""
+
+    __slots__ = ("types", "names", "integer", "properties", "required", "additional", "items", "enum", "const",
+                 "has_const", "min_length", "max_length", "pattern", "minimum", "maximum", "exclusive_minimum",
+                 "exclusive_maximum", "multiple_of", "min_items", "max_items", "min_properties", "max_properties")
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self.properties = {}
+        self.has_const = False
+        self.integer = False
+
+
+_NEVER = _Node()  # The `false` schema: no value is valid
+_NEVER.types = ()
+_NEVER.names = "nothing"
+
+
+def _compile_node(schema, where: str):
+    """Returns a _Node, or None for a schema that accepts anything."""
+    if schema is True or schema == {}:
+        return None
+    if schema is False:
+        return _NEVER
+    if not isinstance(schema, dict):
+        raise InvalidSchema(f"Schema at {where} must be an object or a boolean")
+    unsupported = _UNSUPPORTED.intersection(schema)
+    if unsupported:
+        raise InvalidSchema(f"Unsupported schema keyword(s) at {where}: {', '.join(sorted(unsupported))}")
+
+    node = _Node()
+    kinds = schema.get("type")
+    if kinds is not None:
+        kinds = [kinds] if isinstance(kinds, str) else kinds
+        if not isinstance(kinds, list) or any(kind not in _TYPES for kind in kinds):
+            raise InvalidSchema(f"Unknown type at {where}: {schema['type']!r}")
+        node.types = tuple({t for kind in kinds for t in _TYPES[kind]})
+        node.names = " or ".join(kinds) or "nothing"
+        node.integer = "integer" in kinds and "number" not in kinds
+    properties = schema.get("properties", {})
+    if not isinstance(properties, dict):
+        raise InvalidSchema(f"properties at {where} must be an object")
+    node.properties = {key: _compile_node(sub, f"{where}.{key}") for key, sub in properties.items()}
+    required = schema.get("required", [])
+    if not isinstance(required, list) or not all(isinstance(key, str) for key in required):
+        raise InvalidSchema(f"required at {where} must be an array of strings")
+    node.required = tuple(required)
+    additional = schema.get("additionalProperties", True)
+    node.additional = False if additional is False else _compile_node(additional, f"{where}.*")
+    node.items = _compile_node(schema.get("items", True), f"{where}[]")
+    if "enum" in schema:
+        if not isinstance(schema["enum"], list):
+            raise InvalidSchema(f"enum at {where} must be an array")
+        node.enum = schema["enum"]
+    if "const" in schema:
+        node.const, node.has_const = schema["const"], True
+    for keyword, slot in (("minLength", "min_length"), ("maxLength", "max_length"), ("minimum", "minimum"),
+                          ("maximum", "maximum"), ("exclusiveMinimum", "exclusive_minimum"),
+                          ("exclusiveMaximum", "exclusive_maximum"), ("multipleOf", "multiple_of"),
+                          ("minItems", "min_items"), ("maxItems", "max_items"),
+                          ("minProperties", "min_properties"), ("maxProperties", "max_properties")):
+        value = schema.get(keyword)
+        if value is not None:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise InvalidSchema(f"{keyword} at {where} must be a number")
+            setattr(node, slot, value)
+    if "pattern" in schema:
+        try:
+            node.pattern = re.compile(schema["pattern"])
+        except (re.error, TypeError) as e:
+            raise InvalidSchema(f"Invalid pattern at {where}: {e}")
+    return node
+
+
+def _is_multiple(value, step) -> bool:
+    """multipleOf in decimal, as written: 0.3 is a multiple of 0.1 (float division says it is not)."""
+    try:
+        return Decimal(str(value)) % Decimal(str(step)) == 0
+    except InvalidOperation:  # inf / nan
+        return False
+
+
+def _same(a, b) -> bool:
+    """JSON equality: true is not 1."""
+    return type(a) is type(b) and a == b if isinstance(a, bool) or isinstance(b, bool) else a == b
+
+
+class CompiledSchema:
+    """A response_schema compiled for incremental checks. Build with `compile_schema()`."""
+
+    def __init__(self, schema):
+        self.root = _compile_node(schema, "$")
+        kinds = self.root.types if self.root is not None and self.root.types is not None else (dict, list)
+        self.roots = ("{" if dict in kinds else "") + ("[" if list in kinds else "")
+        if not self.roots:
+            raise InvalidSchema("The schema's root must allow an object or an array")
+
+    def node(self, path: tuple):
+        node = self.root
+        for step in path:
+            if node is None:
+                return None
+            if type(step) is int:
+                node = node.items
+            else:
+                node = node.properties.get(step, _NEVER if node.additional is False else node.additional)
+        return node
+
+
+@lru_cache(maxsize=STRUCTURED_SCHEMA_CACHE_SIZE)
+def _compile_cached(canonical: str) -> CompiledSchema:
+    return CompiledSchema(json.loads(canonical))
+
+
+def compile_schema(schema) -> CompiledSchema:
+    """
+    Compiles a response_schema (cached by its canonical JSON, so a client's
+    repeated schema is compiled once).
+
+    Raises:
+        InvalidSchema: If the schema is too large, malformed or uses unsupported keywords.
+    """
+    canonical = json.dumps(schema, sort_keys=True, separators=(",", ":"))
+    if len(canonical) > STRUCTURED_SCHEMA_MAX_BYTES:
+        raise InvalidSchema(f"response_schema is over {STRUCTURED_SCHEMA_MAX_BYTES} bytes")
+    return _compile_cached(canonical)
+
+
+class SchemaValidator:
+    """
+    Validates one streamed reply against a CompiledSchema.
+
+    `feed(text)` returns the events the text completed: {"type": "field",
+    "path": [...], "value": v} per validated scalar, then {"type": "document",
+    "value": ...}. It raises SchemaViolation as soon as the reply cannot match.
+    Text before the document (a ```json fence, a sentence) and after it is ignored.
+    """
+
+    def __init__(self, schema: CompiledSchema):
+        self.schema = schema
+        self.parser = JsonStreamParser(roots=schema.roots, paths=True)
+        self.document = None
+        self.done = False
+        self._keyed = False  # The current candidate has read a key: a parse error is no longer prose
+
+    def feed(self, text: str) -> list:
+        if self.done or not text:
+            return []
+        out = []
+        for event in self.parser.feed(text):
+            self._check(event, out)
+            if self.done:
+                break
+        return out
+
+    def close(self) -> list:
+        """Ends the reply. Raises SchemaViolation if no complete document was read."""
+        if self.done:
+            return []
+        for event in self.parser.close():  # A document still open
+            raise SchemaViolation(event.path, "The reply ended inside the JSON document")
+        raise SchemaViolation((), "The reply holds no JSON document")
+
+    def _check(self, event, out: list):
+        kind, path = event.kind, event.path
+        if kind == "start":
+            if not path:
+                self._keyed = False
+            node = self.schema.node(path)
+            self._bounds(path)
+            if node is not None and node.types is not None and (dict if event.value == "object" else list) \
+                    not in node.types:
+                raise SchemaViolation(path, f"Expected {node.names}, got an {event.value}")
+        elif kind == "key":
+            self._keyed = True
+            parent = self.schema.node(path[:-1])
+            if parent is not None and parent.additional is False and path[-1] not in parent.properties:
+                raise SchemaViolation(path, f"Property {path[-1]!r} is not allowed")
+        elif kind == "value":
+            self._bounds(path)
+            self._value(self.schema.node(path), path, event.value)
+            if not isinstance(event.value, (dict, list)):
+                out.append({"type": "field", "path": list(path), "value": event.value})
+        elif kind == "document":
+            self._value(self.schema.root, (), event.value)
+            self.document, self.done = event.value, True
+            out.append({"type": "document", "value": event.value})
+        elif kind == "invalid" and (self._keyed or path):
+            raise SchemaViolation(path, f"Invalid JSON: {event.value}")
+
+    def _bounds(self, path: tuple):
+        if path and type(path[-1]) is int:
+            parent = self.schema.node(path[:-1])
+            if parent is not None and parent.max_items is not None and path[-1] >= parent.max_items:
+                raise SchemaViolation(path, f"More than {parent.max_items} items")
+
+    def _value(self, node: _Node, path: tuple, value):
+        if node is None:
+            return
+        if node.types is not None:
+            if not isinstance(value, node.types) or (isinstance(value, bool) and bool not in node.types):
+                raise SchemaViolation(path, f"Expected {node.names}, got {json.dumps(value)[:40]}")
+            if node.integer and isinstance(value, float) and not value.is_integer():
+                raise SchemaViolation(path, f"Expected an integer, got {value}")
+        if node.enum is not None and not any(_same(value, option) for option in node.enum):
+            raise SchemaViolation(path, f"{json.dumps(value)[:40]} is not one of {json.dumps(node.enum)[:80]}")
+        if node.has_const and not _same(value, node.const):
+            raise SchemaViolation(path, f"Expected {json.dumps(node.const)[:40]}")
+        if isinstance(value, str):
+            if node.min_length is not None and len(value) < node.min_length:
+                raise SchemaViolation(path, f"Shorter than {node.min_length} characters")
+            if node.max_length is not None and len(value) > node.max_length:
+                raise SchemaViolation(path, f"Longer than {node.max_length} characters")
+            if node.pattern is not None and node.pattern.search(value) is None:
+                raise SchemaViolation(path, f"Does not match {node.pattern.pattern!r}")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            if node.minimum is not None and value < node.minimum:
+                raise SchemaViolation(path, f"Below the minimum {node.minimum}")
+            if node.maximum is not None and value > node.maximum:
+                raise SchemaViolation(path, f"Above the maximum {node.maximum}")
+            if node.exclusive_minimum is not None and value <= node.exclusive_minimum:
+                raise SchemaViolation(path, f"Not above {node.exclusive_minimum}")
+            if node.exclusive_maximum is not None and value >= node.exclusive_maximum:
+                raise SchemaViolation(path, f"Not below {node.exclusive_maximum}")
+            if node.multiple_of and not _is_multiple(value, node.multiple_of):
+                raise SchemaViolation(path, f"Not a multiple of {node.multiple_of}")
+        elif isinstance(value, dict):
+            missing = [key for key in node.required if key not in value]
+            if missing:
+                raise SchemaViolation(path, f"Missing required properties: {', '.join(missing)}")
+            if node.min_properties is not None and len(value) < node.min_properties:
+                raise SchemaViolation(path, f"Fewer than {node.min_properties} properties")
+            if node.max_properties is not None and len(value) > node.max_properties:
+                raise SchemaViolation(path, f"More than {node.max_properties} properties")
+        elif isinstance(value, list):
+            if node.min_items is not None and len(value) < node.min_items:
+                raise SchemaViolation(path, f"Fewer than {node.min_items} items")
+
+
+def _content(chunk) -> str:
+    if isinstance(chunk, dict):
+        return chunk.get("content")
+    return getattr(chunk, "content", None)
+
+
+async def structured_stream(chunks, schema: CompiledSchema, content: bool = True):
+    """
+    Validates a reply stream against `schema` as it arrives.
+
+    Args:
+        chunks: The bot's reply stream (`LLMBot.send_message(...)`): dicts or message chunks.
+        schema (CompiledSchema): From compile_schema().
+        content (bool): Also pass the reply's own chunks through (WebSocket), not just the events (HTTP).
+
+    Yields:
+        The reply's chunks (if `content`), field events and the document event, or a final
+        {"type": "schema_violation", "path": [...], "detail": ...} after which the reply stream
+        is closed, cancelling the upstream request.
+    """
+    validator = SchemaValidator(schema)
+    try:
+        async with aclosing(chunks) as stream:
+            async for chunk in stream:
+                if content:
+                    yield chunk
+                for event in validator.feed(_content(chunk)):
+                    yield event
+    except SchemaViolation as e:
+        # Leaving aclosing() closed the reply stream: the upstream request is cancelled here
+        metrics.inc("structured_output_streams_total", result="violation")
+        yield {"type": "schema_violation", "path": list(e.path), "detail": e.detail}
+        return
+    try:
+        validator.close()
+    except SchemaViolation as e:
+        metrics.inc("structured_output_streams_total", result="incomplete")
+        yield {"type": "schema_violation", "path": list(e.path), "detail": e.detail}
+        return
+    metrics.inc("structured_output_streams_total", result="valid")
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import random
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from api.services.llm_routing.llm_routing_service import LLMRouter
+from api.services.llm_routing.stub_openai_server import StubOpenAIServer
+from api.services.structured_output.structured_output_service import (
+    InvalidSchema, SchemaValidator, SchemaViolation, compile_schema, structured_stream,
+)
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string", "minLength": 1},
+        "age": {"type": "integer", "minimum": 0},
+        "role": {"enum": ["admin", "user"]},
+        "tags": {"type": "array", "items": {"type": "string"}, "maxItems": 2},
+        "address": {"type": "object", "properties": {"city": {"type": "string"}}, "required": ["city"]},
+    },
+    "required": ["name", "age"],
+    "additionalProperties": False,
+}
+
+
+def violation(text: str, schema: dict = SCHEMA) -> tuple:
+    validator = SchemaValidator(compile_schema(schema))
+    with pytest.raises(SchemaViolation) as broken:
+        validator.feed(text)
+        validator.close()
+    return broken.value.path, broken.value.detail
+
+
+def test_fields_stream_as_they_validate_however_the_reply_is_chunked():
+    document = {"name": "Ada {Lovelace}", "age": 36, "role": "admin", "tags": ["math"], "address": {"city": "London"}}
+    reply = f"Here you go:\n```json\n{json.dumps(document, indent=2)}\n```\nAnything else?"
+    reference = SchemaValidator(compile_schema(SCHEMA)).feed(reply)
+    assert reference[:2] == [{"type": "field", "path": ["name"], "value": "Ada {Lovelace}"},
+                             {"type": "field", "path": ["age"], "value": 36}]
+    assert {"type": "field", "path": ["address", "city"], "value": "London"} in reference
+    assert reference[-1] == {"type": "document", "value": document}
+
+    rng = random.Random(3)
+    for _ in range(100):
+        validator, events, pos = SchemaValidator(compile_schema(SCHEMA)), [], 0
+        while pos < len(reply):
+            size = rng.randint(1, 9)
+            events += validator.feed(reply[pos:pos + size])
+            pos += size
+        assert events == reference and validator.close() == []
+
+
+def test_violations_are_caught_as_early_as_the_reply_shows_them():
+    assert violation('{"name": "x", "nickname": "y"') == (("nickname",), "Property 'nickname' is not allowed")
+    assert violation('{"name": "x", "tags": ["a", "b", "c"') == (("tags", 2), "More than 2 items")
+    assert violation('{"name": "x", "address": [') == (("address",), "Expected object, got an array")
+    assert violation('{"name": "x", "role": "root", ')[0] == ("role",)
+    assert violation('{"name": "x", "age": 1.5}') == (("age",), "Expected an integer, got 1.5")
+    assert violation('{"name": "x", "age": true}')[0] == ("age",)
+    assert violation('{"name": "x", "address": {}}') == (("address",), "Missing required properties: city")
+    assert violation('{"name": "x", "age": 3, "address": {"city": "Par') == (("address", "city"),
+                                                                          "The reply ended inside the JSON document")
+    assert violation('Sorry, I cannot {help} with that.') == ((), "The reply holds no JSON document")
+    assert violation('[1, "a"]', {"type": "array", "items": {"type": "number"}}) == ((1,), 'Expected number, got "a"')
+    prices = {"type": "array", "items": {"type": "number", "multipleOf": 0.1}}
+    assert SchemaValidator(compile_schema(prices)).feed("[0.3, 0.7, 1.1, 2, 1e2]")[-1]["value"] == [0.3, 0.7, 1.1, 2, 100.0]
+    assert violation("[0.3, 0.35]", prices) == ((1,), "Not a multiple of 0.1")
+
+    for schema in ({"anyOf": [{"type": "string"}]}, {"type": "text"}, {"type": "string"}, {"required": "name"},
+                   {"properties": {"a": {"pattern": "("}}}):
+        with pytest.raises(InvalidSchema) as refused:
+            compile_schema(schema)
+        assert refused.value.status_code == 422 and refused.value.ws_code == 4400
+    assert compile_schema(SCHEMA) is compile_schema(json.loads(json.dumps(SCHEMA)))  # Cached by canonical JSON
+
+
+@pytest.mark.asyncio
+async def test_a_reply_that_breaks_the_schema_cancels_generation():
+    tokens = ['{"name": ', '"Ada"', ', "age": ', '"thirty-six"'] + [", filler"] * 200
+    async with StubOpenAIServer(tokens=tokens, token_delay=0.005) as stub:
+        router = LLMRouter({"llama-3": [{"url": stub.url, "engine": "vllm"}]})
+        events = [event async for event in structured_stream(
+            router.astream("llama-3", [HumanMessage(content="Describe Ada as JSON")]), compile_schema(SCHEMA))]
+        contents = [event for event in events if not isinstance(event, dict)]
+        assert len(contents) <= 6  # Cut at the bad value, not after the 200 filler tokens
+        assert [event for event in events if isinstance(event, dict)] == [
+            {"type": "field", "path": ["name"], "value": "Ada"},
+            {"type": "schema_violation", "path": ["age"], "detail": 'Expected integer, got "thirty-six"'},
+        ]
+        for _ in range(50):
+            if stub.cancelled:
+                break
+            await asyncio.sleep(0.01)
+        assert stub.cancelled == 1  # The upstream request was closed
+        await router.aclose()
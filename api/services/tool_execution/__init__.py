@@ -0,0 +1 @@
+# Init for tool_execution module
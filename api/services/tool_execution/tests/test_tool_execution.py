@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+from langchain_core.messages import AIMessage, ToolMessage
+
+from api.services.llm_routing.llm_routing_service import LLMRouter
+from api.services.llm_routing.stub_openai_server import StubOpenAIServer
+from api.services.tool_execution import tool_execution_service
+from api.services.tool_execution.tool_execution_service import ToolExecutor, ToolRegistry
+
+CALLS = {"lookup": 0}
+
+
+async def lookup(city: str) -> dict:
+    """Looks up the weather of a city."""
+    CALLS["lookup"] += 1
+    await asyncio.sleep(0.3)
+    return {"city": city, "sky": "sunny"}
+
+
+def read_sensor(sensor: str) -> str:
+    """Reads a sensor (blocking I/O)."""
+    time.sleep(0.3)
+    return f"{sensor}: 21.5"
+
+
+def crunch(n: int) -> list:
+    """Sums the squares below n (CPU-bound)."""
+    return [sum(i * i for i in range(n)), os.getpid()]
+
+
+async def hang() -> str:
+    """Never answers in time."""
+    await asyncio.sleep(10)
+
+
+def broken(x: int) -> int:
+    """Always fails."""
+    raise RuntimeError("disk on fire")
+
+
+def call(name: str, call_id: str, **args) -> dict:
+    return {"name": name, "args": args, "id": call_id, "type": "tool_call"}
+
+
+def executor() -> ToolExecutor:
+    registry = ToolRegistry()
+    registry.register(lookup)
+    registry.register(read_sensor)
+    registry.register(crunch, kind="cpu")
+    registry.register(hang, timeout=0.2)
+    registry.register(broken, cache=False)
+    return ToolExecutor(registry, pool_size=2, timeout=5.0)
+
+
+@pytest.mark.asyncio
+async def test_calls_of_one_turn_run_concurrently_in_call_order():
+    tools = executor()
+    try:
+        tools.pool().submit(int).result()  # Workers up before timing
+        started = time.monotonic()
+        results = await tools.execute([
+            call("lookup", "a", city="Paris"), call("read_sensor", "b", sensor="t1"),
+            call("crunch", "c", n=200_000), call("lookup", "d", city="Oslo"),
+        ])
+        elapsed = time.monotonic() - started
+    finally:
+        tools.close()
+    assert elapsed < 0.6  # Serially: 0.9 s of sleeps plus the CPU work
+    assert [message.tool_call_id for message in results] == ["a", "b", "c", "d"]
+    assert json.loads(results[0].content) == {"city": "Paris", "sky": "sunny"}
+    assert results[1].content == "t1: 21.5"
+    total, pid = json.loads(results[2].content)
+    assert total == sum(i * i for i in range(200_000)) and pid != os.getpid()  # Ran in a worker process
+    assert all(message.status == "success" for message in results)
+    assert tools.registry.specs()[0]["function"]["parameters"]["properties"] == {"city": {"type": "string"}}
+
+
+@pytest.mark.asyncio
+async def test_timeouts_errors_and_the_argument_cache():
+    tools = executor()
+    CALLS["lookup"] = 0
+    events = []
+    results = await tools.execute([
+        call("lookup", "a", city="Rome"), call("lookup", "b", city="Rome"),  # Identical: one execution
+        call("hang", "c"), call("broken", "d", x=1), call("missing", "e"),
+    ], emit=events.append)
+    assert CALLS["lookup"] == 1 and results[0].content == results[1].content
+    assert [message.status for message in results] == ["success", "success", "error", "error", "error"]
+    assert results[2].content == "Error: hang did not finish within 0.2s"
+    assert results[3].content == "Error: RuntimeError: disk on fire"
+    assert results[4].content == "Error: LookupError: Unknown tool 'missing'"
+    assert [event["status"] for event in events[:5]] == ["started"] * 5
+    finished = {event["id"]: event for event in events[5:]}
+    assert {key: event["status"] for key, event in finished.items()} == {
+        "a": "done", "b": "done", "c": "timeout", "d": "error", "e": "error"}
+    assert finished["d"]["detail"] == "RuntimeError: disk on fire" and finished["c"]["elapsed_ms"] >= 200
+
+    # A later turn reuses the result; failures are not cached
+    events.clear()
+    again = await tools.execute([call("lookup", "f", city="Rome"), call("broken", "g", x=1)], emit=events.append)
+    assert CALLS["lookup"] == 1 and again[0].content == results[0].content
+    assert [event["status"] for event in events if event["status"] != "started"] == ["cached", "error"]
+    tools.cache_ttl = 0
+    tools._cache.clear()
+    await tools.execute([call("lookup", "h", city="Rome")])
+    await tools.execute([call("lookup", "i", city="Rome")])
+    assert CALLS["lookup"] == 3  # Expired at once
+
+
+@pytest.mark.asyncio
+async def test_bot_runs_tool_calls_and_streams_their_progress(monkeypatch):
+    from api.services.llm_ws_streaming import llm_ws_streaming_service as service
+
+    tool_calls = [
+        {"role": "assistant", "content": None, "tool_calls": [{"index": 0, "id": "call_a", "type": "function",
+                                                               "function": {"name": "lookup", "arguments": ""}}]},
+        {"tool_calls": [{"index": 0, "function": {"arguments": '{"city": "Paris"}'}}]},
+        {"tool_calls": [{"index": 1, "id": "call_b", "type": "function",
+                         "function": {"name": "read_sensor", "arguments": '{"sensor": "t1"}'}}]},
+    ]
+
+    def reply(body):
+        return ["Sunny, ", "21.5 degrees."] if body["messages"][-1]["role"] == "tool" else tool_calls
+
+    tools = executor()
+    async with StubOpenAIServer(tokens=reply) as stub:
+        router = LLMRouter({"gpt-4o": [{"url": stub.url, "engine": "vllm"}]})
+        monkeypatch.setattr(service, "get_router", lambda: router)
+        monkeypatch.setattr(tool_execution_service, "get_tool_executor", lambda: tools)
+        bot = service.LLMBot(api_key="sk-test", conversation_id="tool-bot")
+        items = [item async for item in bot.send_message("Weather in Paris, and the sensor?")]
+        await router.aclose()
+
+    events = [item for item in items if item.get("type") == "tool"]
+    assert [event["status"] for event in events] == ["started", "started", "done", "done"]  # Both ran at once
+    assert {event["id"] for event in events} == {"call_a", "call_b"}
+    assert "".join(item.get("content") or "" for item in items) == "Sunny, 21.5 degrees."
+    assert [tool["function"]["name"] for tool in stub.requests[0]["tools"]] == [
+        "lookup", "read_sensor", "crunch", "hang", "broken"]
+    assert [message["role"] for message in stub.requests[1]["messages"]] == ["user", "assistant", "tool", "tool"]
+
+    stored = bot.conversation()
+    assert [type(message) for message in stored] == [type(stored[0]), AIMessage, ToolMessage, ToolMessage, AIMessage]
+    assert [c["args"] for c in stored[1].tool_calls] == [{"city": "Paris"}, {"sensor": "t1"}]
+    assert stored[-1].content == "Sunny, 21.5 degrees."
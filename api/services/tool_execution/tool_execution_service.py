@@ -0,0 +1,326 @@
+"""
+Parallel tool calls.
+
+A model turn may ask for several tools at once. `ToolExecutor.execute()`
+runs all of them concurrently and returns one ToolMessage per call, in call
+order:
+
+- I/O tools (`kind="io"`, the default) run on the event loop: coroutine
+  functions are awaited and plain functions run in a thread.
+- CPU tools (`kind="cpu"`) run in a process pool of TOOL_PROCESS_POOL_SIZE
+  workers, started on first use, so they neither hold the GIL nor block the loop.
+- Each call has a timeout: the tool's own or TOOL_CALL_TIMEOUT.
+- Results are cached by tool name and canonical JSON arguments
+  (TOOL_RESULT_CACHE_SIZE entries, TOOL_RESULT_CACHE_TTL seconds). Identical
+  calls in flight at the same time share one execution. Errors and timeouts
+  are not cached.
+- A failing, slow or unknown tool becomes an error ToolMessage for the
+  model to read; it never fails the turn.
+
+Progress is reported as events, passed to `emit` as they happen:
+{"type": "tool", "id": call id, "name": ..., "status": "started"}, then the
+same with status "done", "cached", "error" or "timeout" and "elapsed_ms".
+`stream()` yields those events followed by the ToolMessages.
+
+Tools are registered once per process with `register_tool`, as a decorator
+(`@register_tool(kind="cpu", timeout=5.0)`) or a call. The model sees the
+function's name, its docstring and a schema of its typed parameters.
+
+The graph side is `call_tools` (the "tools" node) and `route_tools` (the
+edge after the model), plus `tool_specs()` for the tools offered to a request.
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache, partial
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langgraph.config import get_stream_writer
+from langgraph.graph import END
+
+from api.config.logging import logger
+from api.config.metrics import metrics
+from api.config.settings import (
+    TOOL_CALL_TIMEOUT, TOOL_MAX_ROUNDS, TOOL_PROCESS_POOL_SIZE, TOOL_RESULT_CACHE_SIZE, TOOL_RESULT_CACHE_TTL,
+)
+
+metrics.describe("tool_calls_total", "Tool calls by tool and result (ok, cached, error, timeout)")
+
+
+class Tool:
+    """
+    A registered tool.
+
+    Args:
+        fn: The function. CPU tools must be importable by name (module level), so a worker process can load them.
+        name (str): Name offered to the model.
+        kind (str): "io" or "cpu".
+        timeout (float, optional): Seconds per call; TOOL_CALL_TIMEOUT if None.
+        cache (bool): Whether results may be reused for the same arguments.
+    """
+
+    __slots__ = ("fn", "name", "kind", "timeout", "cache", "spec", "is_async")
+
+    def __init__(self, fn, name: str = None, kind: str = "io", timeout: float = None, cache: bool = True,
+                 description: str = None):
+        if kind not in ("io", "cpu"):
+            raise ValueError(f"Tool kind must be 'io' or 'cpu', not {kind!r}")
+        self.fn = fn
+        self.kind = kind
+        self.timeout = timeout
+        self.cache = cache
+        self.is_async = asyncio.iscoroutinefunction(fn)
+        if self.is_async and kind == "cpu":
+            raise ValueError("A CPU tool must be a plain function")
+        self.spec = convert_to_openai_tool(fn)  # Name, description and parameters from the signature and docstring
+        self.name = name or self.spec["function"]["name"]
+        self.spec["function"]["name"] = self.name
+        if description:
+            self.spec["function"]["description"] = description
+
+
+class ToolRegistry:
+    """The tools offered to the model, by name."""
+
+    def __init__(self):
+        self._tools = {}
+        self._specs = []
+
+    def register(self, fn=None, *, name: str = None, kind: str = "io", timeout: float = None, cache: bool = True,
+                 description: str = None):
+        """Registers `fn` (also usable as a decorator, with or without arguments). Returns `fn`."""
+        def add(fn):
+            tool = Tool(fn, name, kind, timeout, cache, description)
+            self._tools[tool.name] = tool
+            self._specs = [tool.spec for tool in self._tools.values()]
+            return fn
+        return add if fn is None else add(fn)
+
+    def get(self, name: str):
+        return self._tools.get(name)
+
+    def specs(self) -> list:
+        """OpenAI tool definitions of every registered tool."""
+        return self._specs
+
+    def __len__(self):
+        return len(self._tools)
+
+
+def _canonical(args: dict) -> str:
+    return json.dumps(args, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def _as_content(result) -> str:
+    return result if isinstance(result, str) else json.dumps(result, default=str)
+
+
+class ToolExecutor:
+    """
+    Runs the tool calls of a model turn concurrently (see the module docstring).
+
+    Args:
+        registry (ToolRegistry): Where calls are looked up.
+        pool_size (int): Worker processes for CPU tools.
+        timeout (float): Default seconds per call.
+        cache_size (int): Results kept; 0 disables the cache.
+        cache_ttl (float): Seconds a result stays valid.
+    """
+
+    def __init__(self, registry: ToolRegistry, pool_size: int = TOOL_PROCESS_POOL_SIZE,
+                 timeout: float = TOOL_CALL_TIMEOUT, cache_size: int = TOOL_RESULT_CACHE_SIZE,
+                 cache_ttl: float = TOOL_RESULT_CACHE_TTL):
+        self.registry = registry
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._pool = None
+        self._cache = OrderedDict()  # (name, canonical args) -> (expires, content)
+        self._inflight = {}  # (name, canonical args) -> Future of the content
+
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.pool_size)
+        return self._pool
+
+    async def execute(self, tool_calls: list, emit=None) -> list:
+        """
+        Runs `tool_calls` (AIMessage.tool_calls) at once.
+
+        Args:
+            tool_calls (list): {"name", "args", "id"} dicts.
+            emit (callable, optional): Called with each progress event.
+
+        Returns:
+            list: One ToolMessage per call, in call order.
+        """
+        return list(await asyncio.gather(*(self._run(call, emit) for call in tool_calls)))
+
+    async def stream(self, tool_calls: list):
+        """Like execute(), yielding the progress events as they happen and then the ToolMessages."""
+        events = asyncio.Queue()
+        task = asyncio.ensure_future(self.execute(tool_calls, events.put_nowait))
+        try:
+            while not task.done() or not events.empty():
+                getter = asyncio.ensure_future(events.get())
+                await asyncio.wait((getter, task), return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            for message in task.result():
+                yield message
+        finally:
+            task.cancel()  # The consumer went away: stop waiting on the tools
+
+    async def _run(self, call: dict, emit) -> ToolMessage:
+        name, call_id = call["name"], call["id"]
+        emit = emit or (lambda event: None)
+        emit({"type": "tool", "id": call_id, "name": name, "status": "started"})
+        started = time.monotonic()
+        status, content = "done", None
+        tool = self.registry.get(name)
+        try:
+            if tool is None:
+                raise LookupError(f"Unknown tool {name!r}")
+            key = (name, _canonical(call["args"]))
+            content = self._cached(key) if tool.cache else None
+            if content is not None:
+                status = "cached"
+            elif tool.cache and key in self._inflight:
+                content = await self._follow(tool, key, call["args"])
+            else:
+                content = await self._call(tool, key, call["args"])
+        except asyncio.TimeoutError:
+            status, content = "timeout", f"Error: {name} did not finish within {tool.timeout or self.timeout:g}s"
+        except Exception as e:
+            status, content = "error", f"Error: {type(e).__name__}: {e}"
+            logger.warning(f"⚠️ Tool {name} failed: {e}")
+        metrics.inc("tool_calls_total", tool=name if tool else "unknown",
+                    result={"done": "ok"}.get(status, status))
+        event = {"type": "tool", "id": call_id, "name": name, "status": status,
+                 "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+        if status in ("error", "timeout"):
+            event["detail"] = content[7:200]
+        emit(event)
+        return ToolMessage(content=content, tool_call_id=call_id, name=name,
+                           status="error" if status in ("error", "timeout") else "success")
+
+    async def _call(self, tool: Tool, key: tuple, args: dict) -> str:
+        future = asyncio.get_running_loop().create_future()
+        if tool.cache:
+            self._inflight[key] = future
+        try:
+            result = await asyncio.wait_for(self._invoke(tool, args), tool.timeout or self.timeout)
+            content = _as_content(result)
+            future.set_result(content)
+            if tool.cache:
+                self._store(key, content)
+            return content
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Retrieved here, so an unshared failure is not logged as never retrieved
+            raise
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def _follow(self, tool: Tool, key: tuple, args: dict) -> str:
+        """Waits for the identical call already running; runs it anew if that one was cancelled."""
+        shared = self._inflight[key]
+        try:
+            return await asyncio.shield(shared)
+        except asyncio.CancelledError:
+            if not shared.cancelled() or asyncio.current_task().cancelling():
+                raise
+            return await self._call(tool, key, args)
+
+    async def _invoke(self, tool: Tool, args: dict):
+        if tool.is_async:
+            return await tool.fn(**args)
+        if tool.kind == "io":
+            return await asyncio.to_thread(tool.fn, **args)
+        try:
+            # A timed-out call stops being awaited but keeps its worker until it returns
+            return await asyncio.get_running_loop().run_in_executor(self.pool(), partial(tool.fn, **args))
+        except BrokenProcessPool:
+            self._pool = None  # A worker died (killed, out of memory): start a fresh pool next time
+            raise
+
+    def _cached(self, key: tuple):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key: tuple, content: str):
+        if self.cache_size > 0:
+            self._cache[key] = (time.monotonic() + self.cache_ttl, content)
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+@lru_cache()
+def get_tool_registry() -> ToolRegistry:
+    """Returns the process-wide tool registry."""
+    return ToolRegistry()
+
+
+@lru_cache()
+def get_tool_executor() -> ToolExecutor:
+    """Returns the process-wide tool executor over get_tool_registry()."""
+    return ToolExecutor(get_tool_registry())
+
+
+def register_tool(fn=None, **options):
+    """Registers a tool with the process-wide registry (see ToolRegistry.register())."""
+    return get_tool_registry().register(fn, **options)
+
+
+def tool_rounds(messages: list) -> int:
+    """Model turns that called tools since the newest user message."""
+    rounds = 0
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            break
+        rounds += isinstance(message, AIMessage) and bool(message.tool_calls)
+    return rounds
+
+
+def tool_specs(messages: list, registry: ToolRegistry = None):
+    """The tools to offer a request for `messages`: None when there are none or TOOL_MAX_ROUNDS are used up."""
+    registry = registry or get_tool_executor().registry
+    if not len(registry) or tool_rounds(messages) >= TOOL_MAX_ROUNDS:
+        return None
+    return registry.specs()
+
+
+def route_tools(state) -> str:
+    """Graph edge after the model: to "tools" if its reply called any, else to the end."""
+    last = state["messages"][-1]
+    return "tools" if isinstance(last, AIMessage) and last.tool_calls else END
+
+
+async def call_tools(state) -> dict:
+    """Graph node: runs the last reply's tool calls, streaming progress through the graph's custom stream."""
+    results = await get_tool_executor().execute(state["messages"][-1].tool_calls, emit=get_stream_writer())
+    return {"messages": results}
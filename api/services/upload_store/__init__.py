@@ -0,0 +1 @@
+# Init for upload_store module
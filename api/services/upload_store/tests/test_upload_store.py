@@ -0,0 +1,71 @@
+import asyncio
+import os
+import time
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from api.config.exceptions import NotFoundException, PayloadTooLargeException
+from api.config.middleware.body_limit_middleware import BodyLimitMiddleware
+from api.services.upload_store.upload_store_service import UploadStore
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def write(store, *parts):
+    return asyncio.run(store.write(chunks(*parts)))
+
+
+def test_upload_round_trip(tmp_path):
+    store = UploadStore(str(tmp_path))
+    upload = write(store, "Grüße ".encode(), b"from ", b"disk")
+    assert upload["bytes"] == len("Grüße from disk".encode())
+    assert store.read_text(upload["upload_id"]) == "Grüße from disk"
+    assert store.text_or_upload("inline", None) == "inline"
+    store.delete(upload["upload_id"])
+    with pytest.raises(NotFoundException):
+        store.read_text(upload["upload_id"])
+    with pytest.raises(NotFoundException):
+        store.read_text("../../etc/passwd")
+
+
+def test_oversized_invalid_and_expired_uploads_leave_nothing_behind(tmp_path):
+    store = UploadStore(str(tmp_path), max_bytes=8, ttl=60)
+    with pytest.raises(PayloadTooLargeException):
+        write(store, b"12345", b"67890")
+    with pytest.raises(ValueError, match="UTF-8"):
+        write(store, b"\xff\xfe")
+    assert os.listdir(tmp_path) == []
+
+    upload = write(store, b"old")
+    path = tmp_path / f"{upload['upload_id']}.txt"
+    os.utime(path, (time.time() - 120, time.time() - 120))
+    with pytest.raises(NotFoundException):
+        store.read_text(upload["upload_id"])
+    write(store, b"new")  # Writing prunes expired uploads
+    assert not path.exists()
+
+
+def test_body_limit_rejects_while_reading():
+    app = FastAPI()
+    received = []
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        async for chunk in request.stream():
+            received.append(len(chunk))
+        return {"bytes": sum(received)}
+
+    app.add_middleware(BodyLimitMiddleware, max_bytes=10, path_limits={})
+    client = TestClient(app)
+    assert client.post("/echo", content=b"x" * 10).json() == {"bytes": 10}
+    assert client.post("/echo", content=b"x" * 11).status_code == 413  # Declared Content-Length
+
+    received.clear()
+    response = client.post("/echo", content=iter([b"x" * 6, b"x" * 6, b"x" * 6]))  # Chunked, no length
+    assert response.status_code == 413
+    assert sum(received) <= 10
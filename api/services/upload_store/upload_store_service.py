@@ -0,0 +1,160 @@
+"""
+Disk-backed store for large chat inputs.
+
+Documents too large for a chat request body are streamed to POST /v1/uploads,
+written chunk by chunk into UPLOAD_DIR and referenced by the returned upload
+id (`user_input_upload` / `system_prompt_upload`). Nothing is buffered while
+uploading: only the current chunk is in memory, and the size limit is
+enforced as the bytes arrive.
+
+When a chat request references an upload, its text is decoded straight from
+a read-only mmap of the file, so the document exists once as a Python string
+(the message) instead of as body bytes, a parsed JSON string and a copy.
+
+UPLOAD_DIR is shared by the workers of a host and an upload's mtime is its
+age, so any worker can serve a chat request referencing it and no index has
+to be kept in memory.
+"""
+
+import codecs
+import hashlib
+import mmap
+import os
+import re
+import secrets
+import time
+from functools import lru_cache
+
+from api.config.exceptions import NotFoundException, PayloadTooLargeException, ServiceUnavailableException
+from api.config.metrics import metrics
+from api.config.settings import UPLOAD_DIR, UPLOAD_MAX_BYTES, UPLOAD_MAX_TOTAL_BYTES, UPLOAD_TTL
+
+metrics.describe("uploads_bytes_total", "Bytes written to the upload store")
+metrics.describe("uploads_rejected_total", "Uploads rejected while being written")
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadStore:
+    """
+    Upload files in a directory shared by the local workers.
+
+    Args:
+        directory (str): Where uploads are written.
+        max_bytes (int): Largest single upload.
+        max_total_bytes (int): Disk budget for all live uploads.
+        ttl (float): Seconds an upload stays readable after it was written.
+    """
+
+    def __init__(self, directory: str = UPLOAD_DIR, max_bytes: int = UPLOAD_MAX_BYTES,
+                 max_total_bytes: int = UPLOAD_MAX_TOTAL_BYTES, ttl: float = UPLOAD_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, upload_id: str) -> str:
+        if not isinstance(upload_id, str) or not _UPLOAD_ID.match(upload_id):
+            raise NotFoundException(f"Unknown upload {upload_id!r}")
+        return os.path.join(self.directory, f"{upload_id}.txt")
+
+    async def write(self, chunks) -> dict:
+        """
+        Streams async iterator `chunks` (bytes) into a new upload.
+
+        Returns:
+            dict: {"upload_id", "bytes", "sha256", "expires_in"}
+
+        Raises:
+            PayloadTooLargeException: Once the upload passes `max_bytes`.
+            ServiceUnavailableException: If the store's disk budget is used up.
+            ValueError: If the upload is not UTF-8 text.
+        """
+        budget = self.max_total_bytes - self._prune()
+        upload_id = secrets.token_hex(16)
+        path = self._path(upload_id)
+        partial = f"{path}.part"  # Renamed into place once complete, so readers never see half an upload
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(partial, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        metrics.inc("uploads_rejected_total", reason="too_large")
+                        raise PayloadTooLargeException(f"Upload exceeds the {self.max_bytes} byte limit")
+                    if size > budget:
+                        metrics.inc("uploads_rejected_total", reason="store_full")
+                        raise ServiceUnavailableException("Upload store is full, retry later")
+                    decoder.decode(chunk)  # Validates UTF-8 without keeping the text
+                    digest.update(chunk)
+                    f.write(chunk)
+                decoder.decode(b"", final=True)
+            os.replace(partial, path)
+        except UnicodeDecodeError as e:
+            metrics.inc("uploads_rejected_total", reason="not_utf8")
+            raise ValueError(f"Upload is not UTF-8 text: {e.reason} at byte {e.start}")
+        finally:
+            if os.path.exists(partial):
+                os.unlink(partial)
+        metrics.inc("uploads_bytes_total", size)
+        return {"upload_id": upload_id, "bytes": size, "sha256": digest.hexdigest(), "expires_in": self.ttl}
+
+    def read_text(self, upload_id: str) -> str:
+        """
+        Returns an upload's text, decoded from an mmap of its file.
+
+        Raises:
+            NotFoundException: If the upload does not exist or has expired.
+        """
+        path = self._path(upload_id)
+        try:
+            with open(path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                if time.time() - stat.st_mtime > self.ttl:
+                    raise NotFoundException(f"Upload {upload_id} has expired")
+                if not stat.st_size:
+                    return ""
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    return str(view, "utf-8")
+        except FileNotFoundError:
+            raise NotFoundException(f"Unknown upload {upload_id!r}")
+
+    def text_or_upload(self, text, upload_id):
+        """Returns `text`, or the referenced upload's text when `upload_id` is set."""
+        return text if upload_id is None else self.read_text(upload_id)
+
+    def delete(self, upload_id: str):
+        """
+        Deletes an upload before it expires.
+
+        Raises:
+            NotFoundException: If the upload does not exist.
+        """
+        try:
+            os.unlink(self._path(upload_id))
+        except FileNotFoundError:
+            raise NotFoundException(f"Unknown upload {upload_id!r}")
+
+    def _prune(self) -> int:
+        """Deletes expired uploads (and stale partial ones); returns the bytes still in use."""
+        cutoff = time.time() - self.ttl
+        used = 0
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+                if stat.st_mtime < cutoff:
+                    os.unlink(entry.path)
+                else:
+                    used += stat.st_size
+            except FileNotFoundError:
+                pass  # Removed by another worker meanwhile
+        return used
+
+
+@lru_cache()
+def get_upload_store() -> UploadStore:
+    """Returns the process-wide upload store."""
+    return UploadStore()
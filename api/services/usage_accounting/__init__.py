@@ -0,0 +1 @@
+# Init for usage_accounting module
@@ -0,0 +1,102 @@
+import json
+import sqlite3
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from api.services.llm_routing.llm_routing_service import LLMRouter
+from api.services.llm_routing.stub_openai_server import StubOpenAIServer
+from api.services.preset_catalog.preset_catalog_service import PresetCatalog
+from api.services.usage_accounting.usage_accounting_service import UsageLedger, count_tokens, estimate_prompt_tokens
+
+MESSAGES = [HumanMessage(content="How many tokens is this?")]
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = str(tmp_path / "app_db.sqlite")
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        'CREATE TABLE "AIProvider" ("id" INTEGER PRIMARY KEY, "category" TEXT, "provider" TEXT, "modelType" TEXT);'
+        'CREATE TABLE "Model" ("id" INTEGER PRIMARY KEY, "name" TEXT, "description" TEXT, "type" TEXT,'
+        ' "inputCost" REAL, "cachedInputCost" REAL, "outputCost" REAL, "totalCost" REAL, "providerId" INTEGER);'
+        'CREATE TABLE "preset" ("id" INTEGER PRIMARY KEY, "name" TEXT, "description" TEXT, "modelId" INTEGER,'
+        ' "prompt" TEXT, "temperature" REAL, "maxTokens" INTEGER, "topP" REAL, "frequencyPenalty" REAL,'
+        ' "presencePenalty" REAL, "createdAt" DATETIME);'
+        "INSERT INTO AIProvider VALUES (1, 'Chat', 'OpenAI', 'LLM');"
+        "INSERT INTO Model VALUES (1, 'GPT-4o', NULL, 'GPT-4', 2.5, 1.25, 10.0, NULL, 1);"
+        "INSERT INTO Model VALUES (2, 'Llama-3', NULL, 'LLM', 0.2, NULL, 0.4, NULL, 1);"
+    )
+    conn.commit()
+    conn.close()
+    catalog = PresetCatalog(path)
+    yield catalog
+    catalog.close()
+
+
+def rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT user_id, conversation_id, model, requests, input_tokens, cached_input_tokens,"
+                            " output_tokens, round(cost_usd, 6) FROM usage ORDER BY model").fetchall()
+    finally:
+        conn.close()
+
+
+def test_costs_come_from_the_model_prices(catalog, tmp_path):
+    ledger = UsageLedger(str(tmp_path / "usage.sqlite"), catalog=catalog)
+    # 1000 input of which 400 cached, 200 output: 600 * 2.5 + 400 * 1.25 + 200 * 10 per million
+    assert ledger.record("gpt-4o", "u1", "c1", 1000, 200, cached_tokens=400) == pytest.approx(0.004)
+    assert ledger.price("llama-3", 1000, 0, cached_tokens=1000) == pytest.approx(0.0002)  # No cached price: input
+    assert ledger.record("unknown-model", "u1", "c1", 50, 50) == 0.0
+    disabled = UsageLedger(str(tmp_path / "off.sqlite"), enabled=False, catalog=catalog)
+    assert disabled.record("gpt-4o", "u1", "c1", 1000, 200) == 0.0 and not disabled._pending
+
+
+def test_flushes_add_to_the_store_and_failures_are_kept(catalog, tmp_path):
+    path = str(tmp_path / "usage.sqlite")
+    ledger = UsageLedger(path, catalog=catalog)
+    ledger.record("gpt-4o", "u1", "c1", 100, 10)
+    ledger.record("gpt-4o", "u1", "c1", 100, 10)
+    ledger.record("llama-3", None, None, 1000, 1000)
+    assert ledger.flush() == 2 and not ledger._pending
+    ledger.record("gpt-4o", "u1", "c1", 100, 10)
+    assert ledger.flush() == 1
+    assert rows(path) == [("u1", "c1", "gpt-4o", 3, 300, 0, 30, 0.00105),
+                          ("", "", "llama-3", 1, 1000, 0, 1000, 0.0006)]
+
+    ledger.record("gpt-4o", "u1", "c1", 100, 10)
+    ledger.close()
+    ledger.path = str(tmp_path / "missing" / "usage.sqlite")  # Cannot be opened
+    assert ledger.flush() == 0 and list(ledger._pending.values()) == [[1, 100, 0, 10, 0.00035]]
+    ledger.record("gpt-4o", "u1", "c1", 100, 10)
+    ledger.path = path
+    assert ledger.flush() == 1
+    assert rows(path)[0] == ("u1", "c1", "gpt-4o", 5, 500, 0, 50, 0.00175)
+    ledger.close()
+
+
+@pytest.mark.asyncio
+async def test_meter_uses_reported_usage_or_estimates(catalog, tmp_path):
+    ledger = UsageLedger(str(tmp_path / "usage.sqlite"), catalog=catalog)
+    async with StubOpenAIServer(name="a", cached_tokens=4) as vllm, StubOpenAIServer(name="b") as llama:
+        router = LLMRouter({
+            "gpt-4o": [{"url": vllm.url, "engine": "vllm"}],
+            "llama-3": [{"url": llama.url, "engine": "llama.cpp"}],
+        })
+        for model_name in ("gpt-4o", "llama-3"):
+            meter = ledger.meter(model_name, "u1", "c1", MESSAGES)
+            chunks = []
+            async for chunk in router.astream(model_name, MESSAGES):
+                meter.observe(chunk)
+                chunks.append(chunk.content)
+            meter.finish("".join(chunks))
+        ledger.meter("gpt-4o", "u1", "c1", MESSAGES).finish("")  # Failed before streaming: not counted
+        await router.aclose()
+
+    assert vllm.requests[0]["stream_options"] == {"include_usage": True}
+    assert "stream_options" not in llama.requests[0]
+    await ledger.aclose()
+    reported, estimated = rows(ledger.path)
+    assert reported[3:7] == (1, len(json.dumps(vllm.requests[0]["messages"])) // 4, 4, 2)
+    assert estimated[3:7] == (1, estimate_prompt_tokens(MESSAGES), 0, count_tokens("Hello world"))
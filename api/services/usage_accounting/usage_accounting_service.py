@@ -0,0 +1,362 @@
+"""
+Token and cost accounting for every LLM request.
+
+Capture:
+- Endpoints ask for usage on streamed responses (`stream_usage`, i.e.
+  `stream_options.include_usage`, for engines that support it). The last
+  chunk then carries `usage_metadata`: input, cached input and output tokens.
+- `UsageMeter` watches one request's chunks. When the stream ends (or is
+  abandoned, since the tokens were still spent) it records the reported
+  usage.
+- A backend that reports nothing is estimated with a local tokenizer:
+  tiktoken's USAGE_TOKENIZER encoding, or characters / 4 without it.
+
+Cost:
+- Prices come from the Model rows in the preset catalog snapshot, which is
+  already in memory and refreshed on change. They are USD per million
+  tokens: `inputCost`, `cachedInputCost` (falls back to `inputCost`) and
+  `outputCost`.
+- A model without a Model row is counted with a cost of 0, and
+  `usage_unpriced_total` tells which.
+
+Storage:
+- `UsageLedger` adds each request to a per-worker dict keyed by
+  (UTC day, user, conversation, model). Everything runs on the event loop, so
+  there is no lock.
+- Every USAGE_FLUSH_INTERVAL seconds a background task swaps the dict for an
+  empty one. It then adds the deltas to USAGE_DB_PATH in one transaction,
+  from a worker thread.
+- The store is a local SQLite file (WAL) shared by the workers of a host.
+  Its rows are sums, so quotas and dashboards read totals directly.
+- A failed flush merges its deltas back. The drain flushes what is left.
+
+Spend (for usage_quota_service):
+- When `subjects` is set (user_id -> the keys budgets apply to, such as the
+  user and their groups), `record()` also adds tokens and cost to a daily
+  per-subject rollup, and every flush re-reads the day's totals of every
+  worker in the same transaction. `spent()` is then store totals plus what
+  this worker has not flushed yet: three dict lookups.
+"""
+
+import asyncio
+import sqlite3
+import time
+from functools import lru_cache
+
+from api.config.drain import get_drain_controller
+from api.config.logging import logger
+from api.config.metrics import metrics
+from api.config.settings import USAGE_DB_PATH, USAGE_ENABLED, USAGE_FLUSH_INTERVAL, USAGE_TOKENIZER
+from api.services.preset_catalog.preset_catalog_service import get_preset_catalog
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS usage ('
+    ' day TEXT NOT NULL, user_id TEXT NOT NULL, conversation_id TEXT NOT NULL, model TEXT NOT NULL,'
+    ' requests INTEGER NOT NULL, input_tokens INTEGER NOT NULL, cached_input_tokens INTEGER NOT NULL,'
+    ' output_tokens INTEGER NOT NULL, cost_usd REAL NOT NULL, updated_at INTEGER NOT NULL,'
+    ' PRIMARY KEY (day, user_id, conversation_id, model)) WITHOUT ROWID;'
+    'CREATE INDEX IF NOT EXISTS usage_user_day ON usage (user_id, day);'
+)
+_ADD = (
+    'INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+    'ON CONFLICT (day, user_id, conversation_id, model) DO UPDATE SET '
+    'requests = requests + excluded.requests, input_tokens = input_tokens + excluded.input_tokens, '
+    'cached_input_tokens = cached_input_tokens + excluded.cached_input_tokens, '
+    'output_tokens = output_tokens + excluded.output_tokens, cost_usd = cost_usd + excluded.cost_usd, '
+    'updated_at = excluded.updated_at'
+)
+_TOTALS = 'SELECT user_id, sum(input_tokens + output_tokens), sum(cost_usd) FROM usage WHERE day = ? GROUP BY user_id'
+
+ANONYMOUS = ""  # user_id of requests without a signed-in user
+
+metrics.describe("llm_tokens_total", "LLM tokens by model and kind (input, cached_input, output)")
+metrics.describe("llm_cost_usd_total", "LLM cost in USD by model, from the Model table prices")
+metrics.describe("usage_estimated_total", "Requests whose usage was estimated locally (backend reported none)")
+metrics.describe("usage_unpriced_total", "Requests for models without a price in the Model table")
+metrics.describe("usage_pending_keys", "Usage counters not yet flushed to the local store")
+metrics.describe("usage_flushes_total", "Flushes of the usage counters by result")
+
+
+_day = [-1, ""]  # UTC day number and its date, formatted once a day
+
+
+def _today() -> str:
+    number = int(time.time() // 86400)
+    if number != _day[0]:
+        _day[:] = number, time.strftime("%Y-%m-%d", time.gmtime(number * 86400))
+    return _day[1]
+
+
+@lru_cache()
+def _encoding():
+    if not (tiktoken and USAGE_TOKENIZER):
+        return None
+    try:
+        return tiktoken.get_encoding(USAGE_TOKENIZER)
+    except Exception as e:  # Unknown name, or the encoding file cannot be downloaded
+        logger.warning(f"⚠️ tiktoken encoding '{USAGE_TOKENIZER}' unavailable, estimating chars / 4: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Local token count of `text`: tiktoken if available, else about 4 characters per token."""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def estimate_prompt_tokens(messages: list) -> int:
+    """Approximate input tokens of a chat request (content plus per-message framing)."""
+    total = 3
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        total += count_tokens(content) + 4
+    return total
+
+
+class UsageMeter:
+    """
+    Usage of one streamed request. Call `observe()` on every chunk and `finish()`
+    once, from a `finally`, so abandoned streams are counted too.
+    """
+
+    __slots__ = ("ledger", "model_name", "user_id", "conversation_id", "messages", "usage", "seen")
+
+    def __init__(self, ledger, model_name: str, user_id: str, conversation_id: str, messages: list):
+        self.ledger = ledger
+        self.model_name = model_name
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.messages = messages
+        self.usage = None
+        self.seen = False
+
+    def observe(self, chunk):
+        self.seen = True
+        usage = getattr(chunk, "usage_metadata", None)
+        if usage:
+            self.usage = usage
+            # The router names the model that answered (a fallback may have)
+            self.model_name = chunk.response_metadata.get("route_model", self.model_name)
+
+    def finish(self, reply: str):
+        """Records the request; nothing if no chunk ever arrived (the request failed before streaming)."""
+        if not self.seen:
+            return
+        if self.usage:
+            details = self.usage.get("input_token_details") or {}
+            self.ledger.record(self.model_name, self.user_id, self.conversation_id, self.usage["input_tokens"],
+                               self.usage["output_tokens"], details.get("cache_read") or 0)
+        else:
+            self.ledger.record(self.model_name, self.user_id, self.conversation_id,
+                               estimate_prompt_tokens(self.messages), count_tokens(reply), estimated=True)
+
+
+class UsageLedger:
+    """
+    Per-worker usage counters, flushed into a local SQLite store.
+
+    Args:
+        path (str): The local store; created if missing.
+        flush_interval (float): Seconds between flushes.
+        enabled (bool): When False, nothing is counted.
+        catalog (PresetCatalog, optional): Source of the prices; defaults to the process-wide catalog.
+    """
+
+    def __init__(self, path: str = USAGE_DB_PATH, flush_interval: float = USAGE_FLUSH_INTERVAL,
+                 enabled: bool = USAGE_ENABLED, catalog=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self.catalog = catalog
+        self._pending = {}  # (day, user_id, conversation_id, model) -> [requests, input, cached, output, cost]
+        self.subjects = None  # user_id -> keys whose daily spend is tracked; set by usage quotas
+        self._spend = {}  # (day, subject) -> [tokens, cost] recorded since the last flush
+        self._flushing = {}  # The same, for the flush in progress
+        self._durable = {}  # (day, subject) -> [tokens, cost] in the store, every worker's, as of the last flush
+        self._lock = asyncio.Lock()
+        self._conn = None
+        self._task = None
+
+    def meter(self, model_name: str, user_id: str, conversation_id: str, messages: list) -> UsageMeter:
+        return UsageMeter(self, model_name, user_id, conversation_id, messages)
+
+    def price(self, model_name: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0):
+        """USD cost of a request, or None if the model has no price."""
+        model = (self.catalog or get_preset_catalog()).model(model_name)
+        if model is None or model.input_cost is None or model.output_cost is None:
+            return None
+        cached_cost = model.cached_input_cost if model.cached_input_cost is not None else model.input_cost
+        return ((input_tokens - cached_tokens) * model.input_cost + cached_tokens * cached_cost
+                + output_tokens * model.output_cost) / 1_000_000
+
+    def record(self, model_name: str, user_id: str, conversation_id: str, input_tokens: int, output_tokens: int,
+               cached_tokens: int = 0, estimated: bool = False) -> float:
+        """Counts one request. Returns its cost in USD (0 if the model has no price)."""
+        if not self.enabled:
+            return 0.0
+        cost = self.price(model_name, input_tokens, output_tokens, cached_tokens)
+        if cost is None:
+            metrics.inc("usage_unpriced_total", model=model_name)
+            cost = 0.0
+        key = (_today(), user_id or ANONYMOUS, conversation_id or "", model_name)
+        counters = self._pending.get(key)
+        if counters is None:
+            counters = self._pending[key] = [0, 0, 0, 0, 0.0]
+            metrics.set("usage_pending_keys", len(self._pending))
+        counters[0] += 1
+        counters[1] += input_tokens
+        counters[2] += cached_tokens
+        counters[3] += output_tokens
+        counters[4] += cost
+        if self.subjects is not None:
+            for subject in self.subjects(user_id):
+                spend = self._spend.get((key[0], subject))
+                if spend is None:
+                    spend = self._spend[(key[0], subject)] = [0, 0.0]
+                spend[0] += input_tokens + output_tokens
+                spend[1] += cost
+
+        metrics.inc("llm_tokens_total", input_tokens - cached_tokens, model=model_name, kind="input")
+        if cached_tokens:
+            metrics.inc("llm_tokens_total", cached_tokens, model=model_name, kind="cached_input")
+        metrics.inc("llm_tokens_total", output_tokens, model=model_name, kind="output")
+        metrics.inc("llm_cost_usd_total", cost, model=model_name)
+        if estimated:
+            metrics.inc("usage_estimated_total", model=model_name)
+        self._ensure_writer()
+        return cost
+
+    def spent(self, subject: str) -> tuple:
+        """Today's (tokens, cost) of `subject`: the store's totals plus this worker's unflushed requests."""
+        key = (_today(), subject)
+        tokens, cost = 0, 0.0
+        for source in (self._durable, self._flushing, self._spend):
+            spend = source.get(key)
+            if spend is not None:
+                tokens += spend[0]
+                cost += spend[1]
+        return tokens, cost
+
+    def flush(self) -> int:
+        """
+        Adds the pending counters to the store in one transaction. Returns the rows touched.
+        With `subjects` set it runs even with nothing pending, to pick up the other workers' spend.
+        """
+        pending = self._take()
+        if not pending and self.subjects is None:
+            return 0
+        return self._settle(pending, *self._store(pending))
+
+    async def aflush(self) -> int:
+        """flush() with the transaction in a worker thread; one at a time."""
+        async with self._lock:
+            pending = self._take()
+            if not pending and self.subjects is None:
+                return 0
+            return self._settle(pending, *await asyncio.to_thread(self._store, pending))
+
+    async def aclose(self):
+        """Drain flush hook: stops the periodic flush and writes what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.aflush()
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _ensure_writer(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        except RuntimeError:
+            pass  # No event loop (scripts): call flush()
+
+    def start(self):
+        """Starts the periodic flush now rather than on the first request (call from the event loop)."""
+        self._ensure_writer()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.shield(self.aflush())  # aclose() cancels the loop, never a transaction half-settled
+
+    def _take(self) -> dict:
+        pending, self._pending = self._pending, {}  # Swap first: new requests count into the fresh dict
+        self._flushing, self._spend = self._spend, {}
+        metrics.set("usage_pending_keys", 0)
+        return pending
+
+    def _settle(self, pending: dict, error, durable: dict = None) -> int:
+        """Runs on the event loop, so a failed flush merges back without racing record()."""
+        flushing, self._flushing = self._flushing, {}
+        if error is not None:
+            for source, target in ((pending, self._pending), (flushing, self._spend)):
+                for key, delta in source.items():
+                    counters = target.get(key)
+                    if counters is None:
+                        counters = target[key] = [0] * len(delta)
+                    for index, value in enumerate(delta):
+                        counters[index] += value
+            metrics.set("usage_pending_keys", len(self._pending))
+            metrics.inc("usage_flushes_total", result="error")
+            logger.error(f"❌ Usage flush failed, {len(pending)} counter(s) kept for the next one: {error}")
+            return 0
+        if durable is not None:
+            self._durable = durable
+        metrics.inc("usage_flushes_total", result="ok")
+        return len(pending)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")  # Workers flush while dashboards read
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _store(self, pending: dict) -> tuple:
+        """
+        Adds `pending` to the store. Returns (error, durable): the error instead of raising it, and
+        with `subjects` set, today's spend per subject read in the same transaction.
+        """
+        now = int(time.time() * 1000)
+        durable = None
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(_ADD, [(*key, *counters, now) for key, counters in pending.items()])
+            if self.subjects is not None:
+                day, durable = _today(), {}
+                for user_id, tokens, cost in conn.execute(_TOTALS, (day,)):
+                    for subject in self.subjects(user_id):
+                        spend = durable.setdefault((day, subject), [0, 0.0])
+                        spend[0] += tokens
+                        spend[1] += cost
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self.close()  # Closing rolls the transaction back
+            return e, None
+        return None, durable
+
+
+@lru_cache()
+def get_usage_ledger() -> UsageLedger:
+    """Returns the process-wide usage ledger; its counters are flushed when the worker drains."""
+    ledger = UsageLedger()
+    get_drain_controller().on_flush(ledger.aclose)
+    return ledger
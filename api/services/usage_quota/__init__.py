@@ -0,0 +1 @@
+# Init for usage_quota module
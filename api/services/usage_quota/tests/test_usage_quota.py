@@ -0,0 +1,110 @@
+import asyncio
+import sqlite3
+from contextlib import aclosing
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from api.services.llm_routing.llm_routing_service import LLMRouter
+from api.services.llm_routing.stub_openai_server import StubOpenAIServer
+from api.services.usage_accounting.usage_accounting_service import UsageLedger
+from api.services.usage_quota.usage_quota_service import QuotaExceeded, QuotaManager
+
+
+class Prices:
+    """A catalog stand-in: every model costs $1 per million tokens, in and out."""
+
+    def model(self, model_name):
+        return type("Model", (), {"input_cost": 1.0, "cached_input_cost": None, "output_cost": 1.0})
+
+
+@pytest.fixture
+def prisma(tmp_path):
+    path = str(tmp_path / "app_db.sqlite")
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        'CREATE TABLE "User" ("id" TEXT PRIMARY KEY, "role" TEXT);'
+        'CREATE TABLE "GroupUser" ("id" TEXT PRIMARY KEY, "userId" TEXT, "groupId" TEXT, "role" TEXT);'
+        "INSERT INTO User VALUES ('alice', 'USER'), ('bob', 'USER'), ('root', 'ADMIN');"
+        "INSERT INTO GroupUser VALUES ('m1', 'alice', 'team', 'MEMBER'), ('m2', 'bob', 'team', 'MEMBER');"
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def manager(tmp_path, prisma, **limits):
+    ledger = UsageLedger(str(tmp_path / "usage.sqlite"), catalog=Prices())
+    quotas = QuotaManager(ledger, prisma, limits={"user": limits.get("user", (0, 0.0)),
+                                                  "group": limits.get("group", (0, 0.0))})
+    assert quotas.refresh()
+    return quotas
+
+
+def test_spent_budgets_refuse_requests(tmp_path, prisma):
+    quotas = manager(tmp_path, prisma, user=(1000, 0.0), group=(0, 0.0015))
+    quotas.admit("alice", "gpt-4o")
+    quotas.ledger.record("gpt-4o", "alice", "c1", 900, 100)
+    with pytest.raises(QuotaExceeded) as refused:
+        quotas.admit("alice", "gpt-4o")
+    assert refused.value.scope == "user" and refused.value.status_code == 429 and refused.value.ws_code == 4429
+    assert 0 < refused.value.retry_after <= 86400
+
+    quotas.admit("bob", "gpt-4o")  # Bob's own budget is untouched, but his group is at $0.001 of $0.0015
+    quotas.ledger.record("gpt-4o", "bob", "c2", 400, 100)
+    with pytest.raises(QuotaExceeded) as refused:
+        quotas.admit("bob", "gpt-4o")
+    assert refused.value.scope == "group"
+
+    quotas.ledger.record("gpt-4o", "root", "c3", 5000, 5000)
+    quotas.admit("root", "gpt-4o")  # Exempt role
+    quotas.admit(None, "gpt-4o")  # Anonymous requests are left to admission control
+    assert not QuotaManager(quotas.ledger, prisma, limits={"user": (0, 0.0), "group": (0, 0.0)}).enabled
+
+
+def test_spend_is_reconciled_with_other_workers(tmp_path, prisma):
+    quotas = manager(tmp_path, prisma, user=(1000, 0.0))
+    other = UsageLedger(quotas.ledger.path, catalog=Prices())  # A second worker on the same host
+    other.record("gpt-4o", "alice", "c1", 600, 0)
+    assert other.flush() == 1
+
+    quotas.ledger.record("gpt-4o", "alice", "c2", 300, 0)
+    assert quotas.ledger.spent(("user", "alice")) == (300, pytest.approx(0.0003))
+    quotas.ledger.flush()  # Writes this worker's 300 and reads every worker's total in one transaction
+    assert quotas.ledger.spent(("user", "alice")) == (900, pytest.approx(0.0009))
+    assert quotas.ledger.spent(("group", "team")) == (900, pytest.approx(0.0009))
+    quotas.ledger.record("gpt-4o", "alice", "c2", 100, 0)
+    with pytest.raises(QuotaExceeded):
+        quotas.admit("alice", "gpt-4o")
+    other.close()
+    quotas.ledger.close()
+
+
+@pytest.mark.asyncio
+async def test_running_stream_is_cut_at_the_quota(tmp_path, prisma):
+    quotas = manager(tmp_path, prisma, user=(60, 0.0))
+    messages = [HumanMessage(content="x" * 40)]  # ~10 tokens held up front
+    async with StubOpenAIServer(tokens=["word"] * 200, token_delay=0.005) as stub:
+        router = LLMRouter({"llama-3": [{"url": stub.url, "engine": "vllm"}]})
+        guard = quotas.admit("alice", "llama-3")
+        second = quotas.admit("alice", "llama-3")
+        second.start(messages)  # A concurrent stream of the same user holds its share too
+        received = 0
+        with pytest.raises(QuotaExceeded):
+            try:
+                guard.start(messages)
+                async with aclosing(router.astream("llama-3", messages)) as stream:
+                    async for chunk in stream:
+                        guard.consume(chunk.content)
+                        received += 1
+            finally:
+                guard.release()
+        assert received == 39  # 60 tokens: 2 x 10 held for the prompts, then 1 per chunk
+        second.release()
+        assert not quotas._inflight
+        for _ in range(50):
+            if stub.cancelled:
+                break
+            await asyncio.sleep(0.01)
+        assert stub.cancelled == 1  # The upstream request was closed, not left running
+        await router.aclose()
@@ -0,0 +1,271 @@
+"""
+Daily token and dollar quotas per user and per Group.
+
+Budgets:
+- Each signed-in user has a daily budget (QUOTA_USER_DAILY_TOKENS / _USD),
+  and so does each Group they belong to (QUOTA_GROUP_DAILY_TOKENS / _USD):
+  a group's spend is the sum of its members'. Days are UTC days, like the
+  usage store; 0 means no limit.
+- Users whose `User.role` is in QUOTA_EXEMPT_ROLES have no quota. Requests
+  without a signed-in user are not limited here (admission control still
+  rate-limits them).
+- Past QUOTA_SOFT_RATIO of a limit, a warning is logged once a day (the soft
+  quota). Past the limit itself, the hard quota applies.
+
+Checks:
+- `admit()` runs before a request stores anything. A spent budget raises
+  `QuotaExceeded`: HTTP 429, WebSocket close code 4429, with Retry-After set
+  to the next UTC midnight.
+- While the reply streams, the guard holds an estimate of the request's
+  tokens and cost (prompt and output so far, characters / 4) for each of its
+  budgets, so concurrent streams of one user count against each other.
+  `consume()` re-checks on every chunk and raises `QuotaExceeded` when a
+  budget runs out: LLMBot stops reading and the upstream request is closed.
+- A check is a few dict lookups per budget. Spend comes from
+  `UsageLedger.spent()`: the store's totals of every worker, re-read in each
+  flush transaction, plus this worker's unflushed requests. Memberships and
+  exempt users are reloaded from the Prisma database every
+  QUOTA_REFRESH_INTERVAL seconds.
+"""
+
+import asyncio
+import sqlite3
+import time
+from functools import lru_cache
+
+from api.config.exceptions import TooManyRequestsException
+from api.config.logging import logger
+from api.config.metrics import metrics
+from api.config.settings import (
+    QUOTA_DB_PATH, QUOTA_ENABLED, QUOTA_EXEMPT_ROLES, QUOTA_GROUP_DAILY_TOKENS, QUOTA_GROUP_DAILY_USD,
+    QUOTA_SOFT_RATIO, QUOTA_USER_DAILY_TOKENS, QUOTA_USER_DAILY_USD,
+)
+from api.services.admission_control.admission_control_service import WS_CLOSE_RATE_LIMITED
+from api.services.usage_accounting.usage_accounting_service import get_usage_ledger
+
+_MEMBERS = 'SELECT "userId", "groupId" FROM "GroupUser"'
+_EXEMPT = 'SELECT "id" FROM "User" WHERE "role" IN ({})'
+
+metrics.describe("quota_exceeded_total", "Requests refused (phase=admit) or streams cut (phase=stream) by a quota")
+metrics.describe("quota_soft_warnings_total", "Budgets that passed the soft quota ratio, once per day")
+metrics.describe("quota_held_budgets", "Budgets that running streams hold an estimate against")
+
+
+class QuotaExceeded(TooManyRequestsException):
+    """
+    A daily budget is spent.
+
+    Args:
+        scope (str): "user" or "group".
+        detail (str): Message returned to the client.
+        retry_after (float): Seconds until the budget resets (next UTC midnight).
+    """
+
+    ws_code = WS_CLOSE_RATE_LIMITED
+
+    def __init__(self, scope: str, detail: str, retry_after: float):
+        super().__init__(detail=detail, retry_after=retry_after)
+        self.scope = scope
+
+
+def _until_midnight(now: float = None) -> float:
+    now = time.time() if now is None else now
+    return 86400 - now % 86400
+
+
+def _estimate(text) -> int:
+    return (len(text) + 3) // 4 if isinstance(text, str) else 0
+
+
+class QuotaGuard:
+    """
+    The quota side of one streamed request. `start()` once the prompt is known,
+    `consume()` on every chunk, `release()` from a `finally`.
+    """
+
+    __slots__ = ("quotas", "subjects", "model_name", "prompt_tokens", "output_tokens", "held")
+
+    def __init__(self, quotas, subjects: tuple, model_name: str):
+        self.quotas = quotas
+        self.subjects = subjects
+        self.model_name = model_name
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.held = None  # (tokens, cost) held against each budget; None before start() and after release()
+
+    def start(self, messages: list):
+        """Holds the prompt's estimate against the budgets."""
+        if self.subjects:
+            self.prompt_tokens = sum(_estimate(message.content) for message in messages)
+            self.quotas._hold(self)
+
+    def consume(self, text: str):
+        """Adds a chunk to the estimate. Raises QuotaExceeded once a budget runs out."""
+        if self.held is not None:
+            self.output_tokens += _estimate(text)
+            self.quotas._hold(self)
+            self.quotas._check(self.subjects, "stream")
+
+    def release(self):
+        """Drops the estimate; the usage ledger has the request's actual usage by now."""
+        if self.held is not None:
+            self.quotas._release(self)
+
+
+class QuotaManager:
+    """
+    Per-worker quota checks against the usage ledger's daily spend.
+
+    Args:
+        ledger (UsageLedger, optional): Source of the spend; defaults to the process-wide ledger.
+        path (str): Prisma database with User and GroupUser, opened read-only.
+        limits (dict, optional): {"user": (tokens, usd), "group": (tokens, usd)}; 0 means no limit.
+        soft_ratio (float): Share of a limit at which a warning is logged.
+        exempt_roles (list): User.role values without quotas.
+        enabled (bool): When False (or without any limit), every request is admitted.
+    """
+
+    def __init__(self, ledger=None, path: str = QUOTA_DB_PATH, limits: dict = None,
+                 soft_ratio: float = QUOTA_SOFT_RATIO, exempt_roles: list = QUOTA_EXEMPT_ROLES,
+                 enabled: bool = QUOTA_ENABLED):
+        self.ledger = ledger or get_usage_ledger()
+        self.path = path
+        self.limits = limits if limits is not None else {
+            "user": (QUOTA_USER_DAILY_TOKENS, QUOTA_USER_DAILY_USD),
+            "group": (QUOTA_GROUP_DAILY_TOKENS, QUOTA_GROUP_DAILY_USD),
+        }
+        self.soft_ratio = soft_ratio
+        self.exempt_roles = list(exempt_roles)
+        self.enabled = enabled and any(tokens or usd for tokens, usd in self.limits.values())
+        self._groups = {}  # user_id -> group ids
+        self._exempt = frozenset()
+        self._inflight = {}  # subject -> [streams, tokens, cost] held by running streams
+        self._warned = set()  # Subjects past the soft ratio today, already logged
+        self._warned_day = None
+        if self.enabled:
+            self.ledger.subjects = self.subjects
+
+    def subjects(self, user_id: str) -> tuple:
+        """The budgets a user's requests count against: ("user", id) and ("group", id) of each group."""
+        if not user_id:
+            return ()
+        return (("user", user_id), *(("group", group_id) for group_id in self._groups.get(user_id, ())))
+
+    def admit(self, user_id: str, model_name: str) -> QuotaGuard:
+        """
+        Checks the user's budgets before a request starts.
+
+        Returns:
+            QuotaGuard: The request's guard (a no-op for unlimited users).
+
+        Raises:
+            QuotaExceeded: If the user's or one of their groups' budget is spent.
+        """
+        if not self.enabled or not user_id or user_id in self._exempt:
+            return QuotaGuard(self, (), model_name)
+        subjects = self.subjects(user_id)
+        self._check(subjects, "admit")
+        return QuotaGuard(self, subjects, model_name)
+
+    def refresh(self) -> bool:
+        """Reloads group memberships and exempt users; keeps the last ones if the database cannot be read."""
+        if not self.enabled:
+            return False
+        try:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=1.0)
+            try:
+                groups = {}
+                for user_id, group_id in conn.execute(_MEMBERS):
+                    groups.setdefault(user_id, []).append(group_id)
+                exempt = frozenset(row[0] for row in conn.execute(
+                    _EXEMPT.format(", ".join("?" * len(self.exempt_roles))), self.exempt_roles
+                )) if self.exempt_roles else frozenset()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Quota memberships unavailable ({self.path}), keeping the last ones: {e}")
+            return False
+        self._groups = {user_id: tuple(group_ids) for user_id, group_ids in groups.items()}
+        self._exempt = exempt
+        return True
+
+    async def run(self, interval: float):
+        """
+        Reads today's spend, starts the ledger's periodic flush, then reloads memberships every
+        `interval` seconds (never if 0) until cancelled.
+        """
+        if not self.enabled:
+            return
+        await self.ledger.aflush()  # Every worker's spend so far, before the first request
+        self.ledger.start()
+        while interval > 0:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.refresh)
+
+    def _hold(self, guard: QuotaGuard):
+        tokens = guard.prompt_tokens + guard.output_tokens
+        cost = self.ledger.price(guard.model_name, guard.prompt_tokens, guard.output_tokens) or 0.0
+        first = guard.held is None
+        held_tokens, held_cost = guard.held or (0, 0.0)
+        guard.held = (tokens, cost)
+        for subject in guard.subjects:
+            held = self._inflight.get(subject)
+            if held is None:
+                held = self._inflight[subject] = [0, 0, 0.0]
+            held[0] += first
+            held[1] += tokens - held_tokens
+            held[2] += cost - held_cost
+        if first:
+            metrics.set("quota_held_budgets", len(self._inflight))
+
+    def _release(self, guard: QuotaGuard):
+        tokens, cost = guard.held
+        guard.held = None
+        for subject in guard.subjects:
+            held = self._inflight[subject]
+            held[0] -= 1
+            if held[0] == 0:
+                del self._inflight[subject]  # Also drops the float drift of the cost
+            else:
+                held[1] -= tokens
+                held[2] -= cost
+        metrics.set("quota_held_budgets", len(self._inflight))
+
+    def _check(self, subjects: tuple, phase: str):
+        for subject in subjects:
+            scope = subject[0]
+            max_tokens, max_usd = self.limits.get(scope, (0, 0.0))
+            if not (max_tokens or max_usd):
+                continue
+            tokens, cost = self.ledger.spent(subject)
+            held = self._inflight.get(subject)
+            if held is not None:
+                tokens += held[1]
+                cost += held[2]
+            if (max_tokens and tokens >= max_tokens) or (max_usd and cost >= max_usd):
+                metrics.inc("quota_exceeded_total", scope=scope, phase=phase)
+                logger.info(f"🚫 Daily {scope} quota of {subject[1]} spent ({tokens} tokens, ${cost:.4f}): {phase}")
+                raise QuotaExceeded(scope, f"Daily {scope} quota exceeded; it resets at 00:00 UTC",
+                                    _until_midnight())
+            if ((max_tokens and tokens >= max_tokens * self.soft_ratio)
+                    or (max_usd and cost >= max_usd * self.soft_ratio)):
+                self._soft_warning(subject, tokens, cost)
+
+    def _soft_warning(self, subject: tuple, tokens: int, cost: float):
+        day = time.strftime("%Y-%m-%d", time.gmtime())
+        if day != self._warned_day:
+            self._warned, self._warned_day = set(), day  # A new day: forget yesterday's warnings
+        if subject in self._warned:
+            return
+        self._warned.add(subject)
+        metrics.inc("quota_soft_warnings_total", scope=subject[0])
+        logger.warning(f"⚠️ {subject[0].capitalize()} {subject[1]} passed {self.soft_ratio:.0%} of a daily quota "
+                       f"({tokens} tokens, ${cost:.4f})")
+
+
+@lru_cache()
+def get_quota_manager() -> QuotaManager:
+    """Returns the process-wide quota manager (memberships load on first use)."""
+    quotas = QuotaManager()
+    quotas.refresh()
+    return quotas
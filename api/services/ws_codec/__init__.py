@@ -0,0 +1 @@
+# Init for ws_codec module
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+
+from api.services.ws_codec.ws_codec_service import CODECS, FIELD_IDS, JSON_CODEC, accept, negotiate
+from api.services.ws_codec.ws_frames import ChatFrame, MuxChatFrame, MuxResumeFrame
+
+FRAME = {"role": "ai", "content": "Hé", "stream_id": "abc", "offset": 3, "extra": [1, 2]}
+
+
+def test_json_codec_matches_starlette_send_json():
+    assert JSON_CODEC.encode(FRAME) == json.dumps(FRAME, separators=(",", ":"), ensure_ascii=False)
+    assert JSON_CODEC.decode(JSON_CODEC.encode(FRAME)) == FRAME
+
+
+@pytest.mark.parametrize("subprotocol", ["chat.msgpack.v1", "chat.cbor.v1"])
+def test_binary_codecs_round_trip_with_short_field_ids(subprotocol):
+    codec = CODECS[subprotocol]
+    payload = codec.encode(FRAME)
+    assert isinstance(payload, bytes) and b"content" not in payload and b"extra" in payload
+    assert len(payload) < len(JSON_CODEC.encode(FRAME).encode())
+    assert codec.decode(payload) == FRAME
+
+
+def test_every_inbound_field_has_a_short_id():
+    fields = {*ChatFrame.__annotations__, *MuxChatFrame.__annotations__, *MuxResumeFrame.__annotations__}
+    assert fields <= set(FIELD_IDS)
+    assert len(set(FIELD_IDS.values())) == len(FIELD_IDS)
+
+
+def test_negotiation_follows_client_preference_and_defaults_to_json():
+    assert negotiate({"subprotocols": ["x-unknown", "chat.cbor.v1", "chat.msgpack.v1"]}).subprotocol == "chat.cbor.v1"
+    assert negotiate({"subprotocols": ["x-unknown"]}) is JSON_CODEC
+    assert negotiate({}) is JSON_CODEC
+
+
+def test_negotiated_subprotocol_is_used_on_the_socket():
+    app = FastAPI()
+
+    @app.websocket("/echo")
+    async def echo(websocket: WebSocket):
+        codec = await accept(websocket)
+        await codec.send(websocket, await codec.receive(websocket))
+        await websocket.close()
+
+    client = TestClient(app)
+    codec = CODECS["chat.msgpack.v1"]
+    with client.websocket_connect("/echo", subprotocols=["chat.msgpack.v1"]) as ws:
+        assert ws.accepted_subprotocol == "chat.msgpack.v1"
+        ws.send_bytes(codec.encode(FRAME))
+        assert codec.decode(ws.receive_bytes()) == FRAME
+    with client.websocket_connect("/echo") as ws:
+        assert ws.accepted_subprotocol is None
+        ws.send_json(FRAME)
+        assert ws.receive_json() == FRAME
@@ -0,0 +1,62 @@
+import pytest
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from api.services.ws_codec.ws_codec_service import CODECS, JSON_CODEC, InvalidFrame, accept, parse_frame, read_frame
+from api.services.ws_codec.ws_frames import CHAT_FRAME, MUX_FRAME
+
+
+def test_chat_frame_validates_constraints_and_ignores_unknown_fields():
+    frame = parse_frame(JSON_CODEC, '{"user_input": "Hi", "temperature": 0.5, "client": "web"}', CHAT_FRAME)
+    assert frame == {"user_input": "Hi", "temperature": 0.5}
+    assert parse_frame(JSON_CODEC, '{"stream_id": "abc", "last_offset": 4}', CHAT_FRAME)["last_offset"] == 4
+    for raw in ('{"user_input": "Hi", "temperature": 5}', '{"user_input": ""}', '{"model_name": "x"}',
+                '["user_input"]', '{"user_input": "Hi"'):
+        with pytest.raises(InvalidFrame):
+            parse_frame(JSON_CODEC, raw, CHAT_FRAME)
+
+
+def test_mux_frame_dispatches_on_type():
+    assert parse_frame(JSON_CODEC, '{"request_id": "r1", "user_input": "Hi"}', MUX_FRAME)["user_input"] == "Hi"
+    assert parse_frame(JSON_CODEC, '{"type": "cancel", "request_id": "r1"}', MUX_FRAME) == {"type": "cancel", "request_id": "r1"}
+    for raw in ('{"user_input": "no id"}', '{"type": "pause", "request_id": "r1"}', '{"type": "resume", "request_id": "r1"}'):
+        with pytest.raises(InvalidFrame):
+            parse_frame(JSON_CODEC, raw, MUX_FRAME)
+
+
+def test_oversized_and_malformed_binary_frames_are_rejected():
+    with pytest.raises(InvalidFrame, match="exceeds"):
+        parse_frame(JSON_CODEC, '{"user_input": "' + "x" * 100 + '"}', CHAT_FRAME, max_bytes=64)
+    for name in ("chat.msgpack.v1", "chat.cbor.v1"):
+        codec = CODECS[name]
+        assert parse_frame(codec, codec.encode({"user_input": "Hi"}), CHAT_FRAME) == {"user_input": "Hi"}
+        for raw in (b"\xc1\xff\x00", '{"user_input": "Hi"}'):  # Garbage, and a text frame
+            with pytest.raises(InvalidFrame) as e:
+                parse_frame(codec, raw, CHAT_FRAME)
+            assert e.value.ws_code == 4400
+
+
+def test_read_frame_on_a_socket():
+    app = FastAPI()
+
+    @app.websocket("/chat")
+    async def chat(websocket: WebSocket):
+        codec = await accept(websocket)
+        try:
+            frame = await read_frame(websocket, codec, CHAT_FRAME, max_bytes=256)
+        except InvalidFrame as e:
+            await websocket.close(code=e.ws_code, reason=str(e))
+            return
+        await codec.send(websocket, frame)
+        await websocket.close()
+
+    client = TestClient(app)
+    with client.websocket_connect("/chat") as ws:
+        ws.send_text('{"user_input": "Hi"}')
+        assert ws.receive_json() == {"user_input": "Hi"}
+    with client.websocket_connect("/chat") as ws:
+        ws.send_text('{"user_input": "' + "x" * 1000 + '"}')
+        with pytest.raises(WebSocketDisconnect) as e:
+            ws.receive_json()
+        assert e.value.code == 4400
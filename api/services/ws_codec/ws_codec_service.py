@@ -0,0 +1,227 @@
+"""
+WebSocket frame encodings.
+
+JSON text frames are the default. A client may instead offer one of these
+subprotocols in Sec-WebSocket-Protocol and then exchange binary frames:
+
+- "chat.msgpack.v1": MessagePack (ormsgpack)
+- "chat.cbor.v1":    CBOR (cbor2)
+- "chat.json.v1":    explicit JSON, same as offering nothing
+
+Binary frames replace the well-known field names with one-letter ids (see
+FIELD_IDS), so {"role": "ai", "content": "Hi"} travels as {"r": "ai", "c": "Hi"}.
+Unknown fields pass through unchanged. Both serializers are optional: a
+subprotocol is only negotiated when its library is installed.
+
+Inbound frames are read with read_frame(): the raw frame is size-checked
+before anything is parsed, then decoded and validated in one pass against a
+precompiled TypeAdapter (see ws_frames.py). Bad frames raise InvalidFrame,
+which routes turn into close code 4400.
+"""
+
+import json
+
+from fastapi import WebSocketDisconnect
+from pydantic import ValidationError
+
+from api.config.logging import logger
+from api.config.metrics import metrics
+from api.config.settings import WS_BINARY_FRAMES_ENABLED, WS_MAX_FRAME_BYTES
+
+try:
+    import ormsgpack
+except ImportError:
+    ormsgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+WS_CLOSE_INVALID_PAYLOAD = 4400  # Application close code mirroring HTTP 400
+
+metrics.describe("ws_frames_rejected_total", "Inbound WebSocket frames rejected before reaching a handler")
+
+
+class InvalidFrame(ValueError):
+    """An inbound frame that is too large, malformed or fails validation."""
+
+    ws_code = WS_CLOSE_INVALID_PAYLOAD
+
+
+# Field name -> short id used on binary frames. Append only: ids are part of the wire format.
+FIELD_IDS = {
+    "type": "t",
+    "role": "r",
+    "content": "c",
+    "stream_id": "s",
+    "offset": "o",
+    "request_id": "q",
+    "conversation_id": "v",
+    "user_input": "u",
+    "model_name": "m",
+    "system_prompt": "p",
+    "temperature": "T",
+    "top_p": "P",
+    "max_length": "L",
+    "frequency_penalty": "F",
+    "resume_token": "k",
+    "last_offset": "l",
+    "code": "x",
+    "detail": "d",
+    "user_input_upload": "U",
+    "system_prompt_upload": "S",
+    "response_schema": "j",
+    "path": "y",
+    "value": "w",
+    "presence_penalty": "N",
+    "preset": "z",
+}
+FIELD_NAMES = {short: name for name, short in FIELD_IDS.items()}
+
+
+def shorten(frame: dict) -> dict:
+    return {FIELD_IDS.get(key, key): value for key, value in frame.items()}
+
+
+def expand(frame: dict) -> dict:
+    if not isinstance(frame, dict):
+        return frame  # Left for validation to reject
+    return {FIELD_NAMES.get(key, key): value for key, value in frame.items()}
+
+
+class JsonCodec:
+    """JSON text frames, byte-for-byte what Starlette's send_json/receive_json exchange."""
+
+    subprotocol = None
+
+    def encode(self, frame: dict) -> str:
+        return json.dumps(frame, separators=(",", ":"), ensure_ascii=False)
+
+    def decode(self, data) -> dict:
+        return json.loads(data)
+
+    async def send(self, websocket, frame: dict):
+        await websocket.send_text(self.encode(frame))
+
+    async def receive(self, websocket) -> dict:
+        return self.decode(await websocket.receive_text())
+
+    async def receive_raw(self, websocket):
+        """Returns the next frame's undecoded text or bytes."""
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+        text = message.get("text")
+        return text if text is not None else message.get("bytes")
+
+    def validate(self, raw, adapter) -> dict:
+        """Parses and validates a raw frame in one pass (JSON text or bytes)."""
+        return adapter.validate_json(raw)
+
+
+class ExplicitJsonCodec(JsonCodec):
+    subprotocol = "chat.json.v1"
+
+
+class MsgpackCodec(JsonCodec):
+    """MessagePack binary frames with short field ids."""
+
+    subprotocol = "chat.msgpack.v1"
+
+    def encode(self, frame: dict) -> bytes:
+        return ormsgpack.packb(shorten(frame))
+
+    def decode(self, data) -> dict:
+        return expand(ormsgpack.unpackb(data))
+
+    async def send(self, websocket, frame: dict):
+        await websocket.send_bytes(self.encode(frame))
+
+    async def receive(self, websocket) -> dict:
+        return self.decode(await websocket.receive_bytes())
+
+    def validate(self, raw, adapter) -> dict:
+        if isinstance(raw, str):
+            raise ValueError(f"{self.subprotocol} expects binary frames")
+        return adapter.validate_python(self.decode(raw))
+
+
+class CborCodec(MsgpackCodec):
+    """CBOR binary frames with short field ids."""
+
+    subprotocol = "chat.cbor.v1"
+
+    def encode(self, frame: dict) -> bytes:
+        return cbor2.dumps(shorten(frame))
+
+    def decode(self, data) -> dict:
+        try:
+            return expand(cbor2.loads(data))
+        except cbor2.CBORDecodeError as e:
+            raise ValueError(str(e))
+
+
+JSON_CODEC = JsonCodec()
+
+CODECS = {ExplicitJsonCodec.subprotocol: ExplicitJsonCodec()}
+if ormsgpack is not None:
+    CODECS[MsgpackCodec.subprotocol] = MsgpackCodec()
+if cbor2 is not None:
+    CODECS[CborCodec.subprotocol] = CborCodec()
+
+
+def negotiate(scope: dict):
+    """
+    Picks the codec for a WebSocket handshake: the first subprotocol the
+    client offers that is available, else JSON without a subprotocol.
+    """
+    if WS_BINARY_FRAMES_ENABLED:
+        for offered in scope.get("subprotocols") or ():
+            codec = CODECS.get(offered)
+            if codec is not None:
+                return codec
+    return JSON_CODEC
+
+
+async def accept(websocket):
+    """Accepts `websocket` with the negotiated subprotocol and returns its codec."""
+    codec = negotiate(websocket.scope)
+    await websocket.accept(subprotocol=codec.subprotocol)
+    if codec.subprotocol:
+        logger.debug(f"🧩 WebSocket subprotocol: {codec.subprotocol}")
+    return codec
+
+
+def parse_frame(codec, raw, adapter, max_bytes: int = WS_MAX_FRAME_BYTES) -> dict:
+    """
+    Size-checks, decodes and validates one raw frame.
+
+    Raises:
+        InvalidFrame: If the frame is over `max_bytes`, malformed, or fails validation.
+    """
+    size = len(raw) if isinstance(raw, bytes) else len(raw.encode())
+    if size > max_bytes:
+        metrics.inc("ws_frames_rejected_total", reason="too_large")
+        raise InvalidFrame(f"Frame of {size} bytes exceeds the {max_bytes} byte limit")
+    try:
+        return codec.validate(raw, adapter)
+    except ValidationError as e:
+        metrics.inc("ws_frames_rejected_total", reason="invalid")
+        error = e.errors(include_url=False)[0]
+        location = ".".join(str(part) for part in error["loc"])
+        raise InvalidFrame(f"{location + ': ' if location else ''}{error['msg']}")
+    except ValueError as e:
+        metrics.inc("ws_frames_rejected_total", reason="malformed")
+        raise InvalidFrame(f"Malformed frame: {e}")
+
+
+async def read_frame(websocket, codec, adapter, max_bytes: int = WS_MAX_FRAME_BYTES) -> dict:
+    """
+    Receives the next frame and returns it validated against `adapter`.
+
+    Raises:
+        InvalidFrame: See parse_frame().
+        WebSocketDisconnect: If the client went away.
+    """
+    return parse_frame(codec, await codec.receive_raw(websocket), adapter, max_bytes)
@@ -0,0 +1,86 @@
+"""
+Schemas of inbound WebSocket frames, compiled once into TypeAdapters.
+
+Frames validate to plain dicts (TypedDicts), so handlers keep their dict
+access while pydantic-core does the parsing and checking in one pass; JSON
+frames go straight from the wire to `validate_json` without a json.loads.
+Unknown fields are ignored, so older and newer clients keep working.
+"""
+
+from typing import Annotated, Literal, Optional, Union
+
+from pydantic import AfterValidator, Discriminator, Field, Tag, TypeAdapter
+from typing_extensions import Required, TypedDict
+
+Id = Annotated[str, Field(min_length=1, max_length=128)]
+Text = Annotated[str, Field(min_length=1)]
+Temperature = Annotated[float, Field(ge=0.0, le=2.0)]
+TopP = Annotated[float, Field(ge=0.0, le=1.0)]
+MaxLength = Annotated[int, Field(gt=0, le=131072)]
+Penalty = Annotated[float, Field(ge=-2.0, le=2.0)]
+Offset = Annotated[int, Field(ge=-1)]
+
+
+class _Params(TypedDict, total=False):
+    model_name: Optional[Id]
+    system_prompt: Optional[str]
+    temperature: Optional[Temperature]
+    top_p: Optional[TopP]
+    max_length: Optional[MaxLength]
+    frequency_penalty: Optional[Penalty]
+    presence_penalty: Optional[Penalty]
+    preset: Optional[Id]
+    conversation_id: Optional[Id]
+
+
+class ChatFrame(_Params, total=False):
+    """A /v1/ws/chat message: a user turn, or a resume by token or stream id."""
+    user_input: Text
+    user_input_upload: Id
+    system_prompt_upload: Id
+    resume_token: Text
+    stream_id: Id
+    last_offset: Offset
+    response_schema: dict  # JSON schema: the reply is validated while it streams (structured_output)
+
+
+def _has_action(frame: dict) -> dict:
+    if not (frame.get("user_input") or frame.get("user_input_upload") or frame.get("resume_token")
+            or frame.get("stream_id")):
+        raise ValueError("one of user_input, user_input_upload, resume_token or stream_id is required")
+    return frame
+
+
+class MuxChatFrame(_Params, total=False):
+    type: Literal["chat"]
+    request_id: Required[Id]
+    user_input: Required[Text]
+
+
+class MuxCancelFrame(TypedDict):
+    type: Literal["cancel"]
+    request_id: Id
+
+
+class MuxResumeFrame(TypedDict, total=False):
+    type: Required[Literal["resume"]]
+    request_id: Required[Id]
+    resume_token: Text
+    stream_id: Id
+    last_offset: Offset
+
+
+def _mux_type(frame) -> str:
+    return frame.get("type", "chat") if isinstance(frame, dict) else None
+
+
+CHAT_FRAME = TypeAdapter(Annotated[ChatFrame, AfterValidator(_has_action)])
+
+MUX_FRAME = TypeAdapter(Annotated[
+    Union[
+        Annotated[MuxChatFrame, Tag("chat")],
+        Annotated[MuxCancelFrame, Tag("cancel")],
+        Annotated[Annotated[MuxResumeFrame, AfterValidator(_has_action)], Tag("resume")],
+    ],
+    Discriminator(_mux_type),
+])
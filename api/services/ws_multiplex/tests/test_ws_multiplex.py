@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from api.services.ws_multiplex.ws_multiplex_service import FairSender, MuxSession
+
+
+class FakeBot:
+    def __init__(self, api_key, model_name=None, conversation_id=None, temperature=0.7, top_p=0.9,
+                 max_length=256, system_prompt=None, user_id=None):
+        self.conversation_id = conversation_id
+        self.model_name = model_name or "gpt-4o"
+        self.temperature, self.top_p, self.max_length = temperature, top_p, max_length
+        self.replies = []
+        self.settings = []
+
+    async def send_message(self, user_input, settings=None):
+        self.settings.append(settings)
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield {"role": "ai", "content": f"{user_input}{i}"}
+        self.replies.append(user_input)
+
+
+async def collect(frames, until):
+    while sum(f["type"] in ("done", "cancelled", "error") for f in frames) < until:
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_fair_sender_round_robins_between_keys():
+    sent = []
+
+    async def send(frame):
+        sent.append(frame)
+
+    sender = FairSender(send, queue_size=10)
+    for i in range(3):
+        await sender.put("long", f"L{i}")
+    await sender.put("short", "S0")
+    sender.start()
+    await asyncio.sleep(0.01)
+    assert sent == ["L0", "S0", "L1", "L2"]
+    await sender.aclose()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_conversations_interleave_and_stay_ordered_within_one():
+    frames = []
+
+    async def send(frame):
+        frames.append(frame)
+
+    session = MuxSession(send, "sk-test", bot_factory=FakeBot)
+    await session.dispatch({"request_id": "r1", "conversation_id": "a", "user_input": "x"})
+    await session.dispatch({"request_id": "r2", "conversation_id": "b", "user_input": "y"})
+    await session.dispatch({"request_id": "r3", "conversation_id": "a", "user_input": "z"})
+    await collect(frames, 3)
+
+    chunks = [(f["request_id"], f["content"]) for f in frames if f["type"] == "chunk"]
+    order = [rid for rid, _ in chunks]
+    assert order.index("r2") < order.index("r1") + 3  # r2 is not held behind all of r1
+    assert order.index("r3") > max(i for i, rid in enumerate(order) if rid == "r1")  # Same conversation: serial
+    assert [c for rid, c in chunks if rid == "r2"] == ["y0", "y1", "y2"]
+    assert session.bots["a"].replies == ["x", "z"]
+    await session.close()
+
+
+@pytest.mark.asyncio
+async def test_cancel_and_bad_frames_only_end_their_request():
+    frames = []
+
+    async def send(frame):
+        frames.append(frame)
+
+    session = MuxSession(send, "sk-test", bot_factory=FakeBot, max_inflight=1)
+    await session.dispatch({"request_id": "r1", "conversation_id": "a", "user_input": "x"})
+    await session.dispatch({"request_id": "r2", "conversation_id": "b", "user_input": "y"})
+    await session.dispatch({"user_input": "no id"})
+    await session.cancel("r1")
+    await collect(frames, 3)
+
+    by_type = {(f["type"], f["request_id"]) for f in frames}
+    assert ("cancelled", "r1") in by_type
+    assert {f["code"] for f in frames if f["type"] == "error"} == {1013, 4400}
+    assert session.bots["a"].replies == []  # Cancelled reply is not stored
+
+    await session.dispatch({"request_id": "r3", "conversation_id": "b", "user_input": "y"})
+    await collect(frames, 4)
+    assert frames[-1]["type"] == "done" and frames[-1]["request_id"] == "r3"
+    await session.close()
+
+
+@pytest.mark.asyncio
+async def test_idle_conversations_are_evicted_over_the_limit():
+    async def send(frame):
+        pass
+
+    session = MuxSession(send, "sk-test", bot_factory=FakeBot, max_conversations=2)
+    for cid in ("a", "b", "c"):
+        session._bind({"conversation_id": cid})
+    assert list(session.bots) == ["b", "c"]
+    bot, settings = session._bind({"conversation_id": "b", "temperature": 0.1})
+    assert settings == {"temperature": 0.1} and list(session.bots) == ["c", "b"]
+    assert bot.temperature == 0.7  # For that request only: the bot's other streams keep theirs
+    await session.close()
+
+
+@pytest.mark.asyncio
+async def test_a_request_settings_apply_to_that_request_only():
+    frames = []
+
+    async def send(frame):
+        frames.append(frame)
+
+    session = MuxSession(send, "sk-test", bot_factory=FakeBot)
+    await session.dispatch({"request_id": "r1", "conversation_id": "c", "user_input": "a", "temperature": 0.2})
+    await session.dispatch({"request_id": "r2", "conversation_id": "c", "user_input": "b", "top_p": 0.5})
+    await collect(frames, 2)
+    bot = session.bots["c"]
+    assert (bot.temperature, bot.top_p) == (0.2, 0.9)  # As the first request bound it
+    assert bot.settings == [{}, {"top_p": 0.5}]
+    await session.close()
@@ -0,0 +1,361 @@
+"""
+Multiplexed WebSocket chat.
+
+One /v1/ws/mux connection carries many conversations. Every client frame
+names a `request_id` (and a `conversation_id`); each request runs as its own
+task that generates into a replay buffer, and a single writer interleaves the
+requests' outgoing frames round-robin so a long reply cannot starve the
+others. Requests in the same conversation run one after another, requests in
+different conversations run concurrently.
+
+Client frames:
+    {"type": "chat", "request_id": "r1", "conversation_id": "c1", "user_input": "...",
+     "model_name": ..., "system_prompt": ..., "temperature": ..., "top_p": ..., "max_length": ...}
+    {"type": "cancel", "request_id": "r1"}
+    {"type": "resume", "request_id": "r2", "stream_id": "...", "last_offset": 41}
+    {"type": "resume", "request_id": "r3", "resume_token": "..."}
+
+Server frames (all tagged with request_id and conversation_id):
+    {"type": "chunk", "stream_id": ..., "offset": n, "role": "ai", "content": "..."}
+    {"type": "done", "stream_id": ...}
+    {"type": "resumed", "offset": n}  /  {"type": "cancelled"}
+    {"type": "error", "code": 4400 | 4410 | 4429 | 1008 | 1011 | 1013, "detail": "..."}
+
+Errors use the /v1/ws/chat close codes but only end their request, not the
+connection.
+"""
+
+import asyncio
+import uuid
+from collections import OrderedDict
+
+from api.config.drain import get_drain_controller
+from api.config.exceptions import NotFoundException, ServiceUnavailableException, UnauthorizedException
+from api.config.logging import logger
+from api.config.metrics import metrics
+from api.config.settings import WS_MUX_MAX_INFLIGHT, WS_MUX_MAX_CONVERSATIONS, WS_MUX_QUEUE_SIZE
+from api.services.admission_control.admission_control_service import AdmissionRejected
+from api.services.usage_quota.usage_quota_service import QuotaExceeded
+from api.services.llm_routing.llm_routing_service import get_router
+from api.services.llm_ws_streaming.llm_ws_streaming_service import LLMBot
+from api.services.preset_catalog.preset_catalog_service import resolve_params
+from api.services.stream_handoff.stream_handoff_service import get_handoff_store, hand_off
+from api.services.stream_replay.stream_replay_service import ReplayGone, WS_CLOSE_STREAM_GONE, get_stream_registry
+
+WS_ERROR_INVALID = 4400
+WS_ERROR_INTERNAL = 1011
+WS_ERROR_TRY_AGAIN_LATER = 1013
+WS_ERROR_POLICY = 1008
+
+CHAT_DEFAULTS = {"temperature": 0.7, "top_p": 0.9, "max_length": 256}  # As on /v1/ws/chat
+
+metrics.describe("ws_mux_sessions", "Open multiplexed WebSocket connections")
+metrics.describe("ws_mux_requests_total", "Multiplexed requests by outcome")
+
+
+class FairSender:
+    """
+    Round-robin writer for one WebSocket.
+
+    Every key (request) has its own bounded queue and the writer sends one
+    frame per key per round. A slow client therefore backpressures the
+    generations instead of buffering without bound, and no request can hold
+    the socket while others wait.
+
+    Args:
+        send (callable): Coroutine function sending one frame.
+        queue_size (int): Frames buffered per key.
+    """
+
+    def __init__(self, send, queue_size: int = WS_MUX_QUEUE_SIZE):
+        self._send = send
+        self.queue_size = queue_size
+        self._queues = OrderedDict()
+        self._closed = set()
+        self._ready = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def put(self, key: str, frame: dict):
+        """Queues `frame` for `key`, waiting while that key's queue is full."""
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = asyncio.Queue(self.queue_size)
+        await queue.put(frame)
+        self._ready.set()
+
+    def close(self, key: str):
+        """No more frames for `key`; its queue is dropped once sent."""
+        if key in self._queues:
+            self._closed.add(key)
+            self._ready.set()
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            progressed = True
+            while progressed:
+                progressed = False
+                for key, queue in list(self._queues.items()):
+                    if not queue.empty():
+                        await self._send(queue.get_nowait())
+                        progressed = True
+                    elif key in self._closed:
+                        del self._queues[key]
+                        self._closed.discard(key)
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class MuxRequest:
+    """One in-flight request of a session."""
+
+    def __init__(self, request_id: str, bot):
+        self.request_id = request_id
+        self.bot = bot
+        self.task = None
+        self.buffer = None
+        self.sent = 0
+        self.outcome = "cancelled"
+
+
+class MuxSession:
+    """
+    The conversations and in-flight requests of one multiplexed connection.
+
+    Args:
+        send (callable): Coroutine function sending one frame to the client.
+        api_key (str): Key the bots are created with.
+        handle (StreamHandle, optional): The connection's drain handle; marked
+            streaming while any request is generating.
+        admission (AdmissionController, optional): Admits each request.
+        client_key (str, optional): Admission key of the client.
+        user_id (str, optional): The signed-in user, passed to every bot.
+        bot_factory (callable): Builds a bot for a new conversation (LLMBot).
+        max_inflight (int): Concurrent requests allowed.
+        max_conversations (int): Conversations bound at once.
+        queue_size (int): Outgoing frames buffered per request.
+    """
+
+    open_sessions = 0
+
+    def __init__(self, send, api_key: str, handle=None, admission=None, client_key: str = None, user_id: str = None,
+                 bot_factory=LLMBot, max_inflight: int = WS_MUX_MAX_INFLIGHT,
+                 max_conversations: int = WS_MUX_MAX_CONVERSATIONS, queue_size: int = WS_MUX_QUEUE_SIZE):
+        self.api_key = api_key
+        self.handle = handle
+        self.admission = admission
+        self.client_key = client_key
+        self.user_id = user_id
+        self.bot_factory = bot_factory
+        self.max_inflight = max_inflight
+        self.max_conversations = max_conversations
+        self.sender = FairSender(send, queue_size)
+        self.bots = OrderedDict()  # conversation_id -> bot, least recently used first
+        self.locks = {}  # conversation_id -> asyncio.Lock serialising its requests
+        self.requests = {}  # request_id -> MuxRequest
+        self.replay = get_stream_registry()
+        self.closed = False
+        self.sender.start()
+        MuxSession.open_sessions += 1
+        metrics.set("ws_mux_sessions", MuxSession.open_sessions)
+
+    # ─── Client frames ─────────────────────────────────────
+
+    async def dispatch(self, frame: dict):
+        """Handles one client frame; never raises for a bad request, answers with an error frame."""
+        kind = frame.get("type", "chat")
+        request_id = frame.get("request_id")
+        if not isinstance(request_id, str) or not request_id:
+            await self._error(None, None, WS_ERROR_INVALID, "request_id is required")
+            return
+        if kind == "cancel":
+            await self.cancel(request_id)
+            return
+        if request_id in self.requests:
+            await self._error(request_id, None, WS_ERROR_INVALID, f"Request {request_id} is already in flight")
+            return
+        if len(self.requests) >= self.max_inflight:
+            await self._error(request_id, frame.get("conversation_id"), WS_ERROR_TRY_AGAIN_LATER,
+                              f"At most {self.max_inflight} requests may be in flight per connection")
+            return
+
+        try:
+            if kind == "chat":
+                bot, settings = self._bind(frame)
+                user_input = frame["user_input"]
+                start = lambda release: (self.replay.start(bot.send_message(user_input, settings), bot, release), 0)
+            elif kind == "resume" and frame.get("stream_id"):
+                buffer = self.replay.get(frame["stream_id"], self.user_id)
+                bot = self._adopt(buffer.bot)
+                start = lambda release: (buffer, frame.get("last_offset", -1) + 1)
+            elif kind == "resume" and frame.get("resume_token"):
+                claims = get_handoff_store().verify_token(frame["resume_token"], self.user_id)
+                bot = self._adopt(self.bot_factory(model_name=claims["model"], api_key=self.api_key,
+                                                   conversation_id=claims["cid"], user_id=self.user_id,
+                                                   **claims["params"]))
+                await self._reply(request_id, bot.conversation_id, {"type": "resumed", "offset": claims["offset"]},
+                                  last=not claims["partial"])
+                if not claims["partial"]:
+                    return
+                start = lambda release: (self.replay.start(bot.continue_message(), bot, release), 0)
+            else:
+                raise ValueError(f"Unknown frame type '{kind}'")
+        except (ValueError, NotFoundException) as e:
+            await self._error(request_id, frame.get("conversation_id"), WS_ERROR_INVALID, getattr(e, "detail", str(e)))
+            return
+        except ReplayGone as e:
+            await self._error(request_id, None, WS_CLOSE_STREAM_GONE, str(e))
+            return
+        except UnauthorizedException as e:
+            await self._error(request_id, None, WS_ERROR_POLICY, e.detail)
+            return
+
+        request = self.requests[request_id] = MuxRequest(request_id, bot)
+        fresh = kind == "chat" or not frame.get("stream_id")  # Resuming a buffered stream generates nothing new
+        request.task = asyncio.create_task(self._run(request, start, fresh))
+        request.task.add_done_callback(lambda _: self._finished(request))
+        self._update_handle()
+
+    async def reject(self, detail: str):
+        """Answers a frame that failed validation (its request_id is unknown) with a 4400 error frame."""
+        await self._error(None, None, WS_ERROR_INVALID, detail)
+
+    async def cancel(self, request_id: str):
+        """Cancels a request and its generation; the partial reply is not stored."""
+        request = self.requests.get(request_id)
+        if request is None:
+            return
+        request.task.cancel()
+        await asyncio.gather(request.task, return_exceptions=True)
+        if request.buffer is not None:
+            request.buffer.cancel()
+        await self._reply(request_id, request.bot.conversation_id, {"type": "cancelled"})
+
+    def _bind(self, frame: dict) -> tuple:
+        """
+        Returns the bot of the frame's conversation, creating it, and the frame's settings for
+        this request only: a bot already bound keeps its own, which its other streams still use.
+        """
+        conversation_id = frame.get("conversation_id") or str(uuid.uuid4())
+        params = resolve_params(frame)  # The frame's values, then its preset's
+        bot = self.bots.get(conversation_id)
+        if bot is None:
+            bot = self.bot_factory(
+                api_key=self.api_key,
+                conversation_id=conversation_id,
+                user_id=self.user_id,
+                **{**CHAT_DEFAULTS, **params},
+            )
+            return self._adopt(bot), {}
+        if params.get("model_name"):
+            get_router().resolve(params["model_name"])  # An unknown model is refused before the turn starts
+        params.pop("system_prompt", None)  # Set when the conversation is bound
+        self.bots.move_to_end(conversation_id)
+        return bot, params
+
+    def _adopt(self, bot):
+        """Binds `bot` to the session, evicting the least recently used idle conversation when full."""
+        if bot.conversation_id not in self.bots and len(self.bots) >= self.max_conversations:
+            busy = {r.bot.conversation_id for r in self.requests.values()}
+            idle = next((cid for cid in self.bots if cid not in busy), None)
+            if idle is None:
+                raise ValueError(f"At most {self.max_conversations} conversations may be active per connection")
+            del self.bots[idle]
+            self.locks.pop(idle, None)
+        self.bots[bot.conversation_id] = bot
+        self.bots.move_to_end(bot.conversation_id)
+        self.locks.setdefault(bot.conversation_id, asyncio.Lock())
+        return bot
+
+    # ─── Requests ──────────────────────────────────────────
+
+    async def _run(self, request: MuxRequest, start, fresh: bool = True):
+        request_id, conversation_id = request.request_id, request.bot.conversation_id
+        try:
+            async with self.locks.setdefault(conversation_id, asyncio.Lock()):
+                # A new generation takes a stream slot that its producer frees when it ends, even if the
+                # client has gone by then; resuming a buffered stream takes none
+                release = await self.admission.enter(self.client_key) if self.admission and fresh else None
+                request.buffer, request.sent = start(release)
+                async for offset, chunk in request.buffer.tail(request.sent):
+                    await self.sender.put(request_id, {"type": "chunk", "request_id": request_id,
+                                                       "conversation_id": conversation_id,
+                                                       "stream_id": request.buffer.stream_id,
+                                                       "offset": offset, **chunk})
+                    request.sent = offset + 1
+            await self.sender.put(request_id, {"type": "done", "request_id": request_id,
+                                               "conversation_id": conversation_id,
+                                               "stream_id": request.buffer.stream_id})
+            request.outcome = "done"
+        except AdmissionRejected as e:
+            request.outcome = "rejected"
+            await self._error(request_id, conversation_id, e.ws_code, e.detail, last=False)
+        except QuotaExceeded as e:
+            request.outcome = "quota"
+            await self._error(request_id, conversation_id, e.ws_code, e.detail, last=False)
+        except ServiceUnavailableException as e:
+            request.outcome = "unavailable"
+            await self._error(request_id, conversation_id, WS_ERROR_TRY_AGAIN_LATER, e.detail, last=False)
+        except ReplayGone as e:
+            request.outcome = "gone"
+            await self._error(request_id, conversation_id, WS_CLOSE_STREAM_GONE, str(e), last=False)
+        except Exception as e:
+            request.outcome = "error"
+            logger.error(f"WebSocket mux request {request_id} failed: {e}")
+            await self._error(request_id, conversation_id, WS_ERROR_INTERNAL, str(e), last=False)
+
+    def _finished(self, request: MuxRequest):
+        # A done callback rather than a finally: a task cancelled before its first step never runs its body
+        metrics.inc("ws_mux_requests_total", outcome=request.outcome)
+        self.requests.pop(request.request_id, None)
+        self.sender.close(request.request_id)
+        self._update_handle()
+
+    async def _reply(self, request_id: str, conversation_id, frame: dict, last: bool = True):
+        await self.sender.put(request_id, {**frame, "request_id": request_id, "conversation_id": conversation_id})
+        if last:
+            self.sender.close(request_id)
+
+    async def _error(self, request_id: str, conversation_id, code: int, detail: str, last: bool = True):
+        await self._reply(request_id, conversation_id, {"type": "error", "code": code, "detail": detail}, last=last)
+
+    def _update_handle(self):
+        if self.handle is None:
+            return
+        self.handle.streaming = bool(self.requests)
+        if not self.requests and get_drain_controller().draining:
+            self.handle.interrupt()  # Idle now: hand the session off without waiting for the deadline
+
+    # ─── Teardown ──────────────────────────────────────────
+
+    async def hand_off(self, send):
+        """
+        Stops every request and sends one resume_token frame per conversation
+        (with the partial reply of any request cut mid-generation).
+        """
+        cut = {r.bot.conversation_id: r for r in self.requests.values()}
+        await self.close()
+        for conversation_id, bot in self.bots.items():
+            request = cut.get(conversation_id)
+            frame = hand_off(bot, request.buffer, request.sent) if request else hand_off(bot)
+            await send({**frame, "request_id": request.request_id if request else None})
+
+    async def close(self):
+        """Stops the session's tasks; generations keep running so their replies are stored and replayable."""
+        if self.closed:
+            return
+        self.closed = True
+        MuxSession.open_sessions -= 1
+        metrics.set("ws_mux_sessions", MuxSession.open_sessions)
+        tasks = [r.task for r in self.requests.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.sender.aclose()
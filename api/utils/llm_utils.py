@@ -1,52 +1,47 @@
-import re
 import json
 from datetime import datetime
 import time
 
+from api.services.json_stream.json_stream_service import extract_json
+from api.services.prompt_template.prompt_template_service import compile_template, escape, render_template
+
 
 def extract_json_from_text(text, json_root_key):
     '''
     This function is used to extract a JSON snippet from a text.
+
+    Returns the first JSON object holding `json_root_key` at its top level,
+    at any nesting depth below it, or None. Uses the incremental scanner of
+    json_stream_service (one linear pass); feed it chunks directly to extract
+    JSON from a streaming reply.
     '''
-    # Define a regular expression pattern to match the JSON snippet
-    # pattern = r'{\s*"' + re.escape(json_root_key) + r'":\s*{[^}]*}\s*}'
-    # Convert back to original format
-    text = text.replace("{{", "{").replace("}}", "}")
-    pattern = r'{{\s*"{}":\s*{{[^}}]*}}\s*}}'.format(re.escape(json_root_key))
-
-    # Use regex to find the JSON snippet in the text
-    match = re.search(pattern, text)
-
-    if match:
-        # Extract the JSON snippet from the text
-        json_str = match.group()
-        json_obj = json.loads(json_str)
-        return json_obj
-    else:
+    json_obj = extract_json(text, json_root_key)
+    if json_obj is None and "{{" in text:
+        # Prompts written by update_json_in_text escape braces for LangChain templating
+        json_obj = extract_json(text.replace("{{", "{").replace("}}", "}"), json_root_key)
+    if json_obj is None:
         print("No JSON snippet found in the text.")
-        return None
+    return json_obj
 
 def update_json_in_text(text, json_to_update, insert_after_text=None):
     '''
     This function is used to update a JSON snippet in a text.
+
+    The text is compiled once by prompt_template_service (cached by content
+    hash) and every block with the same root key is re-rendered from
+    precomputed parts, so repeated updates of one prompt never re-parse it.
     '''
-    # Convert the JSON data to a string
     json_root_key = list(json_to_update.keys())[0]
-    json_to_update_str = json.dumps(json_to_update, indent=4)
-
-    # Define a regular expression pattern to match the JSON snippet
-    # pattern = r'{\s*"' + re.escape(json_root_key) + r'":\s*{[^}]*}\s*}'
-    pattern = r'{{\s*"{}":\s*{{[^}}]*}}\s*}}'.format(re.escape(json_root_key))
+    template = compile_template(text)
 
-    # Use regex to find the JSON snippet in the text
-    match = re.search(pattern, text)
+    if (json_root_key in template.blocks and len(json_to_update) == 1
+            and isinstance(json_to_update[json_root_key], dict)):
+        # Replace the existing JSON snippet(s), escaped so that Langchain templating doesn't treat them as variables
+        return render_template(text, {json_root_key: json_to_update[json_root_key]})
 
     # Escape curly braces so that Langchain templating engine doesn't treat them as prompt variables
-    json_to_update_str = json_to_update_str.replace("{", "{{").replace("}", "}}")
-    if match:
-        # Replace the original JSON snippet with the new JSON string
-        text = re.sub(pattern, json_to_update_str, text)
-    elif insert_after_text is None:
+    json_to_update_str = escape(json.dumps(json_to_update, indent=4))
+    if insert_after_text is None:
         # If no existing JSON snippet is found, insert the new JSON at the desired location
         print("No insert location specified. Appending JSON to the end of the text.")
         text = text + json_to_update_str
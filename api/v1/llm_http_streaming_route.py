@@ -10,13 +10,20 @@ generated response as a streamed plain-text HTTP response.
 Used for synchronous AI API integrations (e.g., form inputs, REST tools).
 """
 
+import json
 import os
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from typing import Optional
 from api.services.llm_http_streaming.llm_http_streaming_service import LLMBot
+from api.config.drain import StreamInterrupted, get_drain_controller
 from api.config.logging import logger
+from api.services.upload_store.upload_store_service import get_upload_store
+from api.services.session_auth.session_auth_service import SessionUser, current_user
+from api.services.preset_catalog.preset_catalog_service import PRESET_PARAMS, resolve_params
+from api.services.usage_quota.usage_quota_service import QuotaExceeded
+from api.services.structured_output.structured_output_service import compile_schema, structured_stream
 
 router = APIRouter()
 
@@ -33,21 +40,39 @@ class ChatRequest(BaseModel):
     Fields:
         - model_name: Which LLM to invoke (optional)
         - system_prompt: Prompt to prime the model (optional)
-        - user_input: Required input from the user
+        - user_input: Input from the user (required unless user_input_upload is set)
+        - user_input_upload: Upload id (POST /v1/uploads) whose text is the user input
+        - system_prompt_upload: Upload id whose text is the system prompt
         - temperature: Sampling temp (default 0.7)
         - top_p: Top-p nucleus sampling (default 0.9)
         - max_length: Max token limit (default 256)
         - frequency_penalty: Penalty to discourage repetition
+        - presence_penalty: Penalty for tokens already present
+        - preset: Named preset supplying the model, system prompt and sampling
+          values the request does not set (optional)
         - conversation_id: Track multi-turn conversation (optional)
+        - response_schema: JSON schema the reply must match (optional); the response is then
+          NDJSON events instead of plain text
     """
     model_name: Optional[str] = None
     system_prompt: Optional[str] = None
-    user_input: str
+    user_input: Optional[str] = None
+    user_input_upload: Optional[str] = None
+    system_prompt_upload: Optional[str] = None
     temperature: Optional[float] = 0.7
     top_p: Optional[float] = 0.9
     max_length: Optional[int] = 256
     frequency_penalty: Optional[float] = 0.0
+    presence_penalty: Optional[float] = 0.0
+    preset: Optional[str] = None
     conversation_id: Optional[str] = None
+    response_schema: Optional[dict] = None
+
+    @model_validator(mode="after")
+    def _has_user_input(self):
+        if self.user_input is None and self.user_input_upload is None:
+            raise ValueError("user_input or user_input_upload is required")
+        return self
 
 
 # ─────────────────────────────────────────────────────────────
@@ -56,33 +81,106 @@ class ChatRequest(BaseModel):
 # ─────────────────────────────────────────────────────────────
 
 @router.post("/chat-window", summary="HTTP based Chat with an LLM", response_class=StreamingResponse, tags=["LLM Http API"])
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, user: SessionUser = Depends(current_user)):
     """
     Accepts a ChatRequest payload, invokes an LLM, and returns a streamed response.
 
+    With AUTH_ENABLED, requires a NextAuth session token (session cookie or
+    `Authorization: Bearer`); 401 otherwise.
+
+    A user (or group) whose daily quota is spent gets 429 with Retry-After; a
+    quota running out mid-answer ends the stream early.
+
+    With `response_schema` (structured output), the reply is validated while it
+    streams and the response is NDJSON (application/x-ndjson), one event per line:
+    {"type": "field", "path": [...], "value": ...} for every validated value, then
+    {"type": "document", "value": {...}}. A reply that can no longer match the schema
+    ends with {"type": "schema_violation", "path": [...], "detail": "..."} and its
+    generation is cancelled. A malformed or unsupported schema gets 422.
+
     Returns:
-        StreamingResponse (text/plain) – incremental LLM output
+        StreamingResponse (text/plain, or application/x-ndjson) – incremental LLM output
     """
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         logger.error("OPENAI_API_KEY not set.")
         raise HTTPException(status_code=500, detail="OPENAI_API_KEY not set in environment.")
 
-    logger.info(f"🔁 Creating bot for model: {request.model_name or 'gpt-4o'}")
-
-    bot = LLMBot(
-        model_name=request.model_name or "gpt-4o",
-        api_key=api_key,
-        system_prompt=request.system_prompt,
-        temperature=request.temperature,
-        top_p=request.top_p,
-        max_length=request.max_length,
-        conversation_id=request.conversation_id,
-    )
+    # Uploaded documents are decoded once, straight from the upload file (404 if unknown or expired)
+    uploads = get_upload_store()
+    user_input = uploads.text_or_upload(request.user_input, request.user_input_upload)
+    system_prompt = uploads.text_or_upload(request.system_prompt, request.system_prompt_upload)
+
+    # Fields the client set, then its preset's (404 if unknown), then the schema defaults
+    params = resolve_params({**request.model_dump(exclude_unset=True), "system_prompt": system_prompt},
+                            {"model_name": "gpt-4o", **request.model_dump(include=set(PRESET_PARAMS), exclude_none=True)})
+
+    # Compiled up front: a bad schema is a 422, not a broken stream
+    schema = compile_schema(request.response_schema) if request.response_schema is not None else None
+
+    logger.info(f"🔁 Creating bot for model: {params['model_name']} (user: {user.user_id if user else 'anonymous'})")
+
+    # Tracked so a draining worker lets this stream finish (503 once draining)
+    drain = get_drain_controller()
+    handle = drain.open_stream("http")
+    handle.streaming = True
+    try:
+        bot = LLMBot(
+            api_key=api_key,
+            conversation_id=request.conversation_id,
+            user_id=user.user_id if user else None,
+            **params,
+        )
+
+        # Pull the first chunk before committing to a 200 so an unavailable
+        # backend surfaces as a 503 instead of a broken stream
+        reply = bot.send_message(user_input)
+        if schema is not None:
+            reply = structured_stream(reply, schema, content=False)
+        stream = handle.iterate(reply)
+        first = await anext(stream, None)
+    except BaseException:
+        drain.close_stream(handle)
+        raise
+
+    def encode(item) -> str:
+        # Structured output streams events as NDJSON, plain replies their text
+        return json.dumps(item) + "\n" if schema is not None else item.content
 
     async def stream_response():
         logger.debug("📤 Streaming LLM response...")
-        async for chunk in bot.send_message(request.user_input):
-            yield chunk.content
-
-    return StreamingResponse(stream_response(), media_type="text/plain")
+        try:
+            if first is None:
+                return
+            yield encode(first)
+            async for chunk in stream:
+                yield encode(chunk)
+        except StreamInterrupted:
+            logger.warning("⚠️ HTTP stream cut by drain deadline")
+        except QuotaExceeded:
+            logger.info("🚫 HTTP stream cut: daily quota spent")
+        finally:
+            drain.close_stream(handle)
+
+    async def release():
+        # The reply was started above: a client gone before the body is iterated never runs the
+        # generator's finally, so close it here (quota hold, cold tier pin, drain handle)
+        await stream.aclose()
+        drain.close_stream(handle)
+
+    return ClosingStreamingResponse(stream_response(), release,
+                                    media_type="application/x-ndjson" if schema is not None else "text/plain")
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that awaits `on_close()` once it is done, however it ended."""
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.on_close()
@@ -0,0 +1,26 @@
+# api/v1/llm_routing_route.py
+
+"""
+🧭 LLM Routing Stats Route
+
+Exposes the router's per-endpoint view: rolling time-to-first-token (TTFT)
+percentiles, error rates, circuit-breaker state, hedge counters and the
+retry budget. Useful for dashboards and for checking how traffic is spread
+across inference nodes.
+
+Stats are per worker process.
+"""
+
+from fastapi import APIRouter
+from api.services.llm_routing.llm_routing_service import get_router
+
+router = APIRouter()
+
+
+@router.get("/llm/routing", summary="LLM endpoint routing stats", tags=["LLM Routing"])
+async def routing_stats():
+    """
+    Returns the routing policy, hedge counters and per-endpoint stats for every
+    model routed so far by this worker.
+    """
+    return get_router().snapshot()
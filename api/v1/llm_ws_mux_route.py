@@ -0,0 +1,106 @@
+# api/v1/llm_ws_mux_route.py
+
+"""
+Multiplexed WebSocket route for chatting in many conversations over one connection.
+Defines the `/v1/ws/mux` endpoint; see api/services/ws_multiplex for the frame protocol.
+
+Unlike `/v1/ws/chat`, which binds the connection to the bot created from its
+first message, every frame here is routed by `conversation_id` and tagged with
+a client-chosen `request_id`, so a dashboard can drive all of its chat panes
+through a single socket.
+
+Example:
+    -> {"type": "chat", "request_id": "r1", "conversation_id": "pane-1", "user_input": "Hi"}
+    -> {"type": "chat", "request_id": "r2", "conversation_id": "pane-2", "user_input": "Hello", "model_name": "gpt-4o"}
+    <- {"type": "chunk", "request_id": "r1", "conversation_id": "pane-1", "stream_id": "...", "offset": 0, "role": "ai", "content": "Hey"}
+    <- {"type": "chunk", "request_id": "r2", "conversation_id": "pane-2", "stream_id": "...", "offset": 0, "role": "ai", "content": "Hi"}
+    <- ...
+    <- {"type": "done", "request_id": "r1", "conversation_id": "pane-1", "stream_id": "..."}
+"""
+
+import functools
+import os
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from api.config.drain import StreamInterrupted, WS_CLOSE_SERVICE_RESTART, get_drain_controller
+from api.config.logging import logger
+from api.config.settings import ADMISSION_ENABLED
+from api.services.admission_control.admission_control_service import get_admission_controller
+from api.services.session_auth.session_auth_service import SessionUser, current_user
+from api.services.ws_codec.ws_codec_service import InvalidFrame, accept as accept_websocket, read_frame
+from api.services.ws_codec.ws_frames import MUX_FRAME
+from api.services.ws_multiplex.ws_multiplex_service import MuxSession
+
+router = APIRouter()
+
+
+@router.websocket("/ws/mux")
+async def websocket_mux_endpoint(websocket: WebSocket, user: SessionUser = Depends(current_user)):
+    """
+    WebSocket endpoint multiplexing many conversations and concurrent requests.
+
+    Args:
+        websocket (WebSocket): The WebSocket connection object.
+        user (SessionUser | None): The signed-in user (AUTH_ENABLED), see /v1/ws/chat.
+
+    Notes:
+        - Path: /v1/ws/mux (prefixed by router).
+        - With AUTH_ENABLED, the handshake is refused without a valid session token (close code
+          1008 before accept; servers with WebSocket denial responses answer HTTP 403).
+        - Accepts the same Sec-WebSocket-Protocol encodings as /v1/ws/chat.
+        - Frames over WS_MAX_FRAME_BYTES or not matching the schema (ws_codec/ws_frames.py) get an
+          error frame with code 4400.
+        - Per-request failures are sent as {"type": "error", "code": ...} frames using the
+          /v1/ws/chat close codes; the connection stays open.
+        - Closes with code 1011 if OPENAI_API_KEY is missing or an unexpected error occurs.
+        - Closes with code 1012 when the server drains, after one {"type": "resume_token", ...}
+          frame per conversation; send {"type": "resume", "request_id": ..., "resume_token": ...}
+          on a new connection to continue each of them.
+    """
+    codec = await accept_websocket(websocket)  # JSON unless a binary subprotocol was negotiated
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        await websocket.close(code=1011, reason="OPENAI_API_KEY not set in environment.")
+        return
+
+    drain = get_drain_controller()
+    if drain.draining:
+        await websocket.close(code=WS_CLOSE_SERVICE_RESTART, reason="Server is draining, reconnect")
+        return
+    handle = drain.open_stream("ws")
+
+    admission = get_admission_controller() if ADMISSION_ENABLED else None
+    send = functools.partial(codec.send, websocket)
+    session = MuxSession(
+        send,
+        api_key,
+        handle=handle,
+        admission=admission,
+        client_key=admission.client_key(websocket.scope) if admission else None,
+        user_id=user.user_id if user else None,
+    )
+
+    try:
+        while True:
+            if drain.draining and not session.requests:
+                raise StreamInterrupted()
+            try:
+                data = await handle.guard(read_frame(websocket, codec, MUX_FRAME))
+            except InvalidFrame as e:
+                await session.reject(str(e))  # Only this frame fails; the connection stays open
+                continue
+            await session.dispatch(data)
+
+    except StreamInterrupted:
+        await session.hand_off(send)
+        await websocket.close(code=WS_CLOSE_SERVICE_RESTART, reason="Server restarting, reconnect with resume_token")
+    except WebSocketDisconnect:
+        logger.info("WebSocket mux connection closed.")
+    except Exception as e:
+        logger.error(f"WebSocket mux error: {str(e)}")
+        await websocket.close(code=1011, reason=str(e)[:120])
+    finally:
+        try:
+            await session.close()
+        finally:
+            drain.close_stream(handle)  # Even if the close itself is cancelled
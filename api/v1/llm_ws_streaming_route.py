@@ -15,25 +15,68 @@ Expected JSON Input:
     "temperature": 0.7,                       # Optional: Sampling temperature (default: 0.7)
     "top_p": 0.9,                            # Optional: Top-p sampling value (default: 0.9)
     "max_length": 256,                        # Optional: Max response length in tokens (default: 256)
-    "conversation_id": "abc123"              # Optional: Unique identifier for conversation tracking
+    "frequency_penalty": 0.0,                 # Optional: Penalize repeated tokens (default: 0.0)
+    "presence_penalty": 0.0,                  # Optional: Penalize tokens already present (default: 0.0)
+    "preset": "GPT Main Preset",              # Optional: Named preset supplying the fields not sent
+    "conversation_id": "abc123",             # Optional: Unique identifier for conversation tracking
+    "response_schema": {"type": "object"}    # Optional: JSON schema the reply must match
 }
 
+Large documents are uploaded first (POST /v1/uploads) and referenced by id
+with "user_input_upload" / "system_prompt_upload" in place of the text.
+
+Frames are JSON text unless the client negotiates a binary encoding through
+Sec-WebSocket-Protocol ("chat.msgpack.v1" or "chat.cbor.v1"); see
+api/services/ws_codec for the short field ids used there.
+
 Response Format (streamed JSON chunks):
 {
     "role": "ai",
-    "content": "partial message content"
+    "content": "partial message content",
+    "stream_id": "9f1c...",                   # Id of this reply's replay buffer
+    "offset": 0                               # Index of the chunk within the reply
 }
+
+With "response_schema", the reply is validated while it streams. The content
+chunks are interleaved with {"type": "field", "path": ["user", "name"], "value": ...}
+for every validated value, then {"type": "document", "value": {...}}; a reply
+that can no longer match ends with {"type": "schema_violation", "path": [...],
+"detail": ...} and its generation is cancelled.
+
+When tools are registered, a reply may call them: while they run, the client
+receives {"type": "tool", "id": "call_1", "name": "get_weather", "status":
+"started"}, then the same with "done", "cached", "error" or "timeout", before
+the model's answer streams.
+
+A client that dropped mid-reply reconnects and sends
+{"stream_id": "9f1c...", "last_offset": 41} to receive the chunks after
+offset 41 and then the rest of the reply as it is generated.
 """
 
 import os
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, status
 from pydantic import BaseModel, Field
 from typing import Optional
 from api.services.llm_ws_streaming.llm_ws_streaming_service import LLMBot
+from api.services.stream_handoff.stream_handoff_service import get_handoff_store, hand_off
+from api.services.stream_replay.stream_replay_service import ReplayGone, WS_CLOSE_STREAM_GONE, get_stream_registry
+from api.config.drain import StreamInterrupted, WS_CLOSE_SERVICE_RESTART, get_drain_controller
+from api.config.exceptions import NotFoundException, ServiceUnavailableException, UnauthorizedException
 from api.config.logging import logger  # Use your logging system
+from api.config.settings import ADMISSION_ENABLED
+from api.services.admission_control.admission_control_service import AdmissionRejected, get_admission_controller
+from api.services.ws_codec.ws_codec_service import InvalidFrame, accept as accept_websocket, read_frame
+from api.services.ws_codec.ws_frames import CHAT_FRAME
+from api.services.upload_store.upload_store_service import get_upload_store
+from api.services.session_auth.session_auth_service import SessionUser, current_user
+from api.services.preset_catalog.preset_catalog_service import resolve_params
+from api.services.usage_quota.usage_quota_service import QuotaExceeded
+from api.services.structured_output.structured_output_service import InvalidSchema, compile_schema, structured_stream
 
 router = APIRouter()
 
+CHAT_DEFAULTS = {"model_name": "gpt-4o", "temperature": 0.7, "top_p": 0.9, "max_length": 256}
+
 """
 Schema for incoming JSON data to the WebSocket endpoint.
 Defines the structure of messages sent by clients to configure the LLMBot and provide input.
@@ -46,12 +89,15 @@ temperature: Optional[float] = 0.7
 top_p: Optional[float] = 0.9
 max_length: Optional[int] = 256
 frequency_penalty: Optional[float] = 0.0
+presence_penalty: Optional[float] = 0.0
+preset: Optional[str] = None
 conversation_id: Optional[str] = None
+response_schema: Optional[dict] = None
 """
 
 
 @router.websocket("/ws/chat")
-async def websocket_chat_endpoint(websocket: WebSocket):
+async def websocket_chat_endpoint(websocket: WebSocket, user: SessionUser = Depends(current_user)):
     """
     WebSocket endpoint for real-time chat with an AI bot.
 
@@ -60,13 +106,35 @@ async def websocket_chat_endpoint(websocket: WebSocket):
 
     Args:
         websocket (WebSocket): The WebSocket connection object.
+        user (SessionUser | None): The signed-in user when AUTH_ENABLED is set. The NextAuth
+            session token comes from the session cookie, `Authorization: Bearer`, or `?token=`.
 
     Notes:
         - Path: /v1/ws/chat (prefixed by router).
+        - With AUTH_ENABLED, the handshake is refused without a valid session token (close code
+          1008 before accept; servers with WebSocket denial responses answer HTTP 403).
         - Closes with code 1011 if OPENAI_API_KEY is missing or an error occurs.
+        - Closes with code 1013 if no LLM endpoint or fallback model can serve the request,
+          or (with ADMISSION_ENABLED) if this worker has no free stream slot.
+        - Closes with code 4429 when the client's rate limit is exhausted, or when the user's or
+          one of their groups' daily quota is spent: before the reply, or cutting it mid-stream.
+        - Closes with code 4400 when a message is over WS_MAX_FRAME_BYTES, malformed, or does not
+          match the ChatFrame schema (api/services/ws_codec/ws_frames.py), or when its
+          response_schema is malformed or uses unsupported keywords.
+        - With response_schema, field events are sent as the reply's values complete; a reply
+          that breaks the schema ends with a schema_violation event (the connection stays open).
+        - Closes with code 4404 when user_input_upload / system_prompt_upload names an unknown
+          or expired upload, or `preset` names an unknown preset.
+        - Closes with code 1012 when the server drains for a restart, after sending
+          {"type": "resume_token", ...}; send {"resume_token": ...} on a new connection
+          to continue the conversation (and an interrupted reply) on another worker. A token
+          issued to another user closes with 1008.
+        - Every reply is generated into a replay buffer: send {"stream_id": ..., "last_offset": n}
+          after a dropped connection to receive the rest. Closes with code 4410 if the stream
+          is unknown to this worker, expired, another user's, or the offset is no longer buffered.
         - Logs connection events using api/config/logging.py.
     """
-    await websocket.accept()
+    codec = await accept_websocket(websocket)  # JSON unless a binary subprotocol was negotiated
 
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
@@ -75,46 +143,143 @@ async def websocket_chat_endpoint(websocket: WebSocket):
         )
         return
 
+    drain = get_drain_controller()
+    if drain.draining:
+        await websocket.close(code=WS_CLOSE_SERVICE_RESTART, reason="Server is draining, reconnect")
+        return
+    handle = drain.open_stream("ws")
+
+    user_id = user.user_id if user else None
     bot = None
+    buffer = None  # Replay buffer of the reply in progress
+    sent = 0  # Offset of the next chunk to send from it
+    replay = get_stream_registry()
+    admission = get_admission_controller() if ADMISSION_ENABLED else None
+    client_key = admission.client_key(websocket.scope) if admission else None
+    uploads = get_upload_store()
 
     try:
         while True:
-            # Receive message from the client
-            data = await websocket.receive_json()
-
-            # Extract user input and optional parameters from the received data
-            user_input = data.get("user_input")
-            model_name = data.get("model_name", "gpt-4o")
-            system_prompt = data.get("system_prompt")
-            temperature = data.get("temperature", 0.7)
-            top_p = data.get("top_p", 0.9)
-            max_length = data.get("max_length", 256)
-            conversation_id = data.get("conversation_id")
-
-            # Create the bot instance if not already created
-            if bot is None:
+            if drain.draining:
+                raise StreamInterrupted()  # Between turns: hand the session off now
+
+            # Receive message from the client: size-checked, then parsed and validated in one pass
+            data = await handle.guard(read_frame(websocket, codec, CHAT_FRAME))
+
+            # A client handed off by a draining worker continues its conversation here
+            resume_token = data.get("resume_token")
+            if resume_token:
+                claims = get_handoff_store().verify_token(resume_token, user_id)  # Only the user it was issued to
                 bot = LLMBot(
-                    model_name=model_name,
+                    model_name=claims["model"],
                     api_key=api_key,
-                    system_prompt=system_prompt,
-                    temperature=temperature,
-                    top_p=top_p,
-                    max_length=max_length,
-                    conversation_id=conversation_id,
+                    conversation_id=claims["cid"],
+                    user_id=user_id,
+                    **claims["params"],
                 )
+                await codec.send(websocket, {"type": "resumed", "conversation_id": bot.conversation_id,
+                                           "offset": claims["offset"]})
+                if not claims["partial"]:
+                    continue
+                stream, user_input, upload_id = bot.continue_message(), None, None
+            elif data.get("stream_id"):
+                # A client that dropped mid-reply picks the reply up where it left off
+                buffer = replay.get(data["stream_id"], user_id)  # Only the user's own stream
+                bot = bot or buffer.bot
+                sent = data.get("last_offset", -1) + 1
+                await codec.send(websocket, {"type": "stream_resumed", "stream_id": buffer.stream_id, "offset": sent})
+                stream, user_input, upload_id = None, None, None
+            else:
+                # Extract user input and optional parameters from the received data
+                upload_id = data.get("user_input_upload")
+                user_input = uploads.text_or_upload(data.get("user_input"), upload_id)
+                conversation_id = data.get("conversation_id")
+
+                # Create the bot instance if not already created
+                if bot is None:
+                    # Sent values first, then the named preset's, then the defaults
+                    system_prompt = uploads.text_or_upload(data.get("system_prompt"), data.get("system_prompt_upload"))
+                    params = resolve_params({**data, "system_prompt": system_prompt}, CHAT_DEFAULTS)
+                    bot = LLMBot(
+                        api_key=api_key,
+                        conversation_id=conversation_id,
+                        user_id=user_id,
+                        **params,
+                    )
+                # Compiled before anything is stored: a bad schema closes with 4400
+                schema = compile_schema(data["response_schema"]) if data.get("response_schema") is not None else None
+                stream = bot.send_message(user_input)
+                if schema is not None:
+                    stream = structured_stream(stream, schema)
+
+            # Each new reply is one LLM stream: rate-limit it and take a stream slot. The producer holds
+            # the slot until generation ends, even if this client leaves; a re-attached stream holds one already
+            if buffer is None:
+                release = await admission.enter(client_key) if admission else None
+                buffer, sent = replay.start(stream, bot, release=release), 0
 
             # Send the user message back to the frontend with the role "user"
-            await websocket.send_json({"role": "user", "content": user_input})
-
-            # Stream the AI response back to the client
-            async for chunk in bot.send_message(user_input):
-                await websocket.send_json(chunk)
-
+            # (uploads are echoed by id, the client already has the document)
+            if upload_id is not None:
+                await codec.send(websocket, {"role": "user", "user_input_upload": upload_id})
+            elif user_input is not None:
+                await codec.send(websocket, {"role": "user", "content": user_input})
+
+            # Generated in the background into the replay buffer and streamed back from it;
+            # a drain lets it finish unless the deadline passes
+            handle.streaming = True
+            async for offset, chunk in handle.iterate(buffer.tail(sent)):
+                await codec.send(websocket, {**chunk, "stream_id": buffer.stream_id, "offset": offset})
+                sent = offset + 1
+            handle.streaming, buffer = False, None
+
+    except StreamInterrupted:
+        await _hand_off(websocket, codec, bot, buffer, sent)
     except WebSocketDisconnect:
         logger.info("WebSocket connection closed.")
+    except AdmissionRejected as e:
+        logger.info(f"WebSocket rejected by admission control: {e.detail}")
+        await websocket.close(code=e.ws_code, reason=e.detail)
+    except QuotaExceeded as e:
+        await websocket.close(code=e.ws_code, reason=e.detail[:120])
+    except ServiceUnavailableException as e:
+        # Every backend (and fallback model) is down: tell the client to retry later
+        logger.warning(f"WebSocket upstream unavailable: {e.detail}")
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason=e.detail[:120])
+    except UnauthorizedException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+    except ReplayGone as e:
+        await websocket.close(code=WS_CLOSE_STREAM_GONE, reason=str(e)[:120])
+    except NotFoundException as e:
+        await websocket.close(code=4404, reason=e.detail[:120])
+    except InvalidFrame as e:
+        logger.info(f"WebSocket payload rejected: {e}")
+        await websocket.close(code=e.ws_code, reason=str(e)[:120])
+    except InvalidSchema as e:
+        logger.info(f"WebSocket response_schema rejected: {e.detail}")
+        await websocket.close(code=e.ws_code, reason=e.detail[:120])
     except Exception as e:
         logger.error(f"WebSocket error: {str(e)}")
         await websocket.close(code=1011, reason=str(e))
+    finally:
+        drain.close_stream(handle)
+
+
+async def _hand_off(websocket: WebSocket, codec, bot, buffer=None, sent: int = 0):
+    """
+    Closes a session interrupted by a drain with 1012, first sending a resume
+    token so the client can continue the conversation on another worker.
+
+    Args:
+        websocket (WebSocket): The session being closed.
+        codec (JsonCodec): The session's frame encoding.
+        bot (LLMBot | None): The session's bot, if a conversation was started.
+        buffer (ReplayBuffer, optional): Replay buffer of the reply cut mid-generation, if any.
+        sent (int): Chunks of that reply the client already has.
+    """
+    if bot is not None:
+        await codec.send(websocket, hand_off(bot, buffer, sent))
+    await websocket.close(code=WS_CLOSE_SERVICE_RESTART, reason="Server restarting, reconnect with resume_token")
 
 
 # ─────────────────────────────────────────────────────────────
@@ -131,8 +296,14 @@ class WebSocketChatRequest(BaseModel):
         default=None,
         description="Optional system-level instruction to guide model behavior (e.g. 'You are a helpful assistant.')",
     )
-    user_input: str = Field(
-        ..., description="The main user message sent to the LLM (required)."
+    user_input: Optional[str] = Field(
+        default=None, description="The main user message sent to the LLM (required unless user_input_upload is set)."
+    )
+    user_input_upload: Optional[str] = Field(
+        default=None, description="Id of an upload (POST /v1/uploads) to use as the user message."
+    )
+    system_prompt_upload: Optional[str] = Field(
+        default=None, description="Id of an upload to use as the system prompt."
     )
     temperature: Optional[float] = Field(
         default=0.7,
@@ -150,10 +321,24 @@ class WebSocketChatRequest(BaseModel):
         default=0.0,
         description="Penalize repeated tokens to reduce redundancy (OpenAI-style).",
     )
+    presence_penalty: Optional[float] = Field(
+        default=0.0,
+        description="Penalize tokens that already appeared, to encourage new topics (OpenAI-style).",
+    )
+    preset: Optional[str] = Field(
+        default=None,
+        description="Name of a preset (Prisma `preset` table) supplying the model, system prompt and sampling "
+                    "values the payload does not set.",
+    )
     conversation_id: Optional[str] = Field(
         default=None,
         description="Optional conversation ID to support multi-turn context or memory (external tracking).",
     )
+    response_schema: Optional[dict] = Field(
+        default=None,
+        description="JSON schema the reply must match. Validated values stream as field events; a reply that "
+                    "breaks the schema is cut short with a schema_violation event.",
+    )
 
 
 # ─────────────────────────────────────────────────────────────
@@ -235,8 +420,10 @@ This endpoint models **OpenAI-style chat completions**, used across LLM provider
 - `system_prompt`: Instructional prompt to steer the model
 - `temperature`, `top_p`: Sampling controls
 - `max_length`: Response length limit
-- `frequency_penalty`: Penalizes repetitive outputs
+- `frequency_penalty`, `presence_penalty`: Penalize repetitive outputs
+- `preset`: Named preset; fills in the model, system prompt and sampling fields you leave out
 - `conversation_id`: For conversation/thread tracking
+- `response_schema`: JSON schema for structured output; adds `field`, `document` and `schema_violation` events
 
 📦 **Request Payload Fields**:
 
@@ -249,6 +436,8 @@ This endpoint models **OpenAI-style chat completions**, used across LLM provider
   "top_p": 0.9,
   "max_length": 256,
   "frequency_penalty": 0.0,
+  "presence_penalty": 0.0,
+  "preset": "GPT Main Preset",
   "conversation_id": "1234-session",
   "api_key": "sk-..."  // optional
 }
@@ -262,9 +451,15 @@ This endpoint models **OpenAI-style chat completions**, used across LLM provider
 | Code  | Meaning                          | Details & Access                               | Usage/Action                                  |
 |-------|----------------------------------|------------------------------------------------|-----------------------------------------------|
 | 1011  | Internal server error            | Indicates an unexpected server-side issue (e.g., unhandled exception). Logged in server logs via `logger.error`. Accessible via the WebSocket close event’s `code` property. | Check server logs for the stack trace or error message (e.g., `reason` field). Restart or debug the server if persistent. |
+| 1013  | Try again later                  | Every endpoint of the model and of its fallback chain is failing or has an open circuit breaker, or (with `ADMISSION_ENABLED`) the worker has no free stream slot. The `reason` field says which. | Reconnect after a delay with backoff; see `GET /v1/metrics` for circuit states. |
+| 1012  | Service restart                  | The worker is draining for a deploy. Just before closing it sends `{"type": "resume_token", "resume_token": "...", "conversation_id": "...", "offset": n}`; `offset` is how many characters of an interrupted reply you already have. | Reconnect and send `{"resume_token": "..."}` as the first message; the server answers `{"type": "resumed", ...}` and streams the rest of the reply. |
+| 1008  | Policy violation                 | A `resume_token` was invalid, expired, or issued to another user. | Start a new conversation. |
+| 4410  | Stream gone                      | A `{"stream_id": ..., "last_offset": n}` resume named a stream this worker does not know, another user's stream, one that finished more than `STREAM_REPLAY_TTL` seconds ago, or an offset no longer buffered. | Send the message again to regenerate the reply. |
+| 4404  | Upload or preset not found       | `user_input_upload` or `system_prompt_upload` named an upload that does not exist or is older than `UPLOAD_TTL`, or `preset` named no preset. | Upload the document again (`POST /v1/uploads`) and send the new id, or fix the preset name. |
+| 4429  | Rate limited                     | The client's token bucket (keyed by API key, else IP) is empty. The `reason` field says when to retry. Only sent with `ADMISSION_ENABLED`. | Wait the indicated time, then reconnect. |
 | 1000  | Normal closure                   | The connection was closed intentionally by the client or server (e.g., via `websocket.close(1000)`). Seen in the client’s WebSocket `onclose` event. | No action needed—indicates a graceful shutdown. Ensure your app handles this cleanly (e.g., notify user). |
 | 1006  | Abnormal disconnect              | Connection dropped unexpectedly (e.g., network failure, server crash). Not explicitly sent by the app; detected by the WebSocket client library. | Verify network stability or server uptime. Retry the connection after a delay (e.g., exponential backoff). |
-| 4400  | Invalid payload                  | Client sent malformed JSON or data not matching the expected schema. Triggered by FastAPI/Pydantic validation; returned in the `reason` field. | Validate your JSON payload structure client-side before sending. Match it to the `WebSocket{module_name_cap}Request` schema. |
+| 4400  | Invalid payload                  | The message was larger than `WS_MAX_FRAME_BYTES`, was not valid JSON (or MessagePack/CBOR on a binary subprotocol), or did not match the schema: `user_input`, `resume_token` or `stream_id` is required; `temperature` 0–2, `top_p` 0–1, `max_length` > 0; `response_schema` must use supported keywords only. The `reason` field names the first offending field. | Validate your payload client-side before sending. Match it to the `WebSocketChatRequest` schema. |
 🧪 **This docuemntation is for testing, not invocation.**
 
 """,
@@ -0,0 +1,26 @@
+# api/v1/metrics_route.py
+
+"""
+📈 Metrics Route
+
+Serves the in-process metrics registry (api/config/metrics.py) in Prometheus
+text format, plus a JSON variant for quick inspection. Values are per worker.
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from api.config.metrics import metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", summary="Prometheus metrics", response_class=PlainTextResponse, tags=["Metrics"])
+async def prometheus_metrics():
+    """Returns all counters and gauges in Prometheus text exposition format."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/metrics/json", summary="Metrics as JSON", tags=["Metrics"])
+async def json_metrics():
+    """Returns all counters and gauges grouped by metric name."""
+    return metrics.snapshot()
@@ -0,0 +1,52 @@
+# api/v1/upload_route.py
+
+"""
+📎 Upload Route
+
+Streams large documents (long user inputs, system prompts) to disk so chat
+requests can reference them by id instead of carrying them in the body:
+
+    POST /v1/uploads            raw UTF-8 body  -> 201 {"upload_id": ..., "bytes": ..., "sha256": ..., "expires_in": ...}
+    POST /v1/chat-window        {"user_input_upload": "<upload_id>", ...}
+    {"system_prompt_upload": "<upload_id>", "user_input": "..."}   (on /v1/ws/chat)
+    DELETE /v1/uploads/{id}     -> 204
+
+The body is read chunk by chunk and never buffered; see
+api/services/upload_store for limits and expiry.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from api.config.logging import logger
+from api.services.upload_store.upload_store_service import get_upload_store
+from api.services.session_auth.session_auth_service import current_user
+
+router = APIRouter(dependencies=[Depends(current_user)])  # Signed-in users only when AUTH_ENABLED
+
+
+@router.post("/uploads", summary="Stream a large document for chat requests", status_code=status.HTTP_201_CREATED,
+             tags=["Uploads"])
+async def create_upload(request: Request):
+    """
+    Writes the raw request body (UTF-8 text, any Content-Type) to the upload store.
+
+    Returns:
+        dict: upload_id to pass as user_input_upload / system_prompt_upload, the size in
+        bytes, its SHA-256 and the seconds it stays referenceable.
+
+    Raises:
+        413 if the body passes UPLOAD_MAX_BYTES, 400 if it is not UTF-8, 503 if the store is full.
+    """
+    try:
+        upload = await get_upload_store().write(request.stream())
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    logger.info(f"📎 Stored upload {upload['upload_id']} ({upload['bytes']} bytes)")
+    return upload
+
+
+@router.delete("/uploads/{upload_id}", summary="Delete an upload", status_code=status.HTTP_204_NO_CONTENT,
+               tags=["Uploads"])
+async def delete_upload(upload_id: str):
+    """Deletes an upload before it expires (404 if unknown)."""
+    get_upload_store().delete(upload_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)